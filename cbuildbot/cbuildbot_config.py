@@ -167,16 +167,75 @@ def IsCanaryType(b_type):
 config = {}
 
 
+class _ConfigIndex(object):
+  """Lookup tables over a dict of configs, built in one pass.
+
+  Members:
+    configs: The dict of configs that was indexed.
+    by_board: Dict mapping each board to the names of configs building it.
+    by_build_type: Dict mapping each build_type to the names of its configs.
+    slaves: Dict mapping (build_type, chrome_rev, branch) to the names of
+            the configs that are eligible slaves of a master with those
+            settings.  See GetSlavesForMaster.
+    lkgm_canaries: Names of the configs important for the Chrome LKGM.
+  """
+
+  def __init__(self, configs):
+    self.configs = configs
+    self.by_board = {}
+    self.by_build_type = {}
+    self.slaves = {}
+    self.lkgm_canaries = []
+    for name, c in configs.iteritems():
+      for board in c.get('boards') or ():
+        self.by_board.setdefault(board, []).append(name)
+      self.by_build_type.setdefault(c.get('build_type'), []).append(name)
+      if (c['important'] and c['manifest_version'] and
+          (not c['master'] or c['boards'])):
+        key = (c['build_type'], c['chrome_rev'], c['branch'])
+        self.slaves.setdefault(key, []).append(name)
+      if (c['build_type'] == constants.CANARY_TYPE and
+          c['critical_for_chrome'] and not c['child_configs']):
+        self.lkgm_canaries.append(name)
+
+
+_config_index = None
+
+
+def _GetConfigIndex():
+  """Returns the _ConfigIndex for the global config dict.
+
+  The index is built on first use, and rebuilt if the config dict was
+  replaced or _InvalidateConfigIndex was called since.
+  """
+  global _config_index
+  if _config_index is None or _config_index.configs is not config:
+    _config_index = _ConfigIndex(config)
+  return _config_index
+
+
+def _InvalidateConfigIndex():
+  """Forces the next _GetConfigIndex call to rebuild the index."""
+  global _config_index
+  _config_index = None
+
+
+def GetConfigsForBoard(board):
+  """Returns the names of all configs that build |board|."""
+  return list(_GetConfigIndex().by_board.get(board, []))
+
+
+def GetConfigsForBuildType(build_type):
+  """Returns the names of all configs of type |build_type|."""
+  return list(_GetConfigIndex().by_build_type.get(build_type, []))
+
+
 # pylint: disable=W0102
 def GetCanariesForChromeLKGM(configs=config):
   """Grabs a list of builders that are important for the Chrome LKGM."""
-  builders = []
-  for build_name, conf in configs.iteritems():
-    if (conf['build_type'] == constants.CANARY_TYPE and
-        conf['critical_for_chrome'] and not conf['child_configs']):
-      builders.append(build_name)
-
-  return builders
+  if configs is config:
+    return list(_GetConfigIndex().lkgm_canaries)
+  return _ConfigIndex(configs).lkgm_canaries
 
 
 def FindFullConfigsForBoard(board=None):
@@ -192,12 +251,17 @@ def FindFullConfigsForBoard(board=None):
   ext_cfgs = []
   int_cfgs = []
 
-  for name, c in config.iteritems():
-    if c['boards'] and (board is None or board in c['boards']):
-      if name.endswith('-%s' % CONFIG_TYPE_RELEASE) and c['internal']:
-        int_cfgs.append(copy.deepcopy(c))
-      elif name.endswith('-%s' % CONFIG_TYPE_FULL) and not c['internal']:
-        ext_cfgs.append(copy.deepcopy(c))
+  if board is None:
+    names = [name for name, c in config.iteritems() if c['boards']]
+  else:
+    names = _GetConfigIndex().by_board.get(board, [])
+
+  for name in names:
+    c = config[name]
+    if name.endswith('-%s' % CONFIG_TYPE_RELEASE) and c['internal']:
+      int_cfgs.append(copy.deepcopy(c))
+    elif name.endswith('-%s' % CONFIG_TYPE_FULL) and not c['internal']:
+      ext_cfgs.append(copy.deepcopy(c))
 
   return ext_cfgs, int_cfgs
 
@@ -218,7 +282,7 @@ def GetSlavesForMaster(master_config):
 
   A slave config is one that matches the master config in build_type,
   chrome_rev, and branch.  It also must be marked important.  For the
-  full requirements see the logic in code below.
+  full requirements see _ConfigIndex.
 
   The master itself is eligible to be a slave (of itself) if it has boards.
 
@@ -233,23 +297,12 @@ def GetSlavesForMaster(master_config):
     AssertionError if the given config is not a master config or it does
       not have a manifest_version.
   """
-  # This is confusing.  "config" really should be capitalized in this file.
-  all_configs = config
-
   assert master_config['manifest_version']
   assert master_config['master']
 
-  slave_configs = []
-  for build_config in all_configs.itervalues():
-    if (build_config['important'] and
-        build_config['manifest_version'] and
-        (not build_config['master'] or build_config['boards']) and
-        build_config['build_type'] == master_config['build_type'] and
-        build_config['chrome_rev'] == master_config['chrome_rev'] and
-        build_config['branch'] == master_config['branch']):
-      slave_configs.append(build_config)
-
-  return slave_configs
+  key = (master_config['build_type'], master_config['chrome_rev'],
+         master_config['branch'])
+  return [config[name] for name in _GetConfigIndex().slaves.get(key, [])]
 
 
 # Enumeration of valid settings; any/all config settings must be in this.
@@ -815,6 +868,36 @@ class HWTestConfig(object):
   def timeout_mins(self):
     return int(self.timeout / 60)
 
+  def __deepcopy__(self, _memo):
+    # All members are immutable, so a shallow copy is a deep copy.
+    return copy.copy(self)
+
+
+# Types of config values that are immutable, and so never need copying.
+_IMMUTABLE_TYPES = (basestring, bool, int, long, float, type(None))
+
+
+def _CopyValue(value):
+  """Return a deep copy of the config value |value|.
+
+  This is a faster version of copy.deepcopy that only handles the types found
+  in configs, and shares immutable values instead of looking them up in a
+  memo. Deriving configs spends almost all of its time copying, and there
+  are over a thousand configs to derive whenever this module is imported.
+  """
+  if isinstance(value, _IMMUTABLE_TYPES):
+    return value
+  elif isinstance(value, _config):
+    return _config((k, _CopyValue(v)) for k, v in value.iteritems())
+  elif isinstance(value, list):
+    return [_CopyValue(x) for x in value]
+  elif isinstance(value, tuple):
+    return tuple(_CopyValue(x) for x in value)
+  elif type(value) is dict:
+    return dict((k, _CopyValue(v)) for k, v in value.iteritems())
+  else:
+    return copy.deepcopy(value)
+
 
 def AFDORecordTest(**kwargs):
   default_dict = dict(pool=constants.HWTEST_SUITES_POOL,
@@ -842,6 +925,9 @@ class _config(dict):
     # Super class (dict) has no __getattr__ method, so use __getattribute__.
     return super(_config, self).__getattribute__(name)
 
+  def __deepcopy__(self, _memo):
+    return _CopyValue(self)
+
   def GetBotId(self, remote_trybot=False):
     """Get the 'bot id' of a particular bot.
 
@@ -865,13 +951,15 @@ class _config(dict):
       A new _config instance.
     """
     inherits, overrides = args, kwargs
-    new_config = copy.deepcopy(self)
+    # Merge shallowly, then copy the result once, so that the new config
+    # shares no mutable values with this config or the mixins.
+    new_config = _config(self)
     for update_config in inherits:
       new_config.update(update_config)
 
     new_config.update(overrides)
 
-    return copy.deepcopy(new_config)
+    return _CopyValue(new_config)
 
   def add_config(self, name, *args, **kwargs):
     """Derive and add the config to cbuildbot's usable config targets
@@ -894,12 +982,13 @@ class _config(dict):
     # to ensure any far flung consumers of the config dictionary
     # aren't affected by recent refactorings.
 
-    config_dict = _default.derive(self, *inherits, **overrides)
+    config_dict = _default.derive(new_config)
 
     # TODO(mtennant): This is just confusing.  Some random _config object
     # (self) can add a new _config object to the global config dict.  Even if
     # self is itself not a part of the global config dict.
     config[name] = config_dict
+    _InvalidateConfigIndex()
 
     return new_config
 
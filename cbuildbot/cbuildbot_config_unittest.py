@@ -51,6 +51,7 @@ class ConfigPickleTest(cros_test_lib.TestCase):
     self.assertEquals(bc1.name, bc2.name)
 
 
+# pylint: disable=W0212
 class ConfigClassTest(cros_test_lib.TestCase):
   """Tests of the config class itself."""
 
@@ -62,6 +63,24 @@ class ConfigClassTest(cros_test_lib.TestCase):
 
     self.assertRaises(AttributeError, getattr, cfg, 'foobar')
 
+  def testDeriveSharesNoMutableValues(self):
+    """Derived configs must not share mutable values with their parents."""
+    hw_test = cbuildbot_config.HWTestConfig('bvt')
+    parent = cbuildbot_config._config(
+        useflags=['foo'], hw_tests=[hw_test],
+        child_configs=[cbuildbot_config._config(boards=['x86-generic'])])
+    child = parent.derive(boards=['daisy'])
+
+    child.useflags.append('bar')
+    child.hw_tests[0].SetBranchedValues()
+    child.child_configs[0].boards.append('amd64-generic')
+    self.assertEqual(parent.useflags, ['foo'])
+    self.assertEqual(hw_test.timeout,
+                     cbuildbot_config.HWTestConfig.DEFAULT_HW_TEST_TIMEOUT)
+    self.assertEqual(parent.child_configs[0].boards, ['x86-generic'])
+    self.assertTrue(isinstance(child.child_configs[0],
+                               cbuildbot_config._config))
+
 
 class CBuildBotTest(cros_test_lib.MoxTestCase):
   """General tests of cbuildbot_config with respect to cbuildbot."""
@@ -519,6 +538,55 @@ class CBuildBotTest(cros_test_lib.MoxTestCase):
                       'for creating the recovery image' % build_name)
 
 
+class ConfigIndexTest(cros_test_lib.TestCase):
+  """Tests that config queries agree with scans over the config dict."""
+
+  def testConfigsForBoard(self):
+    for board in ('x86-generic', 'lumpy', 'daisy'):
+      expected = [name for name, c in cbuildbot_config.config.iteritems()
+                  if board in c['boards']]
+      self.assertEqual(cbuildbot_config.GetConfigsForBoard(board), expected)
+    self.assertEqual(cbuildbot_config.GetConfigsForBoard('no-such-board'), [])
+
+  def testConfigsForBuildType(self):
+    expected = [name for name, c in cbuildbot_config.config.iteritems()
+                if c['build_type'] == constants.PALADIN_TYPE]
+    self.assertEqual(
+        cbuildbot_config.GetConfigsForBuildType(constants.PALADIN_TYPE),
+        expected)
+
+  def testSlavesForMaster(self):
+    master = cbuildbot_config.config[constants.CQ_MASTER]
+    expected = [c for c in cbuildbot_config.config.itervalues()
+                if (c['important'] and c['manifest_version'] and
+                    (not c['master'] or c['boards']) and
+                    c['build_type'] == master['build_type'] and
+                    c['chrome_rev'] == master['chrome_rev'] and
+                    c['branch'] == master['branch'])]
+    self.assertTrue(expected)
+    self.assertEqual(cbuildbot_config.GetSlavesForMaster(master), expected)
+
+  def testIndexUpdatedForNewConfigs(self):
+    """Configs added after the first query are found by later queries."""
+    cbuildbot_config.GetConfigsForBoard('x86-generic')
+    # patch.dict restores the configs behind the index's back.
+    self.addCleanup(cbuildbot_config._InvalidateConfigIndex)
+    with mock.patch.dict(cbuildbot_config.config):
+      cbuildbot_config._default.add_config('new-test-config',
+                                           boards=['new-test-board'])
+      self.assertEqual(cbuildbot_config.GetConfigsForBoard('new-test-board'),
+                       ['new-test-config'])
+
+      # Replacing a config does not change the number of configs.
+      cbuildbot_config._default.add_config('new-test-config',
+                                           boards=['other-test-board'])
+      self.assertEqual(cbuildbot_config.GetConfigsForBoard('new-test-board'),
+                       [])
+      self.assertEqual(
+          cbuildbot_config.GetConfigsForBoard('other-test-board'),
+          ['new-test-config'])
+
+
 class FindFullTest(cros_test_lib.TestCase):
   """Test locating of official build for a board."""
 
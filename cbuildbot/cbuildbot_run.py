@@ -20,16 +20,12 @@ that run attributes (e.g. self.attrs.release_tag) are shared between them
 all, as intended.
 """
 
+import contextlib
 import cPickle
 import functools
+import multiprocessing
 import os
-try:
-  import Queue
-except ImportError:
-  # Python-3 renamed to "queue".  We still use Queue to avoid collisions
-  # with naming variables as "queue".  Maybe we'll transition at some point.
-  # pylint: disable=F0401
-  import queue as Queue
+import tempfile
 import types
 
 from chromite.cbuildbot import archive_lib
@@ -77,7 +73,7 @@ class AttrSepCountError(ValueError):
 
 
 class AttrNotPickleableError(RunAttributesError):
-  """For when attribute value to queue is not pickleable."""
+  """For when attribute value to share is not pickleable."""
 
   def __init__(self, attr, value, *args):
     self.msg = 'Run attribute "%s" value cannot be pickled: %r' % (attr, value)
@@ -94,25 +90,107 @@ class AttrTimeoutError(RunAttributesError):
     self.args = (attr, ) + tuple(args)
 
 
-class LockableQueue(object):
-  """Multiprocessing queue with associated recursive lock.
+class _ParallelAttr(object):
+  """Storage for the value of one parallel run attribute.
 
-  Objects of this class function just like a regular multiprocessing Queue,
-  except that there is also an rlock attribute for getting a multiprocessing
-  RLock associated with this queue.  Actual locking must still be handled by
-  the calling code.  Example usage:
+  Each value is pickled and appended to an unlinked temporary file that is
+  shared by all processes forked after this object was created.  The offset
+  and size of the latest value are kept in shared memory along with a version
+  counter, and are only updated once the value is completely written, so a
+  process that dies at any point cannot lose the value.  An event is set once
+  the attribute has a value, so that waiters wake up as soon as it is set.
+  Each process also remembers the last value it read along with its version,
+  so that reading an attribute that has not changed since does not touch the
+  file at all.
 
-  with queue.rlock:
-    ... process the queue in some way.
+  Objects of this class must be created before the processes that use them
+  are forked.
   """
 
-  def __init__(self, manager):
-    self._queue = manager.Queue()
-    self.rlock = manager.RLock()
+  # The lock is only held for a few system calls, so waiting this long for it
+  # means that a process died while holding it.
+  LOCK_TIMEOUT = 60
+
+  def __init__(self, attr):
+    self._attr = attr
+    self._file = tempfile.TemporaryFile()
+    self._lock = multiprocessing.Lock()
+    self._is_set = multiprocessing.Event()
+    self._version = multiprocessing.RawValue('i', 0)
+    self._offset = multiprocessing.RawValue('l', 0)
+    self._size = multiprocessing.RawValue('l', 0)
+    # The (version, value) pair last seen by this process.
+    self._cache = (0, None)
+
+  @contextlib.contextmanager
+  def _Locked(self, timeout):
+    """Hold the lock, waiting for it up to |timeout| or LOCK_TIMEOUT seconds.
 
-  def __getattr__(self, attr):
-    """Relay everything to the underlying Queue object at self._queue."""
-    return getattr(self._queue, attr)
+    Raises:
+      AttrTimeoutError if the lock could not be taken in time.
+    """
+    if timeout is not None:
+      timeout = max(timeout, self.LOCK_TIMEOUT)
+    if not self._lock.acquire(True, timeout):
+      raise AttrTimeoutError(self._attr)
+    try:
+      yield
+    finally:
+      self._lock.release()
+
+  def Set(self, value, data):
+    """Set the value, replacing any previous value.
+
+    Args:
+      value: The new value.
+      data: |value|, pickled.
+    """
+    with self._Locked(0):
+      fd = self._file.fileno()
+      offset = os.lseek(fd, 0, os.SEEK_END)
+      written = 0
+      while written < len(data):
+        written += os.write(fd, buffer(data, written))
+      self._offset.value = offset
+      self._size.value = len(data)
+      self._version.value += 1
+      self._cache = (self._version.value, value)
+      self._is_set.set()
+
+  def IsSet(self):
+    """Return True if the value has been set."""
+    return self._is_set.is_set()
+
+  def Get(self, timeout):
+    """Get the value, waiting up to |timeout| seconds for it to be set.
+
+    Args:
+      timeout: Timeout, in seconds.  None means wait forever.
+
+    Returns:
+      A (found, value) tuple.  If no value was set in time, found is False.
+
+    Raises:
+      AttrTimeoutError if the value is set, but could not be read in time.
+    """
+    if not self._is_set.wait(timeout):
+      return False, None
+
+    version, value = self._cache
+    if version != self._version.value:
+      with self._Locked(timeout):
+        fd = self._file.fileno()
+        os.lseek(fd, self._offset.value, os.SEEK_SET)
+        size = self._size.value
+        chunks = []
+        while size:
+          chunks.append(os.read(fd, size))
+          size -= len(chunks[-1])
+        version = self._version.value
+      value = cPickle.loads(''.join(chunks))
+      self._cache = (version, value)
+
+    return True, value
 
 
 class RunAttributes(object):
@@ -124,8 +202,8 @@ class RunAttributes(object):
   process they are in.  REGULAR attributes are accessed directly as normal
   attributes on a RunAttributes object, while PARALLEL attributes are accessed
   through the {Set|Has|Get}Parallel methods.  PARALLEL attributes also have the
-  restriction that their values must be pickle-able (in order to be sent
-  through multiprocessing queue).
+  restriction that their values must be pickle-able (in order to be shared
+  between processes).
 
   The currently supported attributes of each kind are listed in REGULAR_ATTRS
   and PARALLEL_ATTRS below.  To add support for a new run attribute simply
@@ -180,19 +258,16 @@ class RunAttributes(object):
   # REGULAR_ATTRS show up as attributes directly on the RunAttributes object.
   __slots__ = tuple(REGULAR_ATTRS) + (
       '_board_targets', # Set of registered board/target combinations.
-      '_manager',       # The multiprocessing.Manager to use.
-      '_queues',        # Dict of parallel attribute names to LockableQueues.
+      '_values',        # Dict of parallel attribute names to _ParallelAttrs.
   )
 
-  def __init__(self, multiprocess_manager):
-    # Create queues for all non-board-specific parallel attributes now.
+  def __init__(self):
+    # Create storage for all non-board-specific parallel attributes now.
     # Parallel board attributes must wait for the board to be registered.
-    self._manager = multiprocess_manager
-    self._queues = {}
+    self._values = {}
     for attr in RunAttributes.PARALLEL_ATTRS:
       if attr not in RunAttributes.BOARD_ATTRS:
-        # pylint: disable=E1101
-        self._queues[attr] = LockableQueue(self._manager)
+        self._values[attr] = _ParallelAttr(attr)
 
     # Set of known <board>||<target> combinations.
     self._board_targets = set()
@@ -214,13 +289,12 @@ class RunAttributes(object):
       # Register board/target as a known board/target.
       self._board_targets.add(board_target)
 
-      # For each board attribute that should be queue-able, create its queue
-      # now.  Queues are kept by the uniquified run attribute name.
+      # For each board attribute create its storage now.  Storage is kept
+      # by the uniquified run attribute name.
       for attr in RunAttributes.BOARD_ATTRS:
         # Every attr in BOARD_ATTRS is in PARALLEL_ATTRS, by construction.
-        # pylint: disable=E1101
         uniquified_attr = self._GetBoardAttrName(attr, board, target)
-        self._queues[uniquified_attr] = LockableQueue(self._manager)
+        self._values[uniquified_attr] = _ParallelAttr(uniquified_attr)
 
     return BoardRunAttributes(self, board, target)
 
@@ -311,33 +385,31 @@ class RunAttributes(object):
       # Clarify the AttributeError.
       raise ParallelAttributeError(attr, board=board, target=target)
 
-  def _GetQueue(self, attr, strict=False):
-    """Return the queue for the given attribute, if it exists.
+  def _GetValue(self, attr):
+    """Return the storage for the given attribute.
 
     Args:
       attr: The run attribute name.
-      strict: If True, then complain if queue for |attr| is not found.
 
     Returns:
-      The LockableQueue for this attribute, if it has one, or None
-        (assuming strict is False).
+      The _ParallelAttr for this attribute.
 
     Raises:
-      ParallelAttributeError if no queue for this attribute is registered,
+      ParallelAttributeError if no storage for this attribute is registered,
         meaning no parallel attribute by this name is known.
     """
-    queue = self._queues.get(attr)
-
-    if queue is None and strict:
+    value = self._values.get(attr)
+    if value is None:
       raise ParallelAttributeError(attr)
 
-    return queue
+    return value
 
   def SetParallel(self, attr, value):
     """Set the given parallel run attribute value.
 
     Called to set the value of any parallel run attribute.  The value is
-    saved onto a multiprocessing queue for that attribute.
+    saved pickled in a file shared by all processes, and any processes
+    waiting for it are woken up.
 
     Args:
       attr: Name of the attribute.
@@ -346,26 +418,15 @@ class RunAttributes(object):
     Raises:
       ParallelAttributeError if attribute is not a valid parallel attribute.
       AttrNotPickleableError if value cannot be pickled, meaning it cannot
-        go through the queue system.
+        be shared with other processes.
+      AttrTimeoutError if the storage of the attribute stays locked.
     """
-    # Confirm that value can be pickled, because otherwise it will fail
-    # in the queue.
     try:
-      cPickle.dumps(value, cPickle.HIGHEST_PROTOCOL)
+      data = cPickle.dumps(value, cPickle.HIGHEST_PROTOCOL)
     except cPickle.PicklingError:
       raise AttrNotPickleableError(attr, value)
 
-    queue = self._GetQueue(attr, strict=True)
-
-    with queue.rlock:
-      # First empty the queue.  Any value already on the queue is now stale.
-      while True:
-        try:
-          queue.get(False)
-        except Queue.Empty:
-          break
-
-      queue.put(value)
+    self._GetValue(attr).Set(value, data)
 
   def HasParallel(self, attr):
     """Return True if the given parallel run attribute is known and set.
@@ -374,10 +435,7 @@ class RunAttributes(object):
       attr: Name of the attribute.
     """
     try:
-      queue = self._GetQueue(attr, strict=True)
-
-      with queue.rlock:
-        return not queue.empty()
+      return self._GetValue(attr).IsSet()
     except ParallelAttributeError:
       return False
 
@@ -394,7 +452,7 @@ class RunAttributes(object):
     Raises:
       ParallelAttributeError if attribute is not a valid parallel attribute.
       AttrNotPickleableError if value cannot be pickled, meaning it cannot
-        go through the queue system.
+        be shared with other processes.
     """
     if not self.HasParallel(attr):
       self.SetParallel(attr, default_value)
@@ -405,11 +463,11 @@ class RunAttributes(object):
   def GetParallel(self, attr, timeout=0):
     """Get value for the given parallel run attribute, optionally waiting.
 
-    If the given parallel run attr already has a value in the queue it will
-    return that value right away.  Otherwise, it will wait for a value to
-    appear in the queue up to the timeout specified (timeout of None means
-    wait forever) before returning the value found or raising AttrTimeoutError
-    if a timeout was reached.
+    If the given parallel run attr already has a value it will return that
+    value right away.  Otherwise, it will wait for a value to be set up to
+    the timeout specified (timeout of None means wait forever) before
+    returning the value found or raising AttrTimeoutError if a timeout was
+    reached.
 
     Args:
       attr: The name of the run attribute.
@@ -419,44 +477,17 @@ class RunAttributes(object):
     Raises:
       ParallelAttributeError if attribute is not set and timeout was 0.
       AttrTimeoutError if timeout is greater than 0 and timeout is reached
-        before a value is available on the queue.
+        before a value is available.
     """
-    got_value = False
-    queue = self._GetQueue(attr, strict=True)
-
-    # First attempt to get a value off the queue, without the lock.  This
-    # allows a blocking get to wait for a value to appear.
-    try:
-      value = queue.get(True, timeout)
-      got_value = True
-    except Queue.Empty:
-      # This means there is nothing on the queue.  Let this fall through to
-      # the locked code block to see if another process is in the process
-      # of re-queuing a value.  Any process doing that will have a lock.
-      pass
-
-    # Now grab the queue lock and flush any other values that are on the queue.
-    # This should only happen if another process put a value in after our first
-    # queue.get above.  If so, accept the updated value.
-    with queue.rlock:
-      while True:
-        try:
-          value = queue.get(False)
-          got_value = True
-        except Queue.Empty:
-          break
-
-      if got_value:
-        # First re-queue the value, then return it.
-        queue.put(value)
-        return value
+    got_value, value = self._GetValue(attr).Get(timeout)
+    if got_value:
+      return value
 
-      else:
-        # Handle no value differently depending on whether timeout is 0.
-        if timeout == 0:
-          raise ParallelAttributeError(attr)
-        else:
-          raise AttrTimeoutError(attr)
+    # Handle no value differently depending on whether timeout is 0.
+    if timeout == 0:
+      raise ParallelAttributeError(attr)
+    else:
+      raise AttrTimeoutError(attr)
 
 
 class BoardRunAttributes(object):
@@ -583,7 +614,7 @@ class _BuilderRunBase(object):
 
     # Create the RunAttributes object for this BuilderRun and save
     # the id number for it in order to look it up via attrs property.
-    attrs = RunAttributes(multiprocess_manager)
+    attrs = RunAttributes()
     self._ATTRS[id(attrs)] = attrs
     self._attrs_id = id(attrs)
 
@@ -7,8 +7,10 @@
 """Test the cbuildbot_run module."""
 
 import logging
+import multiprocessing
 import os
 import cPickle
+import signal
 import sys
 import time
 
@@ -117,7 +119,7 @@ class _BuilderRunTestCase(cros_test_lib.MockTestCase):
     self._manager.__exit__(None, None, None)
 
   def _NewRunAttributes(self):
-    return cbuildbot_run.RunAttributes(self._manager)
+    return cbuildbot_run.RunAttributes()
 
   def _NewBuilderRun(self, options=None, config=None):
     """Create a BuilderRun objection from options and config values.
@@ -499,6 +501,34 @@ class RunAttributesTest(_BuilderRunTestCase):
     self.assertEqual(value,
                      ra.GetBoardParallel(self.BATTR, self.BOARD, self.TARGET))
 
+  def _RunAndKill(self, func):
+    """Run |func| in a child process that is killed right after it."""
+    def _Child():
+      func()
+      os.kill(os.getpid(), signal.SIGKILL)
+    child = multiprocessing.Process(target=_Child)
+    child.start()
+    child.join()
+
+  def testValueOutlivesKilledProcesses(self):
+    """Test that killed processes do not lose the value of an attribute."""
+    ra = self._NewRunAttributes()
+    self._RunAndKill(lambda: ra.SetParallel('unittest_value', 'foo'))
+    self._RunAndKill(lambda: ra.GetParallel('unittest_value'))
+    self.assertEqual('foo', ra.GetParallel('unittest_value', timeout=1))
+
+  def testLockTimeout(self):
+    """Test that a lock left behind by a killed process times out."""
+    self.PatchObject(cbuildbot_run._ParallelAttr, 'LOCK_TIMEOUT', new=0.1)
+    ra = self._NewRunAttributes()
+    self._RunAndKill(lambda: ra.SetParallel('unittest_value', 'foo'))
+    # pylint: disable=W0212
+    self._RunAndKill(ra._GetValue('unittest_value')._lock.acquire)
+    self.assertRaises(cbuildbot_run.AttrTimeoutError, ra.GetParallel,
+                      'unittest_value')
+    self.assertRaises(cbuildbot_run.AttrTimeoutError, ra.SetParallel,
+                      'unittest_value', 'bar')
+
   def testAttributeError(self):
     """Test accessing run attributes that do not exist."""
     ra = self._NewRunAttributes()
@@ -628,6 +658,17 @@ class BoardRunAttributesTest(_BuilderRunTestCase):
     self._TestParallelSetGet(stage_args)
     self.assertEqual(self.VALUE + '2', self.bra.GetParallel(self.BATTR))
 
+  def testParallelSetAfterGet(self):
+    """Values read earlier are not reused once another process changes them."""
+    self.bra.SetParallel(self.BATTR, self.VALUE + '1')
+    self.assertEqual(self.VALUE + '1', self.bra.GetParallel(self.BATTR))
+    stage_args = [
+        (self._CheckWaitForAttr, self.BATTR, self.VALUE + '1'),
+        (self._SetAttr, self.BATTR, self.VALUE + '2', 0),
+    ]
+    self._TestParallelSetGet(stage_args)
+    self.assertEqual(self.VALUE + '2', self.bra.GetParallel(self.BATTR))
+
   def testSetGet(self):
     """Test that board-specific attrs do not work with set/get directly."""
     self.assertRaises(AttributeError, setattr,
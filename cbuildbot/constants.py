@@ -110,6 +110,15 @@ DEFAULT_MANIFEST = 'default.xml'
 OFFICIAL_MANIFEST = 'official.xml'
 SHARED_CACHE_ENVVAR = 'CROS_CACHEDIR'
 
+# When set, chromite scripts write a statistical profile of their run (in the
+# collapsed stack format used by flamegraph.pl) to the named file.
+PROFILE_ENVVAR = 'CROS_PROFILE'
+# Seconds between stack samples when profiling.
+PROFILE_INTERVAL_ENVVAR = 'CROS_PROFILE_INTERVAL'
+# Set by the process that writes the profile to its pid, so that the chromite
+# scripts it starts leave their samples for it to merge.
+PROFILE_OWNER_ENVVAR = 'CROS_PROFILE_OWNER'
+
 # CrOS remotes specified in the manifests.
 EXTERNAL_REMOTE = 'cros'
 INTERNAL_REMOTE = 'cros-internal'
@@ -482,6 +491,8 @@ VM_TEST_RESULTS = 'vm_test_results_%(attempt)s'
 
 METADATA_JSON = 'metadata.json'
 PARTIAL_METADATA_JSON = 'partial-metadata.json'
+# Metadata key under which stages record the resources they used.
+METADATA_STAGE_USAGE_KEY = 'stage-usage'
 DELTA_SYSROOT_TAR = 'delta_sysroot.tar.xz'
 DELTA_SYSROOT_BATCH = 'batch'
 
@@ -279,9 +279,14 @@ class CBuildbotMetadata(object):
             'start': start_time_stamp,
             'finish': current_time_stamp if final_status else '',
             'duration': duration,
-        }
+        },
+        # Network traffic can't be split between stages running in
+        # parallel, so it is only recorded for the build.
+        'usage': results_lib.Results.GetNetworkUsage(),
     }
 
+    stage_usage = builder_run.attrs.metadata.GetDict().get(
+        constants.METADATA_STAGE_USAGE_KEY, {})
     metadata['results'] = []
     for entry in results_lib.Results.Get():
       timestr = datetime.timedelta(seconds=math.ceil(entry.time))
@@ -298,6 +303,7 @@ class CBuildbotMetadata(object):
           'board': entry.board,
           'description': entry.description,
           'log': builder_run.ConstructDashboardURL(stage=entry.name),
+          'usage': stage_usage.get(entry.name),
       })
 
     if get_changes_from_pool:
@@ -387,7 +393,8 @@ class BuildData(object):
 
   @staticmethod
   def ReadMetadataURLs(urls, gs_ctx=None, exclude_running=True,
-                       get_sheets_version=False):
+                       get_sheets_version=False, metadata_dicts=None,
+                       gathered_dicts=None):
     """Read a list of metadata.json URLs and return BuildData objects.
 
     Args:
@@ -400,27 +407,39 @@ class BuildData(object):
         and the last carbon version that was gathered. This requires an extra
         gsutil request and is only needed if you are writing the metadata to
         to the Google Sheets spreadsheet.
+      metadata_dicts: Optional dict mapping some of |urls| to their already
+        parsed metadata dicts, e.g. from a local cache. These URLs are not
+        read from GS again.
+      gathered_dicts: Optional dict mapping some of |urls| to their already
+        known gathered dicts (see BuildData.gathered_dict). The gathered
+        state of these URLs is not read from GS with get_sheets_version.
 
     Returns:
       List of BuildData objects.
     """
     gs_ctx = gs_ctx or gs.GSContext()
+    metadata_dicts = metadata_dicts or {}
+    gathered_dicts = gathered_dicts or {}
     cros_build_lib.Info('Reading %d metadata URLs using %d processes now.',
                         len(urls), MAX_PARALLEL)
 
     build_data_per_url = {}
     def _ReadMetadataURL(url):
       # Read the metadata.json URL and parse json into a dict.
-      metadata_dict = json.loads(gs_ctx.Cat(url, print_cmd=False).output)
+      metadata_dict = metadata_dicts.get(url)
+      if metadata_dict is None:
+        metadata_dict = json.loads(gs_ctx.Cat(url, print_cmd=False).output)
 
       # Read the file next to url which indicates whether the metadata has
       # been gathered before, and with what stats version.
       if get_sheets_version:
-        gathered_dict = {}
-        gathered_url = url + '.gathered'
-        if gs_ctx.Exists(gathered_url, print_cmd=False):
-          gathered_dict = json.loads(gs_ctx.Cat(gathered_url,
-                                                print_cmd=False).output)
+        gathered_dict = gathered_dicts.get(url)
+        if gathered_dict is None:
+          gathered_dict = {}
+          gathered_url = url + '.gathered'
+          if gs_ctx.Exists(gathered_url, print_cmd=False):
+            gathered_dict = json.loads(gs_ctx.Cat(gathered_url,
+                                                  print_cmd=False).output)
 
         sheets_version = gathered_dict.get(BuildData.SHEETS_VER_KEY)
         carbon_version = gathered_dict.get(BuildData.CARBON_VER_KEY)
@@ -497,6 +516,9 @@ class BuildData(object):
       inputs = [[build] for build in builds]
       parallel.RunTasksInProcessPool(_MarkGathered, inputs,
                                      processes=MAX_PARALLEL)
+      # The builds were marked in background processes; mark our copies too.
+      for build in builds:
+        build.MarkGathered(sheets_version, carbon_version)
 
   def __init__(self, metadata_url, metadata_dict, carbon_version=None,
                sheets_version=None):
@@ -797,7 +819,25 @@ def GetMetadataURLsSince(target, start_date):
   Returns:
     Metadata urls for runs found.
   """
-  urls = []
+  return [url for (url, _size, _dt) in
+          GetMetadataURLDetailsSince(target, start_date)]
+
+
+def GetMetadataURLDetailsSince(target, start_date):
+  """Get metadata.json URL details for |target| since |start_date|.
+
+  Like GetMetadataURLsSince, but returns the size and modified time of each
+  URL as well, which callers can use to tell whether a metadata.json file
+  they have seen before has changed since.
+
+  Args:
+    target: Builder target name.
+    start_date: datetime.date object.
+
+  Returns:
+    List of (url, size, modified datetime) tuples for runs found.
+  """
+  url_details_since = []
   milestone = GetLatestMilestone()
   gs_ctx = gs.GSContext()
   while True:
@@ -822,17 +862,17 @@ def GetMetadataURLsSince(target, start_date):
     # in the current batch.
     if url_details[-1][2].date() < start_date:
       # We want a subset of these URLs, then we are done.
-      urls.extend([url for (url, _size, dt) in url_details
-                   if dt.date() >= start_date])
+      url_details_since.extend([x for x in url_details
+                                if x[2].date() >= start_date])
       break
 
     else:
       # Accept all these URLs, then continue on to the next milestone.
-      urls.extend([url for (url, _size, _dt) in url_details])
+      url_details_since.extend(url_details)
       milestone -= 1
       cros_build_lib.Info('Continuing on to R%d.', milestone)
 
-  return urls
+  return url_details_since
 
 
 GerritPatchTuple = collections.namedtuple('GerritPatchTuple',
@@ -34,6 +34,11 @@ _PV_FIELDS = ['pv', 'package', 'version', 'version_no_rev', 'rev']
 PV = collections.namedtuple('PV', _PV_FIELDS)
 CPV = collections.namedtuple('CPV', ['category'] + _PV_FIELDS)
 
+# The values needed to uprev a cros-workon ebuild.  This lives at module scope
+# so it can be passed between processes.
+UprevInfo = collections.namedtuple(
+    'UprevInfo', ('version_no_rev', 'commit_ids', 'tree_ids'))
+
 # Package matching regexp, as dictated by package manager specification:
 # http://www.gentoo.org/proj/en/qa/pms.xml
 _pkg = r'(?P<package>' + r'[\w+][\w+-]*)'
@@ -522,7 +527,34 @@ class EBuild(object):
     else:
       return '"%s"' % unformatted_list[0]
 
-  def RevWorkOnEBuild(self, srcroot, manifest, redirect_file=None):
+  def GetUprevInfo(self, srcroot, manifest):
+    """Compute the version and source hashes needed to rev this ebuild.
+
+    This only reads from the source repositories, so it is safe to run
+    concurrently for ebuilds living in the same overlay.
+
+    Args:
+      srcroot: full path to the 'src' subdirectory in the source
+        repository.
+      manifest: git.ManifestCheckout object.
+
+    Returns:
+      An UprevInfo tuple.
+    """
+    if self.is_stable:
+      stable_version_no_rev = self.GetVersion(srcroot, manifest,
+                                              self.version_no_rev)
+    else:
+      # If given unstable ebuild, use preferred version rather than 9999.
+      stable_version_no_rev = self.GetVersion(srcroot, manifest, '0.0.1')
+
+    srcdirs = self.GetSourcePath(srcroot, manifest)[1]
+    commit_ids = map(self.GetCommitId, srcdirs)
+    tree_ids = map(self.GetTreeId, srcdirs)
+    return UprevInfo(stable_version_no_rev, commit_ids, tree_ids)
+
+  def RevWorkOnEBuild(self, srcroot, manifest, redirect_file=None,
+                      uprev_info=None):
     """Revs a workon ebuild given the git commit hash.
 
     By default this class overwrites a new ebuild given the normal
@@ -536,6 +568,8 @@ class EBuild(object):
       redirect_file: Optional file to write the new ebuild.  By default
         it is written using the standard rev'ing logic.  This file must be
         opened and closed by the caller.
+      uprev_info: Optional UprevInfo tuple previously computed by
+        GetUprevInfo.  If not specified, it is computed here.
 
     Returns:
       If the revved package is different than the old ebuild, return the full
@@ -545,13 +579,9 @@ class EBuild(object):
       OSError: Error occurred while creating a new ebuild.
       IOError: Error occurred while writing to the new revved ebuild file.
     """
-
-    if self.is_stable:
-      stable_version_no_rev = self.GetVersion(srcroot, manifest,
-                                              self.version_no_rev)
-    else:
-      # If given unstable ebuild, use preferred version rather than 9999.
-      stable_version_no_rev = self.GetVersion(srcroot, manifest, '0.0.1')
+    if uprev_info is None:
+      uprev_info = self.GetUprevInfo(srcroot, manifest)
+    stable_version_no_rev, commit_ids, tree_ids = uprev_info
 
     new_version = '%s-r%d' % (
         stable_version_no_rev, self.current_revision + 1)
@@ -563,9 +593,6 @@ class EBuild(object):
       cros_build_lib.Die('Missing unstable ebuild: %s' %
                          self._unstable_ebuild_path)
 
-    srcdirs = self.GetSourcePath(srcroot, manifest)[1]
-    commit_ids = map(self.GetCommitId, srcdirs)
-    tree_ids = map(self.GetTreeId, srcdirs)
     variables = dict(CROS_WORKON_COMMIT=self.FormatBashArray(commit_ids),
                      CROS_WORKON_TREE=self.FormatBashArray(tree_ids))
     self.MarkAsStable(self._unstable_ebuild_path, new_stable_ebuild_path,
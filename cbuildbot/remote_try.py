@@ -154,11 +154,8 @@ class RemoteTryJob(object):
           'limit.  If you have a lot of local patches, upload them and use the '
           '-g flag instead.')
 
-  def _Submit(self, workdir, testjob, dryrun):
-    """Internal submission function.  See Submit() for arg description."""
-    # TODO(rcui): convert to shallow clone when that's available.
-    current_time = str(int(time.time()))
-
+  def _UploadLocalPatches(self, current_time, dryrun):
+    """Upload the local patches of this job to refs/tryjobs."""
     ref_base = os.path.join('refs/tryjobs', self.user_email, current_time)
     for patch in self.local_patches:
       # Isolate the name; if it's a tag or a remote, let through.
@@ -181,6 +178,10 @@ class RemoteTryJob(object):
                                 patch.tracking_branch, tag))
 
     self._VerifyForBuildbot()
+
+  def _CheckoutRepo(self, workdir, testjob):
+    """Update the tryjob repo in |workdir| and create the push branch."""
+    # TODO(rcui): convert to shallow clone when that's available.
     repository.UpdateGitRepo(workdir, self.repo_url)
     version_path = os.path.join(workdir,
                                 self.TRYJOB_FORMAT_FILE)
@@ -197,8 +198,8 @@ class RemoteTryJob(object):
     git.CreatePushBranch(push_branch, workdir, sync=False,
                          remote_push_branch=remote_branch)
 
-    file_name = '%s.%s' % (self.user,
-                           current_time)
+  def _CommitJobFile(self, workdir, file_name):
+    """Commit the description of this job to the tryjob repo in |workdir|."""
     user_dir = os.path.join(workdir, self.user)
     if not os.path.isdir(user_dir):
       os.mkdir(user_dir)
@@ -218,14 +219,6 @@ class RemoteTryJob(object):
     git.RunGit(workdir, ['commit', '-m', self.description],
                extra_env=extra_env)
 
-    try:
-      git.PushWithRetry(push_branch, workdir, retries=3, dryrun=dryrun)
-    except cros_build_lib.RunCommandError:
-      cros_build_lib.Error(
-          'Failed to submit tryjob.  This could be due to too many '
-          'submission requests by users.  Please try again.')
-      raise
-
   def Submit(self, workdir=None, testjob=False, dryrun=False):
     """Submit the tryjob through Git.
 
@@ -237,11 +230,7 @@ class RemoteTryJob(object):
                will be ignored by production master.
       dryrun: Setting to true will run everything except the final submit step.
     """
-    if workdir is None:
-      with self.repo_cache.Lookup(self.cache_key) as ref:
-        self._Submit(ref.path, testjob, dryrun)
-    else:
-      self._Submit(workdir, testjob, dryrun)
+    SubmitJobs([self], workdir=workdir, testjob=testjob, dryrun=dryrun)
 
   def GetTrybotConsoleLink(self):
     """Get link to the console for the user."""
@@ -254,3 +243,58 @@ class RemoteTryJob(object):
     # 24 hours.
     return ('%s/waterfall?committer=%s' % (constants.TRYBOT_DASHBOARD,
                                            self.user_email))
+
+
+def _SubmitJobs(jobs, workdir, testjob, dryrun):
+  """Internal submission function.  See SubmitJobs() for arg description."""
+  # pylint: disable=W0212
+  current_time = str(int(time.time()))
+  for job in jobs:
+    job._UploadLocalPatches(current_time, dryrun)
+
+  first = jobs[0]
+  first._CheckoutRepo(workdir, testjob)
+  for i, job in enumerate(jobs):
+    # Every job gets a commit of its own, so that the tryjob master sees
+    # exactly one job description per commit.
+    file_name = '%s.%s' % (job.user, current_time)
+    if i:
+      file_name += '.%d' % i
+    job._CommitJobFile(workdir, file_name)
+
+  try:
+    git.PushWithRetry(manifest_version.PUSH_BRANCH, workdir, retries=3,
+                      dryrun=dryrun)
+  except cros_build_lib.RunCommandError:
+    cros_build_lib.Error(
+        'Failed to submit tryjob.  This could be due to too many '
+        'submission requests by users.  Please try again.')
+    raise
+
+
+def SubmitJobs(jobs, workdir=None, testjob=False, dryrun=False):
+  """Submit several tryjobs with a single push to the tryjob repo.
+
+  The tryjob repo is only updated and pushed once, which is much cheaper than
+  calling RemoteTryJob.Submit for each job when launching many jobs at once.
+
+  Args:
+    jobs: A list of RemoteTryJob objects. They must all use the same tryjob
+          repo and user.
+    workdir: See RemoteTryJob.Submit.
+    testjob: See RemoteTryJob.Submit.
+    dryrun: See RemoteTryJob.Submit.
+  """
+  if not jobs:
+    return
+  first = jobs[0]
+  for job in jobs[1:]:
+    if (job.repo_url, job.user) != (first.repo_url, first.user):
+      raise ValueError('Tryjobs submitted together must use the same tryjob '
+                       'repo and user.')
+
+  if workdir is None:
+    with first.repo_cache.Lookup(first.cache_key) as ref:
+      _SubmitJobs(jobs, ref.path, testjob, dryrun)
+  else:
+    _SubmitJobs(jobs, workdir, testjob, dryrun)
@@ -162,6 +162,33 @@ class RemoteTryTests(cros_test_lib.MoxTempDirTestCase):
         cwd=self.checkout_dir).output.strip()
     self.assertEqual(remote_url, self.ext_mirror)
 
+  def testBatchedTryJobs(self):
+    """Verify several tryjobs are committed separately and pushed together."""
+    self.mox.StubOutWithMock(repository, 'IsARepoRoot')
+    repository.IsARepoRoot(mox.IgnoreArg()).MultipleTimes().AndReturn(False)
+    self.mox.ReplayAll()
+    job1 = self._CreateJob()
+    args = ['-r', '/tmp/test_build1', '-g', '7777', '--remote',
+            'x86-generic-paladin']
+    options, _ = cbuildbot._ParseCommandLine(self.parser, args)
+    options.cache_dir = self.tempdir
+    job2 = RemoteTryJobMock(options, ['x86-generic-paladin'], [])
+
+    basehash = git.GetGitRepoRevision(job1.repo_url)
+    remote_try.SubmitJobs([job1, job2], workdir=self.checkout_dir, dryrun=True)
+    cmd = ['log', '--format=%H', '%s..' % basehash]
+    commits = git.RunGit(self.checkout_dir, cmd).output.split()
+    self.assertEqual(len(commits), 2)
+
+    extra_args = []
+    for commit in commits:
+      cmd = ['diff', '--name-only', '%s^' % commit, commit]
+      created_file = self._RunGitSingleOutput(self.checkout_dir, cmd)
+      with open(os.path.join(self.checkout_dir, created_file)) as f:
+        extra_args.append(json.load(f)['extra_args'])
+    self.assertTrue('7777' in extra_args[0])
+    self.assertTrue('5555' in extra_args[1])
+
   def testClientVersionAwareness(self):
     self.assertRaises(
         remote_try.ChromiteUpgradeNeeded,
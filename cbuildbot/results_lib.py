@@ -8,6 +8,7 @@ import collections
 import datetime
 import math
 import os
+import resource
 
 from chromite.cbuildbot import failures_lib
 from chromite.lib import cros_build_lib
@@ -36,6 +37,83 @@ def LoadCheckpoint(buildroot):
     Results.RestoreCompletedStages(load_file)
 
 
+# Size of the blocks counted by getrusage's ru_inblock and ru_oublock.
+_RUSAGE_BLOCK_SIZE = 512
+
+
+def _GetNetworkBytes(net_dev='/proc/self/net/dev'):
+  """Return the (received, transmitted) byte counters of our network namespace.
+
+  The loopback interface is ignored. The counters are shared by everything in
+  the namespace, so they cannot be attributed to a single process, or to one
+  of several stages running in parallel; see Results.GetNetworkUsage.
+  """
+  rx = tx = 0
+  try:
+    with open(net_dev) as f:
+      lines = f.readlines()
+  except (IOError, OSError):
+    return None, None
+  for line in lines[2:]:
+    iface, _, counters = line.partition(':')
+    counters = counters.split()
+    if iface.strip() == 'lo' or len(counters) < 9:
+      continue
+    rx += int(counters[0])
+    tx += int(counters[8])
+  return rx, tx
+
+
+def GetResourceUsage():
+  """Snapshot the resources used so far by this process and its children.
+
+  Returns:
+    A dictionary suitable for passing to DiffResourceUsage.
+  """
+  usage = {}
+  for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN):
+    ru = resource.getrusage(who)
+    usage['cpu_user_seconds'] = usage.get('cpu_user_seconds', 0) + ru.ru_utime
+    usage['cpu_sys_seconds'] = usage.get('cpu_sys_seconds', 0) + ru.ru_stime
+    usage['io_read_bytes'] = (usage.get('io_read_bytes', 0) +
+                              ru.ru_inblock * _RUSAGE_BLOCK_SIZE)
+    usage['io_write_bytes'] = (usage.get('io_write_bytes', 0) +
+                               ru.ru_oublock * _RUSAGE_BLOCK_SIZE)
+  return usage
+
+
+def DiffResourceUsage(before, after):
+  """Return the resources used between two GetResourceUsage snapshots.
+
+  CPU time and block I/O are reported as the difference between the
+  snapshots. CPU time of child processes is only included once they have
+  been waited for, which is always the case for the processes started by
+  RunCommand and RunParallelSteps.
+
+  Peak memory is not reported: ru_maxrss is a high water mark over the life
+  of the process (and of its waited for children), so it cannot be split
+  between the stages. Stages running in a cgroup of their own get it from
+  the cgroup instead.
+
+  Args:
+    before: The usage snapshot taken when the stage started.
+    after: The usage snapshot taken when the stage finished.
+
+  Returns:
+    A dictionary mapping the resource names to the amount used. Counters that
+    are unavailable on this system are None.
+  """
+  usage = {}
+  for key, value in after.iteritems():
+    if value is None or before.get(key) is None:
+      usage[key] = None
+    elif isinstance(value, float):
+      usage[key] = round(value - before[key], 3)
+    else:
+      usage[key] = value - before[key]
+  return usage
+
+
 class RecordedTraceback(object):
   """This class represents a traceback recorded in the list of results."""
 
@@ -78,11 +156,27 @@ class _Results(object):
     self._previous = {}
 
     self.start_time = datetime.datetime.now()
+    self._start_network_bytes = _GetNetworkBytes()
 
   def Clear(self):
     """Clear existing stage results."""
     self.__init__()
 
+  def GetNetworkUsage(self):
+    """Return the network traffic since the results were last cleared.
+
+    The traffic is that of our whole network namespace, so it is only
+    reported for the build as a whole and not for the stages.
+
+    Returns:
+      A dictionary with the keys net_rx_bytes and net_tx_bytes. Counters
+      that are unavailable on this system are None.
+    """
+    before = dict(zip(('net_rx_bytes', 'net_tx_bytes'),
+                      self._start_network_bytes))
+    after = dict(zip(('net_rx_bytes', 'net_tx_bytes'), _GetNetworkBytes()))
+    return DiffResourceUsage(before, after)
+
   def PreviouslyCompletedRecord(self, name):
     """Check to see if this stage was previously completed.
 
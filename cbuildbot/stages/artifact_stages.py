@@ -19,6 +19,7 @@ from chromite.cbuildbot import constants
 from chromite.cbuildbot import portage_utilities
 from chromite.cbuildbot import prebuilts
 from chromite.cbuildbot.stages import generic_stages
+from chromite.lib import cgroups
 from chromite.lib import cros_build_lib
 from chromite.lib import git
 from chromite.lib import osutils
@@ -419,6 +420,9 @@ class DebugSymbolsStage(generic_stages.BoardSpecificBuilderStage,
   """Handles generation & upload of debug symbols."""
 
   config_name = 'debug_symbols'
+  # Symbol generation and upload must not starve the image builds (see
+  # BuildImageStage).
+  cgroup_limits = {'cpu_shares': cgroups.DEFAULT_CPU_SHARES // 4}
 
   @failures_lib.SetFailureType(failures_lib.InfrastructureFailure)
   def PerformStage(self):
@@ -588,6 +592,9 @@ class UploadPrebuiltsStage(generic_stages.BoardSpecificBuilderStage):
 
   option_name = 'prebuilts'
   config_name = 'prebuilts'
+  # Uploading prebuilts must not starve the image builds of other boards
+  # (see BuildImageStage).
+  cgroup_limits = {'cpu_shares': cgroups.DEFAULT_CPU_SHARES // 4}
 
   def __init__(self, builder_run, board, **kwargs):
     super(UploadPrebuiltsStage, self).__init__(builder_run, board, **kwargs)
@@ -14,6 +14,7 @@ from chromite.cbuildbot import failures_lib
 from chromite.cbuildbot import repository
 from chromite.cbuildbot.stages import generic_stages
 from chromite.cbuildbot.stages import test_stages
+from chromite.lib import cgroups
 from chromite.lib import cros_build_lib
 from chromite.lib import git
 from chromite.lib import osutils
@@ -250,6 +251,9 @@ class BuildImageStage(BuildPackagesStage):
 
   option_name = 'build'
   config_name = 'images'
+  # Run in a group of its own at the default weight, so that the stages that
+  # run next to it with a lower weight (e.g. DebugSymbolsStage) yield to it.
+  cgroup_limits = {'cpu_shares': cgroups.DEFAULT_CPU_SHARES}
 
   def _BuildImages(self):
     # We only build base, dev, and test images from this stage.
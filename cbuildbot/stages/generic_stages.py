@@ -28,6 +28,7 @@ from chromite.cbuildbot import results_lib
 from chromite.cbuildbot import constants
 from chromite.cbuildbot import portage_utilities
 from chromite.cbuildbot import repository
+from chromite.lib import cgroups
 from chromite.lib import cros_build_lib
 from chromite.lib import gs
 from chromite.lib import osutils
@@ -56,6 +57,14 @@ class BuilderStage(object):
   # TODO(mtennant): Rename this something like skip_config_name.
   config_name = None
 
+  # Class should set this to a dictionary of keyword arguments for
+  # cgroups.Cgroup.SetLimits to limit the resources its processes may use,
+  # so that it cannot starve the stages running in parallel with it. The
+  # stage runs in a group of its own, nested in the group of the builder.
+  # Note that a cpu_shares weight only counts against the stages running
+  # in their own groups next to it.
+  cgroup_limits = None
+
   @classmethod
   def StageNamePrefix(cls):
     """Return cls.__name__ with any 'Stage' suffix removed."""
@@ -336,10 +345,50 @@ class BuilderStage(object):
     """Run if the stage is skipped."""
     pass
 
+  def _LimitResources(self):
+    """Return a context manager applying |cgroup_limits| to this stage.
+
+    The stage's group also accounts for its memory use, so its peak can be
+    recorded; see _GetPeakMemory.
+    """
+    if not self.cgroup_limits or not self._run.options.cgroups:
+      return cros_build_lib.NoOpContextManager()
+    return cgroups.SimpleLimitChildren(
+        self.__class__.__name__,
+        dict(self.cgroup_limits, memory_accounting=True))
+
+  @staticmethod
+  def _GetPeakMemory(limiter):
+    """Return the peak memory use in bytes of a stage run by |limiter|.
+
+    Args:
+      limiter: The context manager returned by _LimitResources, after it
+        was exited.
+
+    Returns:
+      The peak memory use of the stage's cgroup, or None if the stage did
+      not run in a cgroup of its own.
+    """
+    usage = getattr(limiter, 'usage', None) or {}
+    return usage.get('memory_max_usage_bytes')
+
   def _RecordResult(self, *args, **kwargs):
     """Record a successful or failed result."""
     results_lib.Results.Record(*args, **kwargs)
 
+  def _RecordResourceUsage(self, usage):
+    """Record the resources used by this stage in the build metadata.
+
+    The metadata is shared between processes, so this also works for stages
+    that were forked off by RunParallelSteps.
+
+    Args:
+      usage: A dictionary of resource usage, as returned by
+        results_lib.DiffResourceUsage.
+    """
+    self._run.attrs.metadata.UpdateKeyDictWithDict(
+        constants.METADATA_STAGE_USAGE_KEY, {self.name: usage})
+
   def Run(self):
     """Have the builder execute the stage."""
     # See if this stage should be skipped.
@@ -363,6 +412,7 @@ class BuilderStage(object):
       return
 
     start_time = time.time()
+    start_usage = results_lib.GetResourceUsage()
 
     # Set default values
     result = results_lib.Results.SUCCESS
@@ -371,10 +421,13 @@ class BuilderStage(object):
     sys.stdout.flush()
     sys.stderr.flush()
     self._Begin()
+    limiter = None
     try:
       # TODO(davidjames): Verify that PerformStage always returns None. See
       # crbug.com/264781
-      self.PerformStage()
+      limiter = self._LimitResources()
+      with limiter:
+        self.PerformStage()
     except SystemExit as e:
       if e.code != 0:
         result, description, retrying = self._TopHandleStageException()
@@ -398,6 +451,10 @@ class BuilderStage(object):
       elapsed_time = time.time() - start_time
       self._RecordResult(self.name, result, description, prefix=self._prefix,
                          time=elapsed_time)
+      usage = results_lib.DiffResourceUsage(start_usage,
+                                            results_lib.GetResourceUsage())
+      usage['memory_max_usage_bytes'] = self._GetPeakMemory(limiter)
+      self._RecordResourceUsage(usage)
       self._Finish()
       sys.stdout.flush()
       sys.stderr.flush()
@@ -15,11 +15,13 @@ import unittest
 sys.path.insert(0, os.path.abspath('%s/../../..' % os.path.dirname(__file__)))
 from chromite.cbuildbot import commands
 from chromite.cbuildbot import cbuildbot_config as config
+from chromite.cbuildbot import constants
 from chromite.cbuildbot import failures_lib
 from chromite.cbuildbot import results_lib
 from chromite.cbuildbot import cbuildbot_run
 from chromite.cbuildbot import portage_utilities
 from chromite.cbuildbot.stages import generic_stages
+from chromite.lib import cgroups
 from chromite.lib import cros_build_lib
 from chromite.lib import cros_build_lib_unittest
 from chromite.lib import cros_test_lib
@@ -313,6 +315,53 @@ class BuilderStageTest(AbstractStageTest):
     self.assertTrue(isinstance(results.result, TestError))
     self.assertEqual(str(results.result), 'fail!')
 
+  def testRunRecordsResourceUsage(self):
+    """Verify Run() records the resources the stage used in the metadata."""
+    def _PerformStage():
+      cros_build_lib.RunCommand(['true'], print_cmd=False)
+    self.PatchObject(generic_stages.BuilderStage, 'PerformStage',
+                     side_effect=_PerformStage)
+
+    stage = self.ConstructStage()
+    self._RunCapture(stage)
+
+    usage = self._run.attrs.metadata.GetDict()[
+        constants.METADATA_STAGE_USAGE_KEY][stage.name]
+    self.assertGreaterEqual(usage['cpu_user_seconds'], 0)
+    self.assertGreaterEqual(usage['cpu_sys_seconds'], 0)
+    self.assertGreaterEqual(usage['io_write_bytes'], 0)
+    # Without a cgroup of its own, the stage's peak memory is unknown.
+    self.assertIsNone(usage['memory_max_usage_bytes'])
+
+  def testRunLimitsResources(self):
+    """Verify Run() runs the stage in a cgroup with its cgroup_limits."""
+    limit_mock = self.PatchObject(
+        cgroups, 'SimpleLimitChildren',
+        return_value=cros_build_lib.NoOpContextManager())
+    self.PatchObject(generic_stages.BuilderStage, 'cgroup_limits',
+                     new={'cpu_shares': 256})
+    self._run.options.cgroups = True
+
+    stage = self.ConstructStage()
+    self._RunCapture(stage)
+    limit_mock.assert_called_once_with(
+        'BuilderStage', {'cpu_shares': 256, 'memory_accounting': True})
+
+  def testRunRecordsPeakMemory(self):
+    """Verify Run() records the peak memory of the stage's cgroup."""
+    limiter = cros_build_lib.NoOpContextManager()
+    limiter.usage = {'memory_max_usage_bytes': 1 << 20}
+    self.PatchObject(cgroups, 'SimpleLimitChildren', return_value=limiter)
+    self.PatchObject(generic_stages.BuilderStage, 'cgroup_limits',
+                     new={'cpu_shares': 256})
+    self._run.options.cgroups = True
+
+    stage = self.ConstructStage()
+    self._RunCapture(stage)
+    usage = self._run.attrs.metadata.GetDict()[
+        constants.METADATA_STAGE_USAGE_KEY][stage.name]
+    self.assertEqual(usage['memory_max_usage_bytes'], 1 << 20)
+
   def testHandleExceptionException(self):
     """Verify exceptions in HandleException handlers are themselves handled."""
     class TestError(Exception):
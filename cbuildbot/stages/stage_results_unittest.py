@@ -20,6 +20,7 @@ from chromite.cbuildbot.stages import generic_stages
 from chromite.cbuildbot.stages import sync_stages
 from chromite.lib import cros_build_lib
 from chromite.lib import cros_test_lib
+from chromite.lib import osutils
 from chromite.lib import parallel
 from chromite.scripts import cbuildbot
 
@@ -115,6 +116,49 @@ class GetAttrStage(generic_stages.BuilderStage):
     return cbuildbot_run.AttrTimeoutError(self.attr)
 
 
+class ResourceUsageTest(cros_test_lib.MockTempDirTestCase):
+  """Tests of the resource usage helpers in results_lib."""
+
+  def testDiffResourceUsage(self):
+    """Counters are diffed, missing counters are not."""
+    before = {'cpu_user_seconds': 1.5, 'io_read_bytes': 512,
+              'net_rx_bytes': None}
+    after = {'cpu_user_seconds': 4.0, 'io_read_bytes': 2048,
+             'net_rx_bytes': None}
+    self.assertEqual(results_lib.DiffResourceUsage(before, after),
+                     {'cpu_user_seconds': 2.5, 'io_read_bytes': 1536,
+                      'net_rx_bytes': None})
+
+  def testGetNetworkBytes(self):
+    """The loopback interface is not counted."""
+    net_dev = os.path.join(self.tempdir, 'dev')
+    osutils.WriteFile(net_dev, """header 1
+header 2
+    lo: 100 1 0 0 0 0 0 0 100 1 0 0 0 0 0 0
+  eth0: 200 2 0 0 0 0 0 0 300 3 0 0 0 0 0 0
+  eth1: 5 1 0 0 0 0 0 0 7 1 0 0 0 0 0 0
+""")
+    self.assertEqual(results_lib._GetNetworkBytes(net_dev), (205, 307))
+    self.assertEqual(results_lib._GetNetworkBytes(net_dev + '.missing'),
+                     (None, None))
+
+  def testGetNetworkUsage(self):
+    """Network traffic is counted from when the results were cleared."""
+    self.PatchObject(results_lib, '_GetNetworkBytes',
+                     side_effect=[(100, 200), (150, 260), (None, None)])
+    results = results_lib._Results()
+    self.assertEqual(results.GetNetworkUsage(),
+                     {'net_rx_bytes': 50, 'net_tx_bytes': 60})
+    self.assertEqual(results.GetNetworkUsage(),
+                     {'net_rx_bytes': None, 'net_tx_bytes': None})
+
+  def testNoNetworkUsagePerStage(self):
+    """Stage usage doesn't include the network traffic of the namespace."""
+    usage = results_lib.GetResourceUsage()
+    self.assertNotIn('net_rx_bytes', usage)
+    self.assertNotIn('net_tx_bytes', usage)
+
+
 class BuildStagesResultsTest(cros_test_lib.TestCase):
   """Tests for stage results and reporting."""
 
@@ -4,7 +4,9 @@
 
 """Module containing the sync stages."""
 
+import collections
 import contextlib
+import copy
 import datetime
 import logging
 import os
@@ -17,6 +19,7 @@ from chromite.cbuildbot import failures_lib
 from chromite.cbuildbot import constants
 from chromite.cbuildbot import lkgm_manager
 from chromite.cbuildbot import manifest_version
+from chromite.cbuildbot import remote_try
 from chromite.cbuildbot import repository
 from chromite.cbuildbot import tree_status
 from chromite.cbuildbot import trybot_patch_pool
@@ -849,6 +852,10 @@ class PreCQLauncherStage(SyncStage):
     # were inflight.
     self.inflight = {}
     self.retried = set()
+    # Mapping from changes to their Pre-CQ status. This is refreshed in bulk
+    # once per iteration of the launcher loop and kept up to date with the
+    # status updates made by the launcher itself.
+    self.cl_status = {}
 
   def _HasLaunchTimedOut(self, change):
     """Check whether a given |change| has timed out on its trybot launch.
@@ -896,9 +903,11 @@ class PreCQLauncherStage(SyncStage):
       passed: The set of CLs that have been verified.
     """
     busy, passed = set(), set()
+    updates = collections.defaultdict(list)
 
+    self.cl_status = pool.GetCLStatuses(PRE_CQ, changes)
     for change in changes:
-      status = pool.GetCLStatus(PRE_CQ, change)
+      status = self.cl_status[change]
 
       if status != self.STATUS_LAUNCHING:
         # The trybot is not launching, so we should remove it from our
@@ -928,14 +937,12 @@ class PreCQLauncherStage(SyncStage):
 
             pool.SendNotification(change, '%(details)s', details=msg)
             pool.RemoveCommitReady(change)
-            pool.UpdateCLStatus(PRE_CQ, change, self.STATUS_FAILED,
-                                self._run.options.debug)
+            updates[self.STATUS_FAILED].append(change)
             self.retried.discard(change)
           else:
             # Try the change again.
             self.retried.add(change)
-            pool.UpdateCLStatus(PRE_CQ, change, self.STATUS_WAITING,
-                                self._run.options.debug)
+            updates[self.STATUS_WAITING].append(change)
       elif status == self.STATUS_INFLIGHT:
         # Once a Pre-CQ run actually starts, it'll set the status to
         # STATUS_INFLIGHT.
@@ -954,41 +961,80 @@ class PreCQLauncherStage(SyncStage):
 
           pool.SendNotification(change, '%(details)s', details=msg)
           pool.RemoveCommitReady(change)
-          pool.UpdateCLStatus(PRE_CQ, change, self.STATUS_FAILED,
-                              self._run.options.debug)
+          updates[self.STATUS_FAILED].append(change)
       elif status == self.STATUS_FAILED:
         # The Pre-CQ run failed for this change. It's possible that we got
         # unlucky and this change was just marked as 'Not Ready' by a bot. To
         # test this, mark the CL as 'waiting' for now. If the CL is still marked
         # as 'Ready' next time we check, we'll know the CL is truly still ready.
         busy.add(change)
-        pool.UpdateCLStatus(PRE_CQ, change, self.STATUS_WAITING,
-                            self._run.options.debug)
+        updates[self.STATUS_WAITING].append(change)
         self._PrintPatchStatus(change, 'failed')
       elif status == self.STATUS_PASSED:
         passed.add(change)
         self._PrintPatchStatus(change, 'passed')
 
+    self._UpdateCLStatuses(pool, updates)
     return busy, passed
 
-  def LaunchTrybot(self, pool, plan):
-    """Launch a Pre-CQ run with the provided list of CLs.
+  def _UpdateCLStatuses(self, pool, updates):
+    """Concurrently apply status |updates| and record them in self.cl_status.
 
     Args:
-      pool: ValidationPool corresponding to |plan|.
-      plan: The list of patches to test in the Pre-CQ run.
+      pool: The validation pool.
+      updates: A dictionary mapping statuses to the changes to set them on.
+    """
+    for status, changes in updates.iteritems():
+      pool.UpdateCLStatuses(PRE_CQ, changes, status, self._run.options.debug)
+      for change in changes:
+        self.cl_status[change] = status
+
+  def _CreateTryJob(self, plan):
+    """Create a remote Pre-CQ tryjob that tests the patches in |plan|.
+
+    This is equivalent to running
+      cbuildbot --remote pre-cq -g <patch> -g <patch> ...
+    but lets several tryjobs share a single push to the tryjob repo.
     """
-    cmd = ['cbuildbot', '--remote', constants.PRE_CQ_BUILDER_NAME]
+    options = copy.copy(self._run.options)
+    options.gerrit_patches = [cros_patch.AddPrefix(patch, patch.gerrit_number)
+                              for patch in plan]
+    options.local_patches = []
+    options.remote_description = None
+    options.slaves = []
+    options.sourceroot = self._build_root
+    options.pass_through_args = []
+    for patch_id in options.gerrit_patches:
+      options.pass_through_args += ['-g', patch_id]
     if self._run.options.debug:
-      cmd.append('--debug')
-    for patch in plan:
-      cmd += ['-g', cros_patch.AddPrefix(patch, patch.gerrit_number)]
-      self._PrintPatchStatus(patch, 'testing')
-    cros_build_lib.RunCommand(cmd, cwd=self._build_root)
-    for patch in plan:
-      if pool.GetCLStatus(PRE_CQ, patch) != self.STATUS_PASSED:
-        pool.UpdateCLStatus(PRE_CQ, patch, self.STATUS_LAUNCHING,
-                            self._run.options.debug)
+      options.pass_through_args.append('--debug')
+    return remote_try.RemoteTryJob(options, [constants.PRE_CQ_BUILDER_NAME], [])
+
+  def LaunchTrybots(self, pool, plans):
+    """Launch Pre-CQ runs for each of the provided lists of CLs.
+
+    All of the runs are submitted with a single push to the tryjob repo, and
+    the statuses of the CLs are updated concurrently.
+
+    Args:
+      pool: ValidationPool corresponding to |plans|.
+      plans: A list of plans. Each plan is the list of patches to test in one
+        Pre-CQ run.
+    """
+    if not plans:
+      return
+    for plan in plans:
+      for patch in plan:
+        self._PrintPatchStatus(patch, 'testing')
+    remote_try.SubmitJobs([self._CreateTryJob(plan) for plan in plans])
+
+    # A CL may have passed while the jobs were being submitted, so re-read
+    # the statuses rather than trusting the ones we read before the launch.
+    patches = [patch for plan in plans for patch in plan]
+    statuses = pool.GetCLStatuses(PRE_CQ, patches)
+    launched = [patch for patch in patches
+                if statuses[patch] != self.STATUS_PASSED]
+    self._UpdateCLStatuses(pool, {self.STATUS_LAUNCHING: launched})
 
   def GetDisjointTransactionsToTest(self, pool, changes):
     """Get the list of disjoint transactions to test.
@@ -1039,8 +1085,8 @@ class PreCQLauncherStage(SyncStage):
       pool.SubmitNonManifestChanges(check_tree_open=False)
 
     # Launch trybots for manifest changes.
-    for plan in self.GetDisjointTransactionsToTest(pool, changes):
-      self.LaunchTrybot(pool, plan)
+    plans = list(self.GetDisjointTransactionsToTest(pool, changes))
+    self.LaunchTrybots(pool, plans)
 
     # Tell ValidationPool to keep waiting for more changes until we hit
     # its internal timeout.
@@ -17,6 +17,7 @@ from chromite.cbuildbot import constants
 from chromite.cbuildbot import lkgm_manager
 from chromite.cbuildbot import manifest_version
 from chromite.cbuildbot import manifest_version_unittest
+from chromite.cbuildbot import remote_try
 from chromite.cbuildbot import repository
 from chromite.cbuildbot import tree_status
 from chromite.cbuildbot import validation_pool
@@ -293,7 +294,8 @@ class CLStatusMock(partial_mock.PartialMock):
   """Partial mock for CLStatus methods in ValidationPool."""
 
   TARGET = 'chromite.cbuildbot.validation_pool.ValidationPool'
-  ATTRS = ('GetCLStatus', 'GetCLStatusCount', 'UpdateCLStatus',)
+  ATTRS = ('GetCLStatus', 'GetCLStatuses', 'GetCLStatusCount',
+           'UpdateCLStatus', 'UpdateCLStatuses',)
 
   def __init__(self, treat_launching_as_inflight=False):
     """CLStatusMock constructor.
@@ -317,6 +319,9 @@ class CLStatusMock(partial_mock.PartialMock):
       return validation_pool.ValidationPool.STATUS_INFLIGHT
     return status
 
+  def GetCLStatuses(self, bot, changes):
+    return dict((change, self.GetCLStatus(bot, change)) for change in changes)
+
   def GetCLStatusCount(self, _bot, change, count, latest_patchset_only=True):
     # pylint: disable=W0613
     return self.status_count.get(change, 0)
@@ -327,6 +332,10 @@ class CLStatusMock(partial_mock.PartialMock):
     self.status[change] = status
     self.status_count[change] = self.status_count.get(change, 0) + 1
 
+  def UpdateCLStatuses(self, bot, changes, status, dry_run):
+    for change in changes:
+      self.UpdateCLStatus(bot, change, status, dry_run)
+
 
 class PreCQLauncherStageTest(MasterCQSyncTest):
   """Tests for the PreCQLauncherStage."""
@@ -337,6 +346,8 @@ class PreCQLauncherStageTest(MasterCQSyncTest):
 
   def setUp(self):
     self.PatchObject(time, 'sleep', autospec=True)
+    self.job_mock = self.PatchObject(remote_try, 'RemoteTryJob')
+    self.submit_mock = self.PatchObject(remote_try, 'SubmitJobs')
 
   def _PrepareValidationPoolMock(self, auto_launch=False):
     # pylint: disable-msg=W0201
@@ -348,6 +359,11 @@ class PreCQLauncherStageTest(MasterCQSyncTest):
 
     self.sync_stage = sync_stages.PreCQLauncherStage(self._run)
 
+  def _MakePool(self):
+    """Return a ValidationPool to pass to the stage's methods."""
+    return validation_pool.ValidationPool(
+        constants.PUBLIC_OVERLAYS, self.build_root, 1, self.BOT_ID, True, True)
+
   def testTreeClosureIsOK(self):
     """Test that tree closures block commits."""
     self._PrepareValidationPoolMock()
@@ -359,6 +375,43 @@ class PreCQLauncherStageTest(MasterCQSyncTest):
     self.testCommitManifestChange()
     self.assertEqual(self.pre_cq.status.values(), [self.STATUS_LAUNCHING])
     self.assertEqual(self.pre_cq.calls.keys(), [self.STATUS_LAUNCHING])
+    self.assertEqual(self.submit_mock.call_count, 1)
+    options, bots, local_patches = self.job_mock.call_args[0]
+    self.assertEqual(bots, [constants.PRE_CQ_BUILDER_NAME])
+    self.assertEqual(local_patches, [])
+    self.assertEqual(options.gerrit_patches, ['1234'])
+    self.assertEqual(options.pass_through_args[:2], ['-g', '1234'])
+
+  def testLaunchTrybotsBatchesSubmission(self):
+    """Test that several plans are submitted with a single push."""
+    self._PrepareValidationPoolMock()
+    self.sync_stage.cl_status = {}
+    patches = [MockPatch(remote='cros') for _ in range(3)]
+    for i, patch in enumerate(patches):
+      patch.gerrit_number = str(1000 + i)
+    self.sync_stage.LaunchTrybots(self._MakePool(), [[x] for x in patches])
+    self.assertEqual(self.submit_mock.call_count, 1)
+    jobs, = self.submit_mock.call_args[0]
+    self.assertEqual(len(jobs), len(patches))
+    self.assertEqual([x[0][0].gerrit_patches
+                      for x in self.job_mock.call_args_list],
+                     [[x.gerrit_number] for x in patches])
+
+  def testLaunchTrybotsSkipsPassedCLs(self):
+    """Test that CLs that passed during the launch are not marked launching."""
+    self._PrepareValidationPoolMock()
+    patches = [MockPatch(remote='cros') for _ in range(2)]
+    for i, patch in enumerate(patches):
+      patch.gerrit_number = str(1000 + i)
+    # The statuses read before the launch are stale.
+    self.sync_stage.cl_status = dict.fromkeys(patches, None)
+    self.pre_cq.status[patches[0]] = (
+        validation_pool.ValidationPool.STATUS_PASSED)
+    self.sync_stage.LaunchTrybots(self._MakePool(), [patches])
+    self.assertEqual(self.pre_cq.status[patches[0]],
+                     validation_pool.ValidationPool.STATUS_PASSED)
+    self.assertEqual(self.pre_cq.status[patches[1]], self.STATUS_LAUNCHING)
+    self.assertEqual(self.pre_cq.calls, {self.STATUS_LAUNCHING: 1})
 
   def runTrybotTest(self, launching, waiting, failed, runs):
     """Helper function for testing PreCQLauncher.
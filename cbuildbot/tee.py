@@ -4,8 +4,10 @@
 
 """Module that handles tee-ing output to a file."""
 
+import collections
 import errno
 import fcntl
+import gzip
 import os
 import multiprocessing
 import select
@@ -16,8 +18,13 @@ import traceback
 from chromite.lib import cros_build_lib
 
 
-# Max amount of data we're hold in the buffer at a given time.
-_BUFSIZE = 1024
+# Max amount of data we read from the pipe at a time.
+_BUFSIZE = 64 * 1024
+
+# Max amount of data we hold for an output file that cannot keep up. Once an
+# output file has this much data pending, we stop reading from the pipe until
+# it catches up, which in turn blocks the writers.
+_MAX_PENDING = 4 * 1024 * 1024
 
 # Custom signal handlers so we can catch the exception and handle
 # it.
@@ -35,50 +42,134 @@ def _TeeProcessSignalHandler(signum, frame):
   """
   raise ToldToDie(signum)
 
-def _output(line, output_files, complain):
-  """Print line to output_files.
 
-  Args:
-    line: Line to print.
-    output_files: List of files to print to.
-    complain: Print a warning if we get EAGAIN errors. Only one error
-              is printed per line.
-  """
-  for f in output_files:
-    offset = 0
-    while offset < len(line):
-      select.select([], [f], [])
+class _Output(object):
+  """An output file along with the data still waiting to be written to it."""
+
+  def __init__(self, f):
+    self.file = f
+    self.pending = collections.deque()
+    self.pending_size = 0
+    self.offset = 0
+
+  def Add(self, data):
+    """Queue |data| to be written to the file."""
+    self.pending.append(data)
+    self.pending_size += len(data)
+
+  def Write(self, complain, outputs):
+    """Write as much pending data as the file accepts without blocking.
+
+    Args:
+      complain: Print a warning to |outputs| on short writes.
+      outputs: List of all _Output objects.
+    """
+    data = self.pending[0]
+    if isinstance(self.file, file):
       try:
-        offset += os.write(f.fileno(), line[offset:])
+        written = os.write(self.file.fileno(), data[self.offset:])
       except OSError as ex:
-        if ex.errno == errno.EINTR:
-          continue
-        elif ex.errno != errno.EAGAIN:
+        if ex.errno not in (errno.EINTR, errno.EAGAIN):
           raise
+        written = 0
+    else:
+      # Compressed files are regular files and never block.
+      self.file.write(data[self.offset:])
+      written = len(data) - self.offset
+
+    self.offset += written
+    self.pending_size -= written
+    if self.offset == len(data):
+      self.pending.popleft()
+      self.offset = 0
+    elif complain:
+      f = self.file
+      flags = fcntl.fcntl(f.fileno(), fcntl.F_GETFL, 0)
+      if flags & os.O_NONBLOCK:
+        _Queue('\nWarning: %s/%d is non-blocking.\n' % (f.name, f.fileno()),
+               outputs)
+      _Queue('\nWarning: Short write for %s/%d.\n' % (f.name, f.fileno()),
+             outputs)
+
+  def Flush(self):
+    """Write all pending data, blocking if necessary."""
+    while self.pending:
+      select.select([], [self.file], [])
+      self.Write(False, [])
+
+
+def _Queue(data, outputs):
+  """Queue |data| to be written to all |outputs|."""
+  for output in outputs:
+    output.Add(data)
+
+
+def _Drain(input_fd, outputs):
+  """Queue whatever data is already in input_fd without waiting for more."""
+  flags = fcntl.fcntl(input_fd, fcntl.F_GETFL, 0)
+  fcntl.fcntl(input_fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+  while True:
+    try:
+      data = os.read(input_fd, _BUFSIZE)
+    except OSError as ex:
+      if ex.errno == errno.EINTR:
+        continue
+      elif ex.errno != errno.EAGAIN:
+        raise
+      break
+    if not data:
+      break
+    _Queue(data, outputs)
 
-      if offset < len(line) and complain:
-        flags = fcntl.fcntl(f.fileno(), fcntl.F_GETFL, 0)
-        if flags & os.O_NONBLOCK:
-          warning = '\nWarning: %s/%d is non-blocking.\n' % (f.name,
-                                                             f.fileno())
-          _output(warning, output_files, False)
 
-        warning = '\nWarning: Short write for %s/%d.\n' % (f.name,
-                                                           f.fileno())
-        _output(warning, output_files, False)
+def _tee(input_fd, outputs, complain, max_pending=_MAX_PENDING):
+  """Copy data from input_fd to all outputs.
 
+  Data is copied in large blocks rather than line by line. Each output has its
+  own queue of pending data, so a slow output (e.g. a terminal) does not
+  delay the others until it falls |max_pending| bytes behind.
 
-def _tee(input_file, output_files, complain):
-  """Read lines from input_file and write to output_files."""
-  for line in iter(lambda: input_file.readline(_BUFSIZE), ''):
-    _output(line, output_files, complain)
+  Args:
+    input_fd: The fd to read from until EOF.
+    outputs: List of _Output objects to write to.
+    complain: Print a warning if we get short writes.
+    max_pending: Max number of bytes to buffer for a single output.
+  """
+  eof = False
+  while not eof or any(x.pending for x in outputs):
+    readers = []
+    if not eof and all(x.pending_size < max_pending for x in outputs):
+      readers.append(input_fd)
+    writers = [x.file for x in outputs if x.pending]
+    try:
+      readable, writable, _ = select.select(readers, writers, [])
+    except select.error as ex:
+      if ex.args[0] == errno.EINTR:
+        continue
+      raise
+
+    if readable:
+      try:
+        data = os.read(input_fd, _BUFSIZE)
+      except OSError as ex:
+        if ex.errno != errno.EINTR:
+          raise
+      else:
+        if data:
+          _Queue(data, outputs)
+        else:
+          eof = True
+
+    for output in outputs:
+      if output.file in writable:
+        output.Write(complain, outputs)
 
 
 class _TeeProcess(multiprocessing.Process):
   """Replicate output to multiple file handles."""
 
   def __init__(self, output_filenames, complain, error_fd,
-               master_pid):
+               master_pid, compress=False):
     """Write to stdout and supplied filenames.
 
     Args:
@@ -87,11 +178,13 @@ class _TeeProcess(multiprocessing.Process):
       error_fd: The fd to write exceptions/errors to during
         shutdown.
       master_pid: Pid to SIGTERM if we shutdown uncleanly.
+      compress: Whether to gzip the data written to |output_filenames|.
     """
 
     self._reader_pipe, self.writer_pipe = os.pipe()
     self._output_filenames = output_filenames
     self._complain = complain
+    self._compress = compress
     # Dupe the fd on the offchance it's stdout/stderr,
     # which we screw with.
     self._error_handle = os.fdopen(os.dup(error_fd), 'w', 0)
@@ -114,6 +207,7 @@ class _TeeProcess(multiprocessing.Process):
     """Main function for tee subprocess."""
 
     failed = True
+    outputs = []
     try:
       signal.signal(signal.SIGINT, _TeeProcessSignalHandler)
       signal.signal(signal.SIGTERM, _TeeProcessSignalHandler)
@@ -121,19 +215,25 @@ class _TeeProcess(multiprocessing.Process):
       # Cleanup every fd except for what we use.
       self._CloseUnnecessaryFds()
 
-      # Read from the pipe.
-      input_file = os.fdopen(self._reader_pipe, 'r', 0)
-
       # Create list of files to write to.
-      output_files = [os.fdopen(sys.stdout.fileno(), 'w', 0)]
+      outputs.append(_Output(os.fdopen(sys.stdout.fileno(), 'w', 0)))
       for filename in self._output_filenames:
-        output_files.append(open(filename, 'w', 0))
-
-      # Read all lines from input_file and write to output_files.
-      _tee(input_file, output_files, self._complain)
+        if self._compress:
+          f = gzip.open(filename, 'wb')
+        else:
+          f = open(filename, 'w', 0)
+        outputs.append(_Output(f))
+
+      # Copy everything from the pipe to the output files.
+      _tee(self._reader_pipe, outputs, self._complain)
       failed = False
     except ToldToDie:
       failed = False
+      try:
+        _Drain(self._reader_pipe, outputs)
+      except Exception as e:
+        self._error_handle.write('\nTee failed reading remaining output: %s\n'
+                                 % e)
     except Exception as e:
       tb = traceback.format_exc()
       cros_build_lib.PrintBuildbotStepFailure(self._error_handle)
@@ -144,7 +244,18 @@ class _TeeProcess(multiprocessing.Process):
 
     finally:
       # Close input file.
-      input_file.close()
+      os.close(self._reader_pipe)
+
+      # Write out whatever we still hold, so that the log of a dying build
+      # is complete, and close the files so compressed logs are finalized.
+      # The log files go first, as stdout is the output most likely to block.
+      for output in outputs[1:] + outputs[:1]:
+        try:
+          output.Flush()
+          output.file.close()
+        except Exception as e:
+          self._error_handle.write('\nTee failed flushing %s: %s\n' %
+                                   (output.file.name, e))
 
       if failed:
         try:
@@ -162,10 +273,16 @@ class _TeeProcess(multiprocessing.Process):
 
 class Tee(cros_build_lib.MasterPidContextManager):
   """Class that handles tee-ing output to a file."""
-  def __init__(self, output_file):
-    """Initializes object with path to log file."""
+  def __init__(self, output_file, compress=False):
+    """Initializes object with path to log file.
+
+    Args:
+      output_file: The file to write the output to.
+      compress: Whether to gzip |output_file|.
+    """
     cros_build_lib.MasterPidContextManager.__init__(self)
     self._file = output_file
+    self._compress = compress
     self._old_stdout = None
     self._old_stderr = None
     self._old_stdout_fd = None
@@ -189,7 +306,7 @@ class Tee(cros_build_lib.MasterPidContextManager):
 
     # Create a tee subprocess.
     self._tee = _TeeProcess([self._file], True, self._old_stderr_fd,
-                            os.getpid())
+                            os.getpid(), compress=self._compress)
     self._tee.start()
 
     # Redirect stdout and stderr to the tee subprocess.
@@ -0,0 +1,162 @@
+#!/usr/bin/python
+# Copyright 2014 The Chromium OS Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Unittests for tee.py."""
+
+import gzip
+import os
+import signal
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__)))))
+
+from chromite.cbuildbot import tee
+from chromite.lib import cros_test_lib
+from chromite.lib import osutils
+
+
+# pylint: disable=W0212
+
+
+class _SlowOutput(tee._Output):
+  """An output that accepts at most |chunk| bytes per write."""
+
+  def __init__(self, f, chunk):
+    tee._Output.__init__(self, f)
+    self.chunk = chunk
+    self.max_pending_size = 0
+
+  def Add(self, data):
+    tee._Output.Add(self, data)
+    self.max_pending_size = max(self.max_pending_size, self.pending_size)
+
+  def Write(self, complain, outputs):
+    data = self.pending[0]
+    if len(data) - self.offset > self.chunk:
+      # Split the pending block so only |chunk| bytes are written.
+      self.pending.popleft()
+      self.pending.appendleft(data[self.offset + self.chunk:])
+      self.pending.appendleft(data[:self.offset + self.chunk])
+    tee._Output.Write(self, complain, outputs)
+
+
+class TeeTest(cros_test_lib.TempDirTestCase):
+  """Tests of the tee helpers."""
+
+  def _WriteInput(self, data):
+    """Return an fd to read |data| from."""
+    path = os.path.join(self.tempdir, 'input')
+    osutils.WriteFile(path, data)
+    return os.open(path, os.O_RDONLY)
+
+  def testCopiesToAllOutputs(self):
+    """All data is copied to every output, compressed or not."""
+    data = ''.join('line %d\n' % i for i in xrange(50000))
+    plain = os.path.join(self.tempdir, 'plain')
+    compressed = os.path.join(self.tempdir, 'compressed.gz')
+    outputs = [tee._Output(open(plain, 'w', 0)),
+               tee._Output(gzip.open(compressed, 'wb'))]
+    input_fd = self._WriteInput(data)
+    try:
+      tee._tee(input_fd, outputs, False, max_pending=1024)
+    finally:
+      os.close(input_fd)
+    for output in outputs:
+      output.file.close()
+    self.assertEqual(osutils.ReadFile(plain), data)
+    self.assertEqual(gzip.open(compressed).read(), data)
+
+  def testBoundedBuffering(self):
+    """A slow output stops the reads once it falls |max_pending| behind."""
+    data = ''.join('line %d\n' % i for i in xrange(50000))
+    fast_path = os.path.join(self.tempdir, 'fast')
+    slow_path = os.path.join(self.tempdir, 'slow')
+    fast = tee._Output(open(fast_path, 'w', 0))
+    slow = _SlowOutput(open(slow_path, 'w', 0), 1000)
+    input_fd = self._WriteInput(data)
+    try:
+      tee._tee(input_fd, [fast, slow], False, max_pending=4096)
+    finally:
+      os.close(input_fd)
+    fast.file.close()
+    slow.file.close()
+    # Nothing is read while 4096 bytes or more are pending, so at most one
+    # more block is ever queued on top of that.
+    self.assertLess(slow.max_pending_size, 4096 + tee._BUFSIZE)
+    self.assertEqual(osutils.ReadFile(fast_path), data)
+    self.assertEqual(osutils.ReadFile(slow_path), data)
+
+  def testDrainCompressed(self):
+    """Drained data ends up in the compressed output once flushed."""
+    plain = os.path.join(self.tempdir, 'plain')
+    compressed = os.path.join(self.tempdir, 'compressed.gz')
+    outputs = [tee._Output(open(plain, 'w', 0)),
+               tee._Output(gzip.open(compressed, 'wb'))]
+    data = 'pending data\n' * 1000
+    reader, writer = os.pipe()
+    try:
+      os.write(writer, data)
+      tee._Drain(reader, outputs)
+    finally:
+      os.close(reader)
+      os.close(writer)
+    for output in outputs:
+      output.Flush()
+      output.file.close()
+    self.assertEqual(osutils.ReadFile(plain), data)
+    self.assertEqual(gzip.open(compressed).read(), data)
+
+  def testToldToDieCompressed(self):
+    """A tee told to die still writes a complete compressed log."""
+    compressed = os.path.join(self.tempdir, 'log.gz')
+    stdout_path = os.path.join(self.tempdir, 'stdout')
+    data = ''.join('line %d\n' % i for i in xrange(5000))
+
+    # Keep the copy the tee writes to stdout out of the test output.
+    stdout = os.dup(1)
+    with open(stdout_path, 'w') as f:
+      os.dup2(f.fileno(), 1)
+    try:
+      proc = tee._TeeProcess([compressed], False, 2, os.getpid(),
+                             compress=True)
+      proc.start()
+    finally:
+      os.dup2(stdout, 1)
+      os.close(stdout)
+
+    try:
+      # Once the first line is copied to stdout, the signal handlers are in
+      # place.
+      first, rest = data[:7], data[7:]
+      os.write(proc.writer_pipe, first)
+      deadline = time.time() + 60
+      while osutils.ReadFile(stdout_path) != first:
+        self.assertLess(time.time(), deadline)
+        time.sleep(0.01)
+      os.write(proc.writer_pipe, rest)
+      os.kill(proc.pid, signal.SIGTERM)
+      proc.join()
+    finally:
+      os.close(proc.writer_pipe)
+      os.close(proc._reader_pipe)
+    self.assertEqual(gzip.open(compressed).read(), data)
+
+  def testDrain(self):
+    """_Drain queues buffered data without waiting for EOF."""
+    reader, writer = os.pipe()
+    try:
+      os.write(writer, 'pending data')
+      output = tee._Output(None)
+      tee._Drain(reader, [output])
+      self.assertEqual(''.join(output.pending), 'pending data')
+    finally:
+      os.close(reader)
+      os.close(writer)
+
+
+if __name__ == '__main__':
+  cros_test_lib.main()
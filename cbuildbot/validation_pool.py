@@ -777,9 +777,14 @@ class PatchSeries(object):
 
     If we're an external builder, internal changes are filtered out.
 
+    The git objects for the changes are first fetched in bulk: one `git fetch`
+    per repository, with the repositories fetched in parallel.  Each change is
+    then fetched individually, which only needs to read the local repository.
+
     Returns:
       An iterator over a list of the filtered changes.
     """
+    to_fetch = []
     for change in changes:
       try:
         self._helper_pool.ForChange(change)
@@ -787,9 +792,33 @@ class PatchSeries(object):
         # Internal patches are irrelevant to external builders.
         logging.info("Skipping internal patch: %s", change)
         continue
-      change.Fetch(self.GetGitRepoForChange(change, strict=True))
+      to_fetch.append((change, self.GetGitRepoForChange(change, strict=True)))
+
+    self._PrefetchChanges(to_fetch)
+
+    for change, git_repo in to_fetch:
+      change.Fetch(git_repo)
       yield change
 
+  @staticmethod
+  def _PrefetchChanges(changes_and_repos):
+    """Fetch the git objects for the given changes, one repository at a time.
+
+    Args:
+      changes_and_repos: A sequence of (change, git_repo) tuples.
+    """
+    changes_by_repo = {}
+    for change, git_repo in changes_and_repos:
+      changes_by_repo.setdefault(git_repo, []).append(change)
+
+    steps = [functools.partial(cros_patch.PrefetchPatches, git_repo, patches)
+             for git_repo, patches in sorted(changes_by_repo.items())]
+    if len(steps) > 1:
+      parallel.RunParallelSteps(steps)
+    else:
+      for step in steps:
+        step()
+
   @_ManifestDecorator
   def Apply(self, changes, frozen=True, honor_ordering=False,
             changes_filter=None):
@@ -864,20 +893,11 @@ class PatchSeries(object):
         return -len(ids), position[data[0]]
       resolved.sort(key=mk_key)
 
-    for inducing_change, transaction_changes in resolved:
-      try:
-        with self._Transaction(transaction_changes):
-          logging.debug("Attempting transaction for %s: changes: %s",
-                        inducing_change,
-                        ', '.join(map(str, transaction_changes)))
-          self._ApplyChanges(inducing_change, transaction_changes)
-      except cros_patch.PatchException as e:
-        logging.info("Failed applying transaction for %s: %s",
-                     inducing_change, e)
-        failed.append(e)
+    for idx, error in self._ApplyTransactions(resolved):
+      if error is None:
+        applied.extend(resolved[idx][1])
       else:
-        applied.extend(transaction_changes)
-        self.InjectCommittedPatches(transaction_changes)
+        failed.append(error)
 
     # Uniquify while maintaining order.
     def _uniq(l):
@@ -895,6 +915,123 @@ class PatchSeries(object):
     failed_inflight = [x for x in failed if x.inflight]
     return applied, failed_tot, failed_inflight
 
+  def _GroupTransactionsByRepo(self, resolved):
+    """Split transactions into groups that touch disjoint git repositories.
+
+    Transactions in different groups cannot affect each other, so each group
+    can be applied independently of the others.
+
+    Args:
+      resolved: A list of (inducing_change, transaction_changes) tuples.
+
+    Returns:
+      A list of groups, each of which is a sorted list of indices into
+      |resolved|.
+    """
+    groups = []
+    for idx, (_, transaction_changes) in enumerate(resolved):
+      repos = set(self.GetGitRepoForChange(x) for x in transaction_changes)
+      indices = [idx]
+      remaining = []
+      for group_repos, group_indices in groups:
+        if group_repos & repos:
+          repos |= group_repos
+          indices.extend(group_indices)
+        else:
+          remaining.append((group_repos, group_indices))
+      groups = remaining + [(repos, sorted(indices))]
+
+    return sorted(indices for _, indices in groups)
+
+  def _ApplyTransactionGroup(self, resolved, indices):
+    """Apply the given transactions in order, rolling back any that fail.
+
+    Args:
+      resolved: A list of (inducing_change, transaction_changes) tuples.
+      indices: The indices of the transactions in |resolved| to apply.
+
+    Returns:
+      A tuple of (results, failed_tot).  |results| is a list of
+      (index, error) tuples, where error is the cros_patch.PatchException the
+      transaction failed with, or None if it applied cleanly.  |failed_tot| is
+      the updated self.failed_tot.
+    """
+    results = []
+    for idx in indices:
+      inducing_change, transaction_changes = resolved[idx]
+      try:
+        with self._Transaction(transaction_changes):
+          logging.debug("Attempting transaction for %s: changes: %s",
+                        inducing_change,
+                        ', '.join(map(str, transaction_changes)))
+          self._ApplyChanges(inducing_change, transaction_changes)
+      except cros_patch.PatchException as e:
+        logging.info("Failed applying transaction for %s: %s",
+                     inducing_change, e)
+        results.append((idx, e))
+      else:
+        self.InjectCommittedPatches(transaction_changes)
+        results.append((idx, None))
+
+    return results, self.failed_tot
+
+  def _ApplyTransactions(self, resolved):
+    """Apply a list of transactions, in order.
+
+    Transactions that touch disjoint sets of git repositories are applied in
+    parallel.  Within each set of repositories, the transactions are applied
+    serially in the order given, so dependency ordering and rollback behave
+    exactly as if everything was applied serially.
+
+    Args:
+      resolved: A list of (inducing_change, transaction_changes) tuples.
+
+    Returns:
+      A list of (index, error) tuples, sorted by index.  See
+      _ApplyTransactionGroup for details.
+    """
+    groups = self._GroupTransactionsByRepo(resolved)
+    if len(groups) <= 1:
+      return self._ApplyTransactionGroup(resolved, range(len(resolved)))[0]
+
+    steps = [functools.partial(self._ApplyTransactionGroup, resolved, x)
+             for x in groups]
+    # The errors were pickled in the background processes, so point them
+    # back at our own copies of the changes.
+    changes = dict((x.id, x) for _, plan in resolved for x in plan)
+    results = []
+    for group_results, failed_tot in parallel.RunParallelSteps(
+        steps, return_values=True):
+      for idx, error in group_results:
+        if error is None:
+          self.InjectCommittedPatches(resolved[idx][1])
+        else:
+          self._RemapPatchException(error, changes)
+        results.append((idx, error))
+      for change_id, error in failed_tot.iteritems():
+        # Failures known before the fork are already in self.failed_tot.
+        if change_id not in self.failed_tot:
+          self._RemapPatchException(error, changes)
+          self.failed_tot[change_id] = error
+    results.sort(key=lambda x: x[0])
+
+    return results
+
+  @staticmethod
+  def _RemapPatchException(error, changes):
+    """Point |error| and the errors it wraps at the given changes.
+
+    Args:
+      error: A cros_patch.PatchException, e.g. one that was pickled in a
+        background process.
+      changes: A dict mapping change ids to the changes to use instead.
+    """
+    while isinstance(error, cros_patch.PatchException):
+      old = error.patch
+      error.patch = changes.get(old.id, old)
+      error.args = tuple(error.patch if x is old else x for x in error.args)
+      error = getattr(error, 'error', None)
+
   @contextlib.contextmanager
   def _Transaction(self, commits):
     """ContextManager used to rollback changes to a build root if necessary.
@@ -2642,22 +2779,81 @@ class ValidationPool(object):
     Returns:
       The status, as a string.
     """
-    url = cls.GetCLStatusURL(bot, change)
+    return cls._ReadCLStatus(cls.GetCLStatusURL(bot, change))
+
+  @staticmethod
+  def _ReadCLStatus(url, statuses=None):
+    """Return the status stored at |url|, or None if there is none yet.
+
+    If |statuses| is given, the status is also stored in statuses[url].
+    """
     ctx = gs.GSContext()
     try:
-      return ctx.Cat(url).output
+      status = ctx.Cat(url).output
     except gs.GSNoSuchKey:
       logging.debug('No status yet for %r', url)
-      return None
+      status = None
+    if statuses is not None:
+      statuses[url] = status
+    return status
+
+  @classmethod
+  def GetCLStatuses(cls, bot, changes):
+    """Get the status of all of the given |changes| on |bot| in parallel.
+
+    Args:
+      bot: Which bot to look at. Can be CQ or PRE_CQ.
+      changes: GerritPatch instances to operate upon.
+
+    Returns:
+      A dictionary mapping each change to its status, as a string.
+    """
+    urls = dict((change, cls.GetCLStatusURL(bot, change)) for change in changes)
+    if not urls:
+      return {}
+
+    with parallel.Manager() as manager:
+      # Grab the status of all of the CLs in the background, into a proxied
+      # dictionary keyed by URL, as the changes themselves need not be
+      # picklable.
+      statuses = manager.dict()
+      inputs = [[url, statuses] for url in set(urls.itervalues())]
+      parallel.RunTasksInProcessPool(cls._ReadCLStatus, inputs)
+      statuses = dict(statuses)
+
+    return dict((change, statuses[url]) for change, url in urls.iteritems())
+
+  @staticmethod
+  def _WriteCLStatus(url, status, dry_run):
+    """Write |status| to |url| and increment its counter."""
+    ctx = gs.GSContext(dry_run=dry_run)
+    ctx.Copy('-', url, input=status)
+    ctx.Counter('%s/%s' % (url, status)).Increment()
 
   @classmethod
   def UpdateCLStatus(cls, bot, change, status, dry_run):
     """Update the |status| of |change| on |bot|."""
     for latest_patchset_only in (False, True):
       url = cls.GetCLStatusURL(bot, change, latest_patchset_only)
-      ctx = gs.GSContext(dry_run=dry_run)
-      ctx.Copy('-', url, input=status)
-      ctx.Counter('%s/%s' % (url, status)).Increment()
+      cls._WriteCLStatus(url, status, dry_run)
+
+  @classmethod
+  def UpdateCLStatuses(cls, bot, changes, status, dry_run):
+    """Update the |status| of all of the given |changes| on |bot| in parallel.
+
+    Args:
+      bot: Which bot to update. Can be CQ or PRE_CQ.
+      changes: GerritPatch instances to operate upon.
+      status: The new status.
+      dry_run: Whether to skip the actual writes.
+    """
+    inputs = []
+    for change in changes:
+      for latest_patchset_only in (False, True):
+        url = cls.GetCLStatusURL(bot, change, latest_patchset_only)
+        inputs.append([url, status, dry_run])
+    if inputs:
+      parallel.RunTasksInProcessPool(cls._WriteCLStatus, inputs)
 
   @classmethod
   def GetCLStatusCount(cls, bot, change, status, latest_patchset_only=True):
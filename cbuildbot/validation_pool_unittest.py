@@ -210,6 +210,9 @@ class TestPatchSeries(MoxBase):
       helper_pool = self.MakeHelper(cros_internal=True, cros=True)
     series = validation_pool.PatchSeries(self.build_root, helper_pool)
 
+    # Suppress bulk fetching.
+    self.PatchObject(cros_patch, 'PrefetchPatches')
+
     # Suppress transactions.
     series._Transaction = self._ValidateTransactionCall
     series.GetGitRepoForChange = \
@@ -592,6 +595,82 @@ class TestPatchSeries(MoxBase):
     self.assertResults(series, patches, patches)
     self.mox.VerifyAll()
 
+  def testApplyMultipleRepos(self):
+    """Changes in disjoint repos are applied independently of each other."""
+    series = self.GetPatchSeries()
+
+    patch1, patch2 = self.GetPatches(2, project='chromiumos/chromite')
+    patch3, patch4 = self.GetPatches(2, project='chromiumos/overlays/board')
+    patch5 = self.GetPatches(1, project='chromiumos/platform/crosutils')
+
+    self.SetPatchDeps(patch1)
+    self.SetPatchDeps(patch2, [patch1.id])
+    self.SetPatchDeps(patch3)
+    self.SetPatchDeps(patch4, [patch3.id])
+    self.SetPatchDeps(patch5)
+
+    self.SetPatchApply(patch1).AndRaise(
+        cros_patch.ApplyPatchException(patch1))
+    self.SetPatchApply(patch3)
+    self.SetPatchApply(patch4)
+    self.SetPatchApply(patch5)
+
+    self.mox.ReplayAll()
+    with parallel_unittest.ParallelMock():
+      _, failed_tot, _ = self.assertResults(
+          series, [patch1, patch2, patch3, patch4, patch5],
+          [patch3, patch4, patch5], [patch2, patch1])
+    self.mox.VerifyAll()
+
+    # Errors should refer to our copies of the changes.
+    self.assertTrue(any(x.patch is patch1 for x in failed_tot))
+    self.assertIn(patch1.id, series.failed_tot)
+
+  def testApplyMultipleReposDependencyError(self):
+    """Nested errors from parallel groups refer to our copies of changes."""
+    series = self.GetPatchSeries()
+
+    patch1, patch2 = self.GetPatches(2, project='chromiumos/chromite')
+    patch3 = self.GetPatches(1, project='chromiumos/overlays/board')
+
+    self.SetPatchDeps(patch1)
+    self.SetPatchDeps(patch2, [patch1.id])
+    self.SetPatchDeps(patch3)
+
+    self.SetPatchApply(patch1).AndRaise(
+        cros_patch.ApplyPatchException(patch1))
+    self.SetPatchApply(patch3)
+
+    self.mox.ReplayAll()
+    with parallel_unittest.ParallelMock():
+      _, failed_tot, _ = self.assertResults(
+          series, [patch1, patch2, patch3], [patch3], [patch2, patch1])
+    self.mox.VerifyAll()
+
+    errors = dict((x.patch.id, x) for x in failed_tot)
+    error = errors[patch2.id]
+    self.assertTrue(isinstance(error, cros_patch.DependencyError))
+    self.assertIs(error.patch, patch2)
+    self.assertIs(error.error.patch, patch1)
+    self.assertIs(error.args[0], patch2)
+    self.assertIs(errors[patch1.id].patch, patch1)
+    self.assertIs(series.failed_tot[patch1.id].patch, patch1)
+
+  def testGroupTransactionsByRepo(self):
+    """Transactions sharing a repo end up in the same group."""
+    series = self.GetPatchSeries()
+    patch1 = self.GetPatches(1, project='a')
+    patch2 = self.GetPatches(1, project='b')
+    patch3 = self.GetPatches(1, project='c')
+    resolved = [
+        (patch1, [patch1]),
+        (patch2, [patch2]),
+        (patch3, [patch3]),
+        (patch1, [patch1, patch3]),
+    ]
+    self.assertEqual([[0, 2, 3], [1]],
+                     series._GroupTransactionsByRepo(resolved))
+
 
 def MakePool(overlays=constants.PUBLIC_OVERLAYS, build_number=1,
              builder_name='foon', is_master=True, dryrun=True, **kwargs):
@@ -1345,6 +1424,42 @@ class TestCLStatus(MoxBase):
       validation_pool.ValidationPool.PrintLinksToChanges(changes)
       self.assertEqual(len(validation_pool.ValidationPool._CL_STATUS_CACHE), 12)
 
+  def testGetCLStatuses(self):
+    """Test fetching the status of several CLs at once."""
+    changes = self.GetPatches(3)
+    missing_url = validation_pool.ValidationPool.GetCLStatusURL(
+        validation_pool.PRE_CQ, changes[0])
+    def _Cat(url):
+      if url == missing_url:
+        raise gs.GSNoSuchKey(url)
+      return cros_build_lib.CommandResult(output='status of %s' % url)
+    self.PatchObject(gs.GSContext, 'Cat', side_effect=_Cat)
+    with parallel_unittest.ParallelMock():
+      statuses = validation_pool.ValidationPool.GetCLStatuses(
+          validation_pool.PRE_CQ, changes)
+    self.assertEqual(statuses[changes[0]], None)
+    for change in changes[1:]:
+      url = validation_pool.ValidationPool.GetCLStatusURL(
+          validation_pool.PRE_CQ, change)
+      self.assertEqual(statuses[change], 'status of %s' % url)
+
+  def testUpdateCLStatuses(self):
+    """Test updating the status of several CLs at once."""
+    changes = self.GetPatches(3)
+    copy_mock = self.PatchObject(gs.GSContext, 'Copy')
+    self.PatchObject(gs.GSContext, 'Counter')
+    with parallel_unittest.ParallelMock():
+      validation_pool.ValidationPool.UpdateCLStatuses(
+          validation_pool.PRE_CQ, changes,
+          validation_pool.ValidationPool.STATUS_LAUNCHING, True)
+    urls = set(x[0][1] for x in copy_mock.call_args_list)
+    expected = set()
+    for change in changes:
+      for latest_patchset_only in (False, True):
+        expected.add(validation_pool.ValidationPool.GetCLStatusURL(
+            validation_pool.PRE_CQ, change, latest_patchset_only))
+    self.assertEqual(urls, expected)
+
 
 class TestCreateValidationFailureMessage(Base):
   """Tests validation_pool.ValidationPool._CreateValidationFailureMessage"""
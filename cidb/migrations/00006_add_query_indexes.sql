@@ -0,0 +1,10 @@
+-- Indexes to support the read side query API in lib/cidb.py.
+ALTER TABLE buildTable
+  ADD INDEX (build_config, start_time),
+  ADD INDEX (start_time);
+
+ALTER TABLE buildStageTable
+  ADD INDEX (name, build_id);
+
+INSERT INTO schemaVersionTable (schemaVersion, scriptName) VALUES
+  (6, '00006_add_query_indexes.sql');
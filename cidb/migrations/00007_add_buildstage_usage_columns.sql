@@ -0,0 +1,10 @@
+-- Resources used by each build stage, as recorded in metadata.json.
+ALTER TABLE buildStageTable
+  ADD COLUMN cpu_user_seconds FLOAT,
+  ADD COLUMN cpu_sys_seconds FLOAT,
+  ADD COLUMN io_read_bytes BIGINT,
+  ADD COLUMN io_write_bytes BIGINT,
+  ADD COLUMN memory_max_usage_bytes BIGINT;
+
+INSERT INTO schemaVersionTable (schemaVersion, scriptName) VALUES
+  (7, '00007_add_buildstage_usage_columns.sql');
@@ -5,11 +5,12 @@
 """Install/copy the image to the device."""
 
 import cStringIO
+import functools
+import glob
 import logging
 import os
 import shutil
 import tempfile
-import time
 import urlparse
 
 from chromite import cros
@@ -17,6 +18,7 @@ from chromite.cbuildbot import constants
 from chromite.lib import cros_build_lib
 from chromite.lib import dev_server_wrapper as ds_wrapper
 from chromite.lib import osutils
+from chromite.lib import parallel
 from chromite.lib import remote_access
 
 
@@ -107,8 +109,7 @@ def TranslateImagePath(path, board, debug=False):
     A translated path that uniquely identifies one build:
       build-id/version/image_name
   """
-  ds = ds_wrapper.DevServerWrapper(static_dir=DEVSERVER_STATIC_DIR,
-                                   board=board)
+  ds = ds_wrapper.ReusableDevServerWrapper(DEVSERVER_STATIC_DIR, board=board)
   req = GenerateXbuddyRequest(path, 'translate')
   logging.info('Starting local devserver to get image path...')
   try:
@@ -189,7 +190,8 @@ def DevserverURLToLocalPath(url, static_dir, file_type):
 class USBImager(object):
   """Copy image to the target removable device."""
 
-  def __init__(self, device, board, image, debug=False, yes=False):
+  def __init__(self, device, board, image, debug=False, yes=False,
+               verify=False):
     """Initalizes USBImager."""
     self.device = device
     self.board = board if board else cros_build_lib.GetDefaultBoard()
@@ -197,6 +199,7 @@ class USBImager(object):
     self.debug = debug
     self.debug_level = logging.DEBUG if debug else logging.INFO
     self.yes = yes
+    self.verify = verify
 
   def DeviceNameToPath(self, device_name):
     return '/dev/%s' % device_name
@@ -248,22 +251,20 @@ class USBImager(object):
   def CopyImageToDevice(self, image, device):
     """Copies |image| to the removable |device|.
 
+    Only the partition tables and the partitions of |image| are written, see
+    cros_write_image.
+
     Args:
       image: Path to the image to copy.
       device: Device to copy to.
     """
-    # Use pv to display progress bar if possible.
-    cmd_base = 'pv -pretb'
-    try:
-      cros_build_lib.RunCommand(['pv', '--version'], print_cmd=False,
-                                capture_output=True)
-    except cros_build_lib.RunCommandError:
-      cmd_base = 'cat'
-
-    cmd = '%s %s | dd of=%s bs=4M iflag=fullblock oflag=sync' % (
-        cmd_base, image, device)
-    cros_build_lib.SudoRunCommand(cmd, shell=True)
-    cros_build_lib.SudoRunCommand(['sync'], debug_level=self.debug_level)
+    cmd = [os.path.join(constants.CHROMITE_BIN_DIR, 'cros_write_image'),
+           image, device]
+    if self.verify:
+      cmd.append('--verify')
+    if self.debug:
+      cmd.append('--debug')
+    cros_build_lib.SudoRunCommand(cmd, debug_level=self.debug_level)
 
   def GetImagePathFromDevserver(self, path):
     """Gets image path from devserver.
@@ -277,8 +278,8 @@ class USBImager(object):
     Returns:
       A local path to the image.
     """
-    ds = ds_wrapper.DevServerWrapper(static_dir=DEVSERVER_STATIC_DIR,
-                                     board=self.board)
+    ds = ds_wrapper.ReusableDevServerWrapper(DEVSERVER_STATIC_DIR,
+                                             board=self.board)
     req = GenerateXbuddyRequest(path, 'image')
     logging.info('Starting a local devserver to stage image...')
     try:
@@ -397,16 +398,50 @@ class RemoteDeviceUpdater(object):
   DEVSERVER_FILENAME = 'devserver.py'
   STATEFUL_UPDATE_BIN = '/usr/bin/stateful_update'
   UPDATE_ENGINE_BIN = 'update_engine_client'
-  UPDATE_CHECK_INTERVAL = 10
+  # The status is polled on the device, so this can be short.
+  UPDATE_CHECK_INTERVAL = 2
+  # Starts the update and watches the status of the update engine on the
+  # device until it is done. Changes of the status are streamed to stderr and
+  # the final status is printed to stdout, so that a single ssh session
+  # replaces connecting to the device for every status check.
+  UPDATE_WATCH_SCRIPT = """
+%(bin)s -check_for_update -omaha_url=%(omaha_url)s || exit 1
+last=
+while :; do
+  status=$(%(bin)s --status 2>/dev/null)
+  op=$(echo "$status" | sed -n 's/^CURRENT_OP=//p')
+  progress=$(echo "$status" | sed -n 's/^PROGRESS=//p')
+  if [ "$op $progress" != "$last" ]; then
+    echo "Waiting for update...status: $op at progress $progress" >&2
+    last="$op $progress"
+  fi
+  case "$op" in
+    UPDATE_STATUS_UPDATED_NEED_REBOOT|UPDATE_STATUS_IDLE|'') break ;;
+  esac
+  sleep %(interval)d
+done
+echo "$op"
+"""
   # Root working directory on the device. This directory is in the
   # stateful partition and thus has enough space to store the payloads.
   DEVICE_BASE_DIR = '/mnt/stateful_partition/cros-flash'
+  # Local images are copied to directories in the devserver static dir with
+  # this prefix.
+  LOCAL_IMAGE_PREFIX = 'local_image_'
+  MAX_CACHED_LOCAL_IMAGES = 2
 
   def __init__(self, ssh_hostname, ssh_port, image, stateful_update=True,
                rootfs_update=True, clobber_stateful=False, reboot=True,
                board=None, src_image_to_delta=None, wipe=True, debug=False,
-               yes=False, ping=True, disable_verification=False):
-    """Initializes RemoteDeviceUpdater"""
+               yes=False, ping=True, disable_verification=False,
+               payload_board=None):
+    """Initializes RemoteDeviceUpdater
+
+    Args:
+      payload_board: The board the update payloads in |image| were generated
+        for, if known. A device of another board is not updated, unless
+        |board| is given to override the board of the device.
+    """
     if not stateful_update and not rootfs_update:
       cros_build_lib.Die('No update operation to perform. Use -h to see usage.')
 
@@ -415,6 +450,7 @@ class RemoteDeviceUpdater(object):
     self.ssh_port = ssh_port
     self.image = image
     self.board = board
+    self.payload_board = payload_board
     self.src_image_to_delta = src_image_to_delta
     self.do_stateful_update = stateful_update
     self.do_rootfs_update = rootfs_update
@@ -426,11 +462,6 @@ class RemoteDeviceUpdater(object):
     # Do not wipe if debug is set.
     self.wipe = wipe and not debug
     self.yes = yes
-    # The variables below are set if user passes an local image path.
-    # Used to store a copy of the local image.
-    self.image_tempdir = None
-    # Used to store a symlink in devserver's static_dir.
-    self.static_tempdir = None
 
   @classmethod
   def GetUpdateStatus(cls, device, keys=None):
@@ -468,21 +499,36 @@ class RemoteDeviceUpdater(object):
 
     return values
 
-  def UpdateStateful(self, device, payload, clobber=False):
-    """Update the stateful partition of the device.
+  def CopyStatefulUpdate(self, device, payload):
+    """Copy stateful_update and the stateful payload to the device.
+
+    This does not change the device, so it can be done while the rootfs is
+    updated.
 
     Args:
-      device: The ChromiumOSDevice object to update.
+      device: The ChromiumOSDevice object to copy the files to.
       payload: The path to the update payload.
-      clobber: Clobber stateful partition (defaults to False).
     """
     # Copy latest stateful_update to device.
     stateful_update_bin = cros_build_lib.FromChrootPath(
         self.STATEFUL_UPDATE_BIN)
     device.CopyToWorkDir(stateful_update_bin)
-    msg = 'Updating stateful partition'
     logging.info('Copying stateful payload to device...')
     device.CopyToWorkDir(payload)
+
+  def UpdateStateful(self, device, payload, clobber=False, copy=True):
+    """Update the stateful partition of the device.
+
+    Args:
+      device: The ChromiumOSDevice object to update.
+      payload: The path to the update payload.
+      clobber: Clobber stateful partition (defaults to False).
+      copy: Whether to copy the payload to the device first. Pass False if
+        CopyStatefulUpdate was called already.
+    """
+    if copy:
+      self.CopyStatefulUpdate(device, payload)
+    msg = 'Updating stateful partition'
     cmd = ['sh',
            os.path.join(device.work_dir,
                         os.path.basename(self.STATEFUL_UPDATE_BIN)),
@@ -526,6 +572,25 @@ class RemoteDeviceUpdater(object):
     if status != 'UPDATE_STATUS_IDLE':
       raise DeviceUpdateError('Update engine is not idle. Status: %s' % status)
 
+  def WaitForUpdate(self, device, omaha_url):
+    """Updates |device| from |omaha_url| and waits for the update to finish.
+
+    Args:
+      device: The ChromiumOSDevice object to update.
+      omaha_url: The URL of the devserver serving the update.
+    """
+    script = self.UPDATE_WATCH_SCRIPT % {
+        'bin': self.UPDATE_ENGINE_BIN,
+        'omaha_url': cros_build_lib.ShellQuote(omaha_url),
+        'interval': self.UPDATE_CHECK_INTERVAL,
+    }
+    result = device.RunCommand(['sh', '-c', cros_build_lib.ShellQuote(script)],
+                               capture_output=False, redirect_stdout=True)
+    op = result.output.strip()
+    if op != 'UPDATE_STATUS_UPDATED_NEED_REBOOT':
+      raise DeviceUpdateError(
+          'Update failed with unexpected update status: %s' % (op or None))
+
   def UpdateRootfs(self, device, payload, tempdir):
     """Update the rootfs partition of the device.
 
@@ -552,25 +617,7 @@ class RemoteDeviceUpdater(object):
       # client can connect to the devserver.
       omaha_url = ds.GetDevServerURL(
           ip='127.0.0.1', port=ds.port, sub_dir='update/pregenerated')
-      cmd = [self.UPDATE_ENGINE_BIN, '-check_for_update',
-             '-omaha_url=%s' % omaha_url]
-      device.RunCommand(cmd)
-
-      # Loop until update is complete.
-      while True:
-        op, progress = self.GetUpdateStatus(device, ['CURRENT_OP', 'PROGRESS'])
-        logging.info('Waiting for update...status: %s at progress %s',
-                     op, progress)
-
-        if op == 'UPDATE_STATUS_UPDATED_NEED_REBOOT':
-          break
-
-        if op == 'UPDATE_STATUS_IDLE':
-          raise DeviceUpdateError(
-              'Update failed with unexpected update status: %s' % op)
-
-        time.sleep(self.UPDATE_CHECK_INTERVAL)
-
+      self.WaitForUpdate(device, omaha_url)
       ds.Stop()
     except Exception:
       logging.error('Rootfs update failed.')
@@ -588,9 +635,11 @@ class RemoteDeviceUpdater(object):
   def ConvertLocalPathToXbuddyPath(self, path):
     """Converts |path| to an xbuddy path.
 
-    This function copies the image into a temprary directory in chroot
-    and creates a symlink in static_dir for devserver/xbuddy to
-    access.
+    This function copies the image into a directory in static_dir named
+    after the hash of the image, so that xbuddy/devserver can access it. The
+    copy, and the payloads devserver generates for it, are reused when the
+    same image is used again. Only the most recently used
+    MAX_CACHED_LOCAL_IMAGES images are kept.
 
     Args:
       path: Path to an image.
@@ -598,32 +647,37 @@ class RemoteDeviceUpdater(object):
     Returns:
       The xbuddy path for |path|.
     """
-    self.image_tempdir = osutils.TempDir(
-        base_dir=cros_build_lib.FromChrootPath('/tmp'),
-        prefix='cros_flash_local_image',
-        sudo_rm=True)
-
-    tempdir_path = self.image_tempdir.tempdir
-    logging.info('Copying image to temporary directory %s', tempdir_path)
+    image_hash = cros_build_lib.RunCommand(
+        ['sha1sum', path], print_cmd=False,
+        capture_output=True).output.split()[0]
+    image_dir = os.path.join(DEVSERVER_STATIC_DIR,
+                             self.LOCAL_IMAGE_PREFIX + image_hash)
     # Devserver only knows the image names listed in IMAGE_TYPE_TO_NAME.
     # Rename the image to chromiumos_test_image.bin when copying.
     TEMP_IMAGE_TYPE  = 'test'
-    shutil.copy(path,
-                os.path.join(tempdir_path, IMAGE_TYPE_TO_NAME[TEMP_IMAGE_TYPE]))
-    chroot_path = cros_build_lib.ToChrootPath(tempdir_path)
-    # Create and link static_dir/local_imagexxxx/link to the image
-    # folder, so that xbuddy/devserver can understand the path.
-    # Alternatively, we can to pass '--image' at devserver startup,
-    # but this flag is deprecated.
-    self.static_tempdir = osutils.TempDir(base_dir=DEVSERVER_STATIC_DIR,
-                                          prefix='local_image',
-                                          sudo_rm=True)
-    relative_dir = os.path.join(os.path.basename(self.static_tempdir.tempdir),
-                                'link')
-    symlink_path = os.path.join(DEVSERVER_STATIC_DIR, relative_dir)
-    logging.info('Creating a symlink %s -> %s', symlink_path, chroot_path)
-    os.symlink(chroot_path, symlink_path)
-    return os.path.join(relative_dir, TEMP_IMAGE_TYPE)
+    if os.path.isdir(image_dir):
+      logging.info('Using the copy of the image in %s', image_dir)
+      os.utime(image_dir, None)
+    else:
+      # Copy to a temporary directory first, so that an interrupted copy is
+      # never used.
+      tempdir = tempfile.mkdtemp(prefix='.%s' % self.LOCAL_IMAGE_PREFIX,
+                                 dir=DEVSERVER_STATIC_DIR)
+      logging.info('Copying image to %s', image_dir)
+      os.mkdir(os.path.join(tempdir, 'link'))
+      shutil.copy(path, os.path.join(tempdir, 'link',
+                                     IMAGE_TYPE_TO_NAME[TEMP_IMAGE_TYPE]))
+      os.rename(tempdir, image_dir)
+
+    old_dirs = sorted(
+        glob.glob(os.path.join(DEVSERVER_STATIC_DIR,
+                               '%s*' % self.LOCAL_IMAGE_PREFIX)),
+        key=os.path.getmtime, reverse=True)[self.MAX_CACHED_LOCAL_IMAGES:]
+    for old_dir in old_dirs:
+      logging.info('Removing old image copy %s', old_dir)
+      osutils.RmDir(old_dir, ignore_missing=True, sudo=True)
+
+    return os.path.join(os.path.basename(image_dir), 'link', TEMP_IMAGE_TYPE)
 
   def GetUpdatePayloads(self, path, payload_dir, board=None,
                         src_image_to_delta=None, timeout=60 * 15):
@@ -636,8 +690,8 @@ class RemoteDeviceUpdater(object):
       src_image_to_delta: Image used as the base to generate the delta payloads.
       timeout: Timeout for launching devserver (seconds).
     """
-    ds = ds_wrapper.DevServerWrapper(static_dir=DEVSERVER_STATIC_DIR,
-                                     src_image=src_image_to_delta, board=board)
+    ds = ds_wrapper.ReusableDevServerWrapper(
+        DEVSERVER_STATIC_DIR, board=board, src_image=src_image_to_delta)
     req = GenerateXbuddyRequest(path, 'update')
     logging.info('Starting local devserver to generate/serve payloads...')
     try:
@@ -687,12 +741,6 @@ class RemoteDeviceUpdater(object):
 
   def Cleanup(self):
     """Cleans up the temporary directory."""
-    if self.image_tempdir:
-      self.image_tempdir.Cleanup()
-
-    if self.static_tempdir:
-      self.static_tempdir.Cleanup()
-
     if self.wipe:
       logging.info('Cleaning up temporary working directory...')
       osutils.RmDir(self.tempdir)
@@ -725,6 +773,50 @@ class RemoteDeviceUpdater(object):
 
     return True
 
+  def GetPayloadDir(self, board):
+    """Returns the directory with the update payloads for |self.image|.
+
+    Generates the payloads with a local devserver unless |self.image| is a
+    directory with payloads already.
+
+    Args:
+      board: The board of the device(s) to update.
+    """
+    if os.path.isdir(self.image):
+      # If the given path is a directory, we use the provided
+      # update payload(s) in the directory.
+      payload_dir = self.image
+      logging.info('Using provided payloads in %s', payload_dir)
+    else:
+      if os.path.isfile(self.image):
+        # If the given path is an image, make sure devserver can
+        # access it and generate payloads.
+        logging.info('Using image %s', self.image)
+        image_path = self.ConvertLocalPathToXbuddyPath(self.image)
+      else:
+        # For xbuddy paths, we should do a sanity check / confirmation
+        # when the xbuddy board doesn't match the board on the
+        # device. Unfortunately this isn't currently possible since we
+        # don't want to duplicate xbuddy code.  TODO(sosa):
+        # crbug.com/340722 and use it to compare boards.
+
+        # Translate the xbuddy path to get the exact image to use.
+        translated_path = TranslateImagePath(self.image, board,
+                                             debug=self.debug)
+        logging.info('Using image %s', translated_path)
+        # Convert the translated path to be used in the update request.
+        image_path = ConvertTranslatedPath(self.image, translated_path)
+
+      # Launch a local devserver to generate/serve update payloads.
+      payload_dir = self.tempdir
+      self.GetUpdatePayloads(image_path, payload_dir,
+                             board=board,
+                             src_image_to_delta=self.src_image_to_delta)
+
+    # Verify that all required payloads are in the payload directory.
+    self._CheckPayloads(payload_dir)
+    return payload_dir
+
   def Run(self):
     """Performs remote device update."""
     old_root_dev, new_root_dev = None, None
@@ -737,40 +829,13 @@ class RemoteDeviceUpdater(object):
                                         override_board=self.board,
                                         force=self.yes)
         logging.info('Board is %s', board)
+        if self.payload_board and board != self.payload_board:
+          raise DeviceUpdateError(
+              'The board of the device (%s) does not match the board the '
+              'update payloads were generated for (%s). Use --board to '
+              'update the device anyway.' % (board, self.payload_board))
 
-        if os.path.isdir(self.image):
-          # If the given path is a directory, we use the provided
-          # update payload(s) in the directory.
-          payload_dir = self.image
-          logging.info('Using provided payloads in %s', payload_dir)
-        else:
-          if os.path.isfile(self.image):
-            # If the given path is an image, make sure devserver can
-            # access it and generate payloads.
-            logging.info('Using image %s', self.image)
-            image_path = self.ConvertLocalPathToXbuddyPath(self.image)
-          else:
-            # For xbuddy paths, we should do a sanity check / confirmation
-            # when the xbuddy board doesn't match the board on the
-            # device. Unfortunately this isn't currently possible since we
-            # don't want to duplicate xbuddy code.  TODO(sosa):
-            # crbug.com/340722 and use it to compare boards.
-
-            # Translate the xbuddy path to get the exact image to use.
-            translated_path = TranslateImagePath(self.image, board,
-                                                 debug=self.debug)
-            logging.info('Using image %s', translated_path)
-            # Convert the translated path to be used in the update request.
-            image_path = ConvertTranslatedPath(self.image, translated_path)
-
-          # Launch a local devserver to generate/serve update payloads.
-          payload_dir = self.tempdir
-          self.GetUpdatePayloads(image_path, payload_dir,
-                                 board=board,
-                                 src_image_to_delta=self.src_image_to_delta)
-
-        # Verify that all required payloads are in the payload directory.
-        self._CheckPayloads(payload_dir)
+        payload_dir = self.GetPayloadDir(board)
 
         restore_stateful = False
         if (not self._CanRunDevserver(device, self.tempdir) and
@@ -793,7 +858,16 @@ class RemoteDeviceUpdater(object):
           else:
             cros_build_lib.Die('Unable to restore stateful partition. Exiting.')
 
-        # Perform device updates.
+        # Perform device updates. The stateful payload is copied to the
+        # device while the update engine writes the inactive rootfs. The
+        # stateful update itself is staged for the next boot, so it is only
+        # applied once the rootfs update succeeded; otherwise the next boot
+        # would use the new stateful partition with the old rootfs. The
+        # rootfs update goes first so that its progress is shown as it
+        # happens.
+        do_stateful_update = self.do_stateful_update and not restore_stateful
+        stateful_payload = os.path.join(payload_dir, self.STATEFUL_FILENAME)
+        steps = []
         if self.do_rootfs_update:
           self.SetupRootfsUpdate(device)
           # Record the current root device. This must be done after
@@ -802,12 +876,19 @@ class RemoteDeviceUpdater(object):
           # root device.
           old_root_dev = self.GetRootDev(device)
           payload = os.path.join(payload_dir, self.ROOTFS_FILENAME)
-          self.UpdateRootfs(device, payload, self.tempdir)
-          logging.info('Rootfs update completed.')
+          steps.append(functools.partial(self.UpdateRootfs, device, payload,
+                                         self.tempdir))
 
-        if self.do_stateful_update and not restore_stateful:
-          payload = os.path.join(payload_dir, self.STATEFUL_FILENAME)
-          self.UpdateStateful(device, payload, clobber=self.clobber_stateful)
+        if do_stateful_update:
+          steps.append(functools.partial(self.CopyStatefulUpdate, device,
+                                         stateful_payload))
+
+        parallel.RunParallelSteps(steps)
+        if self.do_rootfs_update:
+          logging.info('Rootfs update completed.')
+        if do_stateful_update:
+          self.UpdateStateful(device, stateful_payload,
+                              clobber=self.clobber_stateful, copy=False)
           logging.info('Stateful update completed.')
 
         if self.reboot:
@@ -837,6 +918,78 @@ class RemoteDeviceUpdater(object):
       self.Cleanup()
 
 
+def _UpdateRemoteDevice(hostname, port, payload_dir, **kwargs):
+  """Update one of several devices, see UpdateRemoteDevices.
+
+  Returns:
+    None if the update succeeded, the error message otherwise.
+  """
+  try:
+    RemoteDeviceUpdater(hostname, port, payload_dir, **kwargs).Run()
+  except (Exception, cros_build_lib.DieSystemExit) as e:
+    return str(e) or e.__class__.__name__
+  return None
+
+
+def UpdateRemoteDevices(devices, image, board=None, ping=True, yes=False,
+                        wipe=True, debug=False, **kwargs):
+  """Update several devices with the same image in parallel.
+
+  The update payloads are generated only once, for the board of the first
+  device (or |board|), and then all devices are updated at the same time.
+  Each device still runs its own devserver to serve the payloads to its
+  update engine. Devices of another board fail, unless |board| is given.
+
+  Args:
+    devices: A list of (hostname, port) tuples.
+    image: See RemoteDeviceUpdater.
+    board: The board of the devices.  Defaults to the board of the first one.
+      If given, it also overrides the board detected on each device.
+    ping: See RemoteDeviceUpdater.
+    yes: See RemoteDeviceUpdater.
+    wipe: See RemoteDeviceUpdater.
+    debug: See RemoteDeviceUpdater.
+    **kwargs: Other arguments to pass to RemoteDeviceUpdater.
+
+  Raises:
+    DeviceUpdateError if any of the updates failed.
+  """
+  generator = RemoteDeviceUpdater(devices[0][0], devices[0][1], image,
+                                  board=board, ping=ping, yes=yes, wipe=wipe,
+                                  debug=debug, **kwargs)
+  try:
+    payload_board = board
+    if not os.path.isdir(image) and not payload_board:
+      with remote_access.ChromiumOSDeviceHandler(
+          devices[0][0], port=devices[0][1], ping=ping) as device:
+        payload_board = cros_build_lib.GetBoard(device_board=device.board,
+                                                force=yes)
+    logging.info('Board is %s', payload_board)
+    payload_dir = generator.GetPayloadDir(payload_board)
+
+    # Each device checks its own board against the board of the payloads.
+    steps = [functools.partial(_UpdateRemoteDevice, hostname, port,
+                               payload_dir, board=board,
+                               payload_board=payload_board, ping=ping,
+                               yes=yes, wipe=wipe, debug=debug, **kwargs)
+             for hostname, port in devices]
+    errors = parallel.RunParallelSteps(steps, return_values=True)
+  finally:
+    generator.Cleanup()
+
+  failed = []
+  for (hostname, port), error in zip(devices, errors):
+    name = hostname if port is None else '%s:%s' % (hostname, port)
+    if error is None:
+      logging.info('%s: updated successfully.', name)
+    else:
+      logging.error('%s: update failed: %s', name, error)
+      failed.append(name)
+  if failed:
+    raise DeviceUpdateError('Failed to update %d of %d devices: %s' %
+                            (len(failed), len(devices), ', '.join(failed)))
+
+
 @cros.CommandDecorator('flash')
 class FlashCommand(cros.CrosCommand):
   """Update the device with an image.
@@ -875,6 +1028,9 @@ Examples:
   cros flash usb:///dev/sde xbuddy://peppy/latest
   cros flash file:///~/images xbuddy://peppy/latest
 
+To update several devices of the same board at once:
+  cros flash 192.168.1.7,192.168.1.8:2222 xbuddy://remote/peppy/latest
+
   For more information and known problems/fixes, please see:
   http://dev.chromium.org/chromium-os/build/cros-flash
 """
@@ -893,7 +1049,8 @@ Examples:
     parser.add_argument(
         'device', help='ssh://device_hostname[:port] or usb://{device_path}. '
         'If no device_path is given (i.e. usb://), user will be prompted to '
-        'choose from a list of removable devices.')
+        'choose from a list of removable devices. A comma separated list of '
+        'ssh devices updates all of them in parallel.')
     parser.add_argument(
         'image', nargs='?', default='latest', help="A local path or an xbuddy "
         "path: xbuddy://{local|remote}/board/version/{image_type} image_type "
@@ -906,6 +1063,12 @@ Examples:
         'downloaded images and payloads, and also payloads generated by '
         'the devserver. Default is not to clear.')
 
+    usb = parser.add_argument_group('USB imaging options')
+    usb.add_argument(
+        '--verify', default=False, action='store_true',
+        help='Read the image back from the removable device after writing '
+        'it and check that it matches.')
+
     update = parser.add_argument_group('Advanced device update options')
     update.add_argument(
         '--board', default=None, help='The board to use. By default it is '
@@ -949,6 +1112,7 @@ Examples:
     self.run_mode = None
     self.ssh_hostname = None
     self.ssh_port = None
+    self.ssh_devices = []
     self.usb_dev = None
     self.copy_path = None
     self.any = False
@@ -956,6 +1120,14 @@ Examples:
   def _ParseDevice(self, device):
     """Parse |device| and set corresponding variables ."""
     # pylint: disable=E1101
+    if ',' in device:
+      for d in device.split(','):
+        self._ParseDevice(d)
+        if self.run_mode != self.SSH_MODE:
+          cros_build_lib.Die('Only ssh devices can be updated in parallel, '
+                             'not %s' % d)
+      return
+
     if urlparse.urlparse(device).scheme == '':
       # For backward compatibility, prepend ssh:// ourselves.
       device = 'ssh://%s' % device
@@ -965,6 +1137,7 @@ Examples:
       self.run_mode = self.SSH_MODE
       self.ssh_hostname = parsed.hostname
       self.ssh_port = parsed.port
+      self.ssh_devices.append((self.ssh_hostname, self.ssh_port))
     elif parsed.scheme == self.USB_MODE:
       self.run_mode = self.USB_MODE
       self.usb_dev = device[len('%s://' % self.USB_MODE):]
@@ -981,6 +1154,8 @@ Examples:
 
     if self.options.clear_cache:
       logging.info('Clearing the cache...')
+      if os.path.isdir(DEVSERVER_STATIC_DIR):
+        ds_wrapper.ReusableDevServerWrapper(DEVSERVER_STATIC_DIR).Shutdown()
       ds_wrapper.DevServerWrapper.WipeStaticDirectory(DEVSERVER_STATIC_DIR)
 
     try:
@@ -990,7 +1165,24 @@ Examples:
 
     self._ParseDevice(self.options.device)
     try:
-      if self.run_mode == self.SSH_MODE:
+      if self.run_mode == self.SSH_MODE and len(self.ssh_devices) > 1:
+        logging.info('Preparing to update the remote devices %s',
+                     self.options.device)
+        UpdateRemoteDevices(
+            self.ssh_devices,
+            self.options.image,
+            board=self.options.board,
+            src_image_to_delta=self.options.src_image_to_delta,
+            rootfs_update=self.options.rootfs_update,
+            stateful_update=self.options.stateful_update,
+            clobber_stateful=self.options.clobber_stateful,
+            reboot=self.options.reboot,
+            wipe=self.options.wipe,
+            debug=self.options.debug,
+            yes=self.options.yes,
+            ping=self.options.ping,
+            disable_verification=self.options.disable_rootfs_verification)
+      elif self.run_mode == self.SSH_MODE:
         logging.info('Preparing to update the remote device %s',
                      self.options.device)
         updater = RemoteDeviceUpdater(
@@ -1018,7 +1210,8 @@ Examples:
                            self.options.board,
                            self.options.image,
                            debug=self.options.debug,
-                           yes=self.options.yes)
+                           yes=self.options.yes,
+                           verify=self.options.verify)
         imager.Run()
       elif self.run_mode == self.FILE_MODE:
         path = osutils.ExpandPath(self.copy_path) if self.copy_path else ''
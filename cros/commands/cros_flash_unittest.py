@@ -8,6 +8,7 @@
 import mock
 import os
 import sys
+import tempfile
 
 sys.path.insert(0, os.path.abspath('%s/../../..' % os.path.dirname(__file__)))
 from chromite.cros.commands import cros_flash
@@ -15,6 +16,8 @@ from chromite.cros.commands import init_unittest
 from chromite.lib import cros_build_lib
 from chromite.lib import cros_test_lib
 from chromite.lib import dev_server_wrapper
+from chromite.lib import osutils
+from chromite.lib import parallel
 from chromite.lib import partial_mock
 from chromite.lib import remote_access
 
@@ -99,8 +102,8 @@ class MockFlashCommand(init_unittest.MockCommand):
 class RemoteDeviceUpdaterMock(partial_mock.PartialCmdMock):
   """Mock out RemoteDeviceUpdater."""
   TARGET = 'chromite.cros.commands.cros_flash.RemoteDeviceUpdater'
-  ATTRS = ('UpdateStateful', 'UpdateRootfs', 'GetUpdatePayloads',
-           'SetupRootfsUpdate', 'Verify')
+  ATTRS = ('UpdateStateful', 'CopyStatefulUpdate', 'UpdateRootfs',
+           'GetUpdatePayloads', 'SetupRootfsUpdate', 'Verify')
 
   def __init__(self):
     partial_mock.PartialCmdMock.__init__(self)
@@ -111,6 +114,9 @@ class RemoteDeviceUpdaterMock(partial_mock.PartialCmdMock):
   def UpdateStateful(self, _inst, *_args, **_kwargs):
     """Mock out UpdateStateful."""
 
+  def CopyStatefulUpdate(self, _inst, *_args, **_kwargs):
+    """Mock out CopyStatefulUpdate."""
+
   def UpdateRootfs(self, _inst, *_args, **_kwargs):
     """Mock out UpdateRootfs."""
 
@@ -140,12 +146,15 @@ class UpdateRunThroughTest(cros_test_lib.MockTempDirTestCase,
     self.updater_mock = self.StartPatcher(RemoteDeviceUpdaterMock())
     self.PatchObject(cros_flash, 'GenerateXbuddyRequest',
                      return_value='xbuddy/local/latest')
-    self.PatchObject(dev_server_wrapper, 'DevServerWrapper')
+    self.PatchObject(dev_server_wrapper, 'ReusableDevServerWrapper')
     self.PatchObject(cros_flash, 'TranslateImagePath',
                      return_value='taco-paladin/R36/chromiumos_test_image.bin')
     self.PatchObject(remote_access, 'CHECK_INTERVAL', new=0)
-    self.PatchObject(remote_access.ChromiumOSDevice, '_LearnBoard',
-                     return_value='peppy')
+    self.PatchObject(remote_access.ChromiumOSDevice, '_LearnDeviceInfo',
+                     return_value=('peppy', remote_access.DEV_BIN_PATHS))
+    # Run the update steps in this process so that the mocks see the calls.
+    self.PatchObject(parallel, 'RunParallelSteps',
+                     side_effect=lambda steps, **_: [step() for step in steps])
 
   def testUpdateAll(self):
     """Tests that update methods are called correctly."""
@@ -171,6 +180,15 @@ class UpdateRunThroughTest(cros_test_lib.MockTempDirTestCase,
       self.assertFalse(self.updater_mock.patched['UpdateStateful'].called)
       self.assertTrue(self.updater_mock.patched['UpdateRootfs'].called)
 
+  def testRootfsUpdateFailed(self):
+    """Tests that the stateful update is not staged if the rootfs fails."""
+    self.SetupCommandMock([self.DEVICE, self.IMAGE])
+    self.updater_mock.patched['UpdateRootfs'].side_effect = (
+        cros_flash.DeviceUpdateError('Failed'))
+    with mock.patch('os.path.exists', return_value=True) as _m:
+      self.cmd_mock.inst.Run()
+      self.assertFalse(self.updater_mock.patched['UpdateStateful'].called)
+
   def testMissingPayloads(self):
     """Tests we exit when payloads are missing."""
     self.SetupCommandMock([self.DEVICE, self.IMAGE])
@@ -178,6 +196,124 @@ class UpdateRunThroughTest(cros_test_lib.MockTempDirTestCase,
       self.assertRaises(cros_build_lib.DieSystemExit, self.cmd_mock.inst.Run)
 
 
+class WaitForUpdateTest(cros_test_lib.MockTempDirTestCase):
+  """Test watching the update engine status in one session."""
+
+  def setUp(self):
+    self.PatchObject(tempfile, 'mkdtemp', return_value=self.tempdir)
+    self.updater = cros_flash.RemoteDeviceUpdater('1.1.1.1', None, 'latest',
+                                                  wipe=False)
+    self.PatchObject(cros_flash.RemoteDeviceUpdater, 'UPDATE_CHECK_INTERVAL',
+                     new=0)
+    # The device runs the commands locally.
+    self.device = mock.Mock()
+    self.device.RunCommand.side_effect = (
+        lambda cmd, **kwargs: cros_build_lib.RunCommand(
+            ' '.join(cmd), shell=True, **kwargs))
+
+  def _SetStatuses(self, statuses):
+    """Fakes an update engine that goes through |statuses|."""
+    osutils.WriteFile(os.path.join(self.tempdir, 'statuses'),
+                      '\n'.join(statuses) + '\n')
+    client = os.path.join(self.tempdir, 'update_engine_client')
+    osutils.WriteFile(client, '\n'.join([
+        '#!/bin/sh',
+        'cd %s' % self.tempdir,
+        '[ "$1" = --status ] || exit 0',
+        'echo PROGRESS=0.5',
+        'echo CURRENT_OP=$(head -n 1 statuses)',
+        '[ $(wc -l < statuses) -gt 1 ] && sed -i 1d statuses',
+        'exit 0',
+    ]))
+    os.chmod(client, 0o755)
+    self.PatchObject(cros_flash.RemoteDeviceUpdater, 'UPDATE_ENGINE_BIN',
+                     new=client)
+
+  def testUpdateSucceeded(self):
+    """Tests that the status is watched until a reboot is needed."""
+    self._SetStatuses(['UPDATE_STATUS_CHECKING_FOR_UPDATE',
+                       'UPDATE_STATUS_DOWNLOADING',
+                       'UPDATE_STATUS_UPDATED_NEED_REBOOT'])
+    self.updater.WaitForUpdate(self.device, 'http://127.0.0.1:8080/update')
+    self.assertEqual(self.device.RunCommand.call_count, 1)
+
+  def testUpdateFailed(self):
+    """Tests that an update engine going back to idle is an error."""
+    self._SetStatuses(['UPDATE_STATUS_DOWNLOADING', 'UPDATE_STATUS_IDLE'])
+    self.assertRaises(cros_flash.DeviceUpdateError, self.updater.WaitForUpdate,
+                      self.device, 'http://127.0.0.1:8080/update')
+
+
+class UpdateRemoteDevicesTest(cros_test_lib.MockTempDirTestCase):
+  """Test updating several devices in parallel."""
+
+  DEVICES = [('1.1.1.1', None), ('2.2.2.2', 2222)]
+
+  def setUp(self):
+    self.PatchObject(tempfile, 'mkdtemp', return_value=self.tempdir)
+    self.payload_mock = self.PatchObject(
+        cros_flash.RemoteDeviceUpdater, 'GetPayloadDir',
+        return_value=self.tempdir)
+    self.real_run = cros_flash.RemoteDeviceUpdater.Run
+    self.run_mock = self.PatchObject(cros_flash.RemoteDeviceUpdater, 'Run',
+                                     autospec=True)
+    # Run the steps in this process so that the mocks see the calls.
+    self.PatchObject(parallel, 'RunParallelSteps',
+                     side_effect=lambda steps, **_: [step() for step in steps])
+
+  def testUpdateDevices(self):
+    """Tests that payloads are generated once for all devices."""
+    cros_flash.UpdateRemoteDevices(self.DEVICES, 'latest', board='peppy',
+                                   wipe=False)
+    self.payload_mock.assert_called_once_with('peppy')
+    self.assertEqual(self.run_mock.call_count, 2)
+
+  def testUpdateFailures(self):
+    """Tests that all devices are updated even if one of them fails."""
+    self.run_mock.side_effect = [cros_flash.DeviceUpdateError('Failed'), None]
+    self.assertRaises(cros_flash.DeviceUpdateError,
+                      cros_flash.UpdateRemoteDevices, self.DEVICES, 'latest',
+                      board='peppy', wipe=False)
+    self.assertEqual(self.run_mock.call_count, 2)
+
+  def _PatchDeviceBoards(self, boards):
+    """Fakes devices with the board in |boards| for their hostname."""
+    def _Handler(hostname, **_kwargs):
+      handler = mock.MagicMock()
+      handler.__enter__.return_value.board = boards[hostname]
+      return handler
+    self.PatchObject(remote_access, 'ChromiumOSDeviceHandler',
+                     side_effect=_Handler)
+    self.StartPatcher(RemoteDeviceUpdaterMock())
+    self.PatchObject(cros_flash.RemoteDeviceUpdater, '_CanRunDevserver',
+                     return_value=True)
+    self.PatchObject(cros_flash.RemoteDeviceUpdater, 'GetRootDev')
+    self.run_mock.side_effect = self.real_run
+
+  def testMixedBoards(self):
+    """Tests that a device of another board than the payloads fails."""
+    self._PatchDeviceBoards({'1.1.1.1': 'peppy', '2.2.2.2': 'lumpy'})
+    with self.assertRaises(cros_flash.DeviceUpdateError) as ctx:
+      cros_flash.UpdateRemoteDevices(self.DEVICES, 'latest', wipe=False)
+    self.assertIn('1 of 2 devices: 2.2.2.2:2222', str(ctx.exception))
+    self.payload_mock.assert_any_call('peppy')
+
+  def testMixedBoardsOverride(self):
+    """Tests that all devices are updated if the board is given."""
+    self._PatchDeviceBoards({'1.1.1.1': 'peppy', '2.2.2.2': 'lumpy'})
+    cros_flash.UpdateRemoteDevices(self.DEVICES, 'latest', board='peppy',
+                                   wipe=False)
+
+  def testParseDevices(self):
+    """Tests that a list of ssh devices is parsed."""
+    cmd = cros_flash.FlashCommand(None)
+    cmd._ParseDevice('1.1.1.1,ssh://2.2.2.2:2222')
+    self.assertEqual(cmd.run_mode, cmd.SSH_MODE)
+    self.assertEqual(cmd.ssh_devices, self.DEVICES)
+    self.assertRaises(cros_build_lib.DieSystemExit, cmd._ParseDevice,
+                      '1.1.1.1,usb:///dev/sde')
+
+
 class USBImagerMock(partial_mock.PartialCmdMock):
   """Mock out USBImager."""
   TARGET = 'chromite.cros.commands.cros_flash.USBImager'
@@ -222,7 +358,7 @@ class ImagingRunThroughTest(cros_test_lib.MockTempDirTestCase,
     self.imager_mock = self.StartPatcher(USBImagerMock())
     self.PatchObject(cros_flash, 'GenerateXbuddyRequest',
                      return_value='xbuddy/local/latest')
-    self.PatchObject(dev_server_wrapper, 'DevServerWrapper')
+    self.PatchObject(dev_server_wrapper, 'ReusableDevServerWrapper')
     self.PatchObject(cros_flash, 'TranslateImagePath',
                      return_value='taco-paladin/R36/chromiumos_test_image.bin')
     self.PatchObject(os.path, 'exists', return_value=True)
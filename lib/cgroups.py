@@ -43,6 +43,15 @@ from chromite.lib import sudo
 # would create their own namespace w/in and assign themselves to it.
 
 
+# How long to wait for a freezer group to freeze.
+_FREEZE_TIMEOUT = 1
+# The cpu.shares of a group unless set otherwise.
+DEFAULT_CPU_SHARES = 1024
+# How long to wait for SIGKILLed processes to leave a group before
+# signaling again.
+_SIGKILL_TIMEOUT = 1
+
+
 class _GroupWasRemoved(Exception):
   """Exception representing when a group was unexpectedly removed.
 
@@ -59,6 +68,34 @@ def _FileContains(filename, strings):
   return all(s in contents for s in strings)
 
 
+def _SignalPids(pids, signum):
+  """Send |signum| to all of |pids| at once."""
+  cros_build_lib.SudoRunCommand(
+      ['kill', '-%i' % signum] + sorted(pids),
+      print_cmd=False, error_code_ok=True, redirect_stdout=True,
+      combine_stdout_stderr=True)
+
+
+def _WaitFor(condition, deadline, max_interval):
+  """Wait until |condition| returns True or |deadline| passes.
+
+  The condition is checked with an exponential backoff, starting at a
+  millisecond and capped at |max_interval| seconds, so that fast events are
+  noticed quickly without busy looping on slow ones.
+
+  Returns:
+    Whether the condition became True.
+  """
+  interval = 0.001
+  while not condition():
+    remaining = deadline - time.time()
+    if remaining <= 0:
+      return False
+    time.sleep(min(interval, max_interval, remaining))
+    interval *= 2
+  return True
+
+
 def EnsureInitialized(functor):
   """Decorator for Cgroup methods to ensure the method is ran only if inited"""
 
@@ -99,6 +136,16 @@ class Cgroup(object):
   """
 
   NEEDED_SUBSYSTEMS = ('cpuset',)
+  # Subsystems used to limit the resources of a group; see SetLimits.
+  LIMIT_SUBSYSTEMS = ('cpu', 'cpuacct', 'memory')
+  # Subsystem used to stop all processes of a group at once; see
+  # EnableFreezer and KillProcesses.
+  FREEZER_SUBSYSTEM = 'freezer'
+  # These subsystems live in hierarchies of their own, in which we mirror
+  # our namespaces as needed.
+  MIRROR_SUBSYSTEMS = LIMIT_SUBSYSTEMS + (FREEZER_SUBSYSTEM,)
+  # The MIRROR_SUBSYSTEMS we already tried to mount; see GetMirrorHierarchies.
+  _MOUNT_ATTEMPTED = set()
   PROC_PATH = '/proc/cgroups'
   _MOUNT_ROOT_POTENTIALS = ('/sys/fs/cgroup',)
   _MOUNT_ROOT_FALLBACK = '/dev/cgroup'
@@ -152,6 +199,63 @@ class Cgroup(object):
         os.path.join(cls.CGROUP_ROOT, 'cgroup.clone_children'))
     return True
 
+  @classmethod
+  def _FindMirrorHierarchies(cls):
+    """Return where the mounted MIRROR_SUBSYSTEMS hierarchies are.
+
+    Returns:
+      A dictionary mapping subsystem names to the mount points of their
+      hierarchies.
+    """
+    hierarchies = {}
+    for line in osutils.ReadFile('/proc/mounts').splitlines():
+      fields = line.split()
+      if len(fields) < 4 or fields[2] != 'cgroup':
+        continue
+      if fields[1] == cls.CGROUP_ROOT:
+        continue
+      for opt in fields[3].split(','):
+        if opt in cls.MIRROR_SUBSYSTEMS:
+          hierarchies.setdefault(opt, fields[1])
+    return hierarchies
+
+  @classmethod
+  def GetMirrorHierarchies(cls, subsystems):
+    """Find where the |subsystems| hierarchies are, mounting as needed.
+
+    Subsystems that aren't mounted yet are mounted under MOUNT_ROOT, once per
+    process. If that fails (for example because the subsystem is already
+    bound to a hierarchy with a different set of subsystems), it's left out.
+
+    Args:
+      subsystems: The MIRROR_SUBSYSTEMS to find.
+
+    Returns:
+      A dictionary mapping the names of the available |subsystems| to the
+      mount points of their hierarchies.
+    """
+    if not cls.IsUsable():
+      return {}
+
+    hierarchies = cls._FindMirrorHierarchies()
+    for subsystem in subsystems:
+      if subsystem in hierarchies or subsystem in cls._MOUNT_ATTEMPTED:
+        continue
+      cls._MOUNT_ATTEMPTED.add(subsystem)
+      if not _FileContains(cls.PROC_PATH, ['\n%s\t' % subsystem]):
+        continue
+      mnt = os.path.join(cls.MOUNT_ROOT, subsystem)
+      try:
+        osutils.SafeMakedirs(mnt, sudo=True)
+        cros_build_lib.SudoRunCommand(
+            ['mount', '-t', 'cgroup', '-o', subsystem, subsystem, mnt],
+            print_cmd=False, redirect_stderr=True)
+      except cros_build_lib.RunCommandError:
+        continue
+      hierarchies = cls._FindMirrorHierarchies()
+
+    return dict((k, v) for k, v in hierarchies.iteritems() if k in subsystems)
+
   @classmethod
   @cros_build_lib.MemoizedSingleCall
   def IsSupported(cls):
@@ -462,6 +566,17 @@ class Cgroup(object):
                          "strict was %r, sudo_strict was %r"
                          % (path, strict, sudo_strict))
 
+    # Remove the mirrors of this group in the mirror hierarchies first; they
+    # hold the same processes, so they're removable when we are.
+    relpath = os.path.relpath(path, cls.CGROUP_ROOT)
+    for mnt in set(cls._FindMirrorHierarchies().values()):
+      limit_path = os.path.join(mnt, relpath)
+      if relpath != '.' and os.path.isdir(limit_path):
+        cros_build_lib.SudoRunCommand(
+            ['find', limit_path, '-depth', '-type', 'd', '-exec', 'rmdir',
+             '{}', '+'], redirect_stderr=True, error_code_ok=True,
+            print_cmd=False, strict=sudo_strict)
+
     result = cros_build_lib.SudoRunCommand(
         ['find', path, '-depth', '-type', 'd', '-exec', 'rmdir', '{}', '+'],
         redirect_stderr=True, error_code_ok=not strict,
@@ -521,12 +636,191 @@ class Cgroup(object):
     # Assign this root process to the new cgroup.
     try:
       self._SudoSet('tasks', '%d' % int(pid))
+      # If limits were set on this group (or one of our children, which
+      # mirrors us in the mirror hierarchies), move the pid there as well.
+      for path in self._GetMirrorPaths(self._FindMirrorHierarchies()):
+        if os.path.isdir(path):
+          sudo.SetFileContents(os.path.join(path, 'tasks'), '%d' % int(pid),
+                               cwd=path)
       return True
     except cros_build_lib.RunCommandError:
       if not allow_missing:
         raise
       return False
 
+  def _GetMirrorPaths(self, hierarchies, subsystems=None):
+    """Return the paths of this group in the mirror hierarchies.
+
+    Args:
+      hierarchies: A dictionary mapping subsystems to their mount points.
+      subsystems: The subsystems to get paths for. Defaults to all of
+        |hierarchies|.
+
+    Returns:
+      A dictionary mapping each path to the list of subsystems it is for;
+      subsystems mounted together share a path.
+    """
+    if subsystems is None:
+      subsystems = hierarchies.keys()
+    paths = {}
+    for subsystem in subsystems:
+      if subsystem in hierarchies:
+        path = os.path.normpath(
+            os.path.join(hierarchies[subsystem], self.namespace))
+        paths.setdefault(path, []).append(subsystem)
+    return paths
+
+  @EnsureInitialized
+  def SetLimits(self, cpu_shares=None, cpu_quota=None, cpu_period=None,
+                memory_limit=None, memory_soft_limit=None,
+                memory_accounting=False):
+    """Limit the resources available to the processes in this group.
+
+    The processes already in this group must be transferred again (e.g. via
+    TransferCurrentProcess) for the limits to apply to them; processes that
+    are transferred, and their children, are limited.
+
+    Args:
+      cpu_shares: The CPU weight of this group relative to its siblings
+        (the default weight is DEFAULT_CPU_SHARES). This only matters
+        under contention, and only between sibling groups.
+      cpu_quota: The CPU time in microseconds the group may use per
+        |cpu_period|; e.g. a quota of twice the period allows two CPUs.
+      cpu_period: The period in microseconds for |cpu_quota|.
+      memory_limit: The hard memory limit of the group in bytes.
+      memory_soft_limit: The memory limit in bytes that the group is
+        pushed back to under memory pressure.
+      memory_accounting: Mirror the group in the memory hierarchy even if
+        no memory limit is set, so GetUsage can report its memory usage.
+
+    Returns:
+      True if all limits were set, False if a subsystem they need isn't
+      available on this system. Limits for available subsystems are set
+      regardless.
+    """
+    values = (
+        ('cpu', 'cpu.shares', cpu_shares),
+        ('cpu', 'cpu.cfs_period_us', cpu_period),
+        ('cpu', 'cpu.cfs_quota_us', cpu_quota),
+        ('memory', 'memory.limit_in_bytes', memory_limit),
+        ('memory', 'memory.soft_limit_in_bytes', memory_soft_limit),
+    )
+    values = [x for x in values if x[2] is not None]
+    # Always mirror into cpuacct as well, so usage can be read back.
+    subsystems = set(x[0] for x in values)
+    if memory_accounting:
+      subsystems.add('memory')
+    if subsystems:
+      subsystems.add('cpuacct')
+    paths = self._GetMirrorPaths(self.GetMirrorHierarchies(subsystems),
+                                 subsystems)
+    available = set()
+    for path, path_subsystems in paths.iteritems():
+      osutils.SafeMakedirs(path, sudo=True)
+      available.update(path_subsystems)
+
+    for subsystem, key, value in values:
+      if subsystem not in available:
+        cros_build_lib.Warning('cgroups: %s is unavailable; not setting %s '
+                               'for %s', subsystem, key, self.namespace)
+        continue
+      path = [x for x, y in paths.iteritems() if subsystem in y][0]
+      sudo.SetFileContents(os.path.join(path, key), str(value), cwd=path)
+
+    return all(x[0] in available for x in values)
+
+  def GetUsage(self):
+    """Return the resource usage counters of this group.
+
+    Counters are only kept for groups that limits were set on (see
+    SetLimits); they include the processes in nested groups.
+
+    Returns:
+      A dictionary with the keys cpu_usage_ns, cpu_throttled_periods,
+      cpu_throttled_ns, memory_usage_bytes, memory_max_usage_bytes and
+      memory_limit_hits. Counters that are unavailable are None.
+    """
+    usage = dict.fromkeys(('cpu_usage_ns', 'cpu_throttled_periods',
+                           'cpu_throttled_ns', 'memory_usage_bytes',
+                           'memory_max_usage_bytes', 'memory_limit_hits'))
+
+    hierarchies = self._FindMirrorHierarchies()
+
+    def _Read(subsystem, key):
+      for path in self._GetMirrorPaths(hierarchies, [subsystem]):
+        try:
+          return osutils.ReadFile(os.path.join(path, key))
+        except EnvironmentError as e:
+          if e.errno != errno.ENOENT:
+            raise
+      return None
+
+    def _ReadInt(subsystem, key):
+      value = _Read(subsystem, key)
+      return None if value is None else int(value)
+
+    usage['cpu_usage_ns'] = _ReadInt('cpuacct', 'cpuacct.usage')
+    stat = _Read('cpu', 'cpu.stat')
+    if stat is not None:
+      stat = dict(line.split() for line in stat.splitlines() if line.strip())
+      usage['cpu_throttled_periods'] = int(stat.get('nr_throttled', 0))
+      usage['cpu_throttled_ns'] = int(stat.get('throttled_time', 0))
+    usage['memory_usage_bytes'] = _ReadInt('memory', 'memory.usage_in_bytes')
+    usage['memory_max_usage_bytes'] = _ReadInt('memory',
+                                               'memory.max_usage_in_bytes')
+    usage['memory_limit_hits'] = _ReadInt('memory', 'memory.failcnt')
+    return usage
+
+  @EnsureInitialized
+  def EnableFreezer(self):
+    """Mirror this group in the freezer hierarchy.
+
+    Processes transferred into this group afterwards are put into the mirror
+    as well, which lets KillProcesses stop all of them at once.
+
+    Returns:
+      True if the group is mirrored in the freezer hierarchy.
+    """
+    paths = self._GetMirrorPaths(
+        self.GetMirrorHierarchies([self.FREEZER_SUBSYSTEM]),
+        [self.FREEZER_SUBSYSTEM])
+    try:
+      for path in paths:
+        osutils.SafeMakedirs(path, sudo=True)
+    except (EnvironmentError, cros_build_lib.RunCommandError) as e:
+      cros_build_lib.Warning('cgroups: failed to enable the freezer for %s: %s',
+                             self.namespace, e)
+      return False
+    return bool(paths)
+
+  def _GetFreezerPath(self):
+    """Return the path of our freezer mirror, or None if there is none."""
+    paths = self._GetMirrorPaths(self._FindMirrorHierarchies(),
+                                 [self.FREEZER_SUBSYSTEM])
+    for path in paths:
+      if os.path.isdir(path):
+        return path
+    return None
+
+  def _SetFreezerState(self, path, state):
+    """Set our freezer mirror at |path| to |state|, waiting until it is."""
+    sudo.SetFileContents(os.path.join(path, 'freezer.state'), state, cwd=path)
+    if state == 'FROZEN':
+      # Freezing is asynchronous; the state reads FREEZING until every task
+      # has stopped. Tasks stuck in the kernel may never stop, so only wait
+      # for a bounded time.
+      _WaitFor(lambda: osutils.ReadFile(
+          os.path.join(path, 'freezer.state')).strip() == state,
+               time.time() + _FREEZE_TIMEOUT, _FREEZE_TIMEOUT)
+
+  def _GetAllPids(self):
+    """Return the pids in this group and all groups nested in it."""
+    pids = set()
+    for group in [self] + self.all_nested_groups:
+      pids.update(x.strip() for x in group.GetValue('tasks', '').splitlines())
+    pids.discard('')
+    return pids
+
   # TODO(ferringb): convert to snakeoil.weakref.WeakRefFinalizer
   def __del__(self):
     if self.autoclean and self._inited and self.CGROUP_ROOT:
@@ -552,15 +846,19 @@ class Cgroup(object):
       self.TransferCurrentProcess()
 
   def KillProcesses(self, poll_interval=0.05, remove=False, sigterm_timeout=10):
-    """Kill all processes in this namespace."""
+    """Kill all processes in this namespace.
+
+    If the group is mirrored in the freezer hierarchy (see EnableFreezer),
+    this is done by _KillFrozen. Otherwise processes are signaled as they
+    are found by polling.
+    """
 
     my_pids = set(map(str, self._GetCurrentProcessThreads()))
 
-    def _SignalPids(pids, signum):
-      cros_build_lib.SudoRunCommand(
-          ['kill', '-%i' % signum] + sorted(pids),
-          print_cmd=False, error_code_ok=True, redirect_stdout=True,
-          combine_stdout_stderr=True)
+    freezer_path = self._GetFreezerPath()
+    if freezer_path is not None:
+      return self._KillFrozen(freezer_path, my_pids, poll_interval, remove,
+                              sigterm_timeout)
 
     # First sigterm what we can, exiting after 2 runs w/out seeing pids.
     # Let this phase run for a max of 10 seconds; afterwards, switch to
@@ -642,6 +940,61 @@ class Cgroup(object):
 
 
 
+  def _KillFrozen(self, freezer_path, my_pids, poll_interval, remove,
+                  sigterm_timeout):
+    """Kill all processes in this namespace, freezing them while we do.
+
+    While frozen, no process can fork, so a single scan finds all of them
+    and a single kill signals all of them. We SIGTERM everything once, wait
+    up to |sigterm_timeout| for the group to empty, then SIGKILL whatever is
+    left until the group is empty. cgroups offer no notification when a
+    group empties, so we poll with a backoff that starts at a millisecond
+    and is capped at |poll_interval|.
+
+    See KillProcesses for the arguments.
+    """
+    def _SignalAll(signum):
+      """Signal all processes in the group; returns whether there were any."""
+      pids = self._GetAllPids()
+      self_kill = my_pids.intersection(pids)
+      if self_kill:
+        raise Exception("Bad API usage: asked to kill cgroup %s, but "
+                        "current pid %s is in that group.  Effectively "
+                        "asked to kill ourselves."
+                        % (self.namespace, self_kill))
+      if not pids:
+        return False
+
+      self._SetFreezerState(freezer_path, 'FROZEN')
+      try:
+        # Pick up anything forked between the scan and the freeze.
+        pids = self._GetAllPids()
+        _SignalPids(pids, signum)
+      finally:
+        # Frozen processes only act on signals once thawed.
+        self._SetFreezerState(freezer_path, 'THAWED')
+      return True
+
+    if _SignalAll(signal.SIGTERM):
+      _WaitFor(lambda: not self._GetAllPids(), time.time() + sigterm_timeout,
+               poll_interval)
+
+    while True:
+      if _SignalAll(signal.SIGKILL):
+        _WaitFor(lambda: not self._GetAllPids(),
+                 time.time() + _SIGKILL_TIMEOUT, poll_interval)
+        continue
+
+      # This needs to be nonstrict; see the comments in KillProcesses.
+      if remove:
+        if self.RemoveThisGroup(strict=False):
+          return True
+      elif all([group.RemoveThisGroup(strict=False)
+                for group in self.nested_groups]):
+        return
+
+      time.sleep(poll_interval)
+
   @classmethod
   def _FindCurrentCrosGroup(cls, pid=None):
     """Find and return the cros namespace a pid is currently in.
@@ -728,17 +1081,23 @@ class ContainChildren(cros_build_lib.MasterPidContextManager):
   If |pool_name| is given, that name is used rather than os.getpid() for
   the job pool created.
 
+  If |limits| is given, it is a dictionary of keyword arguments for
+  Cgroup.SetLimits, which are applied to the pool. The usage counters of
+  the pool (see Cgroup.GetUsage) are then available as |usage| after exit.
+
   Finally, note that during cleanup this will suppress all signals
   to ensure that it cleanses any children before returning.
   """
 
-  def __init__(self, node, pool_name=None, sigterm_timeout=10):
+  def __init__(self, node, pool_name=None, sigterm_timeout=10, limits=None):
     super(ContainChildren, self).__init__()
     self.node = node
     self.child = None
     self.pid = None
     self.pool_name = pool_name
     self.sigterm_timeout = sigterm_timeout
+    self.limits = limits
+    self.usage = None
     self.run_kill = False
 
   def _enter(self):
@@ -749,6 +1108,9 @@ class ContainChildren(cros_build_lib.MasterPidContextManager):
     pool_name = str(self.pid) if self.pool_name is None else self.pool_name
     self.child = self.node.AddGroup(pool_name, autoclean=True, lazy_init=True)
     try:
+      if self.limits:
+        self.child.SetLimits(**self.limits)
+      self.child.EnableFreezer()
       self.child.TransferCurrentProcess()
     except _GroupWasRemoved:
       raise SystemExit(
@@ -759,6 +1121,12 @@ class ContainChildren(cros_build_lib.MasterPidContextManager):
   def _exit(self, *_args, **_kwargs):
     with signals.DeferSignals():
       self.node.TransferCurrentProcess()
+      if self.limits and self.run_kill:
+        try:
+          self.usage = self.child.GetUsage()
+        except EnvironmentError as e:
+          cros_build_lib.Warning('cgroups: failed to read the usage of %s: %s',
+                                 self.child.namespace, e)
       if self.run_kill:
         self.child.KillProcesses(remove=True,
                                  sigterm_timeout=self.sigterm_timeout)
@@ -779,6 +1147,25 @@ def SimpleContainChildren(process_name, nesting=True, **kwargs):
   name = '%s:%i' % (process_name, os.getpid())
   return ContainChildren(node, name, **kwargs)
 
+
+def SimpleLimitChildren(process_name, limits, **kwargs):
+  """Convenience context manager to run children with limited resources.
+
+  This creates a pool with the given |limits| (see Cgroup.SetLimits) nested
+  in the pool we're currently contained in, e.g. by SimpleContainChildren,
+  and moves us into it. Children still running on exit are killed. If we
+  aren't contained in a cros pool, this is a noop context manager.
+
+  Args:
+    process_name: Name for the pool, see SimpleContainChildren.
+    limits: Dictionary of keyword arguments for Cgroup.SetLimits.
+    kwargs: Additional arguments for ContainChildren.
+  """
+  # pylint: disable=W0212
+  if not Cgroup.IsSupported() or Cgroup._FindCurrentCrosGroup() is None:
+    return cros_build_lib.NoOpContextManager()
+  return SimpleContainChildren(process_name, limits=limits, **kwargs)
+
 # This is a generic group, not associated with any specific process id, so
 # we shouldn't autoclean it on exit; doing so would delete the group from
 # under the feet of any other processes interested in using the group.
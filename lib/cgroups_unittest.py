@@ -6,6 +6,7 @@
 """Unittests for cgroups.py."""
 
 import os
+import signal
 import sys
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(
     os.path.abspath(__file__)))))
@@ -13,6 +14,7 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(
 from chromite.lib import cgroups
 from chromite.lib import cros_build_lib
 from chromite.lib import cros_test_lib
+from chromite.lib import osutils
 from chromite.lib import parallel
 from chromite.lib import sudo
 
@@ -31,5 +33,169 @@ class TestCreateGroups(cros_test_lib.TestCase):
         parallel.RunTasksInProcessPool(self._CrosSdk, [[]] * 20, 10)
 
 
+class TestLimits(cros_test_lib.MockTempDirTestCase):
+  """Unittests for limiting the resources of groups."""
+
+  def setUp(self):
+    self.mounts = {
+        'cpu': os.path.join(self.tempdir, 'cpu,cpuacct'),
+        'cpuacct': os.path.join(self.tempdir, 'cpu,cpuacct'),
+        'memory': os.path.join(self.tempdir, 'memory'),
+    }
+    self.PatchObject(cgroups.Cgroup, 'CGROUP_ROOT',
+                     os.path.join(self.tempdir, 'cros'))
+    self.PatchObject(cgroups.Cgroup, 'GetMirrorHierarchies',
+                     return_value=self.mounts)
+    self.PatchObject(cgroups.Cgroup, '_FindMirrorHierarchies',
+                     return_value=self.mounts)
+    self.PatchObject(sudo, 'SetFileContents',
+                     side_effect=lambda path, value, **_: osutils.WriteFile(
+                         path, value, mode='a'))
+    self.PatchObject(osutils, 'SafeMakedirs',
+                     side_effect=lambda path, **_: os.makedirs(path))
+    root = cgroups.Cgroup(None, _is_root=True, autoclean=False,
+                          lazy_init=True)
+    self.group = root.AddGroup('cros/cbuildbot/stage:1', autoclean=False,
+                               lazy_init=True)
+    self.group._inited = True
+
+  def _Path(self, subsystem, key):
+    return os.path.join(self.mounts[subsystem], 'cros/cbuildbot/stage:1', key)
+
+  def testSetLimits(self):
+    """Limits are written to the group's mirror in each hierarchy."""
+    self.assertTrue(self.group.SetLimits(cpu_shares=256,
+                                         memory_limit=1 << 30))
+    self.assertEqual(osutils.ReadFile(self._Path('cpu', 'cpu.shares')), '256')
+    self.assertEqual(
+        osutils.ReadFile(self._Path('memory', 'memory.limit_in_bytes')),
+        str(1 << 30))
+
+  def testMemoryAccounting(self):
+    """The group can be mirrored in the memory hierarchy without a limit."""
+    self.assertTrue(self.group.SetLimits(cpu_shares=256,
+                                         memory_accounting=True))
+    self.assertExists(os.path.dirname(self._Path('memory', 'tasks')))
+    self.assertNotExists(self._Path('memory', 'memory.limit_in_bytes'))
+
+  def testSetLimitsUnavailable(self):
+    """Limits for unavailable subsystems are skipped."""
+    del self.mounts['memory']
+    self.assertFalse(self.group.SetLimits(cpu_shares=256,
+                                          memory_limit=1 << 30))
+    self.assertExists(self._Path('cpu', 'cpu.shares'))
+
+  def testTransferPid(self):
+    """Pids are moved into the mirror hierarchies the group is mirrored in."""
+    osutils.SafeMakedirs(self.group.path)
+    self.group.SetLimits(cpu_shares=256)
+    self.group.TransferPid(1234)
+    self.assertEqual(osutils.ReadFile(self._Path('cpu', 'tasks')), '1234')
+    self.assertNotExists(self._Path('memory', 'tasks'))
+
+  def testGetUsage(self):
+    """Usage counters are read back from the mirror hierarchies."""
+    self.group.SetLimits(cpu_shares=256, memory_limit=1 << 30)
+    osutils.WriteFile(self._Path('cpuacct', 'cpuacct.usage'), '1000\n')
+    osutils.WriteFile(self._Path('cpu', 'cpu.stat'),
+                      'nr_periods 10\nnr_throttled 2\nthrottled_time 50\n')
+    osutils.WriteFile(self._Path('memory', 'memory.usage_in_bytes'), '10\n')
+    usage = self.group.GetUsage()
+    self.assertEqual(usage['cpu_usage_ns'], 1000)
+    self.assertEqual(usage['cpu_throttled_periods'], 2)
+    self.assertEqual(usage['cpu_throttled_ns'], 50)
+    self.assertEqual(usage['memory_usage_bytes'], 10)
+    self.assertEqual(usage['memory_max_usage_bytes'], None)
+
+
+class TestMirrorHierarchies(cros_test_lib.MockTestCase):
+  """Unittests for finding and mounting the mirror hierarchies."""
+
+  def setUp(self):
+    self.PatchObject(cgroups.Cgroup, 'IsUsable', return_value=True)
+    self.PatchObject(cgroups.Cgroup, 'MOUNT_ROOT', '/sys/fs/cgroup')
+    self.PatchObject(cgroups.Cgroup, '_MOUNT_ATTEMPTED', new=set())
+    self.PatchObject(cgroups, '_FileContains', return_value=True)
+    self.PatchObject(osutils, 'SafeMakedirs')
+    self.mounted = {}
+    self.PatchObject(cgroups.Cgroup, '_FindMirrorHierarchies',
+                     side_effect=lambda: self.mounted.copy())
+    def _Mount(cmd, **_):
+      self.mounted[cmd[4]] = cmd[-1]
+    self.mount_mock = self.PatchObject(cros_build_lib, 'SudoRunCommand',
+                                       side_effect=_Mount)
+
+  def testMountsOnlyRequested(self):
+    """Only the requested subsystems are mounted, and only once."""
+    self.assertEqual(cgroups.Cgroup.GetMirrorHierarchies(['freezer']),
+                     {'freezer': '/sys/fs/cgroup/freezer'})
+    self.assertEqual(self.mount_mock.call_count, 1)
+    self.assertEqual(cgroups.Cgroup.GetMirrorHierarchies(['freezer']),
+                     {'freezer': '/sys/fs/cgroup/freezer'})
+    self.assertEqual(self.mount_mock.call_count, 1)
+
+  def testEnableFreezer(self):
+    """EnableFreezer doesn't mount the limit hierarchies."""
+    group = cgroups.Cgroup('cbuildbot', parent=cgroups._cros_node,
+                           autoclean=False, lazy_init=True)
+    group._inited = True
+    self.assertTrue(group.EnableFreezer())
+    self.assertEqual(self.mounted.keys(), ['freezer'])
+
+  def testSetLimits(self):
+    """SetLimits mounts only the hierarchies of the limits it sets."""
+    self.PatchObject(sudo, 'SetFileContents')
+    group = cgroups.Cgroup('cbuildbot', parent=cgroups._cros_node,
+                           autoclean=False, lazy_init=True)
+    group._inited = True
+    self.assertTrue(group.SetLimits(cpu_shares=256))
+    self.assertEqual(sorted(self.mounted), ['cpu', 'cpuacct'])
+
+
+class TestKillFrozen(cros_test_lib.MockTestCase):
+  """Unittests for killing the processes of a frozen group."""
+
+  def setUp(self):
+    root = cgroups.Cgroup(None, _is_root=True, autoclean=False,
+                          lazy_init=True)
+    self.group = root.AddGroup('cros/pool:1', autoclean=False,
+                               lazy_init=True)
+    self.PatchObject(cgroups.Cgroup, '_GetFreezerPath',
+                     return_value='/freezer/cros/pool:1')
+    self.PatchObject(cgroups.Cgroup, '_GetCurrentProcessThreads',
+                     return_value=[1])
+    self.PatchObject(cgroups.Cgroup, 'RemoveThisGroup', return_value=True)
+    self.calls = []
+    self.PatchObject(cgroups.Cgroup, '_SetFreezerState',
+                     side_effect=lambda _path, state: self.calls.append(state))
+    self.PatchObject(cgroups, '_SignalPids',
+                     side_effect=lambda pids, sig: self.calls.append(
+                         (sorted(pids), sig)))
+
+  def testSigtermSuffices(self):
+    """Processes that exit on SIGTERM are only signaled once."""
+    pids = [set(['2', '3'])] * 2
+    self.PatchObject(cgroups.Cgroup, '_GetAllPids',
+                     side_effect=lambda: pids.pop(0) if pids else set())
+    self.assertTrue(self.group.KillProcesses(remove=True))
+    self.assertEqual(self.calls, ['FROZEN', (['2', '3'], signal.SIGTERM),
+                                  'THAWED'])
+
+  def testSigkill(self):
+    """Processes that ignore SIGTERM are SIGKILLed after the timeout."""
+    pids = [set(['2'])] * 5
+    self.PatchObject(cgroups.Cgroup, '_GetAllPids',
+                     side_effect=lambda: pids.pop(0) if pids else set())
+    self.assertTrue(self.group.KillProcesses(remove=True, sigterm_timeout=0))
+    self.assertEqual(self.calls, ['FROZEN', (['2'], signal.SIGTERM), 'THAWED',
+                                  'FROZEN', (['2'], signal.SIGKILL), 'THAWED'])
+
+  def testSelfKill(self):
+    """Killing a group we are in is refused before freezing it."""
+    self.PatchObject(cgroups.Cgroup, '_GetAllPids', return_value=set(['1']))
+    self.assertRaises(Exception, self.group.KillProcesses)
+    self.assertEqual(self.calls, [])
+
+
 if __name__ == '__main__':
   cros_test_lib.main()
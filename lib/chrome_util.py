@@ -9,15 +9,19 @@
 
 import functools
 import glob
+import hashlib
 import logging
+import multiprocessing
 import os
 import re
 import shlex
 import shutil
+import stat
 
 from chromite.cbuildbot import failures_lib
 from chromite.lib import cros_build_lib
 from chromite.lib import osutils
+from chromite.lib import parallel
 
 
 # Taken from external/gyp.git/pylib.
@@ -105,6 +109,15 @@ class Conditions(object):
     return functools.partial(cls._StagingFlagNotSet, flag)
 
 
+def HashFile(path):
+  """Returns the hex SHA-1 digest of the contents of the file |path|."""
+  sha1 = hashlib.sha1()
+  with open(path, 'rb') as f:
+    for chunk in iter(functools.partial(f.read, 1024 * 1024), ''):
+      sha1.update(chunk)
+  return sha1.hexdigest()
+
+
 class MultipleMatchError(failures_lib.StepFailure):
   """A glob pattern matches multiple files but a non-dir dest was specified."""
 
@@ -126,7 +139,8 @@ class Copier(object):
   DEFAULT_BLACKLIST = (r'(^|.*/)\.svn($|/.*)',)
 
   def __init__(self, strip_bin=None, strip_flags=None, default_mode=0o644,
-               dir_mode=0o755, exe_mode=0o755, blacklist=None):
+               dir_mode=0o755, exe_mode=0o755, blacklist=None,
+               strip_cache_dir=None, hardlink=False):
     """Initialization.
 
     Args:
@@ -137,9 +151,17 @@ class Copier(object):
       dir_mode: Mode to set for directories.
       exe_mode: Permissions to set on executables.
       blacklist: A list of path patterns to ignore during the copy.
+      strip_cache_dir: If set, a directory to keep the stripped binaries in,
+                       so that unchanged binaries are not stripped again by
+                       the next copy.
+      hardlink: If set, hard link the files that are not stripped instead of
+                copying them, when they already have the right permissions.
+                Only use this if the destination is not modified later on.
     """
     self.strip_bin = strip_bin
     self.strip_flags = strip_flags
+    self.strip_cache_dir = strip_cache_dir
+    self.hardlink = hardlink
     self.default_mode = default_mode
     self.dir_mode = dir_mode
     self.exe_mode = exe_mode
@@ -158,32 +180,96 @@ class Copier(object):
         return True
     return False
 
-  def _CopyFile(self, src, dest, path):
+  def _CopyFile(self, src, dest, exe=False, strip=True, mode=None):
     """Perform the copy.
 
     Args:
       src: The path of the file/directory to copy.
       dest: The exact path of the destination.  Should not already exist.
-      path: The Path instance containing copy operation modifiers (such as
-            Path.exe, Path.strip, etc.)
+      exe: See Path.exe.
+      strip: See Path.strip.
+      mode: See Path.mode.
     """
     assert not os.path.isdir(src), '%s: Not expecting a directory!' % src
     osutils.SafeMakedirs(os.path.dirname(dest), mode=self.dir_mode)
-    if path.exe and self.strip_bin and path.strip and os.path.getsize(src) > 0:
-      strip_flags = (['--strip-unneeded'] if self.strip_flags is None else
-                     self.strip_flags)
-      cros_build_lib.DebugRunCommand(
-          [self.strip_bin] + strip_flags + ['-o', dest, src])
+    if mode is None:
+      mode = self.exe_mode if exe else self.default_mode
+
+    if exe and self.strip_bin and strip and os.path.getsize(src) > 0:
+      self._StripFile(src, dest)
       shutil.copystat(src, dest)
+    elif self.hardlink and self._CanLink(src, mode):
+      try:
+        os.link(src, dest)
+        return
+      except OSError:
+        # E.g. |src| and |dest| are on different filesystems.
+        shutil.copy2(src, dest)
     else:
       shutil.copy2(src, dest)
 
-    mode = path.mode
-    if mode is None:
-      mode = self.exe_mode if path.exe else self.default_mode
     os.chmod(dest, mode)
 
-  def Copy(self, src_base, dest_base, path, strict=False, sloppy=False):
+  @staticmethod
+  def _CanLink(src, mode):
+    """Returns whether |src| can be linked to a destination with |mode|.
+
+    The link shares its permissions with |src|, so they must be right already
+    and must not change when _FixPermissions adds read and execute bits.
+    """
+    if stat.S_IMODE(os.stat(src).st_mode) != mode:
+      return False
+    all_read = mode & 0o444 == 0o444
+    all_exec = not mode & 0o110 or mode & 0o111 == 0o111
+    return all_read and all_exec
+
+  def _StripFile(self, src, dest):
+    """Strip |src| to |dest|, reusing the output of an earlier strip if any.
+
+    Each source file has a slot in the strip cache that holds the output of
+    its last strip, named after the hash of the input and the strip command.
+    Older outputs are dropped, so the cache holds one binary per source file.
+
+    Args:
+      src: The path of the binary to strip.
+      dest: The exact path of the destination.  Should not already exist.
+    """
+    strip_flags = (['--strip-unneeded'] if self.strip_flags is None else
+                   self.strip_flags)
+    strip_cmd = [self.strip_bin] + strip_flags
+    if self.strip_cache_dir is None:
+      cros_build_lib.DebugRunCommand(strip_cmd + ['-o', dest, src])
+      return
+
+    slot = os.path.join(self.strip_cache_dir,
+                        hashlib.sha1(os.path.abspath(src)).hexdigest())
+    key = hashlib.sha1('\0'.join([HashFile(src)] + strip_cmd)).hexdigest()
+    cached = os.path.join(slot, key)
+    if os.path.exists(cached):
+      logging.debug('Using cached strip output for %s', src)
+      shutil.copyfile(cached, dest)
+      return
+
+    cros_build_lib.DebugRunCommand(strip_cmd + ['-o', dest, src])
+    osutils.RmDir(slot, ignore_missing=True)
+    osutils.SafeMakedirs(slot)
+    # Write under a temporary name first, so that an interrupted copy never
+    # leaves a truncated binary in the cache.
+    shutil.copyfile(dest, cached + '.tmp')
+    os.rename(cached + '.tmp', cached)
+
+  def _CopyOrDefer(self, src, dest, path, deferred):
+    """Copy the file |src| now, or add the copy to |deferred| if set."""
+    args = (src, dest, path.exe, path.strip, path.mode)
+    if deferred is None:
+      self._CopyFile(*args)
+    else:
+      # Create the directory up front so that deferred copies do not race.
+      osutils.SafeMakedirs(os.path.dirname(dest), mode=self.dir_mode)
+      deferred.append(args)
+
+  def Copy(self, src_base, dest_base, path, strict=False, sloppy=False,
+           deferred=None):
     """Copy artifact(s) from source directory to destination.
 
     Args:
@@ -192,6 +278,8 @@ class Copier(object):
       path: A Path instance that specifies what is to be copied.
       strict: If set, enforce that all optional files are copied.
       sloppy: If set, ignore when mandatory artifacts are missing.
+      deferred: If set, a list to add the arguments of the file copies to,
+                instead of copying the files.  Run them with CopyFiles.
 
     Returns:
       A list of the artifacts copied.
@@ -243,12 +331,27 @@ class Copier(object):
             if sub_path.endswith('/'):
               osutils.SafeMakedirs(sub_dest, mode=self.dir_mode)
             else:
-              self._CopyFile(sub_path, sub_dest, path)
+              self._CopyOrDefer(sub_path, sub_dest, path, deferred)
         else:
-          self._CopyFile(p, dest, path)
+          self._CopyOrDefer(p, dest, path, deferred)
 
     return copied_paths
 
+  def CopyFiles(self, deferred, processes=None):
+    """Run the file copies deferred by Copy in a pool of processes.
+
+    Args:
+      deferred: The list of deferred copies filled in by Copy.
+      processes: The maximum number of copies to run at once.  Defaults to the
+                 number of CPUs, since stripping is CPU bound.
+    """
+    if not deferred:
+      return
+    if processes is None:
+      processes = multiprocessing.cpu_count()
+    parallel.RunTasksInProcessPool(self._CopyFile, deferred,
+                                   processes=min(processes, len(deferred)))
+
 
 class Path(object):
   """Represents an artifact to be copied from build dir to staging dir."""
@@ -492,7 +595,8 @@ def GetCopyPaths(deployment_type='chrome'):
 
 def StageChromeFromBuildDir(staging_dir, build_dir, strip_bin, strict=False,
                             sloppy=False, gyp_defines=None, staging_flags=None,
-                            strip_flags=None, copy_paths=_COPY_PATHS_CHROME):
+                            strip_flags=None, copy_paths=_COPY_PATHS_CHROME,
+                            strip_cache_dir=None, hardlink=False):
   """Populates a staging directory with necessary build artifacts.
 
   If |strict| is set, then we decide what to stage based on the |gyp_defines|
@@ -514,6 +618,9 @@ def StageChromeFromBuildDir(staging_dir, build_dir, strip_bin, strict=False,
       STAGING_FLAGS.
     strip_flags: A list of flags to pass to the tool used to strip binaries.
     copy_paths: The list of paths to use as a filter for staging files.
+    strip_cache_dir: If set, a directory to cache stripped binaries in.  See
+      Copier.
+    hardlink: If set, hard link the files that are not stripped.  See Copier.
   """
   os.mkdir(os.path.join(staging_dir, 'plugins'), 0o755)
 
@@ -522,16 +629,20 @@ def StageChromeFromBuildDir(staging_dir, build_dir, strip_bin, strict=False,
   if staging_flags is None:
     staging_flags = []
 
-  copier = Copier(strip_bin=strip_bin, strip_flags=strip_flags)
+  copier = Copier(strip_bin=strip_bin, strip_flags=strip_flags,
+                  strip_cache_dir=strip_cache_dir, hardlink=hardlink)
   copied_paths = []
+  deferred = []
   for p in copy_paths:
     if not strict or p.ShouldProcess(gyp_defines, staging_flags):
       copied_paths += copier.Copy(build_dir, staging_dir, p, strict=strict,
-                                  sloppy=sloppy)
+                                  sloppy=sloppy, deferred=deferred)
 
   if not copied_paths:
     raise MissingPathError('Couldn\'t find anything to copy!\n'
                            'Are you looking in the right directory?\n'
                            'Aborting copy...')
 
+  # Strip and copy the files in parallel.
+  copier.CopyFiles(deferred)
   _FixPermissions(staging_dir)
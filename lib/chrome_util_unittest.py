@@ -6,12 +6,15 @@
 """Unittests for chrome_util."""
 
 import os
+import stat
 import sys
 
 sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)),
                                 '..', '..'))
+from chromite.lib import cros_build_lib
 from chromite.lib import cros_test_lib
 from chromite.lib import chrome_util
+from chromite.lib import osutils
 
 # pylint: disable=W0212,W0233
 
@@ -234,5 +237,85 @@ class SloppyDirCopyTest(SloppyFileCopyTest, DirCopyTest):
   """Test directory copies with sloppy=True"""
 
 
+class DeferredCopyTest(cros_test_lib.TempDirTestCase):
+  """Tests of deferred (parallel) copies and hard links."""
+
+  def setUp(self):
+    self.src_base = os.path.join(self.tempdir, 'src_base')
+    self.dest_base = os.path.join(self.tempdir, 'dest_base')
+    cros_test_lib.CreateOnDiskHierarchy(
+        self.src_base, [Dir('monkey', ['file1', 'file2', 'file3'])])
+
+  def testDeferredCopies(self):
+    """Deferred copies only run in CopyFiles."""
+    copier = chrome_util.Copier()
+    deferred = []
+    copier.Copy(self.src_base, self.dest_base, chrome_util.Path('monkey/'),
+                deferred=deferred)
+    self.assertEqual(len(deferred), 3)
+    self.assertEqual(os.listdir(os.path.join(self.dest_base, 'monkey')), [])
+    copier.CopyFiles(deferred, processes=2)
+    cros_test_lib.VerifyOnDiskHierarchy(
+        self.dest_base, [Dir('monkey', ['file1', 'file2', 'file3'])])
+
+  def testHardlink(self):
+    """Files are linked when their permissions are right already."""
+    file1 = os.path.join(self.src_base, 'monkey', 'file1')
+    file2 = os.path.join(self.src_base, 'monkey', 'file2')
+    os.chmod(file1, 0o644)
+    os.chmod(file2, 0o600)
+    copier = chrome_util.Copier(hardlink=True)
+    copier.Copy(self.src_base, self.dest_base, chrome_util.Path('monkey/'))
+    dest1 = os.path.join(self.dest_base, 'monkey', 'file1')
+    dest2 = os.path.join(self.dest_base, 'monkey', 'file2')
+    self.assertTrue(os.path.samefile(file1, dest1))
+    self.assertFalse(os.path.samefile(file2, dest2))
+    self.assertEqual(stat.S_IMODE(os.stat(dest2).st_mode), 0o644)
+    self.assertEqual(stat.S_IMODE(os.stat(file2).st_mode), 0o600)
+
+
+class StripCacheTest(cros_test_lib.MockTempDirTestCase):
+  """Tests of stripping binaries with a strip cache."""
+
+  def setUp(self):
+    self.strip_mock = self.PatchObject(cros_build_lib, 'DebugRunCommand',
+                                       side_effect=self._Strip)
+    self.src = os.path.join(self.tempdir, 'src', 'chrome')
+    self.dest_base = os.path.join(self.tempdir, 'dest')
+    self.copier = chrome_util.Copier(
+        strip_bin='strip', strip_cache_dir=os.path.join(self.tempdir, 'cache'))
+    self.path = chrome_util.Path('chrome', exe=True)
+
+  @staticmethod
+  def _Strip(cmd):
+    src, dest = cmd[-1], cmd[-2]
+    osutils.WriteFile(dest, 'stripped ' + osutils.ReadFile(src))
+
+  def _Copy(self):
+    osutils.RmDir(self.dest_base, ignore_missing=True)
+    self.copier.Copy(os.path.dirname(self.src), self.dest_base, self.path)
+    return osutils.ReadFile(os.path.join(self.dest_base, 'chrome'))
+
+  def testStripCache(self):
+    """Binaries are only stripped again when they changed."""
+    osutils.WriteFile(self.src, 'v1', makedirs=True)
+    self.assertEqual(self._Copy(), 'stripped v1')
+    self.assertEqual(self._Copy(), 'stripped v1')
+    self.assertEqual(self.strip_mock.call_count, 1)
+
+    osutils.WriteFile(self.src, 'v2')
+    self.assertEqual(self._Copy(), 'stripped v2')
+    self.assertEqual(self.strip_mock.call_count, 2)
+    self.assertEqual(len(os.listdir(self.copier.strip_cache_dir)), 1)
+
+  def testStripFlagsChange(self):
+    """Binaries are stripped again when the strip flags changed."""
+    osutils.WriteFile(self.src, 'v1', makedirs=True)
+    self._Copy()
+    self.copier.strip_flags = ['--strip-debug']
+    self._Copy()
+    self.assertEqual(self.strip_mock.call_count, 2)
+
+
 if __name__ == '__main__':
   cros_test_lib.main()
@@ -7,12 +7,15 @@
 import datetime
 import glob
 import logging
+import multiprocessing
 import os
+import Queue
 import re
 import sqlalchemy
 import sqlalchemy.exc
 import sqlalchemy.interfaces
 from sqlalchemy import MetaData
+import threading
 import time
 
 from chromite.cbuildbot import constants
@@ -20,6 +23,31 @@ from chromite.cbuildbot import constants
 CIDB_MIGRATIONS_DIR = os.path.join(constants.CHROMITE_DIR, 'cidb',
                                    'migrations')
 
+# Number of rows to fetch per query when streaming large results.
+DEFAULT_PAGE_SIZE = 1000
+
+# Maximum number of rows that BackgroundCIDBWriter writes per INSERT.
+DEFAULT_WRITE_BATCH_SIZE = 100
+
+# Maximum time, in seconds, that BackgroundCIDBWriter holds on to a row
+# before writing it.
+DEFAULT_WRITE_INTERVAL = 5
+
+# Maximum time, in seconds, that BackgroundCIDBWriter waits for queued rows
+# to be written when the build finishes.
+DEFAULT_FLUSH_TIMEOUT = 60
+
+# Queue marker asking BackgroundCIDBWriter to write all pending rows.
+_FLUSH = '__flush__'
+
+# Schema version that added the resource usage columns to buildStageTable.
+USAGE_SCHEMA_VERSION = 7
+# The buildStageTable columns holding the resources used by a stage. These
+# match the keys of the usage dictionaries that stages record in metadata.
+BUILD_STAGE_USAGE_COLUMNS = ('cpu_user_seconds', 'cpu_sys_seconds',
+                             'io_read_bytes', 'io_write_bytes',
+                             'memory_max_usage_bytes')
+
 class DBException(Exception):
   """General exception class for this module."""
 
@@ -44,6 +72,51 @@ def minimum_schema(min_version):
   return decorator
 
 
+def _GetCLActionValues(build_id, cl_action):
+  """Get the clActionTable column values for a cl_action tuple.
+
+  Args:
+    build_id: primary key of build that performed this action.
+    cl_action: A cl_action tuple, as found in the metadata dict.
+
+  Returns:
+    A dictionary of column values.
+  """
+  # TODO(akeshet): Refactor to use either cl action tuples out of the
+  # metadata dict (as now) OR CLActionTuple objects.
+  change_source = 'internal' if cl_action[0]['internal'] else 'external'
+  return {
+      'build_id' : build_id,
+      'change_source' : change_source,
+      'change_number': cl_action[0]['gerrit_number'],
+      'patch_number' : cl_action[0]['patch_number'],
+      'action' : cl_action[1],
+      'timestamp' : datetime.datetime.fromtimestamp(cl_action[2]),
+      'reason' : cl_action[3]}
+
+
+def _GetBuildStageValues(build_id, stage_name, board, status, log_url,
+                         duration_seconds, summary, usage=None):
+  """Get the buildStageTable column values for a build stage.
+
+  See CIDBConnection.InsertBuildStage for a description of the arguments.
+
+  Returns:
+    A dictionary of column values.
+  """
+  values = {'build_id': build_id,
+            'name': stage_name,
+            'board': board,
+            'status': status,
+            'log_url': log_url,
+            'duration_seconds': duration_seconds,
+            'summary': summary}
+  if usage:
+    for column in BUILD_STAGE_USAGE_COLUMNS:
+      values[column] = usage.get(column)
+  return values
+
+
 class StrictModeListener(sqlalchemy.interfaces.PoolListener):
   """This listener ensures that STRICT_ALL_TABLES for all connections."""
   # pylint: disable-msg=W0613
@@ -283,6 +356,37 @@ class SchemaVersionedMySQLConnection(object):
     r = self._Execute(upd, values)
     return r.rowcount
 
+  def _SelectPaginated(self, query, key, page_size=DEFAULT_PAGE_SIZE):
+    """Create and execute a SELECT query, streaming its results in pages.
+
+    Rows are fetched |page_size| at a time, ordered by |key|, with each
+    subsequent page starting after the last |key| seen. This keeps every
+    page a cheap index range scan, and means the full result set is never
+    held in memory.
+
+    Args:
+      query: A sqlalchemy select object, without any ORDER BY or LIMIT.
+      key: A unique, indexed sqlalchemy column of |query| to page by,
+           usually the primary key.
+      page_size: Number of rows to fetch per query.
+
+    Yields:
+      Dictionaries mapping column name to value, one per row, in ascending
+      |key| order.
+    """
+    last_key = None
+    while True:
+      page = query
+      if last_key is not None:
+        page = page.where(key > last_key)
+      rows = self._Execute(page.order_by(key).limit(page_size)).fetchall()
+      for row in rows:
+        yield dict(row)
+
+      if len(rows) < page_size:
+        return
+      last_key = rows[-1][key]
+
   def _Execute(self, query, *args, **kwargs):
     """Execute a query using engine, with retires.
 
@@ -397,30 +501,12 @@ class CIDBConnection(SchemaVersionedMySQLConnection):
     if not cl_actions:
       return 0
 
-    values = []
-    # TODO(akeshet): Refactor to use either cl action tuples out of the
-    # metadata dict (as now) OR CLActionTuple objects.
-    for cl_action in cl_actions:
-      change_source = 'internal' if cl_action[0]['internal'] else 'external'
-      change_number = cl_action[0]['gerrit_number']
-      patch_number = cl_action[0]['patch_number']
-      action = cl_action[1]
-      timestamp = cl_action[2]
-      reason = cl_action[3]
-      values.append({
-          'build_id' : build_id,
-          'change_source' : change_source,
-          'change_number': change_number,
-          'patch_number' : patch_number,
-          'action' : action,
-          'timestamp' : datetime.datetime.fromtimestamp(timestamp),
-          'reason' : reason})
-
+    values = [_GetCLActionValues(build_id, x) for x in cl_actions]
     return self._InsertMany('clActionTable', values)
 
   @minimum_schema(4)
   def InsertBuildStage(self, build_id, stage_name, board, status,
-                       log_url, duration_seconds, summary):
+                       log_url, duration_seconds, summary, usage=None):
     """Insert a build stage into buildStageTable.
 
     Args:
@@ -431,18 +517,20 @@ class CIDBConnection(SchemaVersionedMySQLConnection):
       log_url: URL of stage log
       duration_seconds: run time of stage, in seconds
       summary: summary message of stage
+      usage: Optional dictionary of the resources used by the stage, keyed
+             by the names in BUILD_STAGE_USAGE_COLUMNS. Ignored if the
+             database schema predates those columns.
 
     Returns:
       Primary key of inserted stage.
     """
+    if self.schema_version < USAGE_SCHEMA_VERSION:
+      usage = None
     return self._Insert('buildStageTable',
-                        {'build_id': build_id,
-                         'name': stage_name,
-                         'board': board,
-                         'status': status,
-                         'log_url': log_url,
-                         'duration_seconds': duration_seconds,
-                         'summary': summary})
+                        _GetBuildStageValues(build_id, stage_name, board,
+                                             status, log_url,
+                                             duration_seconds, summary,
+                                             usage=usage))
 
   @minimum_schema(4)
   def InsertBuildStages(self, stages):
@@ -515,6 +603,322 @@ class CIDBConnection(SchemaVersionedMySQLConnection):
                                           'status_pickle' : status_pickle,
                                           'final' : True})
 
+  @minimum_schema(2)
+  def GetBuildHistory(self, build_config, start_time=None, end_time=None,
+                      page_size=DEFAULT_PAGE_SIZE):
+    """Stream the builds of a given config, optionally within a time range.
+
+    The metadata_json and status_pickle columns are not returned, as they are
+    large; use GetBuildMetadata for those.
+
+    Args:
+      build_config: cbuildbot config of the builds.
+      start_time: (Optional) Unix timestamp. Only return builds that started
+                  at or after this time.
+      end_time: (Optional) Unix timestamp. Only return builds that started
+                before this time.
+      page_size: Number of builds to fetch from the database per query.
+
+    Yields:
+      A dictionary of build columns for each build, in ascending build id
+      order.
+    """
+    self._ReflectToMetadata()
+    t = self._meta.tables['buildTable']
+    columns = [c for c in t.c if c.name not in ('metadata_json',
+                                                'status_pickle')]
+    query = sqlalchemy.select(columns).where(t.c.build_config == build_config)
+    if start_time is not None:
+      query = query.where(
+          t.c.start_time >= datetime.datetime.fromtimestamp(start_time))
+    if end_time is not None:
+      query = query.where(
+          t.c.start_time < datetime.datetime.fromtimestamp(end_time))
+    return self._SelectPaginated(query, t.c.id, page_size=page_size)
+
+  @minimum_schema(2)
+  def GetBuildMetadata(self, build_id):
+    """Get the metadata.json contents of a build.
+
+    Args:
+      build_id: primary key of the build.
+
+    Returns:
+      The metadata JSON string that was recorded by UpdateMetadata, or None.
+    """
+    self._ReflectToMetadata()
+    t = self._meta.tables['buildTable']
+    query = sqlalchemy.select([t.c.metadata_json]).where(t.c.id == build_id)
+    row = self._Execute(query).fetchone()
+    return row[0] if row else None
+
+  @minimum_schema(2)
+  def GetSlaveStatuses(self, master_build_id):
+    """Get the statuses of the slave builds of a given master build.
+
+    Args:
+      master_build_id: primary key of the master build.
+
+    Returns:
+      A list of dictionaries, one per slave build, with keys id,
+      build_config, status, start_time and finish_time.
+    """
+    self._ReflectToMetadata()
+    t = self._meta.tables['buildTable']
+    query = sqlalchemy.select(
+        [t.c.id, t.c.build_config, t.c.status, t.c.start_time,
+         t.c.finish_time]).where(t.c.master_build_id == master_build_id)
+    return list(self._SelectPaginated(query, t.c.id))
+
+  @minimum_schema(3)
+  def GetCLActionHistory(self, change_number, change_source=None,
+                         page_size=DEFAULT_PAGE_SIZE):
+    """Stream the actions that were taken on a given change.
+
+    Args:
+      change_number: Gerrit change number.
+      change_source: (Optional) 'internal' or 'external'. If None, actions
+                     on changes with |change_number| from either source are
+                     returned.
+      page_size: Number of actions to fetch from the database per query.
+
+    Yields:
+      A dictionary of clActionTable columns for each action, in ascending
+      action id order.
+    """
+    self._ReflectToMetadata()
+    t = self._meta.tables['clActionTable']
+    query = t.select().where(t.c.change_number == change_number)
+    if change_source is not None:
+      query = query.where(t.c.change_source == change_source)
+    return self._SelectPaginated(query, t.c.id, page_size=page_size)
+
+  @minimum_schema(4)
+  def GetStageDurations(self, stage_name, build_config=None, start_time=None,
+                        end_time=None, page_size=DEFAULT_PAGE_SIZE):
+    """Stream the results and durations of all runs of a given stage.
+
+    Args:
+      stage_name: Name of the stage.
+      build_config: (Optional) Only return stages of builds of this config.
+      start_time: (Optional) Unix timestamp. Only return stages of builds that
+                  started at or after this time.
+      end_time: (Optional) Unix timestamp. Only return stages of builds that
+                started before this time.
+      page_size: Number of stages to fetch from the database per query.
+
+    Yields:
+      A dictionary for each stage with keys id, build_id, board, status,
+      duration_seconds, build_config and start_time, in ascending stage id
+      order.
+    """
+    self._ReflectToMetadata()
+    stages = self._meta.tables['buildStageTable']
+    builds = self._meta.tables['buildTable']
+    query = sqlalchemy.select(
+        [stages.c.id, stages.c.build_id, stages.c.board, stages.c.status,
+         stages.c.duration_seconds, builds.c.build_config,
+         builds.c.start_time]).select_from(
+             stages.join(builds, stages.c.build_id == builds.c.id)).where(
+                 stages.c.name == stage_name)
+    if build_config is not None:
+      query = query.where(builds.c.build_config == build_config)
+    if start_time is not None:
+      query = query.where(
+          builds.c.start_time >= datetime.datetime.fromtimestamp(start_time))
+    if end_time is not None:
+      query = query.where(
+          builds.c.start_time < datetime.datetime.fromtimestamp(end_time))
+    return self._SelectPaginated(query, stages.c.id, page_size=page_size)
+
+
+class BackgroundCIDBWriter(object):
+  """Write-behind queue for the rows that builds insert into CIDB.
+
+  Stages call InsertBuildStage and InsertCLActions, which only put the rows
+  on a queue and return immediately. A single writer thread in the process
+  that called Start batches the queued rows into multi-row INSERTs over the
+  database connection of that process.
+
+  The queue is a multiprocessing queue, so stages running in processes forked
+  after Start (e.g. via parallel.RunParallelSteps) can use the same writer;
+  they do not open database connections of their own.
+
+  Usage:
+    with BackgroundCIDBWriter(db) as writer:
+      writer.InsertBuildStage(build_id, ...)
+      ...
+      writer.FinishBuild(build_id, ...)
+  """
+
+  def __init__(self, db, batch_size=DEFAULT_WRITE_BATCH_SIZE,
+               interval=DEFAULT_WRITE_INTERVAL):
+    """BackgroundCIDBWriter constructor.
+
+    Args:
+      db: The CIDBConnection to write with.
+      batch_size: Maximum number of rows to write per INSERT.
+      interval: Maximum time, in seconds, to hold on to a row before writing
+                it.
+    """
+    self._db = db
+    self._batch_size = batch_size
+    self._interval = interval
+    self._queue = multiprocessing.Queue()
+    self._thread = None
+    self._owner_pid = None
+    # Events of outstanding Flush calls, keyed by request number.
+    self._flush_events = {}
+    self._flush_count = 0
+
+  def __enter__(self):
+    self.Start()
+    return self
+
+  def __exit__(self, _type, _value, _traceback):
+    self.Stop()
+
+  def Start(self):
+    """Start the writer thread in this process."""
+    assert self._thread is None, 'BackgroundCIDBWriter is already running.'
+    self._owner_pid = os.getpid()
+    self._thread = threading.Thread(target=self._Run,
+                                    name='BackgroundCIDBWriter')
+    self._thread.daemon = True
+    self._thread.start()
+
+  def Stop(self, timeout=DEFAULT_FLUSH_TIMEOUT):
+    """Write all pending rows, and stop the writer thread.
+
+    Args:
+      timeout: Maximum time, in seconds, to wait for pending rows to be
+               written.
+
+    Returns:
+      True if all pending rows were written, False if we timed out.
+    """
+    if self._thread is None or os.getpid() != self._owner_pid:
+      return True
+
+    self._queue.put(None)
+    self._thread.join(timeout)
+    if self._thread.is_alive():
+      logging.warning('Timed out after %ss waiting for CIDB writes to '
+                      'finish; abandoning them.', timeout)
+      return False
+
+    self._thread = None
+    return True
+
+  def Flush(self, timeout=DEFAULT_FLUSH_TIMEOUT):
+    """Write all rows queued so far, waiting at most |timeout| seconds.
+
+    Returns:
+      True if all rows queued so far were written, False if we timed out.
+    """
+    if self._thread is None or os.getpid() != self._owner_pid:
+      return True
+
+    self._flush_count += 1
+    event = self._flush_events[self._flush_count] = threading.Event()
+    self._queue.put((_FLUSH, self._flush_count))
+    event.wait(timeout)
+    self._flush_events.pop(self._flush_count, None)
+    return event.is_set()
+
+  def InsertBuildStage(self, build_id, stage_name, board, status,
+                       log_url, duration_seconds, summary, usage=None):
+    """Queue a build stage for insertion into buildStageTable.
+
+    See CIDBConnection.InsertBuildStage for a description of the arguments.
+    """
+    if usage and self._db.schema_version < USAGE_SCHEMA_VERSION:
+      usage = None
+    self._Put('buildStageTable',
+              [_GetBuildStageValues(build_id, stage_name, board, status,
+                                    log_url, duration_seconds, summary,
+                                    usage=usage)])
+
+  def InsertCLActions(self, build_id, cl_actions):
+    """Queue a list of |cl_actions| for insertion into clActionTable.
+
+    See CIDBConnection.InsertCLActions for a description of the arguments.
+    """
+    if cl_actions:
+      self._Put('clActionTable',
+                [_GetCLActionValues(build_id, x) for x in cl_actions])
+
+  def FinishBuild(self, build_id, finish_time=None, status=None,
+                  status_pickle=None, timeout=DEFAULT_FLUSH_TIMEOUT):
+    """Write all pending rows, then mark the given build as finished.
+
+    The wait for pending rows is bounded by |timeout|, so that a slow
+    database cannot hold up the end of the build indefinitely. The build
+    row itself is always updated.
+
+    See CIDBConnection.FinishBuild for a description of the other arguments.
+    """
+    self.Flush(timeout=timeout)
+    self._db.FinishBuild(build_id, finish_time=finish_time, status=status,
+                         status_pickle=status_pickle)
+
+  def _Put(self, table, rows):
+    """Queue |rows| for insertion into |table|."""
+    if self._owner_pid is None:
+      raise DBException('BackgroundCIDBWriter has not been started.')
+    self._queue.put((table, rows))
+
+  def _Write(self, pending):
+    """Write out |pending| rows, in batches of at most self._batch_size.
+
+    Args:
+      pending: A dictionary mapping table names to lists of rows. It is
+               emptied by this call.
+    """
+    for table, rows in pending.items():
+      for i in xrange(0, len(rows), self._batch_size):
+        batch = rows[i:i + self._batch_size]
+        try:
+          # pylint: disable=W0212
+          self._db._InsertMany(table, batch)
+        except Exception:
+          # Losing a few rows of stats is better than failing the build.
+          logging.error('Failed to write %d rows to %s', len(batch), table,
+                        exc_info=True)
+    pending.clear()
+
+  def _Run(self):
+    """Main loop of the writer thread."""
+    pending = {}
+    pending_count = 0
+    deadline = None
+    while True:
+      timeout = None
+      if deadline is not None:
+        timeout = max(0, deadline - time.time())
+      try:
+        item = self._queue.get(timeout=timeout)
+      except Queue.Empty:
+        item = (_FLUSH, None)
+
+      if item is not None and item[0] != _FLUSH:
+        table, rows = item
+        pending.setdefault(table, []).extend(rows)
+        pending_count += len(rows)
+        if deadline is None:
+          deadline = time.time() + self._interval
+        if pending_count < self._batch_size:
+          continue
+
+      self._Write(pending)
+      pending_count = 0
+      deadline = None
+
+      if item is None:
+        return
+      if item[0] == _FLUSH and item[1] in self._flush_events:
+        self._flush_events[item[1]].set()
+
 
 def GetCIDBConnectionForBuilder(builder_run):
   """Get a CIDBConnection.
@@ -19,6 +19,7 @@ import glob
 import logging
 import os
 import sys
+import time
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(
     os.path.abspath(__file__)))))
 
@@ -140,7 +141,7 @@ class DataSeries0Test(CIDBIntegrationTest):
     # Migrate db to specified version. As new schema versions are added,
     # migrations to later version can be applied after the test builds are
     # simulated, to test that db contents are correctly migrated.
-    self._PrepareFreshDatabase(5)
+    root_db = self._PrepareFreshDatabase(5)
 
     bot_db = cidb.CIDBConnection(TEST_DB_CRED_BOT)
 
@@ -186,6 +187,55 @@ class DataSeries0Test(CIDBIntegrationTest):
     self.assertEqual(rejected_cl_count, 8)
     self.assertEqual(total_actions, 1877)
 
+    # Apply the remaining migrations to the populated database, then check
+    # the read API against the raw queries.
+    root_db.ApplySchemaMigrations()
+    readonly_db = cidb.CIDBConnection(TEST_DB_CRED_READONLY)
+    self._CheckReadAPI(readonly_db)
+
+  def _CheckReadAPI(self, db):
+    """Sanity check the CIDBConnection read API against raw queries."""
+    engine = db._GetEngine()
+
+    master_count = engine.execute(
+        'select count(*) from buildTable where build_config="master-paladin"'
+        ).fetchall()[0][0]
+    masters = list(db.GetBuildHistory('master-paladin', page_size=7))
+    self.assertEqual(len(masters), master_count)
+    self.assertEqual([x['id'] for x in masters],
+                     sorted(x['id'] for x in masters))
+    self.assertNotIn('metadata_json', masters[0])
+    self.assertTrue(db.GetBuildMetadata(masters[0]['id']))
+
+    # Only builds that started within the time range are returned.
+    start = masters[1]['start_time']
+    end = masters[-1]['start_time']
+    in_range = list(db.GetBuildHistory(
+        'master-paladin', start_time=time.mktime(start.timetuple()),
+        end_time=time.mktime(end.timetuple())))
+    self.assertEqual(len(in_range), master_count - 2)
+
+    slave_count = engine.execute(
+        'select count(*) from buildTable where master_build_id=%s',
+        masters[0]['id']).fetchall()[0][0]
+    slaves = db.GetSlaveStatuses(masters[0]['id'])
+    self.assertEqual(len(slaves), slave_count)
+    self.assertTrue(all(x['status'] in ('pass', 'fail') for x in slaves))
+
+    change_number, change_source, action_count = engine.execute(
+        'select change_number, change_source, count(*) from clActionTable '
+        'group by change_number, change_source order by count(*) desc '
+        'limit 1').fetchall()[0]
+    actions = list(db.GetCLActionHistory(change_number, change_source,
+                                         page_size=2))
+    self.assertEqual(len(actions), action_count)
+
+    stage_name, stage_count = engine.execute(
+        'select name, count(*) from buildStageTable group by name '
+        'order by count(*) desc limit 1').fetchall()[0]
+    stages = list(db.GetStageDurations(stage_name, page_size=50))
+    self.assertEqual(len(stages), stage_count)
+
   def simulate_builds(self, db, metadatas):
     """Simulate a serires of Commit Queue master and slave builds.
 
@@ -285,7 +335,7 @@ def SimulateCQBuildFinish(db, metadata, build_id):
     db.InsertBuildStage(build_id, r['name'], r['board'],
                         _TranslateStatus(r['status']), r['log'],
                         cros_build_lib.ParseDurationToSeconds(r['duration']),
-                        r['summary'])
+                        r['summary'], usage=r.get('usage'))
   if len(stage_results) > 1:
     stages = [{'build_id': build_id,
                'name': r['name'],
@@ -0,0 +1,294 @@
+#!/usr/bin/python
+# Copyright 2014 The Chromium OS Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Unit tests for cidb.py module that do not require a database."""
+
+# pylint: disable-msg= W0212
+
+import datetime
+import os
+import sqlalchemy
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__)))))
+
+from chromite.cbuildbot import constants
+from chromite.lib import cidb
+from chromite.lib import cros_test_lib
+
+# TODO(build): Finish test wrapper (http://crosbug.com/37517).
+# Until then, this has to be after the chromite imports.
+import mock
+
+
+class BackgroundCIDBWriterTest(cros_test_lib.TestCase):
+  """Tests of BackgroundCIDBWriter."""
+
+  def setUp(self):
+    self.db = mock.Mock()
+    self.writes = []
+    self.db._InsertMany.side_effect = (
+        lambda table, rows: self.writes.append((table, len(rows))))
+
+  def _InsertStages(self, writer, count):
+    for i in range(count):
+      writer.InsertBuildStage(1, 'Stage%d' % i, 'x86-generic', 'pass',
+                              'http://log', 10, 'summary')
+
+  def testBatchesRows(self):
+    """Rows are written in batches of at most batch_size."""
+    with cidb.BackgroundCIDBWriter(self.db, batch_size=3,
+                                   interval=1000) as writer:
+      self._InsertStages(writer, 7)
+      action = ({'gerrit_number': 1, 'patch_number': 1, 'internal': False},
+                constants.CL_ACTION_PICKED_UP, 0, '')
+      writer.InsertCLActions(1, [action])
+    self.assertEqual(sum(n for t, n in self.writes if t == 'buildStageTable'),
+                     7)
+    self.assertTrue(all(n <= 3 for _, n in self.writes))
+    self.assertIn(('clActionTable', 1), self.writes)
+
+  def testFinishBuildFlushes(self):
+    """FinishBuild writes pending rows before finishing the build."""
+    calls = []
+    self.db._InsertMany.side_effect = lambda table, rows: calls.append(table)
+    self.db.FinishBuild.side_effect = lambda *_a, **_kw: calls.append('finish')
+    with cidb.BackgroundCIDBWriter(self.db, interval=1000) as writer:
+      self._InsertStages(writer, 2)
+      writer.FinishBuild(1, status='pass')
+    self.assertEqual(calls, ['buildStageTable', 'finish'])
+
+  def testIntervalFlush(self):
+    """Rows are written after the interval even if the batch is not full."""
+    with cidb.BackgroundCIDBWriter(self.db, interval=0) as writer:
+      self._InsertStages(writer, 1)
+      self.assertTrue(writer.Flush(timeout=10))
+      self.assertEqual(self.writes, [('buildStageTable', 1)])
+
+  def testWriteErrorsAreLogged(self):
+    """Database errors do not propagate to the caller."""
+    self.db._InsertMany.side_effect = cidb.DBException('boom')
+    with cidb.BackgroundCIDBWriter(self.db) as writer:
+      self._InsertStages(writer, 1)
+      self.assertTrue(writer.Flush(timeout=10))
+
+  def testUsageColumns(self):
+    """Stage usage is only written if the schema has the usage columns."""
+    rows = []
+    self.db._InsertMany.side_effect = lambda table, r: rows.extend(r)
+    usage = dict((k, 1) for k in cidb.BUILD_STAGE_USAGE_COLUMNS)
+    for version in (cidb.USAGE_SCHEMA_VERSION - 1, cidb.USAGE_SCHEMA_VERSION):
+      self.db.schema_version = version
+      with cidb.BackgroundCIDBWriter(self.db) as writer:
+        writer.InsertBuildStage(1, 'Stage', 'x86-generic', 'pass',
+                                'http://log', 10, 'summary', usage=usage)
+    self.assertNotIn('cpu_user_seconds', rows[0])
+    self.assertEqual(rows[1]['cpu_user_seconds'], 1)
+
+  def testNotStarted(self):
+    """Queuing rows on a writer that was never started is an error."""
+    writer = cidb.BackgroundCIDBWriter(self.db)
+    self.assertRaises(cidb.DBException, self._InsertStages, writer, 1)
+
+
+class CIDBQueryTest(cros_test_lib.MockTestCase):
+  """Tests of the CIDBConnection queries, run against an in-memory engine."""
+
+  def setUp(self):
+    engine = sqlalchemy.create_engine('sqlite://')
+    meta = sqlalchemy.MetaData()
+    self.builds = sqlalchemy.Table(
+        'buildTable', meta,
+        sqlalchemy.Column('id', sqlalchemy.Integer, primary_key=True),
+        sqlalchemy.Column('master_build_id', sqlalchemy.Integer),
+        sqlalchemy.Column('build_config', sqlalchemy.String(80)),
+        sqlalchemy.Column('status', sqlalchemy.String(80)),
+        sqlalchemy.Column('start_time', sqlalchemy.DateTime),
+        sqlalchemy.Column('finish_time', sqlalchemy.DateTime),
+        sqlalchemy.Column('status_pickle', sqlalchemy.LargeBinary),
+        sqlalchemy.Column('metadata_json', sqlalchemy.LargeBinary))
+    self.actions = sqlalchemy.Table(
+        'clActionTable', meta,
+        sqlalchemy.Column('id', sqlalchemy.Integer, primary_key=True),
+        sqlalchemy.Column('build_id', sqlalchemy.Integer),
+        sqlalchemy.Column('change_number', sqlalchemy.Integer),
+        sqlalchemy.Column('change_source', sqlalchemy.String(80)),
+        sqlalchemy.Column('action', sqlalchemy.String(80)))
+    self.stages = sqlalchemy.Table(
+        'buildStageTable', meta,
+        sqlalchemy.Column('id', sqlalchemy.Integer, primary_key=True),
+        sqlalchemy.Column('build_id', sqlalchemy.Integer),
+        sqlalchemy.Column('name', sqlalchemy.String(80)),
+        sqlalchemy.Column('board', sqlalchemy.String(80)),
+        sqlalchemy.Column('status', sqlalchemy.String(80)),
+        sqlalchemy.Column('duration_seconds', sqlalchemy.Integer))
+    meta.create_all(engine)
+    self.engine = engine
+
+    # Skip __init__, which connects to a MySQL server.
+    self.db = cidb.CIDBConnection.__new__(cidb.CIDBConnection)
+    self.db._meta = meta
+    self.db.schema_version = cidb.USAGE_SCHEMA_VERSION
+    self.PatchObject(self.db, '_GetEngine', return_value=engine)
+    self.queries = []
+    execute = self.db._Execute
+    def _Execute(query, *args, **kwargs):
+      self.queries.append(str(query))
+      return execute(query, *args, **kwargs)
+    self.PatchObject(self.db, '_Execute', side_effect=_Execute)
+
+  def _Seconds(self, hours):
+    """Return the Unix timestamp |hours| after an arbitrary epoch."""
+    return 1400000000 + hours * 3600
+
+  def _Time(self, hours):
+    """Return the datetime matching _Seconds(|hours|)."""
+    return datetime.datetime.fromtimestamp(self._Seconds(hours))
+
+  def _InsertBuilds(self):
+    """Insert builds 1-5: a master (1) and slaves of two configs."""
+    rows = [
+        {'id': 1, 'build_config': 'master-paladin', 'status': 'pass',
+         'start_time': self._Time(0), 'metadata_json': '{"a": 1}'},
+        {'id': 2, 'build_config': 'x86-paladin', 'master_build_id': 1,
+         'status': 'pass', 'start_time': self._Time(1)},
+        {'id': 3, 'build_config': 'arm-paladin', 'master_build_id': 1,
+         'status': 'fail', 'start_time': self._Time(2)},
+        {'id': 4, 'build_config': 'x86-paladin', 'status': 'fail',
+         'start_time': self._Time(3)},
+        {'id': 5, 'build_config': 'x86-paladin', 'status': 'pass',
+         'start_time': self._Time(4)},
+    ]
+    for row in rows:
+      for column in self.builds.c:
+        row.setdefault(column.name, None)
+    self.engine.execute(self.builds.insert(), rows)
+
+  def testSelectPaginated(self):
+    """Pages are fetched in key order, each starting after the last key."""
+    self._InsertBuilds()
+    query = sqlalchemy.select([self.builds.c.id])
+    rows = list(self.db._SelectPaginated(query, self.builds.c.id,
+                                         page_size=2))
+    self.assertEqual([r['id'] for r in rows], [1, 2, 3, 4, 5])
+    self.assertEqual(len(self.queries), 3)
+    for sql in self.queries:
+      self.assertIn('ORDER BY "buildTable".id', sql)
+      self.assertIn('LIMIT', sql)
+    self.assertNotIn('"buildTable".id >', self.queries[0])
+    self.assertIn('"buildTable".id >', self.queries[1])
+
+  def testSelectPaginatedFullLastPage(self):
+    """A full last page is followed by one query for an empty page."""
+    self._InsertBuilds()
+    query = sqlalchemy.select([self.builds.c.id]).where(
+        self.builds.c.id < 5)
+    rows = list(self.db._SelectPaginated(query, self.builds.c.id,
+                                         page_size=2))
+    self.assertEqual([r['id'] for r in rows], [1, 2, 3, 4])
+    self.assertEqual(len(self.queries), 3)
+
+  def testSelectPaginatedIsLazy(self):
+    """Later pages are not fetched until they are needed."""
+    self._InsertBuilds()
+    rows = self.db._SelectPaginated(sqlalchemy.select([self.builds.c.id]),
+                                    self.builds.c.id, page_size=2)
+    self.assertEqual(next(rows)['id'], 1)
+    self.assertEqual(len(self.queries), 1)
+
+  def testGetBuildHistory(self):
+    """Builds are filtered by config and start time, without large columns."""
+    self._InsertBuilds()
+    builds = list(self.db.GetBuildHistory('x86-paladin', page_size=2))
+    self.assertEqual([b['id'] for b in builds], [2, 4, 5])
+    self.assertNotIn('metadata_json', builds[0])
+    self.assertNotIn('status_pickle', builds[0])
+    self.assertEqual(builds[1]['status'], 'fail')
+
+    builds = self.db.GetBuildHistory('x86-paladin',
+                                     start_time=self._Seconds(3),
+                                     end_time=self._Seconds(4))
+    self.assertEqual([b['id'] for b in builds], [4])
+
+  def testGetBuildMetadata(self):
+    """The metadata of a build is returned, or None for unknown builds."""
+    self._InsertBuilds()
+    self.assertEqual(self.db.GetBuildMetadata(1), '{"a": 1}')
+    self.assertEqual(self.db.GetBuildMetadata(2), None)
+    self.assertEqual(self.db.GetBuildMetadata(42), None)
+
+  def testGetSlaveStatuses(self):
+    """Only the slaves of the given master are returned."""
+    self._InsertBuilds()
+    slaves = self.db.GetSlaveStatuses(1)
+    self.assertEqual([(s['id'], s['build_config'], s['status'])
+                      for s in slaves],
+                     [(2, 'x86-paladin', 'pass'), (3, 'arm-paladin', 'fail')])
+    self.assertEqual(set(slaves[0]), set(['id', 'build_config', 'status',
+                                          'start_time', 'finish_time']))
+    self.assertEqual(self.db.GetSlaveStatuses(2), [])
+
+  def testGetCLActionHistory(self):
+    """Actions are filtered by change number and source."""
+    self.engine.execute(self.actions.insert(), [
+        {'id': 1, 'build_id': 1, 'change_number': 10,
+         'change_source': 'external', 'action': 'picked_up'},
+        {'id': 2, 'build_id': 1, 'change_number': 10,
+         'change_source': 'internal', 'action': 'picked_up'},
+        {'id': 3, 'build_id': 1, 'change_number': 11,
+         'change_source': 'external', 'action': 'picked_up'},
+        {'id': 4, 'build_id': 2, 'change_number': 10,
+         'change_source': 'external', 'action': 'submitted'},
+    ])
+    actions = list(self.db.GetCLActionHistory(10, page_size=1))
+    self.assertEqual([a['id'] for a in actions], [1, 2, 4])
+    self.assertEqual(len(self.queries), 4)
+    actions = self.db.GetCLActionHistory(10, change_source='external')
+    self.assertEqual([(a['id'], a['action']) for a in actions],
+                     [(1, 'picked_up'), (4, 'submitted')])
+
+  def testGetStageDurations(self):
+    """Stages are joined with their builds and filtered by both."""
+    self._InsertBuilds()
+    self.engine.execute(self.stages.insert(), [
+        {'id': 1, 'build_id': 2, 'name': 'BuildPackages', 'board': 'x86',
+         'status': 'pass', 'duration_seconds': 100},
+        {'id': 2, 'build_id': 2, 'name': 'UnitTest', 'board': 'x86',
+         'status': 'pass', 'duration_seconds': 50},
+        {'id': 3, 'build_id': 3, 'name': 'BuildPackages', 'board': 'arm',
+         'status': 'fail', 'duration_seconds': 200},
+        {'id': 4, 'build_id': 5, 'name': 'BuildPackages', 'board': 'x86',
+         'status': 'pass', 'duration_seconds': 300},
+    ])
+    stages = list(self.db.GetStageDurations('BuildPackages', page_size=2))
+    self.assertEqual([(s['id'], s['build_config'], s['duration_seconds'])
+                      for s in stages],
+                     [(1, 'x86-paladin', 100), (3, 'arm-paladin', 200),
+                      (4, 'x86-paladin', 300)])
+    self.assertEqual(stages[0]['start_time'], self._Time(1))
+
+    stages = self.db.GetStageDurations('BuildPackages',
+                                       build_config='x86-paladin',
+                                       start_time=self._Seconds(2))
+    self.assertEqual([s['id'] for s in stages], [4])
+    stages = self.db.GetStageDurations('BuildPackages',
+                                       end_time=self._Seconds(2))
+    self.assertEqual([s['id'] for s in stages], [1])
+
+  def testMinimumSchema(self):
+    """Queries refuse to run against a schema that predates their tables."""
+    self.db.schema_version = 3
+    self.assertRaises(cidb.UnsupportedMethodException,
+                      self.db.GetStageDurations, 'BuildPackages')
+    self.db.schema_version = 2
+    self.assertRaises(cidb.UnsupportedMethodException,
+                      self.db.GetCLActionHistory, 10)
+    self.db.schema_version = 1
+    self.assertRaises(cidb.UnsupportedMethodException,
+                      self.db.GetBuildHistory, 'x86-paladin')
+
+
+if __name__ == '__main__':
+  cros_test_lib.main()
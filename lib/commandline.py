@@ -27,6 +27,7 @@ from chromite.lib import cros_build_lib
 from chromite.lib import git
 from chromite.lib import gs
 from chromite.lib import osutils
+from chromite.lib import sampling_profiler
 
 
 CHECKOUT_TYPE_UNKNOWN = 'unknown'
@@ -560,6 +561,9 @@ def ScriptWrapperMain(find_target_func, argv=None,
       given, sys.argv is defaulted to.
     log_level: Default logging level to start at.
     log_format: Default logging format to use.
+
+  If the constants.PROFILE_ENVVAR environment variable is set, the target is
+  run under a sampling_profiler.SamplingProfiler writing to that file.
   """
   if argv is None:
     argv = sys.argv[:]
@@ -583,6 +587,10 @@ def ScriptWrapperMain(find_target_func, argv=None,
 
   signal.signal(signal.SIGTERM, _DefaultHandler)
 
+  profiler = sampling_profiler.ProfilerFromEnvironment()
+  if profiler is not None:
+    profiler.Start()
+
   ret = 1
   try:
     ret = target(argv[1:])
@@ -603,6 +611,8 @@ def ScriptWrapperMain(find_target_func, argv=None,
     sys.stderr.flush()
     raise
   finally:
+    if profiler is not None:
+      profiler.Stop()
     logging.shutdown()
 
   if ret is None:
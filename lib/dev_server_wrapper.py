@@ -5,6 +5,8 @@
 """Module containing methods and classes to interact with a devserver instance.
 """
 
+import errno
+import json
 import logging
 import multiprocessing
 import os
@@ -15,6 +17,7 @@ import urllib2
 
 from chromite.cbuildbot import constants
 from chromite.lib import cros_build_lib
+from chromite.lib import locking
 from chromite.lib import osutils
 from chromite.lib import timeout_util
 from chromite.lib import remote_access
@@ -72,6 +75,9 @@ class DevServerWrapper(multiprocessing.Process):
   # while to start when generating payloads in parallel.
   DEV_SERVER_TIMEOUT = 900
   KILL_TIMEOUT = 10
+  # Seconds between checks whether the devserver is up. A devserver that does
+  # not have to generate payloads starts in about a second.
+  STARTUP_CHECK_PERIOD = 0.5
 
   def __init__(self, static_dir=None, port=None, log_dir=None, src_image=None,
                board=None):
@@ -193,7 +199,7 @@ class DevServerWrapper(multiprocessing.Process):
       timeout_util.WaitForReturnTrue(os.path.exists,
                                      func_args=[self.port_file],
                                      timeout=self.DEV_SERVER_TIMEOUT,
-                                     period=5)
+                                     period=self.STARTUP_CHECK_PERIOD)
     except timeout_util.TimeoutError:
       self.terminate()
       raise DevServerStartupError('Devserver portfile does not exist!')
@@ -231,17 +237,13 @@ class DevServerWrapper(multiprocessing.Process):
     try:
       timeout_util.WaitForReturnTrue(self.IsReady,
                                      timeout=self.DEV_SERVER_TIMEOUT,
-                                     period=5)
+                                     period=self.STARTUP_CHECK_PERIOD)
     except timeout_util.TimeoutError:
       self.terminate()
       raise DevServerStartupError('Devserver did not start')
 
-  def run(self):
-    """Kicks off devserver in a separate process and waits for it to finish."""
-    # Truncate the log file if it already exists.
-    if os.path.exists(self.log_file):
-      osutils.SafeUnlink(self.log_file, sudo=True)
-
+  def _GetDevServerCmd(self):
+    """Returns the command that starts the devserver in the chroot."""
     port = self.port if self.port else 0
     cmd = [self.devserver_bin,
            '--pidfile', cros_build_lib.ToChrootPath(self._pid_file),
@@ -261,8 +263,16 @@ class DevServerWrapper(multiprocessing.Process):
     if self.board:
       cmd.append('--board=%s' % self.board)
 
+    return cmd
+
+  def run(self):
+    """Kicks off devserver in a separate process and waits for it to finish."""
+    # Truncate the log file if it already exists.
+    if os.path.exists(self.log_file):
+      osutils.SafeUnlink(self.log_file, sudo=True)
+
     result = self._RunCommand(
-        cmd, enter_chroot=True,
+        self._GetDevServerCmd(), enter_chroot=True,
         cwd=constants.SOURCE_ROOT, error_code_ok=True,
         redirect_stdout=True, combine_stdout_stderr=True)
     if result.returncode != 0:
@@ -328,6 +338,188 @@ class DevServerWrapper(multiprocessing.Process):
     return cros_build_lib.SudoRunCommand(*args, **kwargs)
 
 
+def _PidExists(pid):
+  """Returns whether a process with |pid| exists (it may belong to root)."""
+  try:
+    os.kill(int(pid), 0)
+  except OSError as e:
+    return e.errno == errno.EPERM
+  return True
+
+
+class ReusableDevServerWrapper(DevServerWrapper):
+  """A local devserver that is left running for later uses.
+
+  The devserver runs in the background, detached from this process. Its pid,
+  port and arguments are recorded in a state file in the static directory.
+  Start reuses a running devserver that was started with the same arguments,
+  and Stop leaves the devserver running; Shutdown stops it. The payloads that
+  the devserver generates are cached in the static directory, so a reused
+  devserver does not generate them again.
+
+  Users of the devserver hold a shared lock between Start and Stop, so that
+  restarting it with other arguments waits until they are done.
+  """
+
+  STATE_DIR = '.devserver_wrapper'
+
+  def __init__(self, static_dir, board=None, src_image=None):
+    """Initialize a ReusableDevServerWrapper instance.
+
+    Args:
+      static_dir: The static directory to be used by the devserver. It
+        must be inside the chroot.
+      board: Override board to pass to the devserver for xbuddy pathing.
+      src_image: The path to the image to be used as the base to
+        generate delta payloads.
+    """
+    state_dir = os.path.join(static_dir, self.STATE_DIR)
+    osutils.SafeMakedirs(state_dir)
+    super(ReusableDevServerWrapper, self).__init__(
+        static_dir=static_dir, log_dir=state_dir, src_image=src_image,
+        board=board)
+    self.state_file = os.path.join(state_dir, 'state.json')
+    # Written by a wrapper shell when the devserver exits.
+    self.exit_file = os.path.join(state_dir, 'dev_server.exit')
+    self._lock = locking.FileLock(os.path.join(state_dir, 'lock'),
+                                  'devserver lock')
+
+  def _GetPIDFilePath(self):
+    """Returns pid file path."""
+    return os.path.join(self.log_dir, 'dev_server.pid')
+
+  def _GetArgs(self):
+    """Returns the arguments that the state of the devserver must match."""
+    return {
+        'board': self.board,
+        'src_image': (os.path.abspath(self.src_image) if self.src_image
+                      else None),
+    }
+
+  def _ReadState(self):
+    """Returns the recorded state of the running devserver, if any."""
+    try:
+      return json.loads(osutils.ReadFile(self.state_file))
+    except (IOError, ValueError):
+      return None
+
+  def is_alive(self):
+    """Returns whether the devserver is running (or still starting)."""
+    if self._pid:
+      return _PidExists(self._pid)
+    return not os.path.exists(self.exit_file)
+
+  def terminate(self):
+    """Kills the devserver."""
+    self._Kill()
+
+  def _Kill(self):
+    """Kills the devserver with SIGTERM, or SIGKILL if SIGTERM fails."""
+    if not self._pid and os.path.exists(self._pid_file):
+      self._pid = self._GetPID()
+    osutils.SafeUnlink(self.state_file)
+    if not self._pid or not _PidExists(self._pid):
+      self._pid = None
+      return
+
+    logging.debug('Stopping devserver instance with pid %s', self._pid)
+    self._RunCommand(['kill', self._pid], error_code_ok=True)
+    try:
+      timeout_util.WaitForReturnTrue(lambda: not _PidExists(self._pid),
+                                     timeout=self.KILL_TIMEOUT,
+                                     period=self.STARTUP_CHECK_PERIOD)
+    except timeout_util.TimeoutError:
+      logging.warning('Devserver is unstoppable. Killing with SIGKILL')
+      try:
+        self._RunCommand(['kill', '-9', self._pid])
+      except cros_build_lib.RunCommandError as e:
+        raise DevServerStopError('Unable to stop devserver: %s' % e)
+    self._pid = None
+
+  def _Reuse(self, restart=False):
+    """Uses the running devserver if it matches and responds.
+
+    Args:
+      restart: Whether to stop a devserver that cannot be used. This needs
+        the exclusive lock.
+
+    Returns:
+      True if the running devserver is used.
+    """
+    state = self._ReadState()
+    if not state:
+      return False
+
+    if state['args'] == self._GetArgs():
+      self._pid, self.port = state['pid'], state['port']
+      try:
+        if self.IsReady():
+          return True
+      except DevServerStartupError:
+        pass
+
+    if restart:
+      logging.info('Restarting the devserver left running.')
+      self._pid = state['pid']
+      self._Kill()
+    self._pid, self.port = None, None
+    return False
+
+  def _Launch(self):
+    """Starts the devserver detached from this process."""
+    # The files belong to root, but the state directory does not.
+    for path in (self._pid_file, self.port_file, self.exit_file,
+                 self.log_file):
+      osutils.SafeUnlink(path)
+    self._pid = None
+
+    script = '("$@"; echo $? >%s) </dev/null >/dev/null 2>&1 &' % (
+        cros_build_lib.ShellQuote(cros_build_lib.ToChrootPath(self.exit_file)))
+    self._RunCommand(['sh', '-c', script, 'sh'] + self._GetDevServerCmd(),
+                     enter_chroot=True, cwd=constants.SOURCE_ROOT)
+    try:
+      self._WaitUntilStarted()
+    except DevServerStartupError:
+      logging.error('Devserver failed to start!')
+      logging.warning(self.TailLog() or 'No devserver log is available.')
+      raise
+    self._pid = self._GetPID()
+    osutils.WriteFile(self.state_file, json.dumps({
+        'pid': self._pid,
+        'port': self.port,
+        'args': self._GetArgs(),
+    }))
+
+  def Start(self):
+    """Reuses a matching running devserver or starts a new one."""
+    self._lock.read_lock()
+    if self._Reuse():
+      logging.info('Reusing the devserver running at port %d', self.port)
+      return
+
+    # Wait for the users of the running devserver before restarting it.
+    self._lock.write_lock()
+    try:
+      # The devserver may have been restarted while waiting for the lock.
+      if not self._Reuse(restart=True):
+        self._Launch()
+    finally:
+      self._lock.read_lock()
+
+  def Stop(self):
+    """Leaves the devserver running for the next user."""
+    logging.debug('Leaving the devserver running at port %s', self.port)
+    self._lock.unlock()
+
+  def Shutdown(self):
+    """Stops the devserver left running in the static directory, if any."""
+    with self._lock.write_lock():
+      state = self._ReadState()
+      if state:
+        self._pid = state['pid']
+        self._Kill()
+
+
 class RemoteDevServerWrapper(DevServerWrapper):
   """A wrapper of a devserver on a remote device.
 
@@ -343,6 +535,8 @@ class RemoteDevServerWrapper(DevServerWrapper):
   # need to generate payloads.
   DEV_SERVER_TIMEOUT = 30
   KILL_TIMEOUT = 10
+  # Each check runs a command over ssh.
+  STARTUP_CHECK_PERIOD = 1
   PID_FILE_PATH = '/tmp/devserver_wrapper.pid'
 
   CHERRYPY_ERROR_MSG = """
@@ -404,7 +598,7 @@ You can fix this with one of the following three options:
     try:
       timeout_util.WaitForReturnTrue(PortFileExists,
                                      timeout=self.DEV_SERVER_TIMEOUT,
-                                     period=5)
+                                     period=self.STARTUP_CHECK_PERIOD)
     except timeout_util.TimeoutError:
       self.terminate()
       raise DevServerStartupError('Devserver portfile does not exist!')
@@ -0,0 +1,106 @@
+#!/usr/bin/python
+# Copyright 2014 The Chromium OS Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Unittests for dev_server_wrapper.py."""
+
+import os
+import signal
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__)))))
+
+from chromite.lib import cros_build_lib
+from chromite.lib import cros_test_lib
+from chromite.lib import dev_server_wrapper
+from chromite.lib import osutils
+from chromite.lib import timeout_util
+
+
+# pylint: disable=W0212
+
+
+class ReusableDevServerWrapperTest(cros_test_lib.MockTempDirTestCase):
+  """Tests of reusing a devserver left running."""
+
+  def setUp(self):
+    self.PatchObject(cros_build_lib, 'IsInsideChroot', return_value=True)
+    # The health check of a running devserver succeeds.
+    self.PatchObject(dev_server_wrapper.DevServerWrapper, 'OpenURL',
+                     return_value='alive')
+    self.run_mock = self.PatchObject(
+        dev_server_wrapper.ReusableDevServerWrapper, '_RunCommand',
+        autospec=True, side_effect=self._FakeRunCommand)
+    self.devservers = []
+    self.static_dir = os.path.join(self.tempdir, 'static')
+
+  def tearDown(self):
+    for pid in self.devservers:
+      self._Kill(pid)
+
+  def _Kill(self, pid):
+    """Kills the fake devserver |pid|."""
+    try:
+      os.kill(pid, signal.SIGKILL)
+    except OSError:
+      return
+    timeout_util.WaitForReturnTrue(
+        lambda: not dev_server_wrapper._PidExists(pid), timeout=10, period=0.1)
+
+  def _FakeRunCommand(self, wrapper, cmd, **_kwargs):
+    """Starts a fake devserver, or runs |cmd| without sudo."""
+    if cmd[0] != 'sh':
+      return cros_build_lib.RunCommand(cmd, error_code_ok=True, quiet=True)
+
+    # Like the devserver, the fake is not a child of this process.
+    pid = int(cros_build_lib.RunCommand(
+        ['sh', '-c', 'sleep 1000 >/dev/null 2>&1 & echo $!'],
+        capture_output=True, quiet=True).output)
+    self.devservers.append(pid)
+    osutils.WriteFile(wrapper._pid_file, str(pid))
+    osutils.WriteFile(wrapper.port_file, str(8080 + len(self.devservers)))
+
+  def _Start(self, **kwargs):
+    """Starts and stops a devserver and returns its wrapper."""
+    ds = dev_server_wrapper.ReusableDevServerWrapper(self.static_dir, **kwargs)
+    ds.Start()
+    ds.Stop()
+    return ds
+
+  def testReuse(self):
+    """A running devserver with the same arguments is reused."""
+    first = self._Start(board='peppy')
+    self.assertEqual(first.port, 8081)
+    second = self._Start(board='peppy')
+    self.assertEqual((second.port, second._pid), (first.port, first._pid))
+    self.assertEqual(len(self.devservers), 1)
+    self.assertTrue(dev_server_wrapper._PidExists(self.devservers[0]))
+
+  def testRestartWithOtherArguments(self):
+    """A running devserver with other arguments is replaced."""
+    self._Start(board='peppy')
+    second = self._Start(board='lumpy')
+    self.assertEqual(second.port, 8082)
+    self.assertFalse(dev_server_wrapper._PidExists(self.devservers[0]))
+    self.assertTrue(dev_server_wrapper._PidExists(self.devservers[1]))
+
+  def testRestartDeadDevServer(self):
+    """A devserver that no longer runs is restarted."""
+    self._Start()
+    self._Kill(self.devservers[0])
+    self.assertEqual(self._Start().port, 8082)
+
+  def testShutdown(self):
+    """Shutdown stops the devserver left running."""
+    self._Start()
+    dev_server_wrapper.ReusableDevServerWrapper(self.static_dir).Shutdown()
+    self.assertFalse(dev_server_wrapper._PidExists(self.devservers[0]))
+    self.assertFalse(os.path.exists(os.path.join(
+        self.static_dir, dev_server_wrapper.ReusableDevServerWrapper.STATE_DIR,
+        'state.json')))
+
+
+if __name__ == '__main__':
+  cros_test_lib.main()
@@ -599,6 +599,91 @@ def RunParallelSteps(steps, max_parallel=None, halt_on_error=False,
       return [queue.get_nowait() for queue in queues]
 
 
+def _SortSteps(steps, deps):
+  """Sort |steps| so that every step comes after the steps it depends on.
+
+  The relative order of |steps| is kept wherever the dependencies allow it.
+
+  Args:
+    steps: A list of functions.
+    deps: A dict mapping each step to the steps it depends on.
+
+  Returns:
+    The sorted list of steps.
+  """
+  placed = set()
+  remaining = list(steps)
+  ordered = []
+  while remaining:
+    for step in remaining:
+      if all(dep in placed for dep in deps.get(step, ())):
+        break
+    else:
+      raise ValueError('Steps have circular dependencies: %r' % remaining)
+    remaining.remove(step)
+    placed.add(step)
+    ordered.append(step)
+  return ordered
+
+
+def RunStepGraph(steps, deps=None, resources=None, halt_on_error=False):
+  """Run a list of functions in parallel, honoring dependencies between them.
+
+  Each step starts as soon as all the steps it depends on have completed, and
+  while holding all the locks (or semaphores) listed for it in |resources|.
+  This lets independent steps overlap, while limiting how many steps use a
+  scarce resource at once. Steps whose dependencies failed are not run.
+
+  Output and exceptions are handled as in RunParallelSteps. The output of
+  the steps is printed in the order of |steps|, except that steps are moved
+  after the steps they depend on.
+
+  Args:
+    steps: A list of functions to run.
+    deps: Optional dict mapping a step to the list of steps it depends on.
+    resources: Optional dict mapping a step to a list of multiprocessing
+      locks or semaphores that it must hold while it runs. They should be
+      created before any of the steps are started.
+    halt_on_error: See RunParallelSteps.
+
+  Example:
+    # This snippet runs build() first, then test() and archive() in
+    # parallel, but never runs archive() at the same time as another user of
+    # network_lock.
+    RunStepGraph([build, test, archive],
+                 deps={test: [build], archive: [build]},
+                 resources={archive: [network_lock]})
+  """
+  deps = deps or {}
+  resources = resources or {}
+  steps = _SortSteps(steps, deps)
+  index = dict((step, i) for i, step in enumerate(steps))
+  done = [multiprocessing.Event() for _ in steps]
+  passed = multiprocessing.Array('b', len(steps), lock=False)
+
+  def _RunStep(i, step):
+    for dep in deps.get(step, ()):
+      j = index[dep]
+      done[j].wait()
+      if not passed[j]:
+        logger.warning('Not running %r because %r failed.', step, dep)
+        done[i].set()
+        return
+
+    try:
+      with cros_build_lib.ContextManagerStack() as stack:
+        for resource in resources.get(step, ()):
+          stack.Add(lambda r=resource: r)
+        step()
+      passed[i] = 1
+    finally:
+      done[i].set()
+
+  RunParallelSteps([functools.partial(_RunStep, i, step)
+                    for i, step in enumerate(steps)],
+                   halt_on_error=halt_on_error)
+
+
 class _AllTasksComplete(object):
   """Sentinel object to indicate that all tasks are complete."""
 
@@ -440,6 +440,59 @@ class TestHalting(cros_test_lib.MockOutputTestCase, TestBackgroundWrapper):
     self.assertTrue(ex_str)
 
 
+class TestStepGraph(cros_test_lib.TempDirTestCase, cros_test_lib.OutputTestCase):
+  """Test RunStepGraph."""
+
+  def _Step(self, name, fail=False):
+    """Returns a step that records its name in self.tempdir."""
+    def _Run():
+      self.assertFalse(os.path.exists(os.path.join(self.tempdir, 'running')))
+      osutils.Touch(os.path.join(self.tempdir, 'running'))
+      time.sleep(0.1)
+      osutils.Touch(os.path.join(self.tempdir, name))
+      os.unlink(os.path.join(self.tempdir, 'running'))
+      if fail:
+        raise ValueError(name)
+    return _Run
+
+  def _Ran(self, name):
+    return os.path.exists(os.path.join(self.tempdir, name))
+
+  def testDependencies(self):
+    """Steps start only after the steps they depend on have completed."""
+    def _Check():
+      self.assertTrue(self._Ran('first'))
+    first = self._Step('first')
+    lock = multiprocessing.Lock()
+    parallel.RunStepGraph([_Check, first], deps={_Check: [first]},
+                          resources={first: [lock]})
+
+  def testResources(self):
+    """Steps sharing a lock do not run at the same time."""
+    lock = multiprocessing.Lock()
+    steps = [self._Step(str(i)) for i in range(3)]
+    parallel.RunStepGraph(steps, resources=dict((x, [lock]) for x in steps))
+    self.assertTrue(all(self._Ran(str(i)) for i in range(3)))
+
+  def testFailedDependency(self):
+    """Steps whose dependencies failed are not run."""
+    first = self._Step('first', fail=True)
+    second = self._Step('second')
+    with cros_test_lib.LoggingCapturer(parallel.logger.name):
+      with self.OutputCapturer():
+        self.assertRaises(parallel.BackgroundFailure, parallel.RunStepGraph,
+                          [first, second], deps={second: [first]})
+    self.assertTrue(self._Ran('first'))
+    self.assertFalse(self._Ran('second'))
+
+  def testCircularDependencies(self):
+    """Circular dependencies are rejected up front."""
+    first, second = self._Step('first'), self._Step('second')
+    self.assertRaises(ValueError, parallel.RunStepGraph, [first, second],
+                      deps={first: [second], second: [first]})
+    self.assertFalse(self._Ran('first'))
+
+
 class TestConstants(cros_test_lib.TestCase):
   """Test values of constants."""
 
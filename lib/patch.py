@@ -1509,6 +1509,54 @@ class GerritPatch(GerritFetchOnlyPatch):
     return s
 
 
+def PrefetchPatches(git_repo, patches):
+  """Fetch the git objects for many patches into one repository at once.
+
+  GitRepoPatch.Fetch runs a separate `git fetch` for every patch.  This finds
+  which of |patches| are missing from |git_repo| with a single `git cat-file`
+  invocation, then fetches all of the missing refs from each remote with a
+  single `git fetch`.  A later call to Fetch finds the object locally and
+  skips the network.
+
+  Patches whose sha1 isn't known yet are left alone; Fetch handles those.
+  Failures are logged and otherwise ignored so that Fetch can report them
+  against the right patch.
+
+  Args:
+    git_repo: The git repository to fetch the patches into.
+    patches: A sequence of GitRepoPatch instances that belong in |git_repo|.
+  """
+  git_repo = os.path.normpath(git_repo)
+  # pylint: disable=W0212
+  pending = [x for x in patches
+             if x.sha1 is not None and git_repo not in x._is_fetched]
+  if len(pending) < 2:
+    return
+
+  result = git.RunGit(
+      git_repo, ['cat-file', '--batch-check'],
+      input=''.join('%s\n' % x.sha1 for x in pending), error_code_ok=True)
+  if result.returncode != 0:
+    return
+  missing = set(line.split()[0] for line in result.output.splitlines()
+                if line.endswith(' missing'))
+
+  refs_by_url = {}
+  for patch in pending:
+    if patch.sha1 in missing:
+      refs = refs_by_url.setdefault(patch.project_url, [])
+      if patch.ref not in refs:
+        refs.append(patch.ref)
+
+  for url, refs in refs_by_url.iteritems():
+    result = git.RunGit(git_repo, ['fetch', '-f', url] + refs,
+                        error_code_ok=True)
+    if result.returncode != 0:
+      cros_build_lib.Warning('Failed to fetch %d refs from %s into %s; they '
+                             'will be fetched one at a time.',
+                             len(refs), url, git_repo)
+
+
 def GeneratePatchesFromRepo(git_repo, project, tracking_branch, branch, remote,
                             allow_empty=False):
   """Create a list of LocalPatch objects from a repo on disk.
@@ -210,6 +210,19 @@ class TestGitRepoPatch(GitRepoPatchTestCase):
     patch.Fetch(git3)
     self.assertEqual(patch.sha1, self._GetSha1(git3, patch.sha1))
 
+  def testPrefetchPatches(self):
+    git1 = self._MakeRepo('git1', self.source)
+    git2 = self._MakeRepo('git2', self.source)
+    patch1 = self.CommitFile(git1, 'monkeys', 'foon', ref='refs/heads/first')
+    self._run(['git', 'branch', 'first'], git1)
+    patch2 = self.CommitFile(git1, 'monkeys', 'foon2')
+    cros_patch.PrefetchPatches(git2, [patch1, patch2])
+    # Both objects should now be available locally, so Fetch must not need
+    # to go back to the source.
+    for patch in (patch1, patch2):
+      patch.project_url = '/dev/null'
+      self.assertEqual(patch.sha1, patch.Fetch(git2))
+
   def testFetchFirstPatchInSeries(self):
     git1, git2, patch = self._CommonGitSetup()
     self.CommitFile(git1, 'monkeys', 'foon2')
@@ -8,9 +8,12 @@
 import glob
 import logging
 import os
+import random
+import select
 import shutil
 import socket
 import stat
+import subprocess
 import tempfile
 import time
 
@@ -36,6 +39,12 @@ CHECK_INTERVAL = 5
 DEFAULT_SSH_PORT = 22
 SSH_ERROR_CODE = 255
 
+# How long (in seconds) a shared master connection lingers without clients.
+MASTER_PERSIST_TIMEOUT = 600
+# Unix socket paths are limited to 108 bytes, and ssh appends a random suffix
+# to the control path while creating the socket.
+MAX_CONTROL_PATH_LENGTH = 80
+
 # Dev/test packages are installed in these paths.
 DEV_BIN_PATHS = '/usr/local/bin:/usr/local/sbin'
 
@@ -121,6 +130,54 @@ def RunCommandFuncWrapper(func, msg, *args, **kwargs):
     logging.warning(msg)
 
 
+def _FrameCommand(cmd, marker, stop_on_error=False):
+  """Return the sh script that runs |cmd| with its output framed by |marker|.
+
+  The command runs in a subshell with stdin redirected from /dev/null, so it
+  cannot change the state of the shell or consume the commands that follow it.
+  Its stdout is followed by a line with |marker| and its return code, and its
+  stderr by a line with |marker|. See _ParseFramedOutput.
+
+  Args:
+    cmd: The command string or list to run.
+    marker: The string that frames the output.
+    stop_on_error: If set, exit the shell if the command fails.
+  """
+  if not isinstance(cmd, basestring):
+    cmd = cros_build_lib.CmdToStr(cmd)
+  script = ("(eval %s) </dev/null; _rc=$?\n"
+            "printf '\\n%s %%d\\n' $_rc\n"
+            "printf '\\n%s\\n' >&2\n" %
+            (cros_build_lib.ShellQuote(cmd), marker, marker))
+  if stop_on_error:
+    script += '[ $_rc -eq 0 ] || exit 0\n'
+  return script
+
+
+def _ParseFramedOutput(cmds, stdout, stderr, marker):
+  """Split the output of commands framed by _FrameCommand.
+
+  Args:
+    cmds: The list of commands that were run.
+    stdout: The stdout of the shell that ran them.
+    stderr: The stderr of the shell that ran them.
+    marker: The string that frames the output.
+
+  Returns:
+    A list of CommandResult objects for the commands that finished, in order.
+  """
+  outputs = stdout.split('\n%s ' % marker)
+  errors = stderr.split('\n%s\n' % marker)
+  results = []
+  output = outputs[0]
+  for cmd, rest, error in zip(cmds, outputs[1:], errors):
+    returncode, _, next_output = rest.partition('\n')
+    results.append(cros_build_lib.CommandResult(
+        cmd=cmd, output=output, error=error, returncode=int(returncode)))
+    output = next_output
+  return results
+
+
 def CompileSSHConnectSettings(ConnectTimeout=30, ConnectionAttempts=4):
   return ['-o', 'ConnectTimeout=%s' % ConnectTimeout,
           '-o', 'ConnectionAttempts=%s' % ConnectionAttempts,
@@ -138,7 +195,8 @@ class RemoteAccess(object):
   DEFAULT_USERNAME = ROOT_ACCOUNT
 
   def __init__(self, remote_host, tempdir, port=None, username=None,
-               private_key=None, debug_level=logging.DEBUG, interactive=True):
+               private_key=None, debug_level=logging.DEBUG, interactive=True,
+               control_path=None):
     """Construct the object.
 
     Args:
@@ -151,6 +209,9 @@ class RemoteAccess(object):
       private_key: The identify file to pass to `ssh -i` (default: testing_rsa).
       debug_level: Logging level to use for all RunCommand invocations.
       interactive: If set to False, pass /dev/null into stdin for the sh cmd.
+      control_path: If set, ssh, scp and rsync share the master connection
+                    started by StartMaster() through a control socket at this
+                    path.
     """
     self.tempdir = tempdir
     self.remote_host = remote_host
@@ -165,24 +226,104 @@ class RemoteAccess(object):
     shutil.copyfile(private_key_src, self.private_key)
     os.chmod(self.private_key, stat.S_IRUSR)
 
+    if control_path and len(control_path) > MAX_CONTROL_PATH_LENGTH:
+      logging.debug('Not sharing ssh connections; %s is too long for a '
+                    'control socket.', control_path)
+      control_path = None
+    self.control_path = control_path
+
   @property
   def target_ssh_url(self):
     return '%s@%s' % (self.username, self.remote_host)
 
-  def _GetSSHCmd(self, connect_settings=None):
+  def _GetControlSettings(self):
+    """Returns the ssh options to use the shared master connection, if any."""
+    if not self.control_path:
+      return []
+    return ['-o', 'ControlPath=%s' % self.control_path]
+
+  def _GetSSHCmd(self, connect_settings=None, interactive=None):
     if connect_settings is None:
       connect_settings = CompileSSHConnectSettings()
+    if interactive is None:
+      interactive = self.interactive
 
     cmd = (['ssh', '-p', str(self.port)] +
            connect_settings +
+           self._GetControlSettings() +
            ['-i', self.private_key])
-    if not self.interactive:
+    if not interactive:
       cmd.append('-n')
 
     return cmd
 
+  def _GetRemoteShCmd(self, cmd, connect_settings=None, remote_sudo=False,
+                      interactive=None):
+    """Returns the local command that runs |cmd| on the remote device."""
+    ssh_cmd = self._GetSSHCmd(connect_settings, interactive=interactive)
+    ssh_cmd += [self.target_ssh_url, '--']
+
+    if remote_sudo and self.username != ROOT_ACCOUNT:
+      # Prepend sudo to cmd.
+      ssh_cmd.append('sudo')
+
+    if isinstance(cmd, basestring):
+      ssh_cmd += [cmd]
+    else:
+      ssh_cmd += cmd
+
+    return ssh_cmd
+
+  def StartMaster(self, connect_settings=None):
+    """Start a master connection that later ssh, scp and rsync calls share.
+
+    This saves the TCP and SSH handshake of every later call. Calls made while
+    the master connection is not running simply connect on their own, so a
+    failure to start it is not fatal.
+
+    Args:
+      connect_settings: The SSH connect settings to use.
+
+    Returns:
+      True if the master connection is running.
+    """
+    if not self.control_path:
+      return False
+
+    # Send the output to a file: the backgrounded master keeps its stdout and
+    # stderr open, so a pipe would never see EOF.
+    log_file = os.path.join(self.tempdir, 'ssh-master.log')
+    cmd = self._GetSSHCmd(connect_settings) + [
+        '-o', 'ControlMaster=yes',
+        '-o', 'ControlPersist=%d' % MASTER_PERSIST_TIMEOUT,
+        '-N', '-f', self.target_ssh_url]
+    result = cros_build_lib.RunCommand(
+        cmd, error_code_ok=True, combine_stdout_stderr=True,
+        log_stdout_to_file=log_file, debug_level=self.debug_level)
+    if result.returncode:
+      logging.debug('Could not start a master ssh connection to %s: %s',
+                    self.remote_host, osutils.ReadFile(log_file).strip())
+      return False
+    return True
+
+  def StopMaster(self):
+    """Stop the master connection started by StartMaster(), if any.
+
+    Returns:
+      True if a master connection was running.
+    """
+    if not self.control_path or not os.path.exists(self.control_path):
+      return False
+
+    cmd = (['ssh', '-p', str(self.port)] + self._GetControlSettings() +
+           ['-O', 'exit', self.target_ssh_url])
+    cros_build_lib.RunCommand(cmd, error_code_ok=True, capture_output=True,
+                              debug_level=self.debug_level)
+    return True
+
   def RemoteSh(self, cmd, connect_settings=None, error_code_ok=False,
-               remote_sudo=False, ssh_error_ok=False, **kwargs):
+               remote_sudo=False, ssh_error_ok=False, interactive=None,
+               **kwargs):
     """Run a sh command on the remote device through ssh.
 
     Args:
@@ -195,6 +336,8 @@ class RemoteAccess(object):
       ssh_error_ok: Does not throw an exception when the ssh command itself
                     fails (return code 255).
       remote_sudo: If set, run the command in remote shell with sudo.
+      interactive: Whether to send our stdin (or |input|) to the command.
+                   Defaults to the interactive setting of this object.
       **kwargs: See cros_build_lib.RunCommand documentation.
 
     Returns:
@@ -211,18 +354,9 @@ class RemoteAccess(object):
     kwargs.setdefault('capture_output', True)
     kwargs.setdefault('debug_level', self.debug_level)
 
-    ssh_cmd = self._GetSSHCmd(connect_settings)
-    ssh_cmd += [self.target_ssh_url, '--']
-
-    if remote_sudo and self.username != ROOT_ACCOUNT:
-      # Prepend sudo to cmd.
-      ssh_cmd.append('sudo')
-
-    if isinstance(cmd, basestring):
-      ssh_cmd += [cmd]
-    else:
-      ssh_cmd += cmd
-
+    ssh_cmd = self._GetRemoteShCmd(cmd, connect_settings=connect_settings,
+                                   remote_sudo=remote_sudo,
+                                   interactive=interactive)
     try:
       return cros_build_lib.RunCommand(ssh_cmd, **kwargs)
     except cros_build_lib.RunCommandError as e:
@@ -235,6 +369,52 @@ class RemoteAccess(object):
       else:
         raise
 
+  def RemoteShCommands(self, cmds, stop_on_error=True, error_code_ok=False,
+                       **kwargs):
+    """Run a list of sh commands on the remote device in one ssh session.
+
+    Each command still gets a CommandResult of its own, which saves an ssh
+    round trip per command over calling RemoteSh for each of them.
+
+    Args:
+      cmds: The list of command strings or lists to run, in order.
+      stop_on_error: If set, do not run the commands that follow a failed one.
+      error_code_ok: Does not throw an exception when a command exits with a
+                     non-zero returncode.
+      **kwargs: See RemoteSh documentation.
+
+    Returns:
+      A list of CommandResult objects, one for each command that was run.
+      With stop_on_error, the last one is the first command that failed.
+
+    Raises:
+      RunCommandError for the first failed command when error_code_ok is not
+      set.
+      SSHConnectionError when the session ended before all commands ran.
+    """
+    marker = 'CROS_REMOTE_BATCH_%x' % random.getrandbits(64)
+    script = ''.join(_FrameCommand(cmd, marker, stop_on_error=stop_on_error)
+                     for cmd in cmds)
+    kwargs['capture_output'] = True
+    # The shell itself only fails if it went away early, which is detected
+    # below from the missing results.  The script is fed through stdin, so
+    # the session must be interactive.
+    result = self.RemoteSh(['sh'], input=script, error_code_ok=True,
+                           interactive=True, **kwargs)
+    results = _ParseFramedOutput(cmds, result.output, result.error, marker)
+
+    if (len(results) < len(cmds) and
+        not (stop_on_error and results and results[-1].returncode)):
+      raise SSHConnectionError(
+          'Remote session ended after %d of %d commands: %s' %
+          (len(results), len(cmds), result.error))
+    for r in results:
+      if r.returncode and not error_code_ok:
+        raise cros_build_lib.RunCommandError(
+            'Remote command failed with code %d: %s' % (r.returncode, r.cmd),
+            r)
+    return results
+
   def _CheckIfRebooted(self):
     """Checks whether a remote device has rebooted successfully.
 
@@ -273,6 +453,10 @@ class RemoteAccess(object):
     else:
       self.RemoteSh('touch %s && reboot' % REBOOT_MARKER)
 
+    # The master connection does not survive the reboot. Close it so that the
+    # checks below connect on their own, with short timeouts.
+    had_master = self.StopMaster()
+
     time.sleep(CHECK_INTERVAL)
     try:
       timeout_util.WaitForReturnTrue(self._CheckIfRebooted, REBOOT_MAX_WAIT,
@@ -281,9 +465,12 @@ class RemoteAccess(object):
       cros_build_lib.Die('Reboot has not completed after %s seconds; giving up.'
                          % (REBOOT_MAX_WAIT,))
 
+    if had_master:
+      self.StartMaster()
+
   def Rsync(self, src, dest, to_local=False, follow_symlinks=False,
             recursive=True, inplace=False, verbose=False, sudo=False,
-            remote_sudo=False, **kwargs):
+            remote_sudo=False, compress=True, **kwargs):
     """Rsync a path to the remote device.
 
     Rsync a path to the remote device. If |to_local| is set True, it
@@ -301,13 +488,17 @@ class RemoteAccess(object):
       verbose: If set, print more verbose output during rsync file transfer.
       sudo: If set, invoke the command via sudo.
       remote_sudo: If set, run the command in remote shell with sudo.
+      compress: If set, compress the data sent over the network.  Compression
+        costs more time than it saves on fast links.
       **kwargs: See cros_build_lib.RunCommand documentation.
     """
     kwargs.setdefault('debug_level', self.debug_level)
 
     ssh_cmd = ' '.join(self._GetSSHCmd())
-    rsync_cmd = ['rsync', '--perms', '--verbose', '--times', '--compress',
+    rsync_cmd = ['rsync', '--perms', '--verbose', '--times',
                  '--omit-dir-times', '--exclude', '.svn']
+    if compress:
+      rsync_cmd.append('--compress')
     rsync_cmd.append('--copy-links' if follow_symlinks else '--links')
     rsync_sudo = 'sudo' if (
         remote_sudo and self.username != ROOT_ACCOUNT) else ''
@@ -365,6 +556,7 @@ class RemoteAccess(object):
     # SSH login shell.
     scp_cmd = (['scp', '-P', str(self.port)] +
                CompileSSHConnectSettings(ConnectTimeout=60) +
+               self._GetControlSettings() +
                ['-i', self.private_key])
 
     if not self.interactive:
@@ -404,6 +596,119 @@ class RemoteAccess(object):
                          **kwargs)
 
 
+class RemoteShell(object):
+  """A persistent shell on a remote device.
+
+  Commands run one after another in a single ssh session, which saves starting
+  a new ssh process (and, without a master connection, a new SSH handshake)
+  for each of many small commands. Each command runs in a subshell with stdin
+  redirected from /dev/null, so it cannot change the state of the shell or
+  consume the commands that follow it.
+
+  Usage:
+    with RemoteShell(agent) as shell:
+      board = shell.Run(['cat', '/etc/lsb-release']).output
+  """
+
+  def __init__(self, agent, connect_settings=None):
+    """Start the shell.
+
+    Args:
+      agent: The RemoteAccess object of the device.
+      connect_settings: The SSH connect settings to use.
+    """
+    self.agent = agent
+    self._marker = 'CROS_REMOTE_SHELL_%x' % random.getrandbits(64)
+    cmd = agent._GetRemoteShCmd(['sh'], connect_settings=connect_settings,
+                                interactive=True)
+    logging.log(agent.debug_level, 'Starting remote shell: %s',
+                cros_build_lib.CmdToStr(cmd))
+    self._proc = subprocess.Popen(cmd, stdin=subprocess.PIPE,
+                                  stdout=subprocess.PIPE,
+                                  stderr=subprocess.PIPE, close_fds=True)
+
+  def _ReadUntilMarkers(self):
+    """Read stdout and stderr of the shell up to the end of a command.
+
+    Returns:
+      A (stdout, stderr) tuple. Both include the trailing markers.
+
+    Raises:
+      SSHConnectionError if the shell exited.
+    """
+    stdout_end = '\n%s ' % self._marker
+    stderr_end = '\n%s\n' % self._marker
+    stdout_fd = self._proc.stdout.fileno()
+    stderr_fd = self._proc.stderr.fileno()
+    buffers = {stdout_fd: '', stderr_fd: ''}
+    pending = set(buffers)
+    while pending:
+      readable, _, _ = select.select(list(pending), [], [])
+      for fd in readable:
+        data = os.read(fd, 65536)
+        if not data:
+          self.Close()
+          raise SSHConnectionError(buffers[stderr_fd])
+        buffers[fd] += data
+      if (stdout_fd in pending and stdout_end in buffers[stdout_fd] and
+          buffers[stdout_fd].endswith('\n')):
+        pending.discard(stdout_fd)
+      if stderr_fd in pending and buffers[stderr_fd].endswith(stderr_end):
+        pending.discard(stderr_fd)
+    return buffers[stdout_fd], buffers[stderr_fd]
+
+  def Run(self, cmd, error_code_ok=False):
+    """Run a command in the shell.
+
+    Args:
+      cmd: The command string or list to run.
+      error_code_ok: Does not throw an exception when the command exits with a
+                     non-zero returncode.
+
+    Returns:
+      A CommandResult object.
+
+    Raises:
+      RunCommandError when the command failed and error_code_ok is not set.
+      SSHConnectionError when the shell (or its ssh connection) went away.
+    """
+    if self._proc is None:
+      raise SSHConnectionError('The remote shell is closed.')
+
+    logging.log(self.agent.debug_level, 'RemoteShell: %s', cmd)
+    try:
+      self._proc.stdin.write(_FrameCommand(cmd, self._marker))
+      self._proc.stdin.flush()
+    except IOError as e:
+      self.Close()
+      raise SSHConnectionError(str(e))
+
+    stdout, stderr = self._ReadUntilMarkers()
+    result = _ParseFramedOutput([cmd], stdout, stderr, self._marker)[0]
+    if result.returncode and not error_code_ok:
+      raise cros_build_lib.RunCommandError(
+          'Remote command failed with code %d: %s' % (result.returncode, cmd),
+          result)
+    return result
+
+  def Close(self):
+    """Exit the shell."""
+    if self._proc is None:
+      return
+    proc, self._proc = self._proc, None
+    try:
+      proc.stdin.close()
+    except IOError:
+      pass
+    proc.wait()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, _type, _value, _traceback):
+    self.Close()
+
+
 class RemoteDeviceHandler(object):
   """A wrapper of RemoteDevice."""
 
@@ -443,7 +748,8 @@ class RemoteDevice(object):
 
   def __init__(self, hostname, port=None, username=None,
                base_dir=DEFAULT_BASE_DIR, connect_settings=None,
-               private_key=None, debug_level=logging.DEBUG, ping=True):
+               private_key=None, debug_level=logging.DEBUG, ping=True,
+               share_connection=True):
     """Initializes a RemoteDevice object.
 
     Args:
@@ -455,6 +761,8 @@ class RemoteDevice(object):
       private_key: The identify file to pass to `ssh -i`.
       debug_level: Setting debug level for logging.
       ping: Whether to ping the device before attempting to connect.
+      share_connection: Whether all ssh, scp and rsync calls share a single
+        master connection to the device.
     """
     self.hostname = hostname
     self.port = port
@@ -464,6 +772,7 @@ class RemoteDevice(object):
     self.connect_settings = (connect_settings if connect_settings else
                              CompileSSHConnectSettings())
     self.private_key = private_key
+    self.share_connection = share_connection
     self.agent = self._SetupSSH()
     self.debug_level = debug_level
     # Setup a working directory on the device.
@@ -472,6 +781,9 @@ class RemoteDevice(object):
     if ping and not self.Pingable():
       raise DeviceNotPingable('Device %s is not pingable.' % self.hostname)
 
+    if self.share_connection:
+      self.agent.StartMaster(self.connect_settings)
+
     # Do not call RunCommand here because we have not set up work directory yet.
     self.BaseRunCommand(['mkdir', '-p', self.base_dir])
     self.work_dir = self.BaseRunCommand(
@@ -500,8 +812,12 @@ class RemoteDevice(object):
 
   def _SetupSSH(self):
     """Setup the ssh connection with device."""
+    control_path = None
+    if self.share_connection:
+      control_path = os.path.join(self.tempdir.tempdir, 'ssh-master')
     return RemoteAccess(self.hostname, self.tempdir.tempdir, port=self.port,
-                        username=self.username, private_key=self.private_key)
+                        username=self.username, private_key=self.private_key,
+                        control_path=control_path)
 
   def _HasRsync(self):
     """Checks if rsync exists on the device."""
@@ -526,6 +842,7 @@ class RemoteDevice(object):
       kwargs.setdefault('error_code_ok', True)
       self.BaseRunCommand(cmd, **kwargs)
 
+    self.agent.StopMaster()
     self.tempdir.Cleanup()
 
   def CopyToDevice(self, src, dest, mode=None, **kwargs):
@@ -577,6 +894,10 @@ class RemoteDevice(object):
     """Reboot the device."""
     return self.agent.RemoteReboot()
 
+  def OpenShell(self):
+    """Returns a persistent RemoteShell on the device."""
+    return RemoteShell(self.agent, connect_settings=self.connect_settings)
+
   def BaseRunCommand(self, cmd, **kwargs):
     """Executes a shell command on the device with output captured by default.
 
@@ -626,6 +947,39 @@ class RemoteDevice(object):
 
     return self.BaseRunCommand(new_cmd, **kwargs)
 
+  def RunCommands(self, cmds, **kwargs):
+    """Executes a list of shell commands on the device in one ssh session.
+
+    Also sets environment variables using dictionary provided by
+    keyword argument |extra_env|.
+
+    Args:
+      cmds: list of commands to run. See RemoteAccess.RemoteShCommands
+        documentation.
+      **kwargs: keyword arguments to pass along with cmds. See
+        RemoteAccess.RemoteShCommands documentation.
+
+    Returns:
+      A list of CommandResult objects, one for each command that was run.
+    """
+    extra_env = kwargs.pop('extra_env', None)
+    if extra_env:
+      env_list = ['export %s=%s' % (k, cros_build_lib.ShellQuote(v))
+                  for k, v in extra_env.iteritems()]
+      logging.debug('Environment variables: %s', ' '.join(env_list))
+      env = '; '.join(env_list)
+      cmds = ['%s; %s' % (env, cmd if isinstance(cmd, basestring)
+                          else cros_build_lib.CmdToStr(cmd))
+              for cmd in cmds]
+
+    kwargs.setdefault('debug_level', self.debug_level)
+    kwargs.setdefault('connect_settings', self.connect_settings)
+    try:
+      return self.agent.RemoteShCommands(cmds, **kwargs)
+    except SSHConnectionError:
+      logging.error('Error connecting to device %s', self.hostname)
+      raise
+
 
 class ChromiumOSDevice(RemoteDevice):
   """Basic commands to interact with a ChromiumOS device over SSH connection."""
@@ -637,18 +991,40 @@ class ChromiumOSDevice(RemoteDevice):
 
   def __init__(self, *args, **kwargs):
     super(ChromiumOSDevice, self).__init__(*args, **kwargs)
-    self.board = self._LearnBoard()
-    self.path = self._GetPath()
+    self.board, self.path = self._LearnDeviceInfo()
 
-  def _GetPath(self):
-    """Gets $PATH on the device and prepend it with DEV_BIN_PATHS."""
-    try:
-      result = self.BaseRunCommand(['echo', "${PATH}"])
-    except cros_build_lib.RunCommandError:
+  def _LearnDeviceInfo(self):
+    """Grab the board and $PATH of the remote device in one ssh session.
+
+    The board is taken from the first CHROMEOS_RELEASE_BOARD entry. In the case
+    of no entry or if the command failed, the board is an empty string. The
+    path is $PATH on the device prepended with DEV_BIN_PATHS.
+
+    Returns:
+      A (board, path) tuple.
+    """
+    board_result, path_result = super(ChromiumOSDevice, self).RunCommands(
+        [self.GET_BOARD_CMD, 'echo "${PATH}"'], stop_on_error=False,
+        error_code_ok=True)
+
+    board = ''
+    output = board_result.output.splitlines()
+    if board_result.returncode or not output:
+      logging.warning('Error detecting the board.')
+    else:
+      # In the case of multiple matches, use the first one.
+      if len(output) > 1:
+        logging.debug('More than one board entry found!  Using the first one.')
+      board = output[0].strip().partition('=')[-1]
+
+    if path_result.returncode:
       logging.warning('Error detecting $PATH on the device.')
-      raise
+      raise cros_build_lib.RunCommandError(
+          'Remote command failed with code %d: %s' %
+          (path_result.returncode, path_result.cmd), path_result)
+    path = '%s:%s' % (DEV_BIN_PATHS, path_result.output.strip())
 
-    return '%s:%s' % (DEV_BIN_PATHS, result.output.strip())
+    return board, path
 
   def _RemountRootfsAsWritable(self):
     """Attempts to Remount the root partition."""
@@ -703,25 +1079,6 @@ class ChromiumOSDevice(RemoteDevice):
 
     return not self._RootfsIsReadOnly()
 
-  def _LearnBoard(self):
-    """Grab the board reported by the remote device.
-
-    In the case of multiple matches, uses the first one.  In the case of no
-    entry or if the command failed, returns an empty string.
-    """
-    try:
-      result = self.BaseRunCommand(self.GET_BOARD_CMD, capture_output=True)
-    except cros_build_lib.RunCommandError:
-      logging.warning('Error detecting the board.')
-      return ''
-
-    # In the case of multiple matches, use the first one.
-    output = result.output.splitlines()
-    if len(output) > 1:
-      logging.debug('More than one board entry found!  Using the first one.')
-
-    return output[0].strip().partition('=')[-1]
-
   def RunCommand(self, cmd, **kwargs):
     """Executes a shell command on the device with output captured by default.
 
@@ -739,3 +1096,22 @@ class ChromiumOSDevice(RemoteDevice):
     extra_env['PATH'] = path_env
     kwargs['extra_env'] = extra_env
     return super(ChromiumOSDevice, self).RunCommand(cmd, **kwargs)
+
+  def RunCommands(self, cmds, **kwargs):
+    """Executes a list of shell commands on the device in one ssh session.
+
+    Also makes sure $PATH is set correctly by adding DEV_BIN_PATHS to
+    'PATH' in |extra_env|.
+
+    Args:
+      cmds: list of commands to run. See RemoteAccess.RemoteShCommands
+        documentation.
+      **kwargs: keyword arguments to pass along with cmds. See
+        RemoteAccess.RemoteShCommands documentation.
+    """
+    extra_env = kwargs.pop('extra_env', {})
+    path_env = extra_env.get('PATH', None)
+    path_env = self.path if not path_env else '%s:%s' % (path_env, self.path)
+    extra_env['PATH'] = path_env
+    kwargs['extra_env'] = extra_env
+    return super(ChromiumOSDevice, self).RunCommands(cmds, **kwargs)
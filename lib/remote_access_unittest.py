@@ -8,12 +8,14 @@
 import os
 import re
 import sys
+import tempfile
 
 sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)),
                                 '..', '..'))
 from chromite.lib import cros_build_lib
 from chromite.lib import cros_build_lib_unittest
 from chromite.lib import cros_test_lib
+from chromite.lib import osutils
 from chromite.lib import partial_mock
 from chromite.lib import remote_access
 
@@ -143,5 +145,154 @@ class CheckIfRebootedTest(RemoteAccessTest):
     self.assertRaises(Exception, self.host._CheckIfRebooted)
 
 
+class MasterConnectionTest(cros_test_lib.MockTempDirTestCase):
+  """Tests of sharing a master ssh connection."""
+
+  def setUp(self):
+    self.rc_mock = self.StartPatcher(cros_build_lib_unittest.RunCommandMock())
+    self.rc_mock.SetDefaultCmdResult()
+    self.control_path = os.path.join(self.tempdir, 'ssh-master')
+    self.host = self._GetHost(control_path=self.control_path)
+
+  def _GetHost(self, control_path=None):
+    """Returns a RemoteAccess object with a tempdir of its own."""
+    tempdir = tempfile.mkdtemp(dir=self.tempdir)
+    return remote_access.RemoteAccess('foon', tempdir,
+                                      control_path=control_path)
+
+  def testClientsUseControlPath(self):
+    """Test that ssh and scp use the control socket."""
+    option = 'ControlPath=%s' % self.control_path
+    self.assertTrue(option in self.host._GetSSHCmd())
+    self.host.Scp(self.tempdir, '/tmp')
+    self.assertTrue(option in self.rc_mock.call_args_list[-1][0][0])
+
+  def testNoControlPath(self):
+    """Test that nothing is shared without a control path."""
+    host = self._GetHost()
+    self.assertFalse(any(x.startswith('ControlPath')
+                         for x in host._GetSSHCmd()))
+    self.assertFalse(host.StartMaster())
+    self.assertFalse(host.StopMaster())
+    self.assertEqual(self.rc_mock.call_count, 0)
+
+  def testControlPathTooLong(self):
+    """Test that overly long control paths disable sharing."""
+    host = self._GetHost(control_path=os.path.join(self.tempdir, 'x' * 100))
+    self.assertEqual(host.control_path, None)
+
+  def testStartMaster(self):
+    """Test starting the master connection."""
+    self.assertTrue(self.host.StartMaster())
+    cmd = self.rc_mock.call_args_list[-1][0][0]
+    self.assertTrue('ControlMaster=yes' in cmd)
+    self.assertTrue('-N' in cmd)
+    self.assertEqual(cmd[-1], 'root@foon')
+
+  def testStartMasterFailure(self):
+    """Test that a failure to start the master connection is not fatal."""
+    self.rc_mock.AddCmdResult(partial_mock.In('ControlMaster=yes'),
+                              returncode=remote_access.SSH_ERROR_CODE)
+    self.assertFalse(self.host.StartMaster())
+
+  def testStopMaster(self):
+    """Test that only a running master connection is stopped."""
+    self.assertFalse(self.host.StopMaster())
+    self.assertEqual(self.rc_mock.call_count, 0)
+    osutils.Touch(self.control_path)
+    self.assertTrue(self.host.StopMaster())
+    self.rc_mock.assertCommandContains(['-O', 'exit', 'root@foon'])
+
+
+class RemoteShellTest(cros_test_lib.MockTempDirTestCase):
+  """Tests of RemoteShell, using a local shell instead of ssh."""
+
+  def setUp(self):
+    self.PatchObject(remote_access.RemoteAccess, '_GetRemoteShCmd',
+                     side_effect=lambda cmd, **kwargs: cmd)
+    host = remote_access.RemoteAccess('foon', self.tempdir)
+    self.shell = remote_access.RemoteShell(host)
+
+  def tearDown(self):
+    self.shell.Close()
+
+  def testOutput(self):
+    """Test that output, errors and return codes are kept apart."""
+    result = self.shell.Run('echo out; echo err >&2; exit 3',
+                            error_code_ok=True)
+    self.assertEqual(result.output, 'out\n')
+    self.assertEqual(result.error, 'err\n')
+    self.assertEqual(result.returncode, 3)
+    result = self.shell.Run(['printf', '%s', 'no newline'])
+    self.assertEqual(result.output, 'no newline')
+    self.assertEqual(result.error, '')
+    self.assertEqual(result.returncode, 0)
+
+  def testFailure(self):
+    """Test that failed commands raise unless error_code_ok is set."""
+    self.assertRaises(cros_build_lib.RunCommandError, self.shell.Run, 'false')
+
+  def testCommandsAreIsolated(self):
+    """Test that commands cannot break the shell for later commands."""
+    self.shell.Run('cd /; exit 1', error_code_ok=True)
+    self.shell.Run('cat', error_code_ok=True)
+    self.shell.Run('if then', error_code_ok=True)
+    self.assertEqual(self.shell.Run('echo ok').output, 'ok\n')
+
+  def testShellExit(self):
+    """Test that the shell going away raises SSHConnectionError."""
+    self.assertRaises(remote_access.SSHConnectionError, self.shell.Run,
+                      'kill -9 $$')
+    self.assertRaises(remote_access.SSHConnectionError, self.shell.Run, 'true')
+
+
+class RemoteShCommandsTest(cros_test_lib.MockTempDirTestCase):
+  """Tests of RemoteShCommands, using a local shell instead of ssh."""
+
+  def setUp(self):
+    self.sh_cmd_mock = self.PatchObject(
+        remote_access.RemoteAccess, '_GetRemoteShCmd',
+        side_effect=lambda cmd, **kwargs: cmd)
+    self.host = remote_access.RemoteAccess('foon', self.tempdir)
+
+  def testResults(self):
+    """Test that each command gets its own output, errors and return code."""
+    results = self.host.RemoteShCommands(
+        ['echo out; echo err >&2', ['printf', '%s', 'no newline'], 'exit 3'],
+        error_code_ok=True)
+    self.assertEqual([(r.output, r.error, r.returncode) for r in results],
+                     [('out\n', 'err\n', 0), ('no newline', '', 0),
+                      ('', '', 3)])
+
+  def testStopOnError(self):
+    """Test that commands after a failed one are not run by default."""
+    cmds = ['true', 'false', 'echo never']
+    self.assertRaises(cros_build_lib.RunCommandError,
+                      self.host.RemoteShCommands, cmds)
+    results = self.host.RemoteShCommands(cmds, error_code_ok=True)
+    self.assertEqual([r.returncode for r in results], [0, 1])
+
+  def testContinueOnError(self):
+    """Test that all commands run without stop_on_error."""
+    results = self.host.RemoteShCommands(
+        ['x=set; false', 'cat', 'echo ${x-unset}'], stop_on_error=False,
+        error_code_ok=True)
+    self.assertEqual([r.returncode for r in results], [1, 0, 0])
+    self.assertEqual(results[2].output, 'unset\n')
+
+  def testSessionEnded(self):
+    """Test that the shell going away raises SSHConnectionError."""
+    self.assertRaises(remote_access.SSHConnectionError,
+                      self.host.RemoteShCommands, ['kill -9 $$', 'true'],
+                      stop_on_error=False)
+
+  def testNonInteractiveHost(self):
+    """Test that the script is sent even if the host is not interactive."""
+    host = remote_access.RemoteAccess('foon', self.tempdir, interactive=False)
+    results = host.RemoteShCommands(['echo ok'])
+    self.assertEqual(results[0].output, 'ok\n')
+    self.assertTrue(self.sh_cmd_mock.call_args[1]['interactive'])
+
+
 if __name__ == '__main__':
   cros_test_lib.main()
@@ -0,0 +1,251 @@
+# Copyright 2014 The Chromium OS Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Statistical stack sampling profiler for chromite processes.
+
+The profiler is started by commandline.ScriptWrapperMain when the
+constants.PROFILE_ENVVAR environment variable names an output file. A daemon
+thread wakes up every interval and records the stack of every other thread in
+the process. Processes forked via multiprocessing (e.g. parallel's
+_BackgroundTask) restart the sampler in the child and write their samples to
+their own part file. So do chromite scripts started as subprocesses, which
+find the pid of the process that started profiling (the owner) in
+constants.PROFILE_OWNER_ENVVAR. When the owner exits, all part files are
+merged into the output file, which the owner cleared when it started.
+
+The output uses the collapsed stack format understood by flamegraph.pl:
+  MainProcess;main (cbuildbot.py:1);_RunStage (cbuildbot.py:2) 42
+
+Sampling uses wall clock time, so time spent blocked on the network or on
+subprocesses shows up as well. The cost is bounded by the interval, which
+defaults to DEFAULT_INTERVAL seconds, and by MAX_DEPTH.
+"""
+
+import collections
+import errno
+import glob
+import logging
+import multiprocessing
+import multiprocessing.util
+import os
+import sys
+import threading
+
+from chromite.cbuildbot import constants
+from chromite.lib import locking
+from chromite.lib import osutils
+
+
+DEFAULT_INTERVAL = 0.01
+MAX_DEPTH = 100
+
+
+def _FormatFrame(frame):
+  """Return the flamegraph label for a stack frame."""
+  code = frame.f_code
+  return '%s (%s:%d)' % (code.co_name, os.path.basename(code.co_filename),
+                         code.co_firstlineno)
+
+
+def _CollapseStack(frame, max_depth=MAX_DEPTH):
+  """Return the collapsed stack ending in |frame|, outermost frame first."""
+  labels = []
+  while frame is not None and len(labels) < max_depth:
+    labels.append(_FormatFrame(frame))
+    frame = frame.f_back
+  return ';'.join(reversed(labels))
+
+
+def ReadCollapsedStacks(path, samples=None):
+  """Add the samples in the collapsed stack file |path| to |samples|.
+
+  Args:
+    path: The file to read.
+    samples: A collections.Counter to add to. Defaults to a new one.
+
+  Returns:
+    The collections.Counter mapping collapsed stacks to sample counts.
+  """
+  if samples is None:
+    samples = collections.Counter()
+  for line in osutils.ReadFile(path).splitlines():
+    stack, _, count = line.rpartition(' ')
+    if stack:
+      samples[stack] += int(count)
+  return samples
+
+
+def WriteCollapsedStacks(path, samples):
+  """Write the collections.Counter |samples| to |path|."""
+  osutils.WriteFile(path, ''.join('%s %d\n' % (stack, count)
+                                  for stack, count in sorted(samples.items())))
+
+
+class SamplingProfiler(object):
+  """Samples the stacks of all threads of the process at a fixed interval.
+
+  Usage:
+    with SamplingProfiler('/tmp/cbuildbot.prof'):
+      DoWork()
+  """
+
+  def __init__(self, output, interval=DEFAULT_INTERVAL, owner_pid=None):
+    """Initialize.
+
+    Args:
+      output: The file to write the merged collapsed stacks to.
+      interval: The number of seconds between samples.
+      owner_pid: The pid of the process that merges the samples of all
+        processes into |output|. Defaults to this process.
+    """
+    self.output = os.path.abspath(output)
+    self.interval = interval
+    self.samples = collections.Counter()
+    self._owner_pid = owner_pid or os.getpid()
+    self._thread = None
+    self._stopped = threading.Event()
+    self._lock = threading.Lock()
+
+  def _PartFile(self, pid=None):
+    return '%s.%d.part' % (self.output, pid or os.getpid())
+
+  def _PartFiles(self):
+    return glob.glob('%s.*.part' % self.output)
+
+  def _FileLock(self):
+    """Return the lock that guards the output and the part files."""
+    return locking.FileLock('%s.lock' % self.output, verbose=False)
+
+  def _Sample(self):
+    """Record the current stack of every thread except the sampler."""
+    prefix = multiprocessing.current_process().name
+    own_id = threading.current_thread().ident
+    # pylint: disable=W0212
+    frames = sys._current_frames()
+    with self._lock:
+      for thread_id, frame in frames.iteritems():
+        if thread_id != own_id:
+          self.samples['%s;%s' % (prefix, _CollapseStack(frame))] += 1
+
+  def _Run(self):
+    while not self._stopped.wait(self.interval):
+      self._Sample()
+
+  def _StartThread(self):
+    self._stopped.clear()
+    self._thread = threading.Thread(target=self._Run, name='SamplingProfiler')
+    self._thread.daemon = True
+    self._thread.start()
+
+  def _AfterFork(self):
+    """Restart sampling in a multiprocessing child process.
+
+    The child inherits the samples of its parent, but not the sampler thread.
+    The samples are reset and written to a part file of their own when the
+    child exits.
+    """
+    self.samples = collections.Counter()
+    self._lock = threading.Lock()
+    self._stopped = threading.Event()
+    self._StartThread()
+    multiprocessing.util.Finalize(self, self.Stop, exitpriority=100)
+
+  def Start(self):
+    """Start sampling in this process and its multiprocessing children.
+
+    In the owner, this also removes the output and part files of earlier runs,
+    and tells the chromite scripts started from now on to write their samples
+    to part files for this process to merge.
+    """
+    if os.getpid() == self._owner_pid:
+      try:
+        with self._FileLock().write_lock():
+          for path in self._PartFiles() + [self.output]:
+            osutils.SafeUnlink(path)
+      except EnvironmentError as e:
+        logging.warning('Failed to clear profile %s: %s', self.output, e)
+      os.environ[constants.PROFILE_OWNER_ENVVAR] = str(self._owner_pid)
+    multiprocessing.util.register_after_fork(self, SamplingProfiler._AfterFork)
+    self._StartThread()
+
+  def Stop(self):
+    """Stop sampling and write out the samples of this process.
+
+    In the owner, this also merges the part files written by the other
+    processes into the output file.
+    """
+    if self._thread is None:
+      return
+    self._stopped.set()
+    self._thread.join()
+    self._thread = None
+
+    is_owner = os.getpid() == self._owner_pid
+    if is_owner and (os.environ.get(constants.PROFILE_OWNER_ENVVAR) ==
+                     str(self._owner_pid)):
+      del os.environ[constants.PROFILE_OWNER_ENVVAR]
+
+    try:
+      with self._FileLock().write_lock():
+        samples = self.samples.copy()
+        if not is_owner:
+          # An earlier process with the same pid may have left a part file.
+          path = self._PartFile()
+          if os.path.exists(path):
+            ReadCollapsedStacks(path, samples)
+          WriteCollapsedStacks(path, samples)
+          return
+
+        paths = self._PartFiles()
+        for path in paths:
+          ReadCollapsedStacks(path, samples)
+        WriteCollapsedStacks(self.output, samples)
+        for path in paths:
+          osutils.SafeUnlink(path)
+    except EnvironmentError as e:
+      logging.warning('Failed to write profile %s: %s', self.output, e)
+
+  def __enter__(self):
+    self.Start()
+    return self
+
+  def __exit__(self, _type, _value, _traceback):
+    self.Stop()
+
+
+def ProfilerFromEnvironment(environ=None):
+  """Return a SamplingProfiler configured by the environment, if any.
+
+  Args:
+    environ: The environment to use. Defaults to os.environ.
+
+  Returns:
+    A SamplingProfiler writing to the file named by constants.PROFILE_ENVVAR
+    or None if profiling was not requested. If a running process that started
+    profiling is named by constants.PROFILE_OWNER_ENVVAR, the samples are
+    left for it to merge.
+  """
+  if environ is None:
+    environ = os.environ
+  output = environ.get(constants.PROFILE_ENVVAR)
+  if not output:
+    return None
+  interval = environ.get(constants.PROFILE_INTERVAL_ENVVAR)
+  try:
+    interval = float(interval) if interval else DEFAULT_INTERVAL
+  except ValueError:
+    logging.warning('Ignoring invalid %s=%r',
+                    constants.PROFILE_INTERVAL_ENVVAR, interval)
+    interval = DEFAULT_INTERVAL
+  owner_pid = None
+  try:
+    owner_pid = int(environ.get(constants.PROFILE_OWNER_ENVVAR, ''))
+    os.kill(owner_pid, 0)
+  except ValueError:
+    pass
+  except OSError as e:
+    # The process that set the variable is gone, so this one is the owner.
+    if e.errno != errno.EPERM:
+      owner_pid = None
+  return SamplingProfiler(output, interval=interval, owner_pid=owner_pid)
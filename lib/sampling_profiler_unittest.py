@@ -0,0 +1,110 @@
+#!/usr/bin/python
+# Copyright 2014 The Chromium OS Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Unittests for sampling_profiler.py."""
+
+import errno
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__)))))
+
+from chromite.cbuildbot import constants
+from chromite.lib import cros_test_lib
+from chromite.lib import osutils
+from chromite.lib import parallel
+from chromite.lib import sampling_profiler
+
+
+# pylint: disable=W0212
+
+
+def _Spin(seconds):
+  """Burn CPU for |seconds| so that the sampler sees this frame."""
+  end = time.time() + seconds
+  while time.time() < end:
+    pass
+
+
+class SamplingProfilerTest(cros_test_lib.MockTempDirTestCase):
+  """Tests of SamplingProfiler."""
+
+  def setUp(self):
+    self.output = os.path.join(self.tempdir, 'profile')
+
+  def testSamplesMainProcess(self):
+    """Samples of the profiled process are written to the output file."""
+    with sampling_profiler.SamplingProfiler(self.output, interval=0.001):
+      _Spin(0.2)
+    samples = sampling_profiler.ReadCollapsedStacks(self.output)
+    self.assertTrue(any('_Spin (sampling_profiler_unittest.py:' in stack
+                        for stack in samples))
+    self.assertTrue(all(stack.startswith('MainProcess;') for stack in samples))
+
+  def testMergesChildProcesses(self):
+    """Samples of multiprocessing children are merged into the output."""
+    with sampling_profiler.SamplingProfiler(self.output, interval=0.001):
+      parallel.RunParallelSteps([lambda: _Spin(0.2)] * 2)
+    samples = sampling_profiler.ReadCollapsedStacks(self.output)
+    child_stacks = [x for x in samples if not x.startswith('MainProcess;')]
+    self.assertTrue(any('_Spin' in x for x in child_stacks))
+    self.assertEqual(sorted(os.listdir(self.tempdir)),
+                     ['profile', 'profile.lock'])
+    self.assertNotIn(constants.PROFILE_OWNER_ENVVAR, os.environ)
+
+  def testDiscardsEarlierRuns(self):
+    """The output and part files of earlier runs are not merged."""
+    osutils.WriteFile(self.output, 'a;b 3\n')
+    osutils.WriteFile('%s.1.part' % self.output, 'c;d 2\n')
+    with sampling_profiler.SamplingProfiler(self.output, interval=0.001):
+      pass
+    samples = sampling_profiler.ReadCollapsedStacks(self.output)
+    self.assertNotIn('a;b', samples)
+    self.assertNotIn('c;d', samples)
+
+  def testNestedProfiler(self):
+    """A profiler started under a running owner leaves a part file."""
+    with sampling_profiler.SamplingProfiler(self.output, interval=0.001):
+      profiler = sampling_profiler.SamplingProfiler(
+          self.output, interval=0.001, owner_pid=os.getpid() + 1)
+      with profiler:
+        _Spin(0.1)
+      part = profiler._PartFile()
+      self.assertExists(part)
+      self.assertFalse(os.path.exists(self.output))
+    self.assertFalse(os.path.exists(part))
+    samples = sampling_profiler.ReadCollapsedStacks(self.output)
+    self.assertTrue(any('_Spin' in x for x in samples))
+
+  def testProfilerFromEnvironment(self):
+    """The profiler is configured by the environment."""
+    self.assertEqual(sampling_profiler.ProfilerFromEnvironment({}), None)
+    profiler = sampling_profiler.ProfilerFromEnvironment({
+        constants.PROFILE_ENVVAR: self.output,
+        constants.PROFILE_INTERVAL_ENVVAR: '0.5'})
+    self.assertEqual(profiler.output, self.output)
+    self.assertEqual(profiler.interval, 0.5)
+    profiler = sampling_profiler.ProfilerFromEnvironment({
+        constants.PROFILE_ENVVAR: self.output,
+        constants.PROFILE_INTERVAL_ENVVAR: 'bogus'})
+    self.assertEqual(profiler.interval, sampling_profiler.DEFAULT_INTERVAL)
+    self.assertEqual(profiler._owner_pid, os.getpid())
+
+    # Only a running owner takes the samples of a new profiler.
+    profiler = sampling_profiler.ProfilerFromEnvironment({
+        constants.PROFILE_ENVVAR: self.output,
+        constants.PROFILE_OWNER_ENVVAR: str(os.getppid())})
+    self.assertEqual(profiler._owner_pid, os.getppid())
+    self.PatchObject(os, 'kill', side_effect=OSError(errno.ESRCH, 'gone'))
+    profiler = sampling_profiler.ProfilerFromEnvironment({
+        constants.PROFILE_ENVVAR: self.output,
+        constants.PROFILE_OWNER_ENVVAR: '12345'})
+    self.assertEqual(profiler._owner_pid, os.getpid())
+
+
+if __name__ == '__main__':
+  cros_test_lib.main()
@@ -11,9 +11,12 @@ emerge-$board autotest-all, by simply rsync'ing changes from trunk to sysroot.
 
 import argparse
 import glob
+import json
 import logging
 import os
 import re
+import shutil
+import stat
 import sys
 from collections import namedtuple
 
@@ -30,6 +33,11 @@ if cros_build_lib.IsInsideChroot():
   import portage
 
 INCLUDE_PATTERNS_FILENAME = 'autotest-quickmerge-includepatterns'
+# Index of the source files merged by the last quickmerge, kept in the
+# sysroot autotest directory.
+INDEX_FILENAME = '.quickmerge_index'
+# Up to this many changed files are copied directly instead of with rsync.
+DIRECT_COPY_MAX_FILES = 100
 AUTOTEST_PROJECT_NAME = 'chromiumos/third_party/autotest'
 AUTOTEST_EBUILD = 'chromeos-base/autotest'
 DOWNGRADE_EBUILDS = ['chromeos-base/autotest']
@@ -92,6 +100,198 @@ def GetNewestFileTime(path, ignore_subdirs=[]):
   return max(float_times)
 
 
+def GetIncludedPaths(include_pattern_file):
+  """Returns the top level paths selected by an rsync include pattern file.
+
+  Only the simple patterns used by INCLUDE_PATTERNS_FILENAME are understood:
+  'dir/', 'dir/**' and 'file'.
+
+  Args:
+    include_pattern_file: Path of the rsync include pattern file.
+
+  Returns:
+    A sorted list of paths relative to the autotest source tree.
+  """
+  paths = set()
+  for line in osutils.ReadFile(include_pattern_file).splitlines():
+    line = line.strip()
+    if line and not line.startswith('#'):
+      paths.add(line.split('/')[0])
+  return sorted(paths)
+
+
+def _IsExcluded(name):
+  """Returns whether RsyncQuickmerge excludes files named |name|."""
+  return name.endswith(('.pyc', '.pyo')) or ' -> ' in name
+
+
+def IndexSourceTree(source_path, included_paths):
+  """Records the modification time and size of the included source files.
+
+  Args:
+    source_path: The autotest source tree.
+    included_paths: The top level paths to index, see GetIncludedPaths.
+
+  Returns:
+    A (files, directories) tuple, where |files| maps the relative path of
+    each file and symlink to a (mtime, size) tuple, and |directories| is the
+    set of relative paths of the directories.
+  """
+  files = {}
+  directories = set()
+
+  def _AddFile(rel_path):
+    try:
+      st = os.lstat(os.path.join(source_path, rel_path))
+    except OSError:
+      return
+    files[rel_path] = (st.st_mtime, st.st_size)
+
+  for top in included_paths:
+    top_path = os.path.join(source_path, top)
+    if os.path.islink(top_path) or not os.path.isdir(top_path):
+      if os.path.lexists(top_path):
+        _AddFile(top)
+      continue
+
+    for dirpath, dirnames, filenames in os.walk(top_path):
+      rel_dir = os.path.relpath(dirpath, source_path)
+      directories.add(rel_dir)
+      for name in dirnames[:]:
+        # Symlinks to directories are copied as symlinks.
+        if os.path.islink(os.path.join(dirpath, name)):
+          dirnames.remove(name)
+          filenames.append(name)
+      for name in filenames:
+        if not _IsExcluded(name):
+          _AddFile(os.path.join(rel_dir, name))
+
+  return files, directories
+
+
+def ReadIndex(index_file, source_path):
+  """Reads the index written by WriteIndex for |source_path|.
+
+  Returns:
+    The (files, directories) tuple of IndexSourceTree, or None if there is
+    no usable index.
+  """
+  try:
+    index = json.loads(osutils.ReadFile(index_file))
+  except (IOError, ValueError):
+    return None
+  if index.get('source_path') != source_path:
+    return None
+  files = dict((path, tuple(value)) for path, value in index['files'].items())
+  return files, set(index['directories'])
+
+
+def WriteIndex(index_file, source_path, source_index):
+  """Writes the IndexSourceTree |source_index| of |source_path|."""
+  files, directories = source_index
+  osutils.WriteFile(index_file, json.dumps({
+      'source_path': source_path,
+      'files': files,
+      'directories': sorted(directories),
+  }))
+
+
+def GetChangedPaths(old_index, new_index):
+  """Compares two IndexSourceTree results.
+
+  Files that were deleted from the source tree are ignored, like rsync
+  without --delete does.
+
+  Returns:
+    A (changed_files, new_directories) tuple of sorted lists of relative
+    paths.
+  """
+  old_files, old_directories = old_index
+  new_files, new_directories = new_index
+  changed_files = [path for path, value in new_files.iteritems()
+                   if old_files.get(path) != value]
+  return sorted(changed_files), sorted(new_directories - old_directories)
+
+
+def _CopyFile(source, dest, source_stat, dest_stat, umask):
+  """Copies |source| to |dest| like `rsync -a --no-p --chmod=ugo=rwX`."""
+  if dest_stat and (stat.S_ISLNK(source_stat.st_mode) or
+                    not stat.S_ISREG(dest_stat.st_mode)):
+    os.unlink(dest)
+    dest_stat = None
+
+  if stat.S_ISLNK(source_stat.st_mode):
+    os.symlink(os.readlink(source), dest)
+  else:
+    # Existing files keep their permissions.
+    shutil.copyfile(source, dest)
+    if not dest_stat and source_stat.st_mode & 0o111:
+      os.chmod(dest, 0o777 & ~umask)
+    os.utime(dest, (source_stat.st_atime, source_stat.st_mtime))
+  if os.geteuid() == 0:
+    os.lchown(dest, source_stat.st_uid, source_stat.st_gid)
+
+
+def CopyChangedFiles(source_path, sysroot_autotest_path, changed_files,
+                     new_directories, pretend=False, overwrite=False):
+  """Copies changed files to the sysroot, like RsyncQuickmerge does.
+
+  This is faster than starting rsync for a few files.
+
+  Args:
+    source_path: Directory to copy from.
+    sysroot_autotest_path: Directory to copy to.
+    changed_files: Paths of the files to copy, relative to |source_path|.
+    new_directories: Paths of the directories to create, relative to
+                     |source_path|.
+    pretend: True to only report the changes that would be made.
+    overwrite: True to overwrite all files in sysroot, not just older files.
+
+  Returns:
+    ItemizedChangeReport object for the files and directories created or
+    modified.
+  """
+  report = ItemizedChangeReport(new_files=[], modified_files=[],
+                                new_directories=[])
+  umask = os.umask(0)
+  os.umask(umask)
+
+  for rel_dir in new_directories:
+    dest = os.path.join(sysroot_autotest_path, rel_dir)
+    if not os.path.isdir(dest):
+      report.new_directories.append(
+          ItemizedChange('cd+++++++++', os.path.join(dest, '')))
+      if not pretend:
+        os.makedirs(dest, 0o777 & ~umask)
+
+  for rel_path in changed_files:
+    source = os.path.join(source_path, rel_path)
+    dest = os.path.join(sysroot_autotest_path, rel_path)
+    try:
+      source_stat = os.lstat(source)
+    except OSError:
+      continue
+    try:
+      dest_stat = os.lstat(dest)
+    except OSError:
+      dest_stat = None
+    if (dest_stat and not overwrite and
+        dest_stat.st_mtime > source_stat.st_mtime):
+      continue
+
+    # Describe the change like rsync does.
+    prefix = 'cL' if stat.S_ISLNK(source_stat.st_mode) else '>f'
+    if dest_stat:
+      report.modified_files.append(ItemizedChange(prefix + '..t......', dest))
+    else:
+      report.new_files.append(ItemizedChange(prefix + '+++++++++', dest))
+    if not pretend:
+      osutils.SafeMakedirs(os.path.dirname(dest), mode=0o777 & ~umask)
+      _CopyFile(source, dest, source_stat, dest_stat, umask)
+
+  return report
+
+
 def GetStalePackageNames(change_list, autotest_sysroot):
   """Given a rsync change report, returns the names of stale test packages.
 
@@ -267,7 +467,7 @@ def RemoveBzipPackages(autotest_sysroot):
 
 def RsyncQuickmerge(source_path, sysroot_autotest_path,
                     include_pattern_file=None, pretend=False,
-                    overwrite=False):
+                    overwrite=False, files=None):
   """Run rsync quickmerge command, with specified arguments.
 
   Command will take form `rsync -a [options] --exclude=**.pyc
@@ -282,6 +482,8 @@ def RsyncQuickmerge(source_path, sysroot_autotest_path,
     pretend: True to use the '-n' option to rsync, to perform dry run.
     overwrite: True to omit '-u' option, overwrite all files in sysroot,
                not just older files.
+    files: Optional list of paths relative to |source_path| to rsync,
+           instead of the whole tree.
 
   Returns:
     The cros_build_lib.CommandResult object resulting from the rsync command.
@@ -316,9 +518,14 @@ def RsyncQuickmerge(source_path, sysroot_autotest_path,
 
   command += ['--exclude=*']
 
+  if files is not None:
+    command += ['--files-from=-']
+
   command += [source_path, sysroot_autotest_path]
 
-  return cros_build_lib.SudoRunCommand(command, redirect_stdout=True)
+  return cros_build_lib.SudoRunCommand(
+      command, redirect_stdout=True,
+      input='\n'.join(files) + '\n' if files else None)
 
 
 def ParseArguments(argv):
@@ -342,7 +549,8 @@ def ParseArguments(argv):
                       help='Overwrite existing files even if newer.')
   parser.add_argument('--force', action='store_true',
                       help='Do not check whether destination tree is newer '
-                      'than source tree, always perform quickmerge.')
+                      'than source tree or which files changed since the '
+                      'last quickmerge, always perform a full quickmerge.')
   parser.add_argument('--verbose', action='store_true',
                       help='Print detailed change report.')
 
@@ -386,23 +594,51 @@ def main(argv):
     sysroot_autotest_path = os.path.join(sysroot_path, 'usr/local/autotest',
                                          '')
 
-  if not args.force:
-    newest_dest_time = GetNewestFileTime(sysroot_autotest_path, IGNORE_SUBDIRS)
-    newest_source_time = GetNewestFileTime(source_path, IGNORE_SUBDIRS)
-    if newest_dest_time >= newest_source_time:
-      logging.info('The sysroot appears to be newer than the source tree, '
-                   'doing nothing and exiting now.')
+  # Only the source files that changed since the last quickmerge need to be
+  # merged. Without an index of the last quickmerge, rsync the whole tree.
+  index_file = os.path.join(sysroot_autotest_path, INDEX_FILENAME)
+  source_index = IndexSourceTree(source_path,
+                                 GetIncludedPaths(include_pattern_file))
+  old_index = None if args.force else ReadIndex(index_file, source_path)
+
+  if old_index is None:
+    if not args.force:
+      newest_dest_time = GetNewestFileTime(sysroot_autotest_path,
+                                           IGNORE_SUBDIRS)
+      newest_source_time = GetNewestFileTime(source_path, IGNORE_SUBDIRS)
+      if newest_dest_time >= newest_source_time:
+        logging.info('The sysroot appears to be newer than the source tree, '
+                     'doing nothing and exiting now.')
+        return 0
+    changed_files = None
+  else:
+    changed_files, new_directories = GetChangedPaths(old_index, source_index)
+    if not changed_files and not new_directories:
+      logging.info('No files changed since the last quickmerge, doing '
+                   'nothing and exiting now.')
       return 0
 
-  rsync_output = RsyncQuickmerge(source_path, sysroot_autotest_path,
-                                 include_pattern_file, args.pretend,
-                                 args.overwrite)
-
-  if args.verbose:
-    logging.info(rsync_output.output)
-
-  change_report = ItemizeChangesFromRsyncOutput(rsync_output.output,
-                                                sysroot_autotest_path)
+  if changed_files is not None and len(changed_files) <= DIRECT_COPY_MAX_FILES:
+    change_report = CopyChangedFiles(source_path, sysroot_autotest_path,
+                                     changed_files, new_directories,
+                                     args.pretend, args.overwrite)
+    if args.verbose:
+      for change in sorted(change_report.new_directories +
+                           change_report.new_files +
+                           change_report.modified_files):
+        logging.info('%s %s', *change)
+  else:
+    if changed_files is not None:
+      changed_files += new_directories
+    rsync_output = RsyncQuickmerge(source_path, sysroot_autotest_path,
+                                   include_pattern_file, args.pretend,
+                                   args.overwrite, files=changed_files)
+
+    if args.verbose:
+      logging.info(rsync_output.output)
+
+    change_report = ItemizeChangesFromRsyncOutput(rsync_output.output,
+                                                  sysroot_autotest_path)
 
   if not args.pretend:
     logging.info('Updating portage database.')
@@ -428,6 +664,7 @@ def main(argv):
     sentinel_filename = os.path.join(sysroot_autotest_path,
                                      '.quickmerge_sentinel')
     cros_build_lib.RunCommand(['touch', sentinel_filename])
+    WriteIndex(index_file, source_path, source_index)
 
 
   if args.pretend:
@@ -16,6 +16,7 @@ import mox
 sys.path.insert(0, os.path.abspath('%s/../..' % os.path.dirname(__file__)))
 from chromite.lib import cros_build_lib_unittest
 from chromite.lib import cros_test_lib
+from chromite.lib import osutils
 from chromite.scripts import autotest_quickmerge
 
 
@@ -138,6 +139,104 @@ class RsyncCommandTest(cros_build_lib_unittest.RunCommandTestCase):
 
     self.assertCommandContains(expected_command)
 
+  def testRsyncQuickmergeFiles(self):
+    """Test that RsyncQuickmerge passes a list of files to rsync."""
+    autotest_quickmerge.RsyncQuickmerge('a_source_path', 'a_sysroot_path',
+                                        files=['client/a.py', 'server/b.py'])
+    self.assertCommandContains(['--files-from=-', 'a_source_path',
+                                'a_sysroot_path'],
+                               input='client/a.py\nserver/b.py\n')
+
+
+class IncrementalQuickmergeTest(cros_test_lib.TempDirTestCase):
+  """Test the index of the source tree and the direct copy of changes."""
+
+  def setUp(self):
+    self.source = os.path.join(self.tempdir, 'source')
+    self.sysroot = os.path.join(self.tempdir, 'sysroot')
+    self.included = ['client', 'global_config.ini']
+    for path in ('client/a.py', 'client/a.pyc', 'client/site_tests/t/control',
+                 'global_config.ini', 'results/log'):
+      osutils.WriteFile(os.path.join(self.source, path), path, makedirs=True)
+    os.symlink('a.py', os.path.join(self.source, 'client', 'link'))
+
+  def _Index(self):
+    return autotest_quickmerge.IndexSourceTree(self.source, self.included)
+
+  def testGetIncludedPaths(self):
+    """Test that the include patterns of quickmerge are understood."""
+    pattern_file = os.path.join(
+        os.path.dirname(os.path.abspath(__file__)),
+        autotest_quickmerge.INCLUDE_PATTERNS_FILENAME)
+    paths = autotest_quickmerge.GetIncludedPaths(pattern_file)
+    self.assertTrue('client' in paths)
+    self.assertTrue('global_config.ini' in paths)
+    self.assertFalse('client/**' in paths)
+
+  def testIndexSourceTree(self):
+    """Test that only included and not excluded files are indexed."""
+    files, directories = self._Index()
+    self.assertEqual(sorted(files), ['client/a.py', 'client/link',
+                                     'client/site_tests/t/control',
+                                     'global_config.ini'])
+    self.assertEqual(directories,
+                     set(['client', 'client/site_tests', 'client/site_tests/t']))
+
+  def testIndexRoundTrip(self):
+    """Test that a written index is read back for the same source only."""
+    index_file = os.path.join(self.tempdir, 'index')
+    index = self._Index()
+    autotest_quickmerge.WriteIndex(index_file, self.source, index)
+    self.assertEqual(autotest_quickmerge.ReadIndex(index_file, self.source),
+                     index)
+    self.assertEqual(autotest_quickmerge.ReadIndex(index_file, self.sysroot),
+                     None)
+
+  def testGetChangedPaths(self):
+    """Test that modified and new files and directories are found."""
+    old_index = self._Index()
+    osutils.WriteFile(os.path.join(self.source, 'client/a.py'), 'modified')
+    osutils.WriteFile(os.path.join(self.source, 'client/new/b.py'), 'b',
+                      makedirs=True)
+    self.assertEqual(
+        autotest_quickmerge.GetChangedPaths(old_index, self._Index()),
+        (['client/a.py', 'client/new/b.py'], ['client/new']))
+
+  def testCopyChangedFiles(self):
+    """Test that changed files are copied like rsync would."""
+    files, directories = self._Index()
+    dest_a = os.path.join(self.sysroot, 'client/a.py')
+    osutils.WriteFile(dest_a, 'old', makedirs=True)
+    os.chmod(dest_a, 0o600)
+    report = autotest_quickmerge.CopyChangedFiles(
+        self.source, self.sysroot, sorted(files), sorted(directories),
+        overwrite=True)
+
+    self.assertEqual(osutils.ReadFile(dest_a), 'client/a.py')
+    # Existing files keep their permissions.
+    self.assertEqual(os.stat(dest_a).st_mode & 0o777, 0o600)
+    self.assertEqual(os.readlink(os.path.join(self.sysroot, 'client/link')),
+                     'a.py')
+    self.assertEqual(report.modified_files, [('>f..t......', dest_a)])
+    self.assertEqual(
+        sorted(change.absolute_path for change in report.new_files),
+        [os.path.join(self.sysroot, x) for x in
+         ('client/link', 'client/site_tests/t/control', 'global_config.ini')])
+    self.assertEqual(
+        autotest_quickmerge.GetStalePackageNames(
+            report.new_files + report.modified_files, self.sysroot), ['t'])
+
+  def testCopyChangedFilesSkipsNewer(self):
+    """Test that newer files in the sysroot are kept without overwrite."""
+    dest = os.path.join(self.sysroot, 'global_config.ini')
+    osutils.WriteFile(dest, 'newer', makedirs=True)
+    source_mtime = os.stat(os.path.join(self.source, 'global_config.ini'))
+    os.utime(dest, (source_mtime.st_atime, source_mtime.st_mtime + 10))
+    report = autotest_quickmerge.CopyChangedFiles(
+        self.source, self.sysroot, ['global_config.ini'], [])
+    self.assertEqual(osutils.ReadFile(dest), 'newer')
+    self.assertEqual(report.modified_files, [])
+
 
 class PortageManipulationsTest(mox.MoxTestBase):
   """Test usage of autotest_quickmerge.portage."""
@@ -12,6 +12,7 @@ full and pre-flight-queue builds.
 
 import collections
 import distutils.version
+import functools
 import glob
 import json
 import logging
@@ -527,12 +528,6 @@ class SimpleBuilder(Builder):
                      builder_run=builder_run)
       return
 
-    # Build the image first before doing anything else.
-    # TODO(davidjames): Remove this lock once http://crbug.com/352994 is fixed.
-    with self._build_image_lock:
-      self._RunStage(build_stages.BuildImageStage, board,
-                     builder_run=builder_run, afdo_use=config.afdo_use)
-
     # While this stage list is run in parallel, the order here dictates the
     # order that things will be shown in the log.  So group things together
     # that make sense when read in order.  Also keep in mind that, since we
@@ -563,17 +558,40 @@ class SimpleBuilder(Builder):
         [test_stages.UnitTestStage, board],
         [artifact_stages.UploadPrebuiltsStage, board],
         [artifact_stages.DevInstallerPrebuiltsStage, board],
+    ]
+
+    # These stages only need the packages of the board, not its image, so
+    # they run while the image is being built.
+    packages_stage_list = [
         [artifact_stages.DebugSymbolsStage, board],
         [artifact_stages.CPEExportStage, board],
     ]
 
     stage_objs = [self._GetStageInstance(*x, builder_run=builder_run)
                   for x in stage_list]
-
-    parallel.RunParallelSteps([
-        lambda: self._RunParallelStages(stage_objs + [archive_stage]),
-        lambda: self._RunHWTests(builder_run, board),
-    ])
+    packages_stage_objs = [self._GetStageInstance(*x, builder_run=builder_run)
+                           for x in packages_stage_list]
+
+    # Start each group of stages as soon as its inputs are ready.
+    run_build_image = functools.partial(
+        self._RunStage, build_stages.BuildImageStage, board,
+        builder_run=builder_run, afdo_use=config.afdo_use)
+    run_image_stages = functools.partial(self._RunParallelStages,
+                                         stage_objs + [archive_stage])
+    run_packages_stages = functools.partial(self._RunParallelStages,
+                                            packages_stage_objs)
+    run_hw_tests = functools.partial(self._RunHWTests, builder_run, board)
+    parallel.RunStepGraph(
+        [run_build_image, run_packages_stages, run_image_stages,
+         run_hw_tests],
+        deps={
+            run_image_stages: [run_build_image],
+            run_hw_tests: [run_build_image],
+        },
+        # Only build one image at a time.
+        # TODO(davidjames): Remove this lock once http://crbug.com/352994 is
+        # fixed.
+        resources={run_build_image: [self._build_image_lock]})
 
   def _RunSetupBoard(self):
     """Run the SetupBoard stage for all child configs and boards."""
@@ -1250,6 +1268,9 @@ def _CreateParser():
                           help='Use the latest toolchain.')
   parser.add_option('--log_dir', dest='log_dir', type='path',
                     help=('Directory where logs are stored.'))
+  parser.add_option('--compress-log', action='store_true', default=False,
+                    help=('Gzip the log written to the log directory (as '
+                          '%s.gz).' % _BUILDBOT_LOG_FILE))
   group.add_remote_option('--maxarchives', dest='max_archive_builds',
                           default=3, type='int',
                           help='Change the local saved build count limit.')
@@ -1777,6 +1798,8 @@ def main(argv):
   log_file = None
   if options.tee:
     log_file = os.path.join(options.log_dir, _BUILDBOT_LOG_FILE)
+    if options.compress_log:
+      log_file += '.gz'
     osutils.SafeMakedirs(options.log_dir)
     _BackupPreviousLog(log_file)
 
@@ -1791,7 +1814,7 @@ def main(argv):
       # so we run Tee (forked off) outside of it. This prevents a deadlock
       # because the Tee process only exits when its pipe is closed, and the
       # critical section accidentally holds on to that file handle.
-      stack.Add(tee.Tee, log_file)
+      stack.Add(tee.Tee, log_file, compress=options.compress_log)
       options.preserve_paths.add(_DEFAULT_LOG_DIR)
 
     critical_section = stack.Add(cleanup.EnforcedCleanupSection)
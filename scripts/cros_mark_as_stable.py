@@ -6,6 +6,8 @@
 
 """This module uprevs a given package's ebuild to the next revision."""
 
+import collections
+import functools
 import optparse
 import os
 import sys
@@ -21,6 +23,10 @@ from chromite.lib import parallel
 # Commit message for uprevving Portage packages.
 _GIT_COMMIT_MESSAGE = 'Marking 9999 ebuild for %s as stable.'
 
+# Maximum number of ebuilds in a single overlay to compute uprev info for at
+# the same time.  This mostly runs git and chromeos-version.sh scripts.
+_MAX_PARALLEL_EBUILDS = 16
+
 # Dictionary of valid commands with usage information.
 COMMAND_DICTIONARY = {
     'commit': 'Marks given ebuilds as stable locally',
@@ -28,6 +34,15 @@ COMMAND_DICTIONARY = {
 }
 
 
+# The result of uprevving all of the ebuilds in a single overlay.
+#   overlay: Path to the overlay.
+#   revved_packages: List of package names (category/package) that were revved.
+#   new_package_atoms: List of atoms (=category/package-version) for the new
+#     stable ebuilds.
+UprevReport = collections.namedtuple(
+    'UprevReport', ('overlay', 'revved_packages', 'new_package_atoms'))
+
+
 # ======================= Global Helper Functions ========================
 
 
@@ -208,6 +223,91 @@ class GitBranch(object):
     return branch in branches.split()
 
 
+def _GetUprevInfos(ebuilds, srcroot, manifest):
+  """Compute the UprevInfo for each of |ebuilds| in parallel.
+
+  Args:
+    ebuilds: List of portage_utilities.EBuild objects.
+    srcroot: Path to root src directory.
+    manifest: git.ManifestCheckout object.
+
+  Returns:
+    A list of portage_utilities.UprevInfo tuples, in the same order as
+    |ebuilds|.
+  """
+  if len(ebuilds) <= 1:
+    return [ebuild.GetUprevInfo(srcroot, manifest) for ebuild in ebuilds]
+
+  steps = [functools.partial(ebuild.GetUprevInfo, srcroot, manifest)
+           for ebuild in ebuilds]
+  return parallel.RunParallelSteps(steps, max_parallel=_MAX_PARALLEL_EBUILDS,
+                                   return_values=True)
+
+
+def UprevOverlay(overlay, ebuilds, tracking_branch, srcroot, manifest,
+                 verbose=False):
+  """Uprev the cros-workon |ebuilds| in |overlay| and commit the result.
+
+  The version and source hashes of every ebuild are computed in parallel, as
+  they only read from the source repositories.  All changes to the overlay's
+  git repository are then made serially from this process.
+
+  Args:
+    overlay: Path to the overlay to work in.
+    ebuilds: List of portage_utilities.EBuild objects in |overlay| to rev.
+    tracking_branch: The tracking branch of the overlay.
+    srcroot: Path to root src directory.
+    manifest: git.ManifestCheckout object.
+    verbose: Whether to print out what we are working on.
+
+  Returns:
+    An UprevReport for |overlay|.
+  """
+  revved_packages = []
+  new_package_atoms = []
+
+  existing_commit = git.GetGitRepoRevision(overlay)
+  work_branch = GitBranch(constants.STABLE_EBUILD_BRANCH, tracking_branch,
+                          cwd=overlay)
+  work_branch.CreateBranch()
+  if not work_branch.Exists():
+    cros_build_lib.Die('Unable to create stabilizing branch in %s' % overlay)
+
+  # In the case of uprevving overlays that have patches applied to them,
+  # include the patched changes in the stabilizing branch.
+  git.RunGit(overlay, ['rebase', existing_commit])
+
+  uprev_infos = _GetUprevInfos(ebuilds, srcroot, manifest)
+
+  messages = []
+  for ebuild, uprev_info in zip(ebuilds, uprev_infos):
+    if verbose:
+      cros_build_lib.Info('Working on %s', ebuild.package)
+    try:
+      new_package = ebuild.RevWorkOnEBuild(srcroot, manifest,
+                                           uprev_info=uprev_info)
+      if new_package:
+        revved_packages.append(ebuild.package)
+        new_package_atoms.append('=%s' % new_package)
+        messages.append(_GIT_COMMIT_MESSAGE % ebuild.package)
+    except (OSError, IOError):
+      cros_build_lib.Warning(
+          'Cannot rev %s\n'
+          'Note you will have to go into %s '
+          'and reset the git repo yourself.' % (ebuild.package, overlay))
+      raise
+
+  if messages:
+    portage_utilities.EBuild.CommitChange('\n\n'.join(messages), overlay)
+
+  if cros_build_lib.IsInsideChroot():
+    # Regenerate caches if need be.  We do this all the time to
+    # catch when users make changes without updating cache files.
+    portage_utilities.RegenCache(overlay)
+
+  return UprevReport(overlay, revved_packages, new_package_atoms)
+
+
 def main(_argv):
   parser = optparse.OptionParser('cros_mark_as_stable OPTIONS packages')
   parser.add_option('--all', action='store_true',
@@ -258,86 +358,38 @@ def main(_argv):
   if command == 'commit':
     portage_utilities.BuildEBuildDictionary(overlays, options.all, package_list)
 
-  # Contains the array of packages we actually revved.
-  revved_packages = []
-  new_package_atoms = []
+  # Note we intentionally work from the non push tracking branch;
+  # everything built thus far has been against it (meaning, http mirrors),
+  # thus we should honor that.  During the actual push, the code switches
+  # to the correct urls, and does an appropriate rebasing.
+  tracking_branches = {}
+  for overlay in sorted(overlays):
+    if not os.path.isdir(overlay):
+      cros_build_lib.Warning('Skipping %s' % overlay)
+      continue
+    tracking_branches[overlay] = git.GetTrackingBranchViaManifest(
+        overlay, manifest=manifest)[1]
+
+  if command == 'push':
+    for overlay, tracking_branch in sorted(tracking_branches.items()):
+      PushChange(constants.STABLE_EBUILD_BRANCH, tracking_branch,
+                 options.dryrun, cwd=overlay)
+  elif command == 'commit':
+    # Every overlay is its own git repository, so uprev them all in parallel.
+    # Each overlay also regenerates its cache as soon as it is done.
+    steps = [functools.partial(UprevOverlay, overlay, overlays[overlay],
+                               tracking_branch, options.srcroot, manifest,
+                               verbose=options.verbose)
+             for overlay, tracking_branch in sorted(tracking_branches.items())]
+    reports = parallel.RunParallelSteps(steps, return_values=True)
+
+    # Contains the array of packages we actually revved.
+    revved_packages = []
+    new_package_atoms = []
+    for report in reports:
+      revved_packages.extend(report.revved_packages)
+      new_package_atoms.extend(report.new_package_atoms)
 
-  # Slight optimization hack: process the chromiumos overlay before any other
-  # cros-workon overlay first so we can do background cache generation in it.
-  # A perfect solution would walk all the overlays, figure out any dependencies
-  # between them (with layout.conf), and then process them in dependency order.
-  # However, this operation isn't slow enough to warrant that level of
-  # complexity, so we'll just special case the main overlay.
-  #
-  # Similarly, generate the cache in the portage-stable tree asap.  We know
-  # we won't have any cros-workon packages in there, so generating the cache
-  # is the only thing it'll be doing.  The chromiumos overlay instead might
-  # have revbumping to do before it can generate the cache.
-  keys = overlays.keys()
-  for overlay in ('/third_party/chromiumos-overlay',
-                  '/third_party/portage-stable'):
-    for k in keys:
-      if k.endswith(overlay):
-        keys.remove(k)
-        keys.insert(0, k)
-        break
-
-  with parallel.BackgroundTaskRunner(portage_utilities.RegenCache) as queue:
-    for overlay in keys:
-      ebuilds = overlays[overlay]
-      if not os.path.isdir(overlay):
-        cros_build_lib.Warning('Skipping %s' % overlay)
-        continue
-
-      # Note we intentionally work from the non push tracking branch;
-      # everything built thus far has been against it (meaning, http mirrors),
-      # thus we should honor that.  During the actual push, the code switches
-      # to the correct urls, and does an appropriate rebasing.
-      tracking_branch = git.GetTrackingBranchViaManifest(
-          overlay, manifest=manifest)[1]
-
-      if command == 'push':
-        PushChange(constants.STABLE_EBUILD_BRANCH, tracking_branch,
-                   options.dryrun, cwd=overlay)
-      elif command == 'commit':
-        existing_commit = git.GetGitRepoRevision(overlay)
-        work_branch = GitBranch(constants.STABLE_EBUILD_BRANCH, tracking_branch,
-                                cwd=overlay)
-        work_branch.CreateBranch()
-        if not work_branch.Exists():
-          cros_build_lib.Die('Unable to create stabilizing branch in %s' %
-                             overlay)
-
-        # In the case of uprevving overlays that have patches applied to them,
-        # include the patched changes in the stabilizing branch.
-        git.RunGit(overlay, ['rebase', existing_commit])
-
-        messages = []
-        for ebuild in ebuilds:
-          if options.verbose:
-            cros_build_lib.Info('Working on %s', ebuild.package)
-          try:
-            new_package = ebuild.RevWorkOnEBuild(options.srcroot, manifest)
-            if new_package:
-              revved_packages.append(ebuild.package)
-              new_package_atoms.append('=%s' % new_package)
-              messages.append(_GIT_COMMIT_MESSAGE % ebuild.package)
-          except (OSError, IOError):
-            cros_build_lib.Warning(
-                'Cannot rev %s\n'
-                'Note you will have to go into %s '
-                'and reset the git repo yourself.' % (ebuild.package, overlay))
-            raise
-
-        if messages:
-          portage_utilities.EBuild.CommitChange('\n\n'.join(messages), overlay)
-
-        if cros_build_lib.IsInsideChroot():
-          # Regenerate caches if need be.  We do this all the time to
-          # catch when users make changes without updating cache files.
-          queue.put([overlay])
-
-  if command == 'commit':
     if cros_build_lib.IsInsideChroot():
       CleanStalePackages(options.boards.split(':'), new_package_atoms)
     if options.drop_file:
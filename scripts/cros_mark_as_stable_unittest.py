@@ -11,6 +11,7 @@ import sys
 
 sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)),
                                 '..', '..'))
+from chromite.cbuildbot import portage_utilities
 from chromite.lib import cros_build_lib
 from chromite.lib import cros_build_lib_unittest
 from chromite.lib import cros_test_lib
@@ -20,6 +21,10 @@ from chromite.lib import parallel_unittest
 from chromite.lib import partial_mock
 from chromite.scripts import cros_mark_as_stable
 
+# TODO(build): Finish test wrapper (http://crosbug.com/37517).
+# Until then, this has to be after the chromite imports.
+import mock
+
 
 # pylint: disable=W0212,R0904
 class NonClassTests(cros_test_lib.MoxTestCase):
@@ -106,6 +111,54 @@ class CleanStalePackagesTest(cros_build_lib_unittest.RunCommandTestCase):
                         (), ['no/pkg'])
 
 
+class UprevOverlayTest(cros_test_lib.MockTestCase):
+  """Tests for cros_mark_as_stable.UprevOverlay."""
+
+  def setUp(self):
+    self.PatchObject(git, 'GetGitRepoRevision', return_value='deadbeef')
+    self.PatchObject(cros_mark_as_stable.GitBranch, 'CreateBranch')
+    self.PatchObject(cros_mark_as_stable.GitBranch, 'Exists',
+                     return_value=True)
+    self.PatchObject(cros_build_lib, 'IsInsideChroot', return_value=False)
+    self.run_git = self.PatchObject(git, 'RunGit')
+    self.commit = self.PatchObject(portage_utilities.EBuild, 'CommitChange')
+
+  def _MockEBuild(self, package, new_package):
+    """Return a mock EBuild for |package| that revs to |new_package|."""
+    ebuild = mock.Mock()
+    ebuild.package = package
+    ebuild.GetUprevInfo.return_value = portage_utilities.UprevInfo(
+        '0.0.1', ['commit'], ['tree'])
+    ebuild.RevWorkOnEBuild.return_value = new_package
+    return ebuild
+
+  def testUprevOverlay(self):
+    """Test that revved packages are reported and committed."""
+    ebuilds = [self._MockEBuild('cat/foo', 'cat/foo-0.0.1-r2'),
+               self._MockEBuild('cat/bar', None)]
+    with parallel_unittest.ParallelMock():
+      report = cros_mark_as_stable.UprevOverlay(
+          '/overlay', ebuilds, 'cros/master', '/src', None)
+
+    self.assertEqual(report, cros_mark_as_stable.UprevReport(
+        '/overlay', ['cat/foo'], ['=cat/foo-0.0.1-r2']))
+    for ebuild in ebuilds:
+      ebuild.GetUprevInfo.assert_called_once_with('/src', None)
+      ebuild.RevWorkOnEBuild.assert_called_once_with(
+          '/src', None, uprev_info=ebuild.GetUprevInfo.return_value)
+    self.run_git.assert_called_once_with('/overlay', ['rebase', 'deadbeef'])
+    self.commit.assert_called_once_with(
+        cros_mark_as_stable._GIT_COMMIT_MESSAGE % 'cat/foo', '/overlay')
+
+  def testUprevOverlayNoChanges(self):
+    """Test that nothing is committed when no packages are revved."""
+    ebuilds = [self._MockEBuild('cat/foo', None)]
+    report = cros_mark_as_stable.UprevOverlay(
+        '/overlay', ebuilds, 'cros/master', '/src', None)
+    self.assertEqual(report.revved_packages, [])
+    self.assertFalse(self.commit.called)
+
+
 class GitBranchTest(cros_test_lib.MoxTestCase):
   """Tests for cros_mark_as_stable.GitBranch."""
 
@@ -9,6 +9,7 @@
 import copy
 import glob
 import json
+import multiprocessing
 import os
 
 from chromite.cbuildbot import constants
@@ -705,7 +706,8 @@ def _GetFilesForTarget(target, root='/'):
 
 
 def _BuildInitialPackageRoot(output_dir, paths, elfs, ldpaths,
-                             path_rewrite_func=lambda x:x, root='/'):
+                             path_rewrite_func=lambda x:x, root='/',
+                             processes=None):
   """Link in all packable files and their runtime dependencies
 
   This also wraps up executable ELFs with helper scripts.
@@ -717,6 +719,8 @@ def _BuildInitialPackageRoot(output_dir, paths, elfs, ldpaths,
     ldpaths: A dict of static ldpath information
     path_rewrite_func: User callback to rewrite paths in output_dir
     root: The root path to pull all packages/files from
+    processes: The number of processes to parse the ELFs with; see
+      lddtree.ParseELFs
   """
   # Link in all the files.
   sym_paths = []
@@ -754,8 +758,12 @@ def _BuildInitialPackageRoot(output_dir, paths, elfs, ldpaths,
   libdir = os.path.join(output_dir, 'lib')
   osutils.SafeMakedirs(libdir)
   donelibs = set()
-  for elf in elfs:
-    e = lddtree.ParseELF(elf, root=root, ldpaths=ldpaths)
+  # Sort the ELFs so that related ones (e.g. in the same dir) are parsed by
+  # the same worker and share its cache of parsed libraries.
+  elfs = sorted(elfs)
+  trees = lddtree.ParseELFs(elfs, root=root, ldpaths=ldpaths,
+                            processes=processes)
+  for elf, e in zip(elfs, trees):
     interp = e['interp']
     if interp:
       # Generate a wrapper if it is executable.
@@ -869,7 +877,8 @@ def _ProcessDistroCleanups(target, output_dir):
   osutils.RmDir(os.path.join(output_dir, 'etc'))
 
 
-def CreatePackagableRoot(target, output_dir, ldpaths, root='/'):
+def CreatePackagableRoot(target, output_dir, ldpaths, root='/',
+                         processes=None):
   """Setup a tree from the packages for the specified target
 
   This populates a path with all the files from toolchain packages so that
@@ -880,6 +889,7 @@ def CreatePackagableRoot(target, output_dir, ldpaths, root='/'):
     output_dir: The output directory to place all the files
     ldpaths: A dict of static ldpath information
     root: The root path to pull all packages/files from
+    processes: The number of processes to parse the ELFs with
   """
   # Find all the files owned by the packages for this target.
   paths, elfs = _GetFilesForTarget(target, root=root)
@@ -890,7 +900,8 @@ def CreatePackagableRoot(target, output_dir, ldpaths, root='/'):
     """Move /usr/bin to /bin so people can just use that toplevel dir"""
     return path[4:] if path.startswith('/usr/bin/') else path
   _BuildInitialPackageRoot(output_dir, paths, elfs, ldpaths,
-                           path_rewrite_func=MoveUsrBinToBin, root=root)
+                           path_rewrite_func=MoveUsrBinToBin, root=root,
+                           processes=processes)
 
   # The packages, when part of the normal distro, have helper scripts
   # that setup paths and such.  Since we are making this standalone, we
@@ -914,6 +925,9 @@ def CreatePackages(targets_wanted, output_dir, root='/'):
   osutils.SafeMakedirs(output_dir)
   ldpaths = lddtree.LoadLdpaths(root)
   targets = ExpandTargets(targets_wanted)
+  # The targets are set up in parallel already, so split the CPUs between
+  # them rather than having each one parse its ELFs with all of them.
+  processes = max(1, multiprocessing.cpu_count() // max(1, len(targets)))
 
   with osutils.TempDir() as tempdir:
     # We have to split the root generation from the compression stages.  This is
@@ -923,7 +937,7 @@ def CreatePackages(targets_wanted, output_dir, root='/'):
     with parallel.BackgroundTaskRunner(CreatePackagableRoot) as queue:
       for target in targets:
         output_target_dir = os.path.join(tempdir, target)
-        queue.put([target, output_target_dir, ldpaths, root])
+        queue.put([target, output_target_dir, ldpaths, root, processes])
 
     # Build the tarball.
     with parallel.BackgroundTaskRunner(cros_build_lib.CreateTarball) as queue:
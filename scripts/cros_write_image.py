@@ -0,0 +1,216 @@
+#!/usr/bin/python
+# Copyright 2014 The Chromium OS Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Write a Chromium OS disk image to a (removable) block device.
+
+Only the parts of the image that hold the partition tables or a partition are
+written; unallocated space is skipped.  The data is written in large aligned
+chunks with direct I/O where possible and a single fsync at the end, and it
+can be verified by reading it back.
+
+Used by `cros flash usb://...`, which runs it with sudo.
+"""
+
+import errno
+import hashlib
+import logging
+import mmap
+import os
+
+from chromite.lib import commandline
+from chromite.lib import cros_build_lib
+
+
+# Extents are aligned to this many bytes, which is a multiple of the logical
+# block size of any device (as required by direct I/O).
+ALIGNMENT = 1024 * 1024
+# The amount of data read and written at once.
+CHUNK_SIZE = 8 * ALIGNMENT
+# Writes smaller than this cannot use direct I/O.
+DIRECT_IO_BLOCK_SIZE = 4096
+# The size of the backup GPT (header and partition entries) at the end of the
+# image.
+BACKUP_GPT_SIZE = 33 * 512
+# Log the progress every this many bytes.
+PROGRESS_INTERVAL = 256 * 1024 * 1024
+
+
+def GetImageExtents(image):
+  """Returns the byte ranges of |image| that need to be written.
+
+  The ranges cover the protective MBR and GPT at the start of the image, all
+  partitions and the backup GPT at the end of the image.  They are rounded out
+  to ALIGNMENT and merged.  If the partition table cannot be read, the whole
+  image is written.
+
+  Args:
+    image: Path to the image.
+
+  Returns:
+    A sorted list of (start, end) tuples.
+  """
+  size = os.path.getsize(image)
+  try:
+    # Partition names aren't unique (e.g. there are several 'reserved' ones),
+    # so key the partitions by number to get all of them.
+    partitions = cros_build_lib.GetImageDiskPartitionInfo(
+        image, unit='B', key_selector='number').values()
+  except cros_build_lib.RunCommandError as e:
+    logging.warning('Cannot read the partition table of %s, writing all of '
+                    'it: %s', image, e)
+    partitions = []
+  if not partitions:
+    return [(0, size)]
+
+  # Partition offsets are whole numbers of bytes.
+  ranges = [(0, int(min(p.start for p in partitions)))]
+  ranges += [(int(p.start), int(p.start + p.size))
+             for p in partitions if p.size]
+  ranges.append((size - BACKUP_GPT_SIZE, size))
+
+  extents = []
+  for start, end in sorted(ranges):
+    start = start // ALIGNMENT * ALIGNMENT
+    end = min(size, (end + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT)
+    if extents and start <= extents[-1][1]:
+      extents[-1] = (extents[-1][0], max(end, extents[-1][1]))
+    else:
+      extents.append((start, end))
+  return extents
+
+
+def _OpenDirect(path, flags, direct=True):
+  """Open |path|, with direct I/O if requested and supported.
+
+  Returns:
+    An (fd, direct) tuple.  |direct| tells whether direct I/O is used.
+  """
+  if direct and hasattr(os, 'O_DIRECT'):
+    try:
+      return os.open(path, flags | os.O_DIRECT), True
+    except OSError as e:
+      if e.errno != errno.EINVAL:
+        raise
+      logging.debug('%s does not support direct I/O.', path)
+  return os.open(path, flags), False
+
+
+def _IterChunks(extents):
+  """Yields the (offset, length) of the chunks to copy for |extents|."""
+  for start, end in extents:
+    for offset in xrange(start, end, CHUNK_SIZE):
+      yield offset, min(CHUNK_SIZE, end - offset)
+
+
+def WriteImage(image, device, extents, direct=True):
+  """Write the |extents| of |image| to the same offsets of |device|.
+
+  Args:
+    image: Path to the image.
+    device: Path to the device (or file) to write to.
+    extents: The list of (start, end) byte ranges to write, e.g. from
+      GetImageExtents.
+    direct: Whether to use direct I/O if the device supports it.
+
+  Returns:
+    The hex SHA-1 digest of the data written, see HashExtents.
+  """
+  total = sum(end - start for start, end in extents)
+  logging.info('Writing %d MiB of %s to %s...', total >> 20, image, device)
+  sha1 = hashlib.sha1()
+  # Direct I/O needs page aligned buffers, which mmap provides.
+  buf = mmap.mmap(-1, CHUNK_SIZE)
+  written = 0
+  with open(image, 'rb', 0) as src:
+    fd, direct = _OpenDirect(device, os.O_WRONLY, direct=direct)
+    # Direct I/O cannot write a tail that is not a multiple of the block size.
+    tail_fd = os.open(device, os.O_WRONLY) if direct else fd
+    try:
+      for offset, length in _IterChunks(extents):
+        src.seek(offset)
+        if src.readinto(buf) < length:
+          raise IOError('Short read from %s at offset %d' % (image, offset))
+        data = buffer(buf, 0, length)
+        sha1.update(data)
+        out_fd = fd if length % DIRECT_IO_BLOCK_SIZE == 0 else tail_fd
+        os.lseek(out_fd, offset, os.SEEK_SET)
+        os.write(out_fd, data)
+
+        previous, written = written, written + length
+        if written // PROGRESS_INTERVAL > previous // PROGRESS_INTERVAL:
+          logging.info('Wrote %d of %d MiB', written >> 20, total >> 20)
+
+      logging.info('Syncing %s...', device)
+      os.fsync(fd)
+    finally:
+      if tail_fd != fd:
+        os.close(tail_fd)
+      os.close(fd)
+      buf.close()
+
+  return sha1.hexdigest()
+
+
+def HashExtents(path, extents, direct=True):
+  """Returns the hex SHA-1 digest of the |extents| of |path|.
+
+  Args:
+    path: Path to the device (or file) to read.
+    extents: The list of (start, end) byte ranges to read.
+    direct: Whether to use direct I/O (bypassing the page cache) if supported.
+  """
+  sha1 = hashlib.sha1()
+  buf = mmap.mmap(-1, CHUNK_SIZE)
+  fd, direct = _OpenDirect(path, os.O_RDONLY, direct=direct)
+  src = os.fdopen(fd, 'rb', 0)
+  # Direct I/O cannot read a tail that is not a multiple of the block size.
+  tail_fd = os.open(path, os.O_RDONLY) if direct else fd
+  try:
+    for offset, length in _IterChunks(extents):
+      if length % DIRECT_IO_BLOCK_SIZE == 0:
+        src.seek(offset)
+        data = buffer(buf, 0, min(src.readinto(buf), length))
+      else:
+        os.lseek(tail_fd, offset, os.SEEK_SET)
+        data = os.read(tail_fd, length)
+      if len(data) < length:
+        raise IOError('Short read from %s at offset %d' % (path, offset))
+      sha1.update(data)
+  finally:
+    if tail_fd != fd:
+      os.close(tail_fd)
+    src.close()
+    buf.close()
+
+  return sha1.hexdigest()
+
+
+def GetParser():
+  """Creates the argparse parser."""
+  parser = commandline.ArgumentParser(description=__doc__)
+  parser.add_argument('image', type='path', help='The image to write.')
+  parser.add_argument('device', type='path',
+                      help='The device (or file) to write the image to.')
+  parser.add_argument('--verify', default=False, action='store_true',
+                      help='Read the data back and compare it to the image.')
+  parser.add_argument('--no-direct-io', dest='direct', default=True,
+                      action='store_false',
+                      help='Do not bypass the page cache.')
+  return parser
+
+
+def main(argv):
+  options = GetParser().parse_args(argv)
+  options.Freeze()
+
+  extents = GetImageExtents(options.image)
+  digest = WriteImage(options.image, options.device, extents,
+                      direct=options.direct)
+  if options.verify:
+    logging.info('Verifying %s...', options.device)
+    if HashExtents(options.device, extents, direct=options.direct) != digest:
+      cros_build_lib.Die('Verification of %s failed: the data read back '
+                         'differs from the image.' % options.device)
+    logging.info('Verification succeeded.')
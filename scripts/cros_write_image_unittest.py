@@ -0,0 +1,113 @@
+#!/usr/bin/python
+# Copyright 2014 The Chromium OS Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Unittests for cros_write_image.py."""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__)))))
+
+from chromite.lib import cros_build_lib
+from chromite.lib import cros_test_lib
+from chromite.lib import osutils
+from chromite.scripts import cros_write_image
+
+
+MiB = 1024 * 1024
+
+
+def _Partition(number, start, size, name=None):
+  """Returns a PartitionInfo as parsed with unit='B'."""
+  return cros_build_lib.PartitionInfo(
+      number=number, start=float(start), end=float(start + size - 1),
+      size=float(size), file_system='', name=name or 'part%d' % number,
+      flags='')
+
+
+class WriteImageTest(cros_test_lib.MockTempDirTestCase):
+  """Tests of writing the allocated parts of an image."""
+
+  # The backup GPT makes the image end in a partial block.
+  IMAGE_SIZE = 8 * MiB + 512
+
+  def setUp(self):
+    self.image = os.path.join(self.tempdir, 'chromiumos_image.bin')
+    self.device = os.path.join(self.tempdir, 'device')
+    osutils.WriteFile(self.image, ''.join(
+        chr(i % 251) * 512 for i in xrange(self.IMAGE_SIZE // 512)))
+    osutils.WriteFile(self.device, '\xff' * self.IMAGE_SIZE)
+    self.partitions = [_Partition(1, 1 * MiB, 1 * MiB),
+                       _Partition(2, 3 * MiB, MiB + MiB // 2)]
+    self.partition_mock = self.PatchObject(
+        cros_build_lib, 'GetImageDiskPartitionInfo',
+        side_effect=self._GetImageDiskPartitionInfo)
+
+  def _GetImageDiskPartitionInfo(self, _image, unit='MB', key_selector='name'):
+    """Returns self.partitions like GetImageDiskPartitionInfo would."""
+    self.assertEqual(unit, 'B')
+    return dict((getattr(p, key_selector), p) for p in self.partitions)
+
+  def _ReadRange(self, path, start, end):
+    with open(path, 'rb') as f:
+      f.seek(start)
+      return f.read(end - start)
+
+  def testGetImageExtents(self):
+    """Extents cover the partitions and GPTs, aligned and merged."""
+    self.assertEqual(cros_write_image.GetImageExtents(self.image),
+                     [(0, 2 * MiB), (3 * MiB, 5 * MiB),
+                      (7 * MiB, self.IMAGE_SIZE)])
+
+  def testGetImageExtentsSameName(self):
+    """Partitions sharing a name are all written."""
+    self.partitions = [_Partition(9, 1 * MiB, 1 * MiB, name='reserved'),
+                       _Partition(10, 5 * MiB, 1 * MiB, name='reserved')]
+    extents = cros_write_image.GetImageExtents(self.image)
+    self.assertEqual(extents, [(0, 2 * MiB), (5 * MiB, 6 * MiB),
+                               (7 * MiB, self.IMAGE_SIZE)])
+    cros_write_image.WriteImage(self.image, self.device, extents)
+    for start, end in ((1 * MiB, 2 * MiB), (5 * MiB, 6 * MiB)):
+      self.assertEqual(self._ReadRange(self.device, start, end),
+                       self._ReadRange(self.image, start, end))
+
+  def testGetImageExtentsFallback(self):
+    """The whole image is written if the partition table cannot be read."""
+    self.partition_mock.side_effect = cros_build_lib.RunCommandError(
+        'parted failed', cros_build_lib.CommandResult())
+    self.assertEqual(cros_write_image.GetImageExtents(self.image),
+                     [(0, self.IMAGE_SIZE)])
+
+  def testWriteImage(self):
+    """Only the extents are written, and the digest matches the device."""
+    extents = cros_write_image.GetImageExtents(self.image)
+    digest = cros_write_image.WriteImage(self.image, self.device, extents)
+    for start, end in extents:
+      self.assertEqual(self._ReadRange(self.device, start, end),
+                       self._ReadRange(self.image, start, end))
+    self.assertEqual(self._ReadRange(self.device, 5 * MiB, 7 * MiB),
+                     '\xff' * 2 * MiB)
+    self.assertEqual(cros_write_image.HashExtents(self.device, extents),
+                     digest)
+
+  def testVerifyFailure(self):
+    """Verification fails when the data read back differs."""
+    extents = cros_write_image.GetImageExtents(self.image)
+    digest = cros_write_image.WriteImage(self.image, self.device, extents,
+                                         direct=False)
+    with open(self.device, 'r+b') as f:
+      f.seek(3 * MiB)
+      f.write('corrupt')
+    self.assertNotEqual(cros_write_image.HashExtents(self.device, extents),
+                        digest)
+
+    self.PatchObject(cros_write_image, 'WriteImage', return_value=digest)
+    self.assertRaises(SystemExit, cros_write_image.main,
+                      [self.image, self.device, '--verify'])
+
+
+if __name__ == '__main__':
+  cros_test_lib.main()
@@ -19,8 +19,8 @@ device's rootfs.
 
 import collections
 import contextlib
-import functools
 import glob
+import json
 import logging
 import multiprocessing
 import os
@@ -28,7 +28,6 @@ import optparse
 import shlex
 import shutil
 import tarfile
-import time
 import zipfile
 
 
@@ -72,6 +71,9 @@ _SET_MOUNT_FLAGS_CMD = 'mount -o remount,exec,suid %s'
 DF_COMMAND = 'df -k %s'
 DF_COMMAND_ANDROID = 'df %s'
 
+# The manifest of file hashes kept on the device by --delta deploys.
+_DELTA_MANIFEST = '.deploy_chrome_manifest'
+
 def _UrlBaseName(url):
   """Return the last component of the URL."""
   return url.rstrip('/').rpartition('/')[-1]
@@ -81,6 +83,47 @@ class DeployFailure(failures_lib.StepFailure):
   """Raised whenever the deploy fails."""
 
 
+def _StageDelta(staging_dir, delta_dir, old_manifest):
+  """Populate |delta_dir| with the files that changed since the last deploy.
+
+  Files are hard linked when possible.  The directory structure and symlinks
+  of |staging_dir| are always recreated.
+
+  Args:
+    staging_dir: The staging directory with all of the files to deploy.
+    delta_dir: An empty directory to put the changed files in.
+    old_manifest: A dictionary mapping the paths relative to |staging_dir| of
+      the files that were deployed last to their hashes.
+
+  Returns:
+    The manifest for |staging_dir|.
+  """
+  manifest = {}
+  for root, dirs, files in os.walk(staging_dir):
+    rel_root = os.path.relpath(root, staging_dir)
+    dest_root = os.path.normpath(os.path.join(delta_dir, rel_root))
+    osutils.SafeMakedirs(dest_root)
+    shutil.copymode(root, dest_root)
+    for name in dirs + files:
+      src = os.path.join(root, name)
+      dest = os.path.join(dest_root, name)
+      if os.path.islink(src):
+        os.symlink(os.readlink(src), dest)
+        continue
+      elif name in dirs:
+        continue
+
+      rel_path = os.path.normpath(os.path.join(rel_root, name))
+      manifest[rel_path] = chrome_util.HashFile(src)
+      if old_manifest.get(rel_path) != manifest[rel_path]:
+        try:
+          os.link(src, dest)
+        except OSError:
+          shutil.copy2(src, dest)
+
+  return manifest
+
+
 DeviceInfo = collections.namedtuple(
     'DeviceInfo', ['target_dir_size', 'target_fs_free'])
 
@@ -99,19 +142,22 @@ class DeployChrome(object):
     self.tempdir = tempdir
     self.options = options
     self.staging_dir = staging_dir
-    self.host = remote.RemoteAccess(options.to, tempdir, port=options.port)
+    self.host = remote.RemoteAccess(
+        options.to, tempdir, port=options.port,
+        control_path=os.path.join(tempdir, 'ssh-master'))
     self._rootfs_is_still_readonly = multiprocessing.Event()
 
     # Used to track whether deploying content_shell or chrome to a device.
     self.content_shell = False
     self.copy_paths = chrome_util.GetCopyPaths('chrome')
     self.chrome_dir = _CHROME_DIR
+    # Compression only slows down transfers to VMs on this machine.
+    self.compress = options.to not in (remote.LOCALHOST, remote.LOCALHOST_IP)
 
-  def _GetRemoteMountFree(self, remote_dir):
-    result = self.host.RemoteSh((DF_COMMAND if not self.content_shell
-                                 else DF_COMMAND_ANDROID) % remote_dir,
-                                capture_output=True)
-    line = result.output.splitlines()[1]
+  @staticmethod
+  def _ParseRemoteMountFree(output):
+    """Return the free space in bytes from the output of DF_COMMAND."""
+    line = output.splitlines()[1]
     value = line.split()[3]
     multipliers = {
         'G': 1024 * 1024 * 1024,
@@ -120,15 +166,10 @@ class DeployChrome(object):
     }
     return int(value.rstrip('GMK')) * multipliers.get(value[-1], 1)
 
-  def _GetRemoteDirSize(self, remote_dir):
-    if self.content_shell:
-      # Content Shell devices currently do not contain the du binary.
-      logging.warning('Remote host does not contain du; cannot get remote '
-                      'directory size to properly calculate available free '
-                      'space.')
-      return 0
-    result = self.host.RemoteSh('du -ks %s' % remote_dir, capture_output=True)
-    return int(result.output.split()[0])
+  @staticmethod
+  def _ParseRemoteDirSize(output):
+    """Return the size in KiB from the output of 'du -ks'."""
+    return int(output.split()[0])
 
   def _GetStagingDirSize(self):
     result = cros_build_lib.DebugRunCommand(['du', '-ks', self.staging_dir],
@@ -203,15 +244,19 @@ class DeployChrome(object):
     # need to help shut the chrome processes down.
     try:
       with timeout_util.Timeout(KILL_PROC_MAX_WAIT):
-        while self._ChromeFileInUse():
+        in_use = self._ChromeFileInUse()
+        while in_use:
           logging.warning('The chrome binary on the device is in use.')
           logging.warning('Killing chrome and session_manager processes...\n')
 
-          self.host.RemoteSh("pkill 'chrome|session_manager'",
-                             error_code_ok=True)
-          # Wait for processes to actually terminate
-          time.sleep(POST_KILL_WAIT)
+          # Kill, wait for processes to actually terminate and recheck the
+          # binary in a single ssh session.
+          results = self.host.RemoteShCommands(
+              ["pkill 'chrome|session_manager'", 'sleep %d' % POST_KILL_WAIT,
+               LSOF_COMMAND % (self.options.target_dir,)],
+              stop_on_error=False, error_code_ok=True)
           logging.info('Rechecking the chrome binary...')
+          in_use = results[-1].returncode == 0
     except timeout_util.TimeoutError:
       msg = ('Could not kill processes after %s seconds.  Please exit any '
              'running chrome processes and try again.' % KILL_PROC_MAX_WAIT)
@@ -235,12 +280,24 @@ class DeployChrome(object):
       self._rootfs_is_still_readonly.set()
 
   def _GetDeviceInfo(self):
-    steps = [
-        functools.partial(self._GetRemoteDirSize, self.options.target_dir),
-        functools.partial(self._GetRemoteMountFree, self.options.target_dir)
-    ]
-    return_values = parallel.RunParallelSteps(steps, return_values=True)
-    return DeviceInfo(*return_values)
+    remote_dir = self.options.target_dir
+    cmds = [(DF_COMMAND if not self.content_shell
+             else DF_COMMAND_ANDROID) % remote_dir]
+    if not self.content_shell:
+      cmds.append('du -ks %s' % remote_dir)
+    # Query the free space and the directory size in a single ssh session.
+    results = self.host.RemoteShCommands(cmds)
+
+    target_fs_free = self._ParseRemoteMountFree(results[0].output)
+    if self.content_shell:
+      # Content Shell devices currently do not contain the du binary.
+      logging.warning('Remote host does not contain du; cannot get remote '
+                      'directory size to properly calculate available free '
+                      'space.')
+      target_dir_size = 0
+    else:
+      target_dir_size = self._ParseRemoteDirSize(results[1].output)
+    return DeviceInfo(target_dir_size, target_fs_free)
 
   def _CheckDeviceFreeSpace(self, device_info):
     """See if target device has enough space for Chrome.
@@ -288,20 +345,36 @@ class DeployChrome(object):
 
       dest_path = _ANDROID_DIR
     else:
-      self.host.Rsync('%s/' % os.path.abspath(self.staging_dir),
+      src_dir = self.staging_dir
+      if self.options.delta:
+        src_dir = os.path.join(self.tempdir, 'delta')
+        manifest = _StageDelta(self.staging_dir, src_dir,
+                               self._TakeRemoteManifest())
+      else:
+        # This deploy changes the files, so the manifest of an earlier --delta
+        # deploy no longer describes them.
+        self.host.RemoteSh('rm -f %s' % self._RemoteManifestPath())
+      self.host.Rsync('%s/' % os.path.abspath(src_dir),
                       self.options.target_dir,
                       inplace=True, debug_level=logging.INFO,
-                      verbose=self.options.verbose)
+                      verbose=self.options.verbose, compress=self.compress)
 
+    # Fix up owners and modes in a single ssh session.
+    cmds = []
     for p in self.copy_paths:
       if p.owner:
-        self.host.RemoteSh('chown %s %s/%s' % (p.owner, dest_path,
-                                               p.src if not p.dest else p.dest))
+        cmds.append('chown %s %s/%s' % (p.owner, dest_path,
+                                        p.src if not p.dest else p.dest))
       if p.mode:
         # Set mode if necessary.
-        self.host.RemoteSh('chmod %o %s/%s' % (p.mode, dest_path,
-                                               p.src if not p.dest else p.dest))
+        cmds.append('chmod %o %s/%s' % (p.mode, dest_path,
+                                        p.src if not p.dest else p.dest))
+    if cmds:
+      self.host.RemoteShCommands(cmds)
 
+    if self.options.delta and not self.content_shell:
+      self.host.RemoteSh('cat > %s' % self._RemoteManifestPath(),
+                         input=json.dumps(manifest, indent=0, sort_keys=True))
 
     if self.options.startui:
       logging.info('Starting UI...')
@@ -310,6 +383,32 @@ class DeployChrome(object):
       else:
         self.host.RemoteSh('start ui')
 
+  def _RemoteManifestPath(self):
+    return os.path.join(self.options.target_dir, _DELTA_MANIFEST)
+
+  def _TakeRemoteManifest(self):
+    """Fetch and remove the manifest of the last deploy from the device.
+
+    The manifest is only put back once the deploy succeeded, so a deploy that
+    was interrupted half way is followed by a full one.
+
+    Returns:
+      A dictionary mapping the deployed files to their hashes.  Empty if the
+      device has no (valid) manifest.
+    """
+    path = self._RemoteManifestPath()
+    results = self.host.RemoteShCommands(
+        ['cat %s' % path, 'rm -f %s' % path], error_code_ok=True)
+    if results[0].returncode:
+      logging.info('No manifest of an earlier deploy on the device; '
+                   'deploying all files.')
+      return {}
+    try:
+      return json.loads(results[0].output)
+    except ValueError:
+      logging.warning('Ignoring invalid manifest %s on the device.', path)
+      return {}
+
   def _CheckConnection(self):
     try:
       logging.info('Testing connection to the device...')
@@ -396,6 +495,9 @@ class DeployChrome(object):
       self._PrepareStagingDir()
       return 0
 
+    # Share a single ssh connection between all of the steps below.
+    self.host.StartMaster()
+
     # Run setup steps in parallel. If any step fails, RunParallelSteps will
     # stop printing output at that point, and halt any running steps.
     steps = [self._GetDeviceInfo, self._CheckConnection,
@@ -474,6 +576,10 @@ def _CreateParser():
   parser.add_option('--mount', action='store_true', default=False,
                     help='Deploy Chrome to default target directory and bind it'
                          'to default mount directory.')
+  parser.add_option('--delta', action='store_true', default=False,
+                    help='Only strip and transfer the files that changed since '
+                         'the last --delta deploy to the device.  Meant for '
+                         'repeated deploys of local builds.')
 
   group = optparse.OptionGroup(parser, 'Advanced Options')
   group.add_option('-l', '--local-pkg-path', type='path',
@@ -660,11 +766,20 @@ def _PrepareStagingDir(options, tempdir, staging_dir, copy_paths=None,
     with _StripBinContext(options) as strip_bin:
       strip_flags = (None if options.strip_flags is None else
                      shlex.split(options.strip_flags))
+      strip_cache_dir = None
+      if options.delta:
+        strip_cache_dir = os.path.join(options.cache_dir, 'deploy_chrome',
+                                       'strip')
       chrome_util.StageChromeFromBuildDir(
           staging_dir, options.build_dir, strip_bin, strict=options.strict,
           sloppy=options.sloppy, gyp_defines=options.gyp_defines,
           staging_flags=options.staging_flags,
-          strip_flags=strip_flags, copy_paths=copy_paths)
+          strip_flags=strip_flags, copy_paths=copy_paths,
+          strip_cache_dir=strip_cache_dir,
+          # The staging dir is only used to rsync from when deploying, so
+          # linking to the build dir is safe.  The Chrome ebuild modifies the
+          # files staged by --staging-only, so those must be copies.
+          hardlink=not options.staging_only)
   else:
     pkg_path = options.local_pkg_path
     if options.gs_path:
@@ -714,3 +829,5 @@ def main(argv):
         deploy.Perform()
       except failures_lib.StepFailure as ex:
         raise SystemExit(str(ex).strip())
+      finally:
+        deploy.host.StopMaster()
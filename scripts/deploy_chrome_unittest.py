@@ -337,5 +337,87 @@ class TestContentDeploymentType(DeployTestBuildDir):
     self.deploy._CheckDeployType()
     self.assertFalse(self.deploy.content_shell)
 
+
+class StageDeltaTest(cros_test_lib.TempDirTestCase):
+  """Test staging of the files that changed since the last deploy."""
+
+  def testStageDelta(self):
+    """Only new and changed files are staged, with the directory structure."""
+    staging_dir = os.path.join(self.tempdir, 'staging')
+    delta_dir = os.path.join(self.tempdir, 'delta')
+    osutils.WriteFile(os.path.join(staging_dir, 'chrome'), 'new chrome',
+                      makedirs=True)
+    osutils.WriteFile(os.path.join(staging_dir, 'locales', 'en-US.pak'), 'en',
+                      makedirs=True)
+    osutils.SafeMakedirs(os.path.join(staging_dir, 'plugins'))
+    os.symlink('chrome', os.path.join(staging_dir, 'chrome-link'))
+    old_manifest = {
+        'chrome': 'old hash',
+        'locales/en-US.pak': chrome_util.HashFile(
+            os.path.join(staging_dir, 'locales', 'en-US.pak')),
+    }
+
+    manifest = deploy_chrome._StageDelta(staging_dir, delta_dir, old_manifest)
+    self.assertEqual(sorted(manifest), ['chrome', 'locales/en-US.pak'])
+    self.assertEqual(manifest['chrome'], chrome_util.HashFile(
+        os.path.join(staging_dir, 'chrome')))
+    self.assertEqual(
+        osutils.ReadFile(os.path.join(delta_dir, 'chrome')), 'new chrome')
+    self.assertEqual(os.readlink(os.path.join(delta_dir, 'chrome-link')),
+                     'chrome')
+    self.assertEqual(os.listdir(os.path.join(delta_dir, 'locales')), [])
+    self.assertTrue(os.path.isdir(os.path.join(delta_dir, 'plugins')))
+
+
+class _LocalHost(object):
+  """Runs the commands DeployChrome runs on the device locally."""
+
+  def Rsync(self, src, dest, **_kwargs):
+    cros_build_lib.RunCommand(['cp', '-a', src + '.', dest], quiet=True)
+
+  def RemoteSh(self, cmd, **kwargs):
+    return cros_build_lib.RunCommand(cmd, shell=True, quiet=True, **kwargs)
+
+  def RemoteShCommands(self, cmds, **kwargs):
+    return [self.RemoteSh(cmd, **kwargs) for cmd in cmds]
+
+
+class DeltaDeployTest(cros_test_lib.MockTempDirTestCase):
+  """Test --delta deploys mixed with full deploys."""
+
+  def setUp(self):
+    self.target_dir = os.path.join(self.tempdir, 'device')
+    osutils.SafeMakedirs(self.target_dir)
+
+  def _Deploy(self, chrome, delta=False):
+    """Deploys a build with |chrome| as the contents of the chrome binary."""
+    argv = list(_REGULAR_TO) + ['--gs-path', _GS_PATH, '--nostartui',
+                                '--target-dir', self.target_dir]
+    if delta:
+      argv.append('--delta')
+    options, _ = _ParseCommandLine(argv)
+    tempdir = os.path.join(self.tempdir, 'tmp')
+    osutils.RmDir(tempdir, ignore_missing=True)
+    staging_dir = os.path.join(self.tempdir, 'staging')
+    osutils.RmDir(staging_dir, ignore_missing=True)
+    osutils.WriteFile(os.path.join(staging_dir, 'chrome'), chrome,
+                      makedirs=True)
+    osutils.SafeMakedirs(tempdir)
+    deploy = deploy_chrome.DeployChrome(options, tempdir, staging_dir)
+    deploy.host = _LocalHost()
+    deploy.copy_paths = []
+    deploy._Deploy()
+
+  def testDeltaAfterFullDeploy(self):
+    """A --delta deploy after a full deploy copies the files it changed."""
+    self._Deploy('build 1', delta=True)
+    self._Deploy('build 2')
+    self.assertEqual(
+        osutils.ReadFile(os.path.join(self.target_dir, 'chrome')), 'build 2')
+    self._Deploy('build 1', delta=True)
+    self.assertEqual(
+        osutils.ReadFile(os.path.join(self.target_dir, 'chrome')), 'build 1')
+
+
 if __name__ == '__main__':
   cros_test_lib.main()
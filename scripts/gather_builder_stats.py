@@ -7,10 +7,12 @@
 from __future__ import division
 import collections
 import datetime
+import json
 import logging
 import numpy
 import os
 import re
+import sqlite3
 import sys
 
 from chromite.cbuildbot import cbuildbot_config
@@ -21,6 +23,7 @@ from chromite.lib import cros_build_lib
 from chromite.lib import gdata_lib
 from chromite.lib import graphite
 from chromite.lib import gs
+from chromite.lib import osutils
 from chromite.lib import table
 
 # Useful config targets.
@@ -36,6 +39,10 @@ PFQ = constants.PFQ_TYPE
 # Number of parallel processes used when uploading/downloading GS files.
 MAX_PARALLEL = 40
 
+# Default location of the local cache of metadata.json contents, relative to
+# the cache dir.
+METADATA_CACHE_PATH = os.path.join('gather_builder_stats', 'metadata.sqlite')
+
 # The graphite graphs use seconds since epoch start as time value.
 EPOCH_START = metadata_lib.EPOCH_START
 
@@ -540,6 +547,110 @@ class SSUploader(object):
                              row_dict, e)
 
 
+class BuildDataCache(object):
+  """Local cache of metadata.json contents, backed by an sqlite database.
+
+  Each entry is keyed by metadata.json URL, and records the size and modified
+  time of the GS file it was read from, so that an entry is only used while
+  the GS file is unchanged. Builds that finished before the previous run
+  therefore do not need to be downloaded and parsed again.
+
+  The cache also records the stats versions each build was gathered for (the
+  contents of its metadata.json.gathered file), as last read or written by
+  this script, so that they are not read from GS again either.
+  """
+
+  SCHEMA = ('CREATE TABLE IF NOT EXISTS metadata ('
+            'url TEXT PRIMARY KEY, size INTEGER, modified TEXT, '
+            'metadata_json TEXT)')
+  GATHERED_SCHEMA = ('CREATE TABLE IF NOT EXISTS gathered ('
+                     'url TEXT PRIMARY KEY, gathered_json TEXT)')
+
+  def __init__(self, path):
+    """BuildDataCache constructor.
+
+    Args:
+      path: Path to the sqlite database file. It is created if needed.
+    """
+    osutils.SafeMakedirs(os.path.dirname(path))
+    self._conn = sqlite3.connect(path)
+    self._conn.execute(self.SCHEMA)
+    self._conn.execute(self.GATHERED_SCHEMA)
+
+  @staticmethod
+  def _Modified(dt):
+    return dt.isoformat() if dt else None
+
+  def GetMetadataDicts(self, url_details):
+    """Look up cached metadata dicts for the given URLs.
+
+    Args:
+      url_details: List of (url, size, modified datetime) tuples, as returned
+        by metadata_lib.GetMetadataURLDetailsSince.
+
+    Returns:
+      A dict mapping each URL with an up to date cache entry to its metadata
+      dict.
+    """
+    expected = dict((url, (size, self._Modified(dt)))
+                    for url, size, dt in url_details)
+    cached = {}
+    cursor = self._conn.execute(
+        'SELECT url, size, modified, metadata_json FROM metadata')
+    for url, size, modified, metadata_json in cursor:
+      if expected.get(url) == (size, modified):
+        cached[url] = json.loads(metadata_json)
+    return cached
+
+  def Update(self, builds, url_details):
+    """Store the metadata of |builds| in the cache.
+
+    Args:
+      builds: List of metadata_lib.BuildData objects.
+      url_details: List of (url, size, modified datetime) tuples, including
+        those of |builds|.
+    """
+    details = dict((url, (size, self._Modified(dt)))
+                   for url, size, dt in url_details)
+    rows = []
+    for build in builds:
+      if build.metadata_url in details:
+        size, modified = details[build.metadata_url]
+        rows.append((build.metadata_url, size, modified,
+                     json.dumps(build.metadata_dict)))
+    with self._conn:
+      self._conn.executemany(
+          'INSERT OR REPLACE INTO metadata VALUES (?, ?, ?, ?)', rows)
+
+  def GetGatheredDicts(self, urls):
+    """Look up the cached gathered dicts for the given URLs.
+
+    Args:
+      urls: List of metadata.json URLs.
+
+    Returns:
+      A dict mapping each URL with a cache entry to its gathered dict.
+    """
+    urls = set(urls)
+    cached = {}
+    cursor = self._conn.execute('SELECT url, gathered_json FROM gathered')
+    for url, gathered_json in cursor:
+      if url in urls:
+        cached[url] = json.loads(gathered_json)
+    return cached
+
+  def UpdateGathered(self, builds):
+    """Store the gathered dicts of |builds| in the cache.
+
+    Args:
+      builds: List of metadata_lib.BuildData objects.
+    """
+    rows = [(b.metadata_url, json.dumps(b.gathered_dict)) for b in builds]
+    with self._conn:
+      self._conn.executemany(
+          'INSERT OR REPLACE INTO gathered VALUES (?, ?)', rows)
+
+
 class StatsManager(object):
   """Abstract class for managing stats for one config target.
 
@@ -566,12 +677,13 @@ class StatsManager(object):
   GET_SHEETS_VERSION = True
 
   def __init__(self, config_target, ss_key=None,
-               no_sheets_version_filter=False):
+               no_sheets_version_filter=False, cache=None):
     self.builds = []
     self.gs_ctx = gs.GSContext()
     self.config_target = config_target
     self.ss_key = ss_key
     self.no_sheets_version_filter = no_sheets_version_filter
+    self.cache = cache
     self.summary = {}
 
 
@@ -590,7 +702,7 @@ class StatsManager(object):
       creds: Login credentials as returned by _PrepareCreds. (optional)
     """
     self.builds = self._FetchBuildData(start_date, self.config_target,
-                                       self.gs_ctx)
+                                       self.gs_ctx, cache=self.cache)
 
     if sort_by_build_number:
       # Sort runs by build_number, from newest to oldest.
@@ -645,27 +757,46 @@ class StatsManager(object):
     return (per_patch_actions, per_cl_actions)
 
   @classmethod
-  def _FetchBuildData(cls, start_date, config_target, gs_ctx):
+  def _FetchBuildData(cls, start_date, config_target, gs_ctx, cache=None):
     """Fetches BuildData for builds of |config_target| since |start_date|.
 
     Args:
       start_date: A datetime.date instance.
       config_target: String config name to fetch metadata for.
       gs_ctx: A gs.GSContext instance.
+      cache: Optional BuildDataCache instance. Metadata found in it is not
+             read from GS again, and newly read metadata is added to it.
 
     Returns:
       A list of of metadata_lib.BuildData objects that were fetched.
     """
     cros_build_lib.Info('Gathering data for %s since %s', config_target,
                         start_date)
-    urls = metadata_lib.GetMetadataURLsSince(config_target,
-                                                   start_date)
+    url_details = metadata_lib.GetMetadataURLDetailsSince(config_target,
+                                                          start_date)
+    urls = [url for url, _size, _dt in url_details]
     cros_build_lib.Info('Found %d metadata.json URLs to process.\n'
                         '  From: %s\n  To  : %s', len(urls), urls[0], urls[-1])
 
+    metadata_dicts = cache.GetMetadataDicts(url_details) if cache else {}
+    gathered_dicts = {}
+    if cache:
+      cros_build_lib.Info('Found %d of them in the local cache.',
+                          len(metadata_dicts))
+      if cls.GET_SHEETS_VERSION:
+        gathered_dicts = cache.GetGatheredDicts(urls)
+
     builds = metadata_lib.BuildData.ReadMetadataURLs(
-        urls, gs_ctx, get_sheets_version=cls.GET_SHEETS_VERSION)
+        urls, gs_ctx, get_sheets_version=cls.GET_SHEETS_VERSION,
+        metadata_dicts=metadata_dicts, gathered_dicts=gathered_dicts)
     cros_build_lib.Info('Read %d total metadata files.', len(builds))
+
+    if cache:
+      cache.Update([b for b in builds if b.metadata_url not in metadata_dicts],
+                   url_details)
+      if cls.GET_SHEETS_VERSION:
+        cache.UpdateGathered([b for b in builds
+                              if b.metadata_url not in gathered_dicts])
     return builds
 
   # TODO(akeshet): Return statistics in dictionary rather than just printing
@@ -774,6 +905,8 @@ class StatsManager(object):
                                                 self.sheets_version,
                                                 self.carbon_version,
                                                 gs_ctx=self.gs_ctx)
+      if self.cache:
+        self.cache.UpdateGathered(self.builds)
 
 
 # TODO(mtennant): This class is an untested placeholder.
@@ -784,7 +917,7 @@ class CQSlaveStats(StatsManager):
   GET_SHEETS_VERSION = True
 
   def __init__(self, slave_target, **kwargs):
-    super(CQSlaveStats, self).__init__(slave_target, kwargs)
+    super(CQSlaveStats, self).__init__(slave_target, **kwargs)
 
   # TODO(mtennant): This is totally untested, but is a refactoring of the
   # graphite code that was in place before for CQ slaves.
@@ -877,7 +1010,7 @@ class CLStats(StatsManager):
     self.reasons = {}
     self.blames = {}
     self.summary = {}
-    self.pre_cq_stats = PreCQStats()
+    self.pre_cq_stats = PreCQStats(cache=self.cache)
 
   def GatherFailureReasons(self, creds):
     """Gather the reasons why our builds failed and the blamed bugs or CLs.
@@ -1450,6 +1583,16 @@ def GetParser():
   mode.add_argument('--override-ss-key', action='store', default=None,
                     dest='ss_key',
                     help='Override spreadsheet key.')
+  mode.add_argument('--metadata-cache', action='store', type='path',
+                    default=None,
+                    help='Path of the local cache of metadata.json contents. '
+                         'Defaults to a file in the cache dir.')
+  mode.add_argument('--no-metadata-cache', action='store_false', default=True,
+                    dest='use_metadata_cache',
+                    help='Read all metadata.json files (and the stats '
+                         'versions they were gathered for) from GS, ignoring '
+                         'the local cache. Use this if builds may have been '
+                         'marked gathered from another machine.')
 
   return parser
 
@@ -1474,6 +1617,12 @@ def main(argv):
     else:
       start_date = (now - datetime.timedelta(days=1)).date()
 
+  cache = None
+  if options.use_metadata_cache:
+    cache = BuildDataCache(options.metadata_cache or
+                           os.path.join(commandline.GetCacheDir(),
+                                        METADATA_CACHE_PATH))
+
   # Prepare the rounds of stats gathering to do.
   stats_managers = []
 
@@ -1481,7 +1630,8 @@ def main(argv):
     stats_managers.append(
         CQMasterStats(
             ss_key=options.ss_key or CQ_SS_KEY,
-            no_sheets_version_filter=options.no_sheets_version_filter))
+            no_sheets_version_filter=options.no_sheets_version_filter,
+            cache=cache))
 
   if options.cl_actions:
     # CL stats manager uses the CQ spreadsheet to fetch failure reasons
@@ -1489,23 +1639,25 @@ def main(argv):
         CLStats(
             options.email,
             ss_key=options.ss_key or CQ_SS_KEY,
-            no_sheets_version_filter=options.no_sheets_version_filter))
+            no_sheets_version_filter=options.no_sheets_version_filter,
+            cache=cache))
 
   if options.pfq_master:
     stats_managers.append(
         PFQMasterStats(
             ss_key=options.ss_key or PFQ_SS_KEY,
-            no_sheets_version_filter=options.no_sheets_version_filter))
+            no_sheets_version_filter=options.no_sheets_version_filter,
+            cache=cache))
 
   if options.pre_cq:
     # TODO(mtennant): Add spreadsheet and/or graphite support for pre-cq.
-    stats_managers.append(PreCQStats())
+    stats_managers.append(PreCQStats(cache=cache))
 
   if options.cq_slaves:
     targets = _GetSlavesOfMaster(CQ_MASTER)
     for target in targets:
       # TODO(mtennant): Add spreadsheet and/or graphite support for cq-slaves.
-      stats_managers.append(CQSlaveStats(target))
+      stats_managers.append(CQSlaveStats(target, cache=cache))
 
   # If options.save is set and any of the instructions include a table class,
   # or specify summary columns for upload, prepare spreadsheet creds object
@@ -6,8 +6,10 @@
 
 """Unit tests for gather_builder_stats."""
 
+import copy
 import datetime
 import itertools
+import json
 import os
 import random
 import sys
@@ -16,6 +18,8 @@ import unittest
 sys.path.insert(0, os.path.abspath('%s/../..' % os.path.dirname(__file__)))
 from chromite.lib import cros_build_lib
 from chromite.lib import cros_test_lib
+from chromite.lib import gs
+from chromite.lib import parallel
 from chromite.scripts import gather_builder_stats
 from chromite.cbuildbot import metadata_lib
 from chromite.cbuildbot import constants
@@ -225,5 +229,74 @@ class TestCLActionLogic(unittest.TestCase):
                      expected)
 
 
+class BuildDataCacheTest(cros_test_lib.MockTempDirTestCase):
+  """Tests of the local metadata cache."""
+
+  URL = 'gs://chromeos-image-archive/foo/R1-1.0.0-b1/metadata.json'
+
+  def setUp(self):
+    self.cache_path = os.path.join(self.tempdir, 'cache', 'metadata.sqlite')
+    self.url_details = [(self.URL, 100, datetime.datetime(2014, 5, 1))]
+    self.metadata = {'build-number': 1, 'status': {'status': 'passed'}}
+    self.PatchObject(metadata_lib, 'GetMetadataURLDetailsSince',
+                     return_value=self.url_details)
+    # Read metadata in this process, so that GS calls can be counted. The
+    # inputs are copied, as they would be when sent to another process.
+    self.PatchObject(parallel, 'RunTasksInProcessPool',
+                     side_effect=lambda f, inputs, **_kw: [
+                         f(*copy.deepcopy(x)) for x in inputs])
+    self.gs_ctx = mock.Mock()
+    self.gs_ctx.Exists.return_value = False
+    self.cat = self.gs_ctx.Cat
+    self.cat.return_value = cros_build_lib.CommandResult(
+        output=json.dumps(self.metadata))
+
+  def _Fetch(self, cache, stats_class=gather_builder_stats.PreCQStats):
+    return stats_class._FetchBuildData(
+        datetime.date(2014, 5, 1), constants.PRE_CQ_GROUP, self.gs_ctx,
+        cache=cache)
+
+  def testCacheHit(self):
+    """Builds seen on a previous run are not read from GS again."""
+    builds = self._Fetch(gather_builder_stats.BuildDataCache(self.cache_path))
+    self.assertEqual(self.cat.call_count, 1)
+    self.assertEqual(builds[0].metadata_dict, self.metadata)
+
+    builds = self._Fetch(gather_builder_stats.BuildDataCache(self.cache_path))
+    self.assertEqual(self.cat.call_count, 1)
+    self.assertEqual(builds[0].metadata_dict, self.metadata)
+    self.assertEqual(builds[0].metadata_url, self.URL)
+
+  def testCacheMissOnChange(self):
+    """Builds whose metadata.json changed are read from GS again."""
+    cache = gather_builder_stats.BuildDataCache(self.cache_path)
+    self._Fetch(cache)
+    self.url_details[0] = (self.URL, 200, datetime.datetime(2014, 5, 2))
+    self._Fetch(cache)
+    self.assertEqual(self.cat.call_count, 2)
+
+  def testGatheredCached(self):
+    """The gathered state is kept in the cache, and updated when marking."""
+    self.PatchObject(gs, 'GSContext', return_value=self.gs_ctx)
+    stats_class = gather_builder_stats.CQMasterStats
+    cache = gather_builder_stats.BuildDataCache(self.cache_path)
+    builds = self._Fetch(cache, stats_class)
+    self.assertEqual(self.gs_ctx.Exists.call_count, 1)
+    self.assertEqual(builds[0].sheets_version, -1)
+
+    stats = stats_class(cache=cache)
+    stats.builds = builds
+    stats.MarkGathered()
+    self.assertEqual(self.gs_ctx.Copy.call_count, 1)
+    self.assertEqual(builds[0].sheets_version, stats.sheets_version)
+
+    builds = self._Fetch(gather_builder_stats.BuildDataCache(self.cache_path),
+                         stats_class)
+    self.assertEqual(self.gs_ctx.Exists.call_count, 1)
+    self.assertEqual(self.cat.call_count, 1)
+    self.assertEqual(builds[0].sheets_version, stats.sheets_version)
+    self.assertEqual(builds[0].carbon_version, stats.carbon_version)
+
+
 if __name__ == '__main__':
   cros_test_lib.main()
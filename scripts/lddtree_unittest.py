@@ -0,0 +1,140 @@
+#!/usr/bin/python
+# Copyright 2014 The Chromium OS Authors. All rights reserved.
+# Use of this source code is governed by a BSD-style license that can be
+# found in the LICENSE file.
+
+"""Unit tests for the local changes to the lddtree script."""
+
+import os
+import shutil
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                                '..', '..'))
+
+from chromite.lib import cros_test_lib
+
+from chromite.scripts import lddtree
+
+
+# pylint: disable=W0212
+
+# Dynamically linked programs that should exist on any build machine.
+_SYSTEM_ELFS = ('/bin/ls', '/bin/bash', '/bin/cp', '/usr/bin/env',
+                sys.executable)
+
+
+def _IsELF(path):
+  """Return whether |path| is an ELF file."""
+  try:
+    with open(path, 'rb') as f:
+      return f.read(4) == '\x7fELF'
+  except IOError:
+    return False
+
+
+class ParseELFTest(cros_test_lib.MockTempDirTestCase):
+  """Tests of ParseELF, ParseELFs and the ELF cache."""
+
+  def setUp(self):
+    self.cache = {}
+    self.PatchObject(lddtree, '_ELF_CACHE', new=self.cache)
+    self.ldpaths = lddtree.LoadLdpaths('/')
+    self.paths = [x for x in set(os.path.realpath(x) for x in _SYSTEM_ELFS)
+                  if _IsELF(x)]
+    if not self.paths:
+      self.skipTest('no system ELFs found')
+    self.paths.sort()
+
+  def _ParseUncached(self, path):
+    """Run ParseELF on |path| with an empty cache."""
+    self.cache.clear()
+    return lddtree.ParseELF(path, ldpaths=self.ldpaths)
+
+  def _AllNeeded(self, path):
+    """Return the libraries |path| needs, directly or not."""
+    return lddtree.ParseELF(path, ldpaths=self.ldpaths)['libs'].keys()
+
+  def testParseELFCached(self):
+    """ParseELF gives the same results with a warm cache."""
+    expected = [self._ParseUncached(x) for x in self.paths]
+    self.cache.clear()
+    results = [lddtree.ParseELF(x, ldpaths=self.ldpaths) for x in self.paths]
+    self.assertEqual(expected, results)
+    self.assertTrue(any(x['needed'] for x in results))
+    for result in results:
+      for lib in result['needed']:
+        self.assertTrue(result['libs'][lib]['path'], msg=lib)
+
+  def testParseELFs(self):
+    """ParseELFs gives the serial results, in order."""
+    expected = [self._ParseUncached(x) for x in self.paths]
+    self.cache.clear()
+    self.assertEqual(expected, lddtree.ParseELFs(self.paths,
+                                                 ldpaths=self.ldpaths,
+                                                 processes=2))
+    self.assertEqual(expected, lddtree.ParseELFs(self.paths,
+                                                 ldpaths=self.ldpaths,
+                                                 processes=1))
+
+  def testReadELF(self):
+    """_ReadELF reads the dynamic tags of an ELF."""
+    path = self.paths[0]
+    info = lddtree._ReadELF(path)
+    self.assertEqual(set(info), set(['interp', 'needed', 'rpath', 'runpath',
+                                     'compat']))
+    self.assertTrue(info['interp'])
+    self.assertIn('libc.so.6', self._AllNeeded(path))
+    self.assertEqual(len(info['compat']), 4)
+
+  def testReadELFCacheKey(self):
+    """_ReadELF re-reads a file that was replaced or modified."""
+    path = os.path.join(self.tempdir, 'elf')
+    shutil.copy2(self.paths[0], path)
+    info = lddtree._ReadELF(path)
+    self.assertIs(info, lddtree._ReadELF(path))
+
+    # A different path to the same file is a different entry.
+    link = os.path.join(self.tempdir, 'link')
+    os.link(path, link)
+    self.assertIsNot(info, lddtree._ReadELF(link))
+
+    # Changing the mtime invalidates the entry.
+    st = os.stat(path)
+    os.utime(path, (st.st_atime, st.st_mtime + 10))
+    new_info = lddtree._ReadELF(path)
+    self.assertIsNot(info, new_info)
+    self.assertEqual(info, new_info)
+
+    # So does replacing the file.
+    os.rename(path, path + '.old')
+    shutil.copy2(path + '.old', path)
+    os.utime(path, (st.st_atime, st.st_mtime + 10))
+    self.assertIsNot(new_info, lddtree._ReadELF(path))
+
+  def _ParseFakeELF(self, rpath=None, runpath=None):
+    """Run ParseELF on an ELF with the given RPATH and RUNPATH."""
+    self.PatchObject(lddtree, '_ReadELF', return_value={
+        'interp': None,
+        'needed': [],
+        'rpath': rpath,
+        'runpath': runpath,
+        'compat': ('ELFOSABI_SYSV', 64, True, 'EM_X86_64'),
+    })
+    return lddtree.ParseELF('/foo/bin/elf', root='/root')
+
+  def testRpath(self):
+    """RPATH is used (and $ORIGIN expanded) when there is no RUNPATH."""
+    elf = self._ParseFakeELF(rpath='/lib:$ORIGIN/../lib')
+    self.assertEqual(elf['rpath'], ['/root/lib', '/foo/lib'])
+    self.assertEqual(elf['runpath'], [])
+
+  def testRunpath(self):
+    """RUNPATH takes precedence over RPATH."""
+    elf = self._ParseFakeELF(rpath='/lib', runpath='/usr/lib')
+    self.assertEqual(elf['rpath'], [])
+    self.assertEqual(elf['runpath'], ['/root/usr/lib'])
+
+
+if __name__ == '__main__':
+  cros_test_lib.main()
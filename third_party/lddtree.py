@@ -16,6 +16,7 @@ from __future__ import print_function
 
 import glob
 import errno
+import multiprocessing
 import optparse
 import os
 import shutil
@@ -252,42 +253,107 @@ def LoadLdpaths(root='/', prefix=''):
   return ldpaths
 
 
-def CompatibleELFs(elf1, elf2):
-  """See if two ELFs are compatible
+# The ELF metadata lddtree needs, keyed by (path, inode, mtime).  Libraries
+# like the C library are needed by nearly every ELF, so this saves parsing
+# them over and over when walking many trees in one run.
+_ELF_CACHE = {}
 
-  This compares the aspects of the ELF to see if they're compatible:
-  bit size, endianness, machine type, and operating system.
+
+def _ELFCompat(elf):
+  """Return the aspects of |elf| that CompatibleELFs compares
 
   Args:
-    elf1: an ELFFile object
-    elf2: an ELFFile object
+    elf: an ELFFile object
 
   Returns:
-    True if compatible, False otherwise
+    a tuple of the OS ABI, bit size, endianness, and machine type
+  """
+  return (elf.header['e_ident']['EI_OSABI'], elf.elfclass, elf.little_endian,
+          elf.header['e_machine'])
+
+
+def _ReadELF(path):
+  """Read (or look up in the cache) the metadata of the ELF at |path|
+
+  Args:
+    path: The ELF to read
+
+  Returns:
+    a dict containing the raw metadata of the ELF; e.g.
+    {
+      'interp': '/lib64/ld-linux-x86-64.so.2',
+      'needed': ['libc.so.6',],
+      'rpath': None,
+      'runpath': '$ORIGIN/../lib',
+      'compat': ('ELFOSABI_SYSV', 64, True, 'EM_X86_64'),
+    }
   """
-  osabis = frozenset([e.header['e_ident']['EI_OSABI'] for e in (elf1, elf2)])
+  with open(path, 'rb') as f:
+    st = os.fstat(f.fileno())
+    key = (path, st.st_dev, st.st_ino, st.st_mtime)
+    info = _ELF_CACHE.get(key)
+    if info is not None:
+      return info
+
+    elf = ELFFile(f)
+    info = {
+      'interp': None,
+      'needed': [],
+      'rpath': None,
+      'runpath': None,
+      'compat': _ELFCompat(elf),
+    }
+    seen_dynamic = False
+    for segment in elf.iter_segments():
+      if segment.header.p_type == 'PT_INTERP':
+        if info['interp'] is None:
+          info['interp'] = bstr(segment.get_interp_name())
+      elif segment.header.p_type == 'PT_DYNAMIC':
+        # XXX: We assume there is only one PT_DYNAMIC.  This is
+        # probably fine since the runtime ldso does the same.
+        if seen_dynamic:
+          continue
+        seen_dynamic = True
+        for t in segment.iter_tags():
+          if t.entry.d_tag == 'DT_RPATH':
+            info['rpath'] = bstr(t.rpath)
+          elif t.entry.d_tag == 'DT_RUNPATH':
+            info['runpath'] = bstr(t.runpath)
+          elif t.entry.d_tag == 'DT_NEEDED':
+            info['needed'].append(bstr(t.needed))
+
+  _ELF_CACHE[key] = info
+  return info
+
+
+def _CompatibleELFs(compat1, compat2):
+  """Like CompatibleELFs, but takes the tuples returned by _ELFCompat"""
+  osabis = frozenset([compat1[0], compat2[0]])
   compat_sets = (
     frozenset('ELFOSABI_%s' % x for x in ('NONE', 'SYSV', 'GNU', 'LINUX',)),
   )
   return ((len(osabis) == 1 or any(osabis.issubset(x) for x in compat_sets)) and
-    elf1.elfclass == elf2.elfclass and
-    elf1.little_endian == elf2.little_endian and
-    elf1.header['e_machine'] == elf2.header['e_machine'])
+    compat1[1:] == compat2[1:])
 
 
-def FindLib(elf, lib, ldpaths, root='/', debug=False):
-  """Try to locate a |lib| that is compatible to |elf| in the given |ldpaths|
+def CompatibleELFs(elf1, elf2):
+  """See if two ELFs are compatible
+
+  This compares the aspects of the ELF to see if they're compatible:
+  bit size, endianness, machine type, and operating system.
 
   Args:
-    elf: The elf which the library should be compatible with (ELF wise)
-    lib: The library (basename) to search for
-    ldpaths: A list of paths to search
-    root: The root path to resolve symlinks
-    debug: Enable debug output
+    elf1: an ELFFile object
+    elf2: an ELFFile object
 
   Returns:
-    Tuple of the full path to the desired library and the real path to it
+    True if compatible, False otherwise
   """
+  return _CompatibleELFs(_ELFCompat(elf1), _ELFCompat(elf2))
+
+
+def _FindLib(compat, lib, ldpaths, root='/', debug=False):
+  """Like FindLib, but takes the tuple returned by _ELFCompat"""
   dbg(debug, '  FindLib(%s)' % lib)
 
   for ldpath in ldpaths:
@@ -299,14 +365,28 @@ def FindLib(elf, lib, ldpaths, root='/', debug=False):
       dbg(debug, '    checking:', path)
 
     if os.path.exists(target):
-      with open(target, 'rb') as f:
-        libelf = ELFFile(f)
-        if CompatibleELFs(elf, libelf):
-          return (target, path)
+      if _CompatibleELFs(compat, _ReadELF(target)['compat']):
+        return (target, path)
 
   return (None, None)
 
 
+def FindLib(elf, lib, ldpaths, root='/', debug=False):
+  """Try to locate a |lib| that is compatible to |elf| in the given |ldpaths|
+
+  Args:
+    elf: The elf which the library should be compatible with (ELF wise)
+    lib: The library (basename) to search for
+    ldpaths: A list of paths to search
+    root: The root path to resolve symlinks
+    debug: Enable debug output
+
+  Returns:
+    Tuple of the full path to the desired library and the real path to it
+  """
+  return _FindLib(_ELFCompat(elf), lib, ldpaths, root=root, debug=debug)
+
+
 def ParseELF(path, root='/', prefix='', ldpaths={'conf':[], 'env':[], 'interp':[]},
              display=None, debug=False, _first=True, _all_libs={}):
   """Parse the ELF dependency tree of the specified file
@@ -355,85 +435,109 @@ def ParseELF(path, root='/', prefix='', ldpaths={'conf':[], 'env':[], 'interp':[
 
   dbg(debug, 'ParseELF(%s)' % path)
 
-  with open(path, 'rb') as f:
-    elf = ELFFile(f)
+  elf = _ReadELF(path)
 
-    # If this is the first ELF, extract the interpreter.
-    if _first:
-      for segment in elf.iter_segments():
-        if segment.header.p_type != 'PT_INTERP':
-          continue
+  # If this is the first ELF, extract the interpreter.
+  interp = elf['interp']
+  if _first and interp is not None:
+    dbg(debug, '  interp           =', interp)
+    ret['interp'] = normpath(root + interp)
+    ret['libs'][os.path.basename(interp)] = {
+      'path': ret['interp'],
+      'realpath': readlink(ret['interp'], root, prefixed=True),
+      'needed': [],
+    }
+    # XXX: Should read it and scan for /lib paths.
+    ldpaths['interp'] = [
+      normpath(root + os.path.dirname(interp)),
+      normpath(root + prefix + '/usr' + os.path.dirname(interp).lstrip(prefix)),
+    ]
+    dbg(debug, '  ldpaths[interp]  =', ldpaths['interp'])
+
+  # Expand the ELF's dynamic tags.
+  libs = list(elf['needed'])
+  rpaths = []
+  runpaths = []
+  if elf['runpath'] is not None:
+    runpaths = ParseLdPaths(elf['runpath'], root=root, path=path)
+  if elf['rpath'] is not None and not runpaths:
+    # If both RPATH and RUNPATH are set, only the latter is used.
+    rpaths = ParseLdPaths(elf['rpath'], root=root, path=path)
+  if _first:
+    # Propagate the rpaths used by the main ELF since those will be
+    # used at runtime to locate things.
+    ldpaths['rpath'] = rpaths
+    ldpaths['runpath'] = runpaths
+    dbg(debug, '  ldpaths[rpath]   =', rpaths)
+    dbg(debug, '  ldpaths[runpath] =', runpaths)
+  ret['rpath'] = rpaths
+  ret['runpath'] = runpaths
+  ret['needed'] = libs
+
+  # Search for the libs this ELF uses.
+  all_ldpaths = None
+  for lib in libs:
+    if lib in _all_libs:
+      continue
+    if all_ldpaths is None:
+      all_ldpaths = rpaths + ldpaths['rpath'] + ldpaths['env'] + runpaths + ldpaths['runpath'] + ldpaths['conf'] + ldpaths['interp']
+    realpath, fullpath = _FindLib(elf['compat'], lib, all_ldpaths, root,
+                                  debug=debug)
+    _all_libs[lib] = {
+      'realpath': realpath,
+      'path': fullpath,
+      'needed': [],
+    }
+    if fullpath:
+      lret = ParseELF(realpath, root, prefix, ldpaths, display=fullpath,
+                      debug=debug, _first=False, _all_libs=_all_libs)
+      _all_libs[lib]['needed'] = lret['needed']
 
-        interp = bstr(segment.get_interp_name())
-        dbg(debug, '  interp           =', interp)
-        ret['interp'] = normpath(root + interp)
-        ret['libs'][os.path.basename(interp)] = {
-          'path': ret['interp'],
-          'realpath': readlink(ret['interp'], root, prefixed=True),
-          'needed': [],
-        }
-        # XXX: Should read it and scan for /lib paths.
-        ldpaths['interp'] = [
-          normpath(root + os.path.dirname(interp)),
-          normpath(root + prefix + '/usr' + os.path.dirname(interp).lstrip(prefix)),
-        ]
-        dbg(debug, '  ldpaths[interp]  =', ldpaths['interp'])
-        break
-
-    # Parse the ELF's dynamic tags.
-    libs = []
-    rpaths = []
-    runpaths = []
-    for segment in elf.iter_segments():
-      if segment.header.p_type != 'PT_DYNAMIC':
-        continue
+  return ret
 
-      for t in segment.iter_tags():
-        if t.entry.d_tag == 'DT_RPATH':
-          rpaths = ParseLdPaths(bstr(t.rpath), root=root, path=path)
-        elif t.entry.d_tag == 'DT_RUNPATH':
-          runpaths = ParseLdPaths(bstr(t.runpath), root=root, path=path)
-        elif t.entry.d_tag == 'DT_NEEDED':
-          libs.append(bstr(t.needed))
-      if runpaths:
-        # If both RPATH and RUNPATH are set, only the latter is used.
-        rpaths = []
-
-      # XXX: We assume there is only one PT_DYNAMIC.  This is
-      # probably fine since the runtime ldso does the same.
-      break
-    if _first:
-      # Propagate the rpaths used by the main ELF since those will be
-      # used at runtime to locate things.
-      ldpaths['rpath'] = rpaths
-      ldpaths['runpath'] = runpaths
-      dbg(debug, '  ldpaths[rpath]   =', rpaths)
-      dbg(debug, '  ldpaths[runpath] =', runpaths)
-    ret['rpath'] = rpaths
-    ret['runpath'] = runpaths
-    ret['needed'] = libs
-
-    # Search for the libs this ELF uses.
-    all_ldpaths = None
-    for lib in libs:
-      if lib in _all_libs:
-        continue
-      if all_ldpaths is None:
-        all_ldpaths = rpaths + ldpaths['rpath'] + ldpaths['env'] + runpaths + ldpaths['runpath'] + ldpaths['conf'] + ldpaths['interp']
-      realpath, fullpath = FindLib(elf, lib, all_ldpaths, root, debug=debug)
-      _all_libs[lib] = {
-        'realpath': realpath,
-        'path': fullpath,
-        'needed': [],
-      }
-      if fullpath:
-        lret = ParseELF(realpath, root, prefix, ldpaths, display=fullpath,
-                        debug=debug, _first=False, _all_libs=_all_libs)
-        _all_libs[lib]['needed'] = lret['needed']
-
-    del elf
 
-  return ret
+def _ParseELFTask(args):
+  """Run ParseELF in a ParseELFs worker"""
+  path, kwargs = args
+  return ParseELF(path, **kwargs)
+
+
+def ParseELFs(paths, root='/', prefix='', ldpaths={'conf':[], 'env':[], 'interp':[]},
+              debug=False, processes=None):
+  """Parse the ELF dependency trees of many files in parallel
+
+  The ELFs are split among a pool of processes.  Each process caches what it
+  parses, so the libraries shared by the trees are only parsed once or so per
+  process rather than once per tree.
+
+  Args:
+    paths: The ELFs to scan
+    root: See ParseELF
+    prefix: See ParseELF
+    ldpaths: See ParseELF
+    debug: Enable debug output
+    processes: The number of processes to use; defaults to the number of CPUs
+
+  Returns:
+    a list of the ParseELF results of |paths|, in the same order
+  """
+  kwargs = {'root': root, 'prefix': prefix, 'ldpaths': ldpaths, 'debug': debug}
+  tasks = [(path, kwargs) for path in paths]
+  if processes is None:
+    processes = multiprocessing.cpu_count()
+  processes = min(processes, len(tasks))
+  if processes <= 1:
+    return [_ParseELFTask(x) for x in tasks]
+
+  pool = multiprocessing.Pool(processes)
+  try:
+    # Hand out the ELFs in order so that the trees of related ELFs (which
+    # tend to be next to each other) end up in the same worker's cache.
+    chunksize = max(1, len(tasks) // (processes * 4))
+    return pool.map(_ParseELFTask, tasks, chunksize=chunksize)
+  finally:
+    pool.terminate()
+    pool.join()
 
 
 def _NormalizePath(option, _opt, value, parser):